@@ -0,0 +1,3 @@
+set -e
+
+poetry run python -m benchmarks.suite "$@"
@@ -0,0 +1,103 @@
+"""
+Benchmark: getting the function calls that each agent accepts, from a large blackboard.
+- compares a scan of all the stored calls, with the function name index (see FunctionCallBlackboard.get_generated_functions_matching()).
+- no LLM calls are made.
+
+Usage: python -m benchmarks.blackboard_matching
+"""
+
+import time
+
+from rich.console import Console
+from rich.table import Table
+
+from gpt_multi_atomic_agents.blackboard import FunctionCallBlackboard
+from gpt_multi_atomic_agents.functions_dto import FunctionCallSchema
+
+console = Console()
+
+CALL_COUNT = 100_000
+AGENT_COUNT = 20
+FUNCTION_NAME_COUNT = 200
+ACCEPTED_FUNCTION_COUNT = 3
+REPEATS = 5
+
+
+def _build_blackboard(call_count: int = CALL_COUNT) -> FunctionCallBlackboard:
+    blackboard = FunctionCallBlackboard()
+    blackboard.add_generated_functions(
+        [
+            FunctionCallSchema(
+                agent_name="client",
+                function_name=f"Function{i % FUNCTION_NAME_COUNT}",
+                parameters={"name": f"object{i}"},
+            )
+            for i in range(call_count)
+        ]
+    )
+    return blackboard
+
+
+def _build_accepted_function_names() -> list[list[str]]:
+    return [
+        [
+            f"Function{(agent * ACCEPTED_FUNCTION_COUNT + j) % FUNCTION_NAME_COUNT}"
+            for j in range(ACCEPTED_FUNCTION_COUNT)
+        ]
+        for agent in range(AGENT_COUNT)
+    ]
+
+
+def _get_matching_by_scan(
+    blackboard: FunctionCallBlackboard, function_names: list[str]
+) -> list[FunctionCallSchema]:
+    # The previous implementation
+    return list(
+        filter(
+            lambda f: f.function_name in function_names,
+            blackboard.internal_previously_generated_functions,
+        )
+    )
+
+
+def _time_generation_in_ms(
+    blackboard: FunctionCallBlackboard,
+    accepted_function_names: list[list[str]],
+    is_indexed: bool,
+) -> float:
+    """Time one generation: each agent gets the calls that it accepts."""
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        for function_names in accepted_function_names:
+            if is_indexed:
+                blackboard.get_generated_functions_matching(function_names)
+            else:
+                _get_matching_by_scan(blackboard, function_names)
+    return (time.perf_counter() - start) * 1000 / REPEATS
+
+
+def main() -> None:
+    blackboard = _build_blackboard()
+    accepted_function_names = _build_accepted_function_names()
+
+    for function_names in accepted_function_names:
+        assert blackboard.get_generated_functions_matching(
+            function_names
+        ) == _get_matching_by_scan(blackboard, function_names)
+
+    table = Table(title="Matching calls per generation (ms)")
+    table.add_column("Stored calls", justify="right")
+    table.add_column("Agents", justify="right")
+    table.add_column("Scan", justify="right")
+    table.add_column("Index", justify="right")
+    table.add_row(
+        f"{CALL_COUNT:,}",
+        str(AGENT_COUNT),
+        f"{_time_generation_in_ms(blackboard, accepted_function_names, is_indexed=False):.2f}",
+        f"{_time_generation_in_ms(blackboard, accepted_function_names, is_indexed=True):.2f}",
+    )
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: the previously generated functions sent to an agent, with a token budget (see function_call_selection.py).
+- uses the saved sessions in data-generated/*.function_call.json.
+- for each creature of a session, the prompt asks about that creature: a call is 'relevant' if it mentions the creature.
+- reports the estimated input tokens, the share of the relevant calls that were kept (recall), and the time to select.
+- no LLM calls are made.
+
+Usage: python -m benchmarks.previous_function_selection
+"""
+
+import glob
+import os
+import time
+
+from pydantic import TypeAdapter
+from rich.console import Console
+from rich.table import Table
+
+from gpt_multi_atomic_agents import function_call_selection
+from gpt_multi_atomic_agents.blackboard import FunctionCallBlackboard
+from gpt_multi_atomic_agents.blackboard_serde import SerializedBlackboard
+from gpt_multi_atomic_agents.config import Config
+from gpt_multi_atomic_agents.functions_dto import FunctionCallSchema
+
+console = Console()
+
+BUDGETS = [0, 400, 200, 100]  # 0 means no budget
+
+
+def _load_sessions(dir_path: str) -> dict[str, list[FunctionCallSchema]]:
+    sessions: dict[str, list[FunctionCallSchema]] = {}
+    for path in sorted(glob.glob(os.path.join(dir_path, "*.function_call.json"))):
+        with open(path, encoding="utf-8") as file:
+            serialized = TypeAdapter(SerializedBlackboard).validate_json(file.read())
+        if isinstance(serialized.blackboard, FunctionCallBlackboard):
+            sessions[os.path.basename(path).split(".")[0]] = (
+                serialized.blackboard.internal_previously_generated_functions
+            )
+    return sessions
+
+
+def _is_relevant(function_call: FunctionCallSchema, creature_name: str) -> bool:
+    return creature_name in function_call.parameters.values()
+
+
+def _select(
+    function_calls: list[FunctionCallSchema], creature_name: str, budget: int
+) -> list[FunctionCallSchema]:
+    if budget <= 0:
+        return function_calls
+    return function_call_selection.select_function_calls_within_budget(
+        function_calls=function_calls,
+        user_prompt=f"Add a relationship: the {creature_name} fights a new creature",
+        agent_parameters={"creature_name": [creature_name]},
+        max_tokens=budget,
+    )
+
+
+def main() -> None:
+    sessions = _load_sessions(Config().temp_data_dir_path)
+    table = Table(title="Previously generated functions sent to an agent")
+    table.add_column("Session")
+    table.add_column("Calls", justify="right")
+    table.add_column("Budget", justify="right")
+    table.add_column("Tokens (avg)", justify="right")
+    table.add_column("Relevant kept", justify="right")
+    table.add_column("ms per agent", justify="right")
+
+    for session_name, function_calls in sessions.items():
+        creature_names = [
+            f.parameters["creature_name"]
+            for f in function_calls
+            if f.function_name == "AddCreature" and "creature_name" in f.parameters
+        ]
+        if not creature_names:
+            continue
+        for budget in BUDGETS:
+            total_tokens = 0
+            relevant_count = 0
+            relevant_kept_count = 0
+            start = time.perf_counter()
+            for creature_name in creature_names:
+                selected = _select(function_calls, creature_name, budget)
+                total_tokens += sum(
+                    function_call_selection.estimate_function_call_tokens(f)
+                    for f in selected
+                )
+                relevant_count += sum(
+                    _is_relevant(f, creature_name) for f in function_calls
+                )
+                relevant_kept_count += sum(
+                    _is_relevant(f, creature_name) for f in selected
+                )
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            table.add_row(
+                session_name,
+                str(len(function_calls)),
+                str(budget) if budget else "-",
+                str(total_tokens // len(creature_names)),
+                f"{relevant_kept_count / max(1, relevant_count):.0%}",
+                f"{elapsed_ms / len(creature_names):.2f}",
+            )
+
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark: the estimated size of the router's input, by the number of available agents.
+- compares sending all agents, with sending only the candidate agents (see agent_retrieval.py).
+- no LLM calls are made.
+
+Usage: python -m benchmarks.router_input_tokens
+"""
+
+from rich.console import Console
+from rich.table import Table
+
+from gpt_multi_atomic_agents import agent_retrieval, prompts_router, util_tokens
+from gpt_multi_atomic_agents.config import Config
+
+console = Console()
+
+SUBJECTS = [
+    "creature",
+    "vegetation",
+    "weather",
+    "terrain",
+    "building",
+    "vehicle",
+    "inventory",
+    "character",
+    "quest",
+    "music",
+    "lighting",
+    "camera",
+    "economy",
+    "dialogue",
+    "achievement",
+    "tutorial",
+    "map",
+    "sound",
+    "animation",
+    "physics",
+]
+ACTIONS = ["Creates", "Updates", "Removes", "Describes", "Validates"]
+
+AGENT_COUNTS = [5, 10, 25, 50, 100]
+
+USER_PROMPT = "Add a wolf creature that hunts at night"
+MAX_CANDIDATE_AGENTS = 20
+
+
+def _build_agent_descriptions(count: int) -> list[prompts_router.AgentDescription]:
+    agent_descriptions = []
+    for i in range(count):
+        subject = SUBJECTS[i % len(SUBJECTS)]
+        action = ACTIONS[(i // len(SUBJECTS)) % len(ACTIONS)]
+        agent_descriptions.append(
+            prompts_router.AgentDescription(
+                agent_name=f"{action} {subject} agent",
+                description=f"{action} {subject} objects in the game, given the user prompt. Ensures that ALL {subject} objects mentioned by the user are handled.",
+                topics=[subject, "summary"],
+                agent_parameter_names=[f"{subject}_name"],
+            )
+        )
+    return agent_descriptions
+
+
+def _estimate_router_input_tokens(
+    agent_descriptions: list[prompts_router.AgentDescription],
+) -> int:
+    router_input = prompts_router.build_input(
+        user_prompt=USER_PROMPT,
+        agent_descriptions=agent_descriptions,
+        chat_agent_description="Handles users questions about an ecosystem game like Sim Life",
+    )
+    system_prompt = (
+        prompts_router._build_system_prompt_generator_custom().generate_prompt()
+    )
+    return util_tokens.estimate_tokens(system_prompt + router_input.model_dump_json())
+
+
+def main() -> None:
+    config = Config(max_router_candidate_agents=MAX_CANDIDATE_AGENTS)
+    table = Table(title=f"Router input tokens (estimated) - prompt: '{USER_PROMPT}'")
+    table.add_column("Agents", justify="right")
+    table.add_column("All agents", justify="right")
+    table.add_column(
+        f"Candidates (top {config.max_router_candidate_agents})", justify="right"
+    )
+
+    for count in AGENT_COUNTS:
+        agent_descriptions = _build_agent_descriptions(count)
+        candidates = agent_retrieval.select_candidate_agents(
+            agent_descriptions=agent_descriptions,
+            user_prompt=USER_PROMPT,
+            messages=None,
+            previous_plan=None,
+            max_candidates=config.max_router_candidate_agents,
+        )
+        table.add_row(
+            str(count),
+            str(_estimate_router_input_tokens(agent_descriptions)),
+            str(_estimate_router_input_tokens(candidates)),
+        )
+
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,606 @@
+"""
+Benchmark suite: the generation pipeline and the blackboard operations, compared with a stored baseline.
+- runs offline: the LLM is the mock AI platform (see mock_llm.py), replaying canned responses. With no injected latency, this measures the framework's own overhead.
+- writes the results as JSON, and compares them with the baseline: exits with 1 if a result has regressed by more than its threshold.
+- the timings depend on the machine: after a deliberate change (or on a new machine), update the baseline via --update-baseline.
+
+Usage: python -m benchmarks.suite [--quick] [--output PATH] [--baseline PATH] [--update-baseline] [--llm-latency-seconds S]
+"""
+
+import argparse
+import contextlib
+import gc
+from dataclasses import asdict, dataclass
+import glob
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import typing
+
+from rich.console import Console
+from rich.table import Table
+from rich.text import Text
+
+from gpt_multi_atomic_agents import (
+    agent_retrieval,
+    blackboard_serde,
+    main_generator,
+    mock_llm,
+    prompts_router,
+    util_tokens,
+)
+from gpt_multi_atomic_agents.agent_definition import (
+    FunctionAgentDefinition,
+    build_function_agent_definition,
+)
+from gpt_multi_atomic_agents.blackboard import GraphQLBlackboard
+from gpt_multi_atomic_agents.config import AI_PLATFORM_Enum, Config, MOCK_LATENCY_Enum
+from gpt_multi_atomic_agents.functions_dto import (
+    FunctionAgentOutputSchema,
+    FunctionCallSchema,
+    FunctionSpecSchema,
+    ParameterSpec,
+    ParameterType,
+)
+
+from . import blackboard_matching, router_input_tokens
+
+console = Console()
+
+DEFAULT_OUTPUT_PATH = os.path.join("temp", "benchmark_results.json")
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# A result regresses if it is worse than the baseline by more than its threshold (a ratio).
+# Timings vary between runs, so their threshold is loose; sizes are deterministic.
+TIME_THRESHOLD = 0.5
+SIZE_THRESHOLD = 0.05
+MIN_TIMING_SECONDS = 0.05
+# A fixed workload, timed in each run: the other timings are compared after scaling the baseline by how fast this ran, so a slower (or busier) machine is not reported as a regression
+REFERENCE_RESULT_NAME = "reference.ms"
+
+PLAN_AGENT_COUNTS = [1, 2, 5, 10]
+ROUTER_AGENT_COUNTS = router_input_tokens.AGENT_COUNTS
+MATCHING_ENTRY_COUNTS = [1_000, 10_000, 100_000]
+SERDE_SCALES = [1, 10, 100]
+
+GENERATION_SUBJECTS = router_input_tokens.SUBJECTS[: max(PLAN_AGENT_COUNTS)]
+USER_PROMPT = "Add a wolf creature that hunts at night"
+CHAT_AGENT_DESCRIPTION = "Handles users questions about an ecosystem game like Sim Life"
+
+
+@dataclass
+class BenchmarkResult:
+    name: str  # the benchmark and its parameters, for example 'generate_with_blackboard.latency_ms[agents=5]'
+    value: float
+    unit: str
+    threshold: float
+    is_higher_better: bool = False
+    is_timing: bool = True  # timings are compared after allowing for the speed of the machine (see REFERENCE_RESULT_NAME)
+
+
+@dataclass
+class _Settings:
+    repeats: int
+    matching_entry_counts: list[int]
+    serde_scales: list[int]
+    llm_latency_seconds: float
+
+
+def _time_ms(function: typing.Callable[[], typing.Any], repeats: int) -> list[float]:
+    """
+    Time the function, in milliseconds per call: one timing per repeat (after one warm-up call).
+    - a fast function is called several times per timing, so that each timing is long enough to be stable (as timeit does).
+    - the garbage collector is paused while timing (as timeit does), since its pauses are a large source of noise.
+    """
+    start = time.perf_counter()
+    function()
+    warm_up_seconds = time.perf_counter() - start
+    loops = max(1, math.ceil(MIN_TIMING_SECONDS / max(warm_up_seconds, 1e-9)))
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(loops):
+                function()
+            timings.append((time.perf_counter() - start) * 1000 / loops)
+        finally:
+            gc.enable()
+    return timings
+
+
+@contextlib.contextmanager
+def _quiet() -> typing.Iterator[None]:
+    """Hide the console output of the framework (which is printed as it would be for a user)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def _build_generation_agents() -> list[FunctionAgentDefinition]:
+    agent_definitions = []
+    for subject in GENERATION_SUBJECTS:
+        function_spec = FunctionSpecSchema(
+            function_name=f"Add{subject.title()}",
+            description=f"Adds a new {subject} to the world",
+            parameters=[
+                ParameterSpec(name=f"{subject}_name", type=ParameterType.string)
+            ],
+        )
+        agent_definitions.append(
+            build_function_agent_definition(
+                agent_name=f"{subject.title()} Creator",
+                description=f"Creates new {subject} objects given the user prompt.",
+                accepted_functions=[function_spec],
+                functions_allowed_to_generate=[function_spec],
+                topics=[subject],
+            )
+        )
+    return agent_definitions
+
+
+def _add_cassette_entry(cassette: mock_llm.Cassette, response: typing.Any) -> None:
+    response_model_name = type(response).__name__
+    cassette.add(
+        mock_llm.CassetteEntry(
+            request_key=mock_llm.build_request_key(response_model_name, []),
+            response_model_name=response_model_name,
+            response_json=response.model_dump_json(),
+        )
+    )
+
+
+def _create_generation_cassette(
+    path: str, agent_definitions: list[FunctionAgentDefinition], plan_agent_count: int
+) -> None:
+    """A cassette with a router plan that recommends the first plan_agent_count agents, and a response for any function-calling agent."""
+    cassette = mock_llm.get_cassette(path)
+    _add_cassette_entry(
+        cassette,
+        prompts_router.RouterAgentOutputSchema(
+            execution_plan=prompts_router.AgentExecutionPlanSchema(
+                chat_message="Sure, I will add that.",
+                recommended_agents=[
+                    prompts_router.RecommendedAgent(
+                        agent_name=a.agent_name,
+                        rewritten_user_prompt=USER_PROMPT,
+                        agent_parameters={},
+                    )
+                    for a in agent_definitions[:plan_agent_count]
+                ],
+            )
+        ),
+    )
+    function_spec = agent_definitions[0].accepted_functions[0]
+    _add_cassette_entry(
+        cassette,
+        FunctionAgentOutputSchema(
+            chat_message="Added a wolf.",
+            generated_function_calls=[
+                FunctionCallSchema(
+                    agent_name="",
+                    function_name=function_spec.function_name,
+                    parameters={function_spec.parameters[0].name: "wolf"},
+                )
+            ],
+        ),
+    )
+
+
+def _benchmark_generation(settings: _Settings, temp_dir: str) -> list[BenchmarkResult]:
+    """End-to-end generate_with_blackboard(): the router, then the recommended agents."""
+    agent_definitions = _build_generation_agents()
+    results = []
+    for plan_agent_count in PLAN_AGENT_COUNTS:
+        cassette_path = os.path.join(temp_dir, f"generation-{plan_agent_count}.jsonl")
+        _create_generation_cassette(cassette_path, agent_definitions, plan_agent_count)
+        _config = Config(
+            ai_platform=AI_PLATFORM_Enum.mock,
+            mock_cassette_path=cassette_path,
+            mock_is_strict=False,
+            mock_latency=(
+                MOCK_LATENCY_Enum.constant
+                if settings.llm_latency_seconds > 0
+                else MOCK_LATENCY_Enum.none
+            ),
+            mock_latency_seconds=settings.llm_latency_seconds,
+        )
+
+        def _generate() -> None:
+            main_generator.generate_with_blackboard(
+                agent_definitions=list(agent_definitions),
+                chat_agent_description=CHAT_AGENT_DESCRIPTION,
+                _config=_config,
+                user_prompt=USER_PROMPT,
+            )
+
+        with _quiet():
+            timings = _time_ms(_generate, settings.repeats)
+        params = f"[agents={plan_agent_count}]"
+        if settings.llm_latency_seconds > 0:
+            # (not comparable with the results without latency)
+            params = f"[agents={plan_agent_count},llm_latency_s={settings.llm_latency_seconds}]"
+        results += [
+            BenchmarkResult(
+                name=f"generate_with_blackboard.latency_ms{params}",
+                value=statistics.median(timings),
+                unit="ms",
+                threshold=TIME_THRESHOLD,
+            ),
+            BenchmarkResult(
+                name=f"generate_with_blackboard.throughput{params}",
+                value=1000 * len(timings) / sum(timings),
+                unit="generations/s",
+                threshold=TIME_THRESHOLD,
+                is_higher_better=True,
+            ),
+        ]
+    return results
+
+
+def _build_router_input_json(
+    agent_descriptions: list[prompts_router.AgentDescription], _config: Config
+) -> str:
+    """Build the router's input as it is sent to the LLM: select the candidate agents, then serialize."""
+    candidates = agent_retrieval.select_candidate_agents(
+        agent_descriptions=agent_descriptions,
+        user_prompt=USER_PROMPT,
+        messages=None,
+        previous_plan=None,
+        max_candidates=_config.max_router_candidate_agents,
+    )
+    router_input_json: str = prompts_router.build_input(
+        user_prompt=USER_PROMPT,
+        agent_descriptions=candidates,
+        chat_agent_description=CHAT_AGENT_DESCRIPTION,
+    ).model_dump_json()
+    return router_input_json
+
+
+def _benchmark_router_input(settings: _Settings) -> list[BenchmarkResult]:
+    _config = Config(
+        max_router_candidate_agents=router_input_tokens.MAX_CANDIDATE_AGENTS
+    )
+    results = []
+    for agent_count in ROUTER_AGENT_COUNTS:
+        agent_descriptions = router_input_tokens._build_agent_descriptions(agent_count)
+        timings = _time_ms(
+            lambda: _build_router_input_json(agent_descriptions, _config),
+            settings.repeats,
+        )
+        params = f"[agents={agent_count}]"
+        results += [
+            BenchmarkResult(
+                name=f"router_input.build_ms{params}",
+                value=statistics.median(timings),
+                unit="ms",
+                threshold=TIME_THRESHOLD,
+            ),
+            BenchmarkResult(
+                name=f"router_input.tokens{params}",
+                value=util_tokens.estimate_tokens(
+                    _build_router_input_json(agent_descriptions, _config)
+                ),
+                unit="tokens",
+                threshold=SIZE_THRESHOLD,
+                is_timing=False,
+            ),
+        ]
+    return results
+
+
+def _build_mutations_blackboard(entry_count: int) -> GraphQLBlackboard:
+    blackboard = GraphQLBlackboard()
+    blackboard.add_generated_mutations(
+        [
+            f'mutation {{\n  addThing{i % blackboard_matching.FUNCTION_NAME_COUNT}(input: {{ name: "object{i}" }}) {{\n    id\n  }}\n}}'
+            for i in range(entry_count)
+        ]
+    )
+    return blackboard
+
+
+def _build_accepted_graphql_schemas() -> list[list[str]]:
+    return [
+        [
+            "type Mutation {\n"
+            + "".join(
+                f"  {name.replace('Function', 'addThing')}(input: ThingInput!): Thing\n"
+                for name in function_names
+            )
+            + "}"
+        ]
+        for function_names in blackboard_matching._build_accepted_function_names()
+    ]
+
+
+def _benchmark_matching(settings: _Settings) -> list[BenchmarkResult]:
+    """Each agent of a generation gets the previously generated functions (or mutations) that it accepts."""
+    accepted_function_names = blackboard_matching._build_accepted_function_names()
+    accepted_graphql_schemas = _build_accepted_graphql_schemas()
+    results = []
+    for entry_count in settings.matching_entry_counts:
+        function_blackboard = blackboard_matching._build_blackboard(entry_count)
+        mutation_blackboard = _build_mutations_blackboard(entry_count)
+        function_timings = _time_ms(
+            lambda: [
+                function_blackboard.get_generated_functions_matching(names)
+                for names in accepted_function_names
+            ],
+            settings.repeats,
+        )
+        mutation_timings = _time_ms(
+            lambda: [
+                mutation_blackboard.get_generated_mutations_matching(schemas)
+                for schemas in accepted_graphql_schemas
+            ],
+            settings.repeats,
+        )
+        params = f"[entries={entry_count},agents={blackboard_matching.AGENT_COUNT}]"
+        results += [
+            BenchmarkResult(
+                name=f"get_generated_functions_matching.ms{params}",
+                value=statistics.median(function_timings),
+                unit="ms",
+                threshold=TIME_THRESHOLD,
+            ),
+            BenchmarkResult(
+                name=f"get_generated_mutations_matching.ms{params}",
+                value=statistics.median(mutation_timings),
+                unit="ms",
+                threshold=TIME_THRESHOLD,
+            ),
+        ]
+    return results
+
+
+def _write_scaled_blackboard_file(source_path: str, scale: int, temp_dir: str) -> str:
+    """Copy a saved blackboard, with its generated calls and messages repeated 'scale' times (as after a long session)."""
+    with open(source_path, encoding="utf-8") as file:
+        json_data = json.load(file)
+    blackboard = json_data["blackboard"]
+    for key, value in blackboard.items():
+        if isinstance(value, list):
+            blackboard[key] = value * scale
+    scaled_path = os.path.join(temp_dir, f"x{scale}-{os.path.basename(source_path)}")
+    with open(scaled_path, "w", encoding="utf-8") as file:
+        json.dump(json_data, file)
+    return scaled_path
+
+
+def _benchmark_serde(settings: _Settings, temp_dir: str) -> list[BenchmarkResult]:
+    """Load and save all the saved blackboards in data-generated, scaled up."""
+    data_dir_path = Config().temp_data_dir_path
+    source_paths = sorted(
+        glob.glob(os.path.join(data_dir_path, "*.function_call.json"))
+        + glob.glob(os.path.join(data_dir_path, "*.graphql.json"))
+    )
+    if not source_paths:
+        console.print(Text("No saved blackboards to benchmark", style="yellow"))
+        return []
+    results = []
+    for scale in settings.serde_scales:
+        paths = [
+            _write_scaled_blackboard_file(p, scale, temp_dir) for p in source_paths
+        ]
+        blackboards = [blackboard_serde.load_blackboard_from_path(p) for p in paths]
+        load_timings = _time_ms(
+            lambda: [blackboard_serde.load_blackboard_from_path(p) for p in paths],
+            settings.repeats,
+        )
+
+        def _save_all() -> None:
+            for blackboard, path in zip(blackboards, paths):
+                blackboard_serde.save_blackboard_to_path(blackboard, path + ".saved")
+
+        save_timings = _time_ms(_save_all, settings.repeats)
+        params = f"[files={len(paths)},scale={scale}]"
+        results += [
+            BenchmarkResult(
+                name=f"blackboard_serde.load_ms{params}",
+                value=statistics.median(load_timings),
+                unit="ms",
+                threshold=TIME_THRESHOLD,
+            ),
+            BenchmarkResult(
+                name=f"blackboard_serde.save_ms{params}",
+                value=statistics.median(save_timings),
+                unit="ms",
+                threshold=TIME_THRESHOLD,
+            ),
+        ]
+    return results
+
+
+def _run_reference_workload() -> None:
+    objects = [{"name": f"object{i}", "value": i * 7919 % 1000} for i in range(5_000)]
+    json.loads(json.dumps(sorted(objects, key=lambda o: (o["value"], o["name"]))))
+
+
+def run_benchmarks(settings: _Settings) -> list[BenchmarkResult]:
+    reference_timings: list[float] = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results = []
+        for title, run in [
+            (
+                "generate_with_blackboard",
+                lambda: _benchmark_generation(settings, temp_dir),
+            ),
+            ("router input", lambda: _benchmark_router_input(settings)),
+            ("matching", lambda: _benchmark_matching(settings)),
+            ("blackboard_serde", lambda: _benchmark_serde(settings, temp_dir)),
+        ]:
+            console.print(f"Benchmarking {title}...")
+            # (the reference is timed throughout, since the speed of the machine can vary during the run)
+            reference_timings += _time_ms(_run_reference_workload, settings.repeats)
+            results += run()
+        mock_llm.clear_cassettes()
+    return [
+        BenchmarkResult(
+            name=REFERENCE_RESULT_NAME,
+            value=statistics.median(reference_timings),
+            unit="ms",
+            threshold=0.0,
+        )
+    ] + results
+
+
+def _write_results(results: list[BenchmarkResult], path: str) -> None:
+    dir_path = os.path.dirname(path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    json_data = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+        },
+        "results": [asdict(r) for r in results],
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(json_data, file, indent=2)
+        file.write("\n")
+
+
+def _read_results(path: str) -> dict[str, BenchmarkResult]:
+    with open(path, encoding="utf-8") as file:
+        json_data = json.load(file)
+    return {r["name"]: BenchmarkResult(**r) for r in json_data["results"]}
+
+
+def get_change(
+    result: BenchmarkResult, baseline: BenchmarkResult, slowdown: float = 1.0
+) -> float:
+    """
+    How much worse the result is than the baseline, as a ratio: positive is a regression, negative an improvement.
+    - a timing is compared with the baseline scaled by the slowdown of this machine (this run's reference time / the baseline's).
+    """
+    if baseline.value == 0 or result.value == 0:
+        return 0.0 if baseline.value == result.value else float("inf")
+    ratio = result.value / baseline.value
+    if result.is_higher_better:
+        ratio = 1 / ratio
+    if result.is_timing:
+        ratio /= slowdown
+    return ratio - 1
+
+
+def _get_slowdown(
+    results: list[BenchmarkResult], baseline: dict[str, BenchmarkResult]
+) -> float:
+    reference = next((r for r in results if r.name == REFERENCE_RESULT_NAME), None)
+    baseline_reference = baseline.get(REFERENCE_RESULT_NAME)
+    if reference is None or baseline_reference is None or not baseline_reference.value:
+        return 1.0
+    return reference.value / baseline_reference.value
+
+
+def compare_with_baseline(
+    results: list[BenchmarkResult], baseline: dict[str, BenchmarkResult]
+) -> list[str]:
+    """Print the comparison, and return the names of the results that have regressed."""
+    slowdown = _get_slowdown(results, baseline)
+    table = Table(
+        title=f"Benchmark results (vs baseline) - this machine is {slowdown:.2f}x as slow as the baseline's, which the timing changes allow for"
+    )
+    table.add_column("Benchmark", overflow="fold")
+    table.add_column("Baseline", justify="right")
+    table.add_column("Result", justify="right")
+    table.add_column("Unit")
+    table.add_column("Change", justify="right")
+    table.add_column("Status")
+
+    regressions = []
+    for result in results:
+        baseline_result = baseline.get(result.name)
+        if result.name == REFERENCE_RESULT_NAME:
+            continue
+        if baseline_result is None:
+            table.add_row(
+                result.name, "-", f"{result.value:.3f}", result.unit, "-", "new"
+            )
+            continue
+        change = get_change(result, baseline_result, slowdown)
+        is_regression = change > baseline_result.threshold
+        if is_regression:
+            regressions.append(result.name)
+        table.add_row(
+            result.name,
+            f"{baseline_result.value:.3f}",
+            f"{result.value:.3f}",
+            result.unit,
+            f"{change:+.0%}",
+            Text("REGRESSED", style="red")
+            if is_regression
+            else Text("ok", style="green"),
+        )
+    console.print(table)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the generation pipeline and the blackboard operations (offline)."
+    )
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Save the results as the new baseline",
+    )
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Fewer repeats, and skip the largest sizes (the results are then only compared for the sizes that ran)",
+    )
+    parser.add_argument("--repeats", type=int, default=0)
+    parser.add_argument(
+        "--llm-latency-seconds",
+        type=float,
+        default=0.0,
+        help="Inject a constant latency into each LLM call (0 measures the framework's own overhead)",
+    )
+    args = parser.parse_args()
+
+    settings = _Settings(
+        repeats=args.repeats or (3 if args.quick else 10),
+        matching_entry_counts=MATCHING_ENTRY_COUNTS[:-1]
+        if args.quick
+        else MATCHING_ENTRY_COUNTS,
+        serde_scales=SERDE_SCALES[:-1] if args.quick else SERDE_SCALES,
+        llm_latency_seconds=args.llm_latency_seconds,
+    )
+    results = run_benchmarks(settings)
+    _write_results(results, args.output)
+    console.print(f"Wrote the results to {args.output}")
+
+    if args.update_baseline:
+        _write_results(results, args.baseline)
+        console.print(f"Updated the baseline {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        console.print(
+            Text(
+                f"No baseline at {args.baseline} - to create it, run with --update-baseline",
+                style="yellow",
+            )
+        )
+        return
+    regressions = compare_with_baseline(results, _read_results(args.baseline))
+    if regressions:
+        console.print(
+            Text(f"{len(regressions)} benchmark(s) regressed", style="bold red")
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+import copy
+from dataclasses import dataclass
+import hashlib
+import threading
+import typing
+
+from atomic_agents.agents.base_agent import BaseAgent
+from atomic_agents.lib.components.agent_memory import AgentMemory
+from atomic_agents.lib.components.system_prompt_generator import SystemPromptGenerator
+
+from . import metrics
+
+MAX_CACHED_AGENTS = 256
+
+
+class CachedSystemPromptGenerator(SystemPromptGenerator):
+    """
+    A system prompt generator that renders the prompt once, and then re-uses it.
+    - only for generators without context providers, since their info can change between calls.
+    """
+
+    def __init__(self, system_prompt_generator: SystemPromptGenerator) -> None:
+        # note: not calling super().__init__(), since that would extend the output instructions again
+        self.background = system_prompt_generator.background
+        self.steps = system_prompt_generator.steps
+        self.output_instructions = system_prompt_generator.output_instructions
+        self.context_providers = system_prompt_generator.context_providers
+        self._rendered_prompt: str = system_prompt_generator.generate_prompt()
+
+    def generate_prompt(self) -> str:
+        return self._rendered_prompt
+
+
+@dataclass
+class AgentCacheStats:
+    hits: int = 0
+    misses: int = 0
+    size: int = 0
+
+
+_cache: OrderedDict[str, BaseAgent] = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = AgentCacheStats()
+
+
+def build_cache_key(*parts: typing.Any) -> str:
+    """Build a content hash from the parts, which describe everything that the built agent depends on (for example: agent definition, Config, client)."""
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(str(part).encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def _copy_for_run(agent: BaseAgent) -> BaseAgent:
+    """Copy the cached agent, with its own empty memory, so that concurrent runs do not share state. This is much cheaper than building the agent again."""
+    agent_copy = copy.copy(agent)
+    agent_copy.memory = AgentMemory()
+    agent_copy.initial_memory = AgentMemory()
+    agent_copy.current_user_input = None
+    return agent_copy
+
+
+def get_or_create_agent(
+    key: str, create_agent: typing.Callable[[], BaseAgent]
+) -> BaseAgent:
+    """
+    Get a fully built agent from the cache, or else create it.
+    - the key should be a content hash (see build_cache_key()), so that the cache is invalidated when the agent definition or Config changes.
+    - the system prompt of a new agent is rendered once and then re-used.
+    - returns a copy, with its own memory, that is ready to run.
+    """
+    with _cache_lock:
+        agent = _cache.get(key)
+        if agent:
+            _cache.move_to_end(key)
+            _stats.hits += 1
+            return _copy_for_run(agent)
+        _stats.misses += 1
+
+    agent = create_agent()
+    if not agent.system_prompt_generator.context_providers:
+        agent.system_prompt_generator = CachedSystemPromptGenerator(
+            agent.system_prompt_generator
+        )
+
+    with _cache_lock:
+        _cache[key] = agent
+        while len(_cache) > MAX_CACHED_AGENTS:
+            _cache.popitem(last=False)
+
+    return _copy_for_run(agent)
+
+
+def get_agent_cache_stats() -> AgentCacheStats:
+    with _cache_lock:
+        return AgentCacheStats(hits=_stats.hits, misses=_stats.misses, size=len(_cache))
+
+
+def clear_agent_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def _collect_metrics() -> None:
+    stats = get_agent_cache_stats()
+    metrics.record_cache_stats(
+        "agent", hits=stats.hits, misses=stats.misses, size=stats.size
+    )
+
+
+metrics.get_metrics_registry().add_collector(_collect_metrics)
@@ -18,7 +18,7 @@ from .system_prompt_builders import (
 )
 from .util_pydantic import CustomBaseModel
 
-from . import util_output
+from . import function_call_selection, graphql_data, util_graphql, util_output
 from .blackboard import (
     Blackboard,
     FunctionCallBlackboard,
@@ -47,6 +47,10 @@ class AgentDefinitionBase(CustomBaseModel):
     description: str = Field(
         description="Describes the function of the agent. This acts as a mini prompt for the LLM."
     )
+    agent_group: str = Field(
+        description="Optional: the group of the agent, for example its domain. Used to route across many agents. By default, agents are grouped by their first topic.",
+        default="",
+    )
     input_schema: type[BaseIOSchema]
     initial_input: BaseIOSchema
     output_schema: type[BaseIOSchema]
@@ -78,6 +82,16 @@ class AgentDefinitionBase(CustomBaseModel):
     def get_agent_parameters(self) -> ParamNameToValues:
         raise NotImplementedError
 
+    @abstractmethod
+    def get_accepted_call_names(self) -> list[str]:
+        """The names of the calls (functions or mutations) that this agent understands as input."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_generated_call_names(self) -> list[str]:
+        """The names of the calls (functions or mutations) that this agent can generate."""
+        raise NotImplementedError
+
 
 class FunctionAgentDefinition(AgentDefinitionBase):
     input_schema: type[FunctionAgentInputSchema]
@@ -107,15 +121,26 @@ class FunctionAgentDefinition(AgentDefinitionBase):
     ) -> BaseIOSchema:
         function_blackboard = self._cast_blackboard(blackboard)
 
-        initial_input = self.initial_input
+        # Copy, so that the same agent definition can be used by parallel agents
+        initial_input = self.initial_input.model_copy()
         initial_input.user_input = rewritten_user_prompt
         initial_input.agent_parameters = agent_parameters
 
-        initial_input.previously_generated_functions = (
+        previously_generated_functions = (
             function_blackboard.get_generated_functions_matching(
                 self.get_accepted_function_names()
             )
         )
+        if config.max_previous_function_tokens_per_agent > 0:
+            previously_generated_functions = (
+                function_call_selection.select_function_calls_within_budget(
+                    function_calls=previously_generated_functions,
+                    user_prompt=rewritten_user_prompt,
+                    agent_parameters=agent_parameters,
+                    max_tokens=config.max_previous_function_tokens_per_agent,
+                )
+            )
+        initial_input.previously_generated_functions = previously_generated_functions
 
         util_output.print_debug(
             f"[{self.agent_name}] build_input(): {initial_input}", config
@@ -130,6 +155,14 @@ class FunctionAgentDefinition(AgentDefinitionBase):
     def get_accepted_function_names(self) -> list[str]:
         return [f.function_name for f in self.accepted_functions]
 
+    def get_accepted_call_names(self) -> list[str]:
+        return self.get_accepted_function_names()
+
+    def get_generated_call_names(self) -> list[str]:
+        return [
+            f.function_name for f in self.initial_input.functions_allowed_to_generate
+        ]
+
     def get_topics(self) -> list[str]:
         return self.initial_input.topics
 
@@ -161,12 +194,14 @@ def build_function_agent_definition(
     functions_allowed_to_generate: list[FunctionSpecSchema],
     topics: list[str],
     agent_parameters: ParamNameToValues | None = None,
+    agent_group: str = "",
 ) -> FunctionAgentDefinition:
     if not agent_parameters:
         agent_parameters = {}
     return FunctionAgentDefinition(
         agent_name=agent_name,
         description=description,
+        agent_group=agent_group,
         accepted_functions=accepted_functions,
         input_schema=FunctionAgentInputSchema,
         initial_input=FunctionAgentInputSchema(
@@ -199,6 +234,30 @@ class GraphQLAgentDefinition(AgentDefinitionBase):
             raise RuntimeError("Expected response to be a GraphQLAgentOutputSchema")
         return typing.cast(GraphQLAgentOutputSchema, response)
 
+    def _build_graphql_data(
+        self,
+        graphql_blackboard: GraphQLBlackboard,
+        config: Config,
+        agent_parameters: ParamNameToValues,
+    ) -> str:
+        user_data = graphql_blackboard.get_user_data()
+        if not config.is_graphql_data_pruning_enabled:
+            return user_data
+        user_data_index = graphql_blackboard.get_user_data_index()
+        if not user_data_index.is_prunable:
+            return user_data
+
+        pruned_data = user_data_index.get_data_for_agent(
+            accepted_graphql_schemas=self.accepted_graphql_schemas,
+            agent_parameters=agent_parameters
+            if config.is_graphql_data_narrowed_by_agent_parameters
+            else None,
+        )
+        graphql_data.record_pruning(
+            agent_name=self.agent_name, user_data=user_data, pruned_data=pruned_data
+        )
+        return pruned_data
+
     def build_input(
         self,
         rewritten_user_prompt: str,
@@ -208,12 +267,17 @@ class GraphQLAgentDefinition(AgentDefinitionBase):
     ) -> BaseIOSchema:
         graphql_blackboard = self._cast_blackboard(blackboard)
 
-        initial_input = self.initial_input
+        # Copy, so that the same agent definition can be used by parallel agents
+        initial_input = self.initial_input.model_copy()
 
         initial_input.user_input = rewritten_user_prompt
         initial_input.agent_parameters = agent_parameters
 
-        initial_input.graphql_data = graphql_blackboard.get_user_data()
+        initial_input.graphql_data = self._build_graphql_data(
+            graphql_blackboard=graphql_blackboard,
+            config=config,
+            agent_parameters=agent_parameters,
+        )
 
         initial_input.previously_generated_mutations = (
             graphql_blackboard.get_generated_mutations_matching(
@@ -233,6 +297,16 @@ class GraphQLAgentDefinition(AgentDefinitionBase):
     def get_system_prompt_builder(self, _config: Config) -> SystemPromptBuilderBase:
         return GraphQLSystemPromptBuilder(_config=_config)
 
+    def get_accepted_call_names(self) -> list[str]:
+        return util_graphql.parse_out_mutation_names_from_schemas(
+            self.accepted_graphql_schemas
+        )
+
+    def get_generated_call_names(self) -> list[str]:
+        return util_graphql.parse_out_mutation_names_from_schemas(
+            self.initial_input.mutations_allowed_to_generate
+        )
+
     def get_topics(self) -> list[str]:
         return self.initial_input.topics
 
@@ -256,12 +330,14 @@ def build_graphql_agent_definition(
     mutations_allowed_to_generate: list[str],
     topics: list[str],
     agent_parameters: ParamNameToValues | None = None,
+    agent_group: str = "",
 ) -> GraphQLAgentDefinition:
     if not agent_parameters:
         agent_parameters = {}
     return GraphQLAgentDefinition(
         agent_name=agent_name,
         description=description,
+        agent_group=agent_group,
         accepted_graphql_schemas=accepted_graphql_schemas,
         input_schema=GraphQLAgentInputSchema,
         initial_input=GraphQLAgentInputSchema(
@@ -0,0 +1,199 @@
+from dataclasses import dataclass
+import hashlib
+from itertools import zip_longest
+import threading
+
+from . import agent_scheduler
+from .agent_definition import AgentDefinitionBase
+from .config import Config
+from .prompts_group_router import AgentGroupSummary
+from .prompts_router import (
+    CHAT_AGENT_NAME,
+    AgentDescription,
+    AgentExecutionPlanSchema,
+    ParallelAgentsGroup,
+    RecommendedAgent,
+)
+
+DEFAULT_GROUP_NAME = "general"
+
+
+@dataclass
+class AgentGroup:
+    summary: AgentGroupSummary
+    agent_descriptions: list[AgentDescription]
+
+
+def _get_group_name(agent: AgentDescription) -> str:
+    if agent.agent_group:
+        return agent.agent_group
+    return agent.topics[0] if agent.topics else DEFAULT_GROUP_NAME
+
+
+def build_agent_groups(agent_descriptions: list[AgentDescription]) -> list[AgentGroup]:
+    """
+    Group the agents by their agent_group, or else by their first topic.
+    - the groups are in order of their first agent, and each group keeps the order of its agents.
+    """
+    groups: dict[str, AgentGroup] = {}
+    for agent in agent_descriptions:
+        group_name = _get_group_name(agent)
+        group = groups.get(group_name)
+        if group is None:
+            group = AgentGroup(
+                summary=AgentGroupSummary(group_name=group_name, topics=[]),
+                agent_descriptions=[],
+            )
+            groups[group_name] = group
+        group.agent_descriptions.append(agent)
+        group.summary.topics += [
+            t for t in agent.topics if t not in group.summary.topics
+        ]
+    return list(groups.values())
+
+
+MAX_CACHED_AGENT_GROUPS = 64
+
+_agent_groups: dict[str, list[AgentGroup]] = {}
+_lock = threading.Lock()
+
+
+def get_agent_groups(agent_descriptions: list[AgentDescription]) -> list[AgentGroup]:
+    """Get the groups of the agents: the groups and their summaries are only built once per agent set."""
+    key = hashlib.sha256(repr(agent_descriptions).encode()).hexdigest()
+    with _lock:
+        groups = _agent_groups.get(key)
+    if groups is None:
+        groups = build_agent_groups(agent_descriptions)
+        with _lock:
+            if len(_agent_groups) >= MAX_CACHED_AGENT_GROUPS:
+                _agent_groups.clear()
+            _agent_groups[key] = groups
+    return groups
+
+
+def is_hierarchical_routing_needed(
+    agent_groups: list[AgentGroup], _config: Config
+) -> bool:
+    agent_count = sum(len(g.agent_descriptions) for g in agent_groups)
+    return (
+        _config.hierarchical_routing_min_agents > 0
+        and agent_count >= _config.hierarchical_routing_min_agents
+        and len(agent_groups) > 1
+    )
+
+
+def select_agent_groups(
+    agent_groups: list[AgentGroup],
+    group_names: list[str],
+    previous_plan: AgentExecutionPlanSchema | None,
+) -> list[AgentGroup]:
+    """Select the named groups, plus the groups of the agents in the previous plan (since the user may be giving feedback about them)."""
+    previous_agent_names = (
+        {a.agent_name for a in previous_plan.recommended_agents}
+        if previous_plan
+        else set()
+    )
+    return [
+        g
+        for g in agent_groups
+        if g.summary.group_name in group_names
+        or any(a.agent_name in previous_agent_names for a in g.agent_descriptions)
+    ]
+
+
+def _is_chat_agent(agent: RecommendedAgent) -> bool:
+    return agent.agent_name == CHAT_AGENT_NAME
+
+
+def _build_merged_dependencies(
+    recommended_agents: list[RecommendedAgent],
+    plan_index_of_agent: list[int],
+    stage_index_of_agent: list[int],
+    agent_definitions: list[AgentDefinitionBase] | None,
+) -> list[list[int]]:
+    """
+    Build the dependencies of the merged plan (see agent_scheduler.build_dependencies()).
+    - an agent waits for the earlier stages of its own plan, as the router of its group planned.
+    - an agent of another group can still produce the calls that the agent reads: so it also waits for those agents. Without the agent definitions, that is not known, so it waits for all the earlier agents of the other groups.
+    """
+    dependencies_across_plans = (
+        agent_scheduler.build_dependencies(
+            recommended_agents=recommended_agents, agent_definitions=agent_definitions
+        )
+        if agent_definitions is not None
+        else [list(range(i)) for i in range(len(recommended_agents))]
+    )
+    dependencies: list[list[int]] = []
+    for i, agent_dependencies in enumerate(dependencies_across_plans):
+        dependencies.append(
+            [
+                j
+                for j in range(i)
+                if j in agent_dependencies
+                or (
+                    plan_index_of_agent[j] == plan_index_of_agent[i]
+                    and stage_index_of_agent[j] < stage_index_of_agent[i]
+                )
+            ]
+        )
+    return dependencies
+
+
+def merge_plans(
+    plans: list[AgentExecutionPlanSchema],
+    agent_definitions: list[AgentDefinitionBase] | None = None,
+) -> AgentExecutionPlanSchema:
+    """
+    Merge the plans from routing within each group, into one plan.
+    - the agents are in order of stage, then of group. Their stages are scheduled from their dependencies (see _build_merged_dependencies()): so agents of different groups run together, unless one reads the calls that the other generates.
+    - the chat agent (and its message) is only kept if no other agent was recommended.
+    """
+    # Only keep the plans that recommend a real agent, else the chat messages of the other groups would say that they cannot help
+    plans_with_agents = [
+        p for p in plans if not all(_is_chat_agent(a) for a in p.recommended_agents)
+    ]
+    if plans_with_agents:
+        plans = plans_with_agents
+        plans_stages = [
+            [
+                [a for a in stage if not _is_chat_agent(a)]
+                for stage in p.get_agent_stages()
+            ]
+            for p in plans
+        ]
+    else:
+        plans = plans[:1]
+        plans_stages = [p.get_agent_stages()[:1] for p in plans]
+
+    chat_messages: list[str] = []
+    for plan in plans:
+        if plan.chat_message and plan.chat_message not in chat_messages:
+            chat_messages.append(plan.chat_message)
+
+    recommended_agents: list[RecommendedAgent] = []
+    plan_index_of_agent: list[int] = []
+    stage_index_of_agent: list[int] = []
+    for stage_index, stages in enumerate(zip_longest(*plans_stages, fillvalue=[])):
+        for plan_index, plan_stage in enumerate(stages):
+            recommended_agents += plan_stage
+            plan_index_of_agent += [plan_index] * len(plan_stage)
+            stage_index_of_agent += [stage_index] * len(plan_stage)
+
+    merged_stages = agent_scheduler.build_waves(
+        recommended_agents=recommended_agents,
+        dependencies=_build_merged_dependencies(
+            recommended_agents=recommended_agents,
+            plan_index_of_agent=plan_index_of_agent,
+            stage_index_of_agent=stage_index_of_agent,
+            agent_definitions=agent_definitions,
+        ),
+    )
+    return AgentExecutionPlanSchema(
+        chat_message=" ".join(chat_messages),
+        recommended_agents=recommended_agents,
+        parallel_agent_groups=[
+            ParallelAgentsGroup(agent_names=[a.agent_name for a in stage])
+            for stage in merged_stages
+        ],
+    )
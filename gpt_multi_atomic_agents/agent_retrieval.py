@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import re
+import threading
+
+import numpy as np
+
+from .blackboard import Message
+from .prompts_router import AgentDescription, AgentExecutionPlanSchema
+
+logger = logging.getLogger(__file__)
+
+# BM25 parameters: term frequency saturation, and document length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# The topics describe when an agent should be used, so they count more than the words of the description
+TOPIC_WEIGHT = 3
+
+# The recent messages help when the user refers to them (for example: 'add another one')
+MAX_RECENT_MESSAGES = 3
+
+# If no agent scores at least this much, then the prompt only shares common words (or none) with the agents: the ranking means nothing, so all agents are sent to the router.
+# (a term that only a few agents have scores above 1)
+MIN_TOP_SCORE = 1.0
+
+
+def _tokenize(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def _get_agent_terms(agent: AgentDescription) -> list[str]:
+    terms = _tokenize(agent.agent_name) + _tokenize(agent.description)
+    for topic in agent.topics:
+        terms += _tokenize(topic) * TOPIC_WEIGHT
+    for name in agent.agent_parameter_names:
+        terms += _tokenize(name.replace("_", " "))
+    return terms
+
+
+class AgentRetriever:
+    """
+    Scores agents against a prompt via BM25 over their names, descriptions, topics and parameter names.
+    - the term matrix (agents x vocabulary) is built once per agent set, so scoring is a few vectorized operations.
+    """
+
+    def __init__(self, agent_descriptions: list[AgentDescription]) -> None:
+        agents_terms = [_get_agent_terms(a) for a in agent_descriptions]
+        self._vocabulary: dict[str, int] = {}
+        for terms in agents_terms:
+            for term in terms:
+                self._vocabulary.setdefault(term, len(self._vocabulary))
+
+        term_frequencies = np.zeros(
+            (len(agent_descriptions), len(self._vocabulary)), dtype=np.float32
+        )
+        for row, terms in enumerate(agents_terms):
+            for term in terms:
+                term_frequencies[row, self._vocabulary[term]] += 1.0
+
+        agent_count = len(agent_descriptions)
+        document_frequencies = np.count_nonzero(term_frequencies, axis=0)
+        self._idf = np.log(
+            1.0
+            + (agent_count - document_frequencies + 0.5) / (document_frequencies + 0.5)
+        ).astype(np.float32)
+
+        lengths = term_frequencies.sum(axis=1, keepdims=True)
+        average_length = max(float(lengths.mean()), 1.0) if agent_count else 1.0
+        # The saturated term frequencies do not depend on the query, so are computed up front
+        self._weights = (term_frequencies * (BM25_K1 + 1)) / (
+            term_frequencies
+            + BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+        )
+
+    def score(self, query: str) -> np.ndarray:
+        """Get the BM25 score of each agent, in the order of the agent descriptions."""
+        query_columns = [
+            self._vocabulary[t] for t in set(_tokenize(query)) if t in self._vocabulary
+        ]
+        if not query_columns:
+            return np.zeros(self._weights.shape[0], dtype=np.float32)
+        scores: np.ndarray = self._weights[:, query_columns] @ self._idf[query_columns]
+        return scores
+
+
+MAX_CACHED_RETRIEVERS = 64
+
+_retrievers: dict[str, AgentRetriever] = {}
+_lock = threading.Lock()
+
+
+def _get_retriever(agent_descriptions: list[AgentDescription]) -> AgentRetriever:
+    key = hashlib.sha256(repr(agent_descriptions).encode()).hexdigest()
+    with _lock:
+        retriever = _retrievers.get(key)
+    if retriever is None:
+        retriever = AgentRetriever(agent_descriptions=agent_descriptions)
+        with _lock:
+            if len(_retrievers) >= MAX_CACHED_RETRIEVERS:
+                _retrievers.clear()
+            _retrievers[key] = retriever
+    return retriever
+
+
+def _build_query(user_prompt: str, messages: list[Message] | None) -> str:
+    recent_messages = (messages or [])[-MAX_RECENT_MESSAGES:]
+    return " ".join([user_prompt] + [m.message for m in recent_messages])
+
+
+def select_candidate_agents(
+    agent_descriptions: list[AgentDescription],
+    user_prompt: str,
+    messages: list[Message] | None,
+    previous_plan: AgentExecutionPlanSchema | None,
+    max_candidates: int,
+) -> list[AgentDescription]:
+    """
+    Select the agents that are most relevant to the prompt, so the router prompt does not grow with the number of agents.
+    - the agents of the previous plan are always kept, since the user may be giving feedback about them.
+    - the selected agents keep their original order.
+    - if max_candidates is 0, or there are not more agents than that, then all agents are returned.
+    - if no agent is relevant enough (see MIN_TOP_SCORE), for example when the prompt has no words in common with the agents, then all agents are returned.
+    """
+    if max_candidates <= 0 or len(agent_descriptions) <= max_candidates:
+        return agent_descriptions
+
+    scores = _get_retriever(agent_descriptions).score(
+        _build_query(user_prompt=user_prompt, messages=messages)
+    )
+    if not len(scores) or float(scores.max()) < MIN_TOP_SCORE:
+        logger.info("No agent matches the prompt well enough: routing with all agents")
+        return agent_descriptions
+
+    # Stable sort, so agents with equal scores keep their order
+    ranked_rows = np.argsort(-scores, kind="stable")[:max_candidates]
+
+    selected_rows = set(int(r) for r in ranked_rows)
+    if previous_plan:
+        previous_agent_names = {a.agent_name for a in previous_plan.recommended_agents}
+        selected_rows.update(
+            i
+            for i, a in enumerate(agent_descriptions)
+            if a.agent_name in previous_agent_names
+        )
+
+    logger.info(
+        f"Selected {len(selected_rows)} of {len(agent_descriptions)} agents for routing"
+    )
+    return [agent_descriptions[i] for i in sorted(selected_rows)]
@@ -0,0 +1,90 @@
+import logging
+
+from .agent_definition import AgentDefinitionBase
+from .prompts_router import RecommendedAgent
+
+logger = logging.getLogger(__file__)
+
+
+def _find_agent_definition_or_none(
+    agent_name: str, agent_definitions: list[AgentDefinitionBase]
+) -> AgentDefinitionBase | None:
+    for agent_definition in agent_definitions:
+        if agent_definition.agent_name == agent_name:
+            return agent_definition
+    return None
+
+
+def is_dependent(
+    consumer: AgentDefinitionBase | None, producer: AgentDefinitionBase | None
+) -> bool:
+    """Does the consumer agent read any of the calls that the producer agent generates?"""
+    if not consumer or not producer:
+        return False
+    accepted = set(consumer.get_accepted_call_names())
+    return any(name in accepted for name in producer.get_generated_call_names())
+
+
+def build_dependencies(
+    recommended_agents: list[RecommendedAgent],
+    agent_definitions: list[AgentDefinitionBase],
+) -> list[list[int]]:
+    """
+    Build the dependency graph of the plan, from the calls that each agent accepts and generates.
+    - returns, for each recommended agent, the indices of the earlier agents that it depends on.
+    - an agent only depends on agents that come before it in the plan, so the plan's order is respected and there are no cycles.
+    """
+    definitions = [
+        _find_agent_definition_or_none(a.agent_name, agent_definitions)
+        for a in recommended_agents
+    ]
+
+    dependencies: list[list[int]] = []
+    for i, consumer in enumerate(definitions):
+        dependencies.append(
+            [j for j in range(i) if is_dependent(consumer, definitions[j])]
+        )
+    return dependencies
+
+
+def build_waves(
+    recommended_agents: list[RecommendedAgent], dependencies: list[list[int]]
+) -> list[list[RecommendedAgent]]:
+    """
+    Schedule the recommended agents into waves, given the indices of the earlier agents that each one depends on (see build_dependencies()).
+    - each agent runs in the wave after the last of its dependencies.
+    - within a wave, the agents keep the order of the plan.
+    """
+    wave_of_agent: list[int] = []
+    for agent_dependencies in dependencies:
+        wave_of_agent.append(
+            1 + max((wave_of_agent[j] for j in agent_dependencies), default=-1)
+        )
+
+    waves: list[list[RecommendedAgent]] = [
+        [] for _ in range(max(wave_of_agent, default=-1) + 1)
+    ]
+    for recommended_agent, wave in zip(recommended_agents, wave_of_agent):
+        waves[wave].append(recommended_agent)
+    return waves
+
+
+def build_execution_stages(
+    recommended_agents: list[RecommendedAgent],
+    agent_definitions: list[AgentDefinitionBase],
+) -> list[list[RecommendedAgent]]:
+    """
+    Schedule the recommended agents into waves: agents with no producer/consumer relationship run together, and an agent that reads another agent's output waits for it.
+    - within a wave, the agents keep the order of the plan.
+    """
+    waves = build_waves(
+        recommended_agents=recommended_agents,
+        dependencies=build_dependencies(
+            recommended_agents=recommended_agents, agent_definitions=agent_definitions
+        ),
+    )
+
+    logger.info(
+        f"Scheduled {len(recommended_agents)} agents into {len(waves)} waves: {[[a.agent_name for a in w] for w in waves]}"
+    )
+    return waves
@@ -1,11 +1,15 @@
+import bisect
 from dataclasses import dataclass
 from enum import StrEnum, auto
+import heapq
+import typing
 
-from pydantic import Field
+from pydantic import Field, PrivateAttr, field_validator
 
 from .util_pydantic import CustomBaseModel
 
-from .functions_dto import FunctionCallSchema
+from .functions_dto import FunctionCallSchema, get_function_call_id
+from .graphql_data import GraphQLDataIndex
 from . import util_graphql
 from . import rest_api_examples
 
@@ -26,6 +30,95 @@ class Message:
     message: str
 
 
+class HistorySummary(CustomBaseModel):
+    """A summary of the older messages of a chat, so that the Router's input stays bounded (see chat_history.py)."""
+
+    summary: str
+    message_count: int = Field(
+        description="The number of messages, from the start of the chat, that the summary covers"
+    )
+
+
+class FunctionCallDeltaOperation(StrEnum):
+    add = auto()
+    remove = auto()
+    replace_ = "replace"  # (named with a trailing underscore, since 'replace' would hide str.replace())
+
+
+class FunctionCallDelta(CustomBaseModel):
+    """One change to the client data: add a function call, or remove or replace an existing function call (identified by its id - see get_function_call_id())."""
+
+    operation: FunctionCallDeltaOperation = Field(description="The type of change")
+    function_call_id: str | None = Field(
+        description="For remove or replace: the id of the existing function call",
+        default=None,
+    )
+    function_call: FunctionCallSchema | None = Field(
+        description="For add or replace: the new function call", default=None
+    )
+
+
+@dataclass
+class FunctionCallBlackboardCheckpoint:
+    """The state of a blackboard before a request changes it, so the changes can be undone if the request fails (see FunctionCallBlackboard.create_checkpoint())."""
+
+    function_calls: list[FunctionCallSchema]
+    function_call_count: int
+    function_calls_copy: list[FunctionCallSchema] | None
+    previous_message_count: int
+    history_summary: HistorySummary | None
+    newly_generated_messages: list[Message]
+    newly_generated_functions: list[FunctionCallSchema]
+
+
+class _ChangeCountingList(list[FunctionCallSchema]):
+    """
+    A list of function calls that counts its changes, other than appends: so the indexes of the blackboard can tell when they are stale, even if a client edits the list in place.
+    - appends are not counted, since the indexes add the appended calls incrementally.
+    """
+
+    change_count: int = 0
+
+    def _on_change(self) -> None:
+        self.change_count += 1
+
+    def __setitem__(self, index: typing.Any, value: typing.Any) -> None:
+        super().__setitem__(index, value)
+        self._on_change()
+
+    def __delitem__(self, index: typing.Any) -> None:
+        super().__delitem__(index)
+        self._on_change()
+
+    def __imul__(self, count: typing.SupportsIndex) -> typing.Self:
+        self._on_change()
+        return super().__imul__(count)
+
+    def insert(self, index: typing.SupportsIndex, value: FunctionCallSchema) -> None:
+        super().insert(index, value)
+        self._on_change()
+
+    def remove(self, value: FunctionCallSchema) -> None:
+        super().remove(value)
+        self._on_change()
+
+    def pop(self, index: typing.SupportsIndex = -1) -> FunctionCallSchema:
+        self._on_change()
+        return super().pop(index)
+
+    def clear(self) -> None:
+        super().clear()
+        self._on_change()
+
+    def sort(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        super().sort(*args, **kwargs)
+        self._on_change()
+
+    def reverse(self) -> None:
+        super().reverse()
+        self._on_change()
+
+
 class FunctionCallBlackboard(CustomBaseModel):
     format: BlackboardFormat = Field(
         description="The data format of the blackboard",
@@ -35,7 +128,7 @@ class FunctionCallBlackboard(CustomBaseModel):
     internal_previously_generated_functions: list[FunctionCallSchema] = Field(
         description="All previously generated functions: either from client (representing its data) or from agents in this generation",
         examples=[[rest_api_examples.example_create_creature_call__wolf]],
-        default_factory=list,
+        default_factory=_ChangeCountingList,
     )
     # All previous messages in this chat (series of generations)
     internal_previous_messages: list[Message] = Field(
@@ -51,6 +144,9 @@ class FunctionCallBlackboard(CustomBaseModel):
         ],
     )
 
+    # A summary of the older messages, sent to the Router instead of them (see chat_history.py). Replaced as a whole, when refreshed.
+    internal_history_summary: HistorySummary | None = Field(default=None)
+
     # Messages that were newly-generated during this generation (required for client to know what new messages to display)
     internal_newly_generated_messages: list[Message] = Field(
         default_factory=list, examples=[[]]
@@ -61,21 +157,98 @@ class FunctionCallBlackboard(CustomBaseModel):
         default_factory=list, examples=[[]]
     )
 
+    # The id of each function call in internal_previously_generated_functions, and an index from id to positions. Built on first use by apply_user_data_delta().
+    _function_call_ids: list[str] | None = PrivateAttr(default=None)
+    _function_call_positions: dict[str, list[int]] = PrivateAttr(default_factory=dict)
+
+    # An index from function name to the positions of its calls in internal_previously_generated_functions (in insertion order). Built on first use by get_generated_functions_matching().
+    # Appended calls are indexed incrementally.
+    _function_name_positions: dict[str, list[int]] = PrivateAttr(default_factory=dict)
+    _function_name_indexed_count: int = PrivateAttr(default=0)
+
+    # The list, and its change count, that the indexes were built from: if the list is replaced or changed in place (other than by appending), then the indexes are rebuilt.
+    _indexed_function_calls: list[FunctionCallSchema] | None = PrivateAttr(default=None)
+    _indexed_change_count: int = PrivateAttr(default=0)
+
+    @field_validator("internal_previously_generated_functions", mode="after")
+    @classmethod
+    def _to_change_counting_list(
+        cls, function_calls: list[FunctionCallSchema]
+    ) -> list[FunctionCallSchema]:
+        return _ChangeCountingList(function_calls)
+
+    def __setattr__(self, name: str, value: typing.Any) -> None:
+        # (so a list that is assigned directly is also tracked - see _invalidate_indexes_if_changed())
+        if name == "internal_previously_generated_functions" and not isinstance(
+            value, _ChangeCountingList
+        ):
+            value = _ChangeCountingList(value)
+        super().__setattr__(name, value)
+
+    def _get_change_count(self) -> int:
+        function_calls = self.internal_previously_generated_functions
+        if not isinstance(function_calls, _ChangeCountingList):
+            # (for example, if built via model_construct(), which skips the validators)
+            self.internal_previously_generated_functions = function_calls
+            function_calls = self.internal_previously_generated_functions
+        return typing.cast(_ChangeCountingList, function_calls).change_count
+
+    def _invalidate_indexes_if_changed(self) -> None:
+        """Drop the indexes if the list was replaced, or changed other than by appending (for example, by a client that edits the public list directly)."""
+        change_count = self._get_change_count()
+        function_calls = self.internal_previously_generated_functions
+        if (
+            function_calls is self._indexed_function_calls
+            and change_count == self._indexed_change_count
+        ):
+            return
+        self._function_call_ids = None
+        self._invalidate_function_name_positions()
+        self._indexed_function_calls = function_calls
+        self._indexed_change_count = change_count
+
+    def _mark_indexes_up_to_date(self) -> None:
+        """After the blackboard's own changes to the list, which also updated the indexes."""
+        self._indexed_change_count = self._get_change_count()
+
     def add_generated_functions(
         self, generated_function_calls: list[FunctionCallSchema]
     ) -> None:
-        self.internal_previously_generated_functions += generated_function_calls
-        self.internal_newly_generated_functions += generated_function_calls
+        self._invalidate_indexes_if_changed()
+        self.internal_previously_generated_functions.extend(generated_function_calls)
+        self.internal_newly_generated_functions.extend(generated_function_calls)
+        if self._function_call_ids is not None:
+            for function_call in generated_function_calls:
+                self._add_function_call_id(get_function_call_id(function_call))
+
+    def _invalidate_function_name_positions(self) -> None:
+        self._function_name_positions = {}
+        self._function_name_indexed_count = 0
+
+    def _ensure_function_name_positions(self) -> None:
+        """Bring the function name index up to date: the calls appended since the last use are indexed incrementally."""
+        self._invalidate_indexes_if_changed()
+        function_calls = self.internal_previously_generated_functions
+        for position in range(self._function_name_indexed_count, len(function_calls)):
+            self._function_name_positions.setdefault(
+                function_calls[position].function_name, []
+            ).append(position)
+        self._function_name_indexed_count = len(function_calls)
 
     def get_generated_functions_matching(
         self, function_names: list[str]
     ) -> list[FunctionCallSchema]:
-        return list(
-            filter(
-                lambda f: f.function_name in function_names,
-                self.internal_previously_generated_functions,
-            )
-        )
+        """Get the function calls of the given functions, in the order they were added. Costs O(matching calls), via an index of the function names."""
+        self._ensure_function_name_positions()
+        positions_by_name = [
+            self._function_name_positions[name]
+            for name in dict.fromkeys(function_names)
+            if name in self._function_name_positions
+        ]
+        function_calls = self.internal_previously_generated_functions
+        if len(positions_by_name) == 1:
+            return [function_calls[p] for p in positions_by_name[0]]
+        return [function_calls[p] for p in heapq.merge(*positions_by_name)]
 
     def add_message(self, message: Message) -> None:
         self.internal_previous_messages.append(message)
@@ -90,8 +263,11 @@ class FunctionCallBlackboard(CustomBaseModel):
         """
         self.internal_previously_generated_functions.clear()
         self.internal_previous_messages.clear()
+        self.internal_history_summary = None
         self.internal_newly_generated_messages.clear()
         self.internal_newly_generated_functions.clear()
+        self._function_call_ids = None
+        self._invalidate_function_name_positions()
 
     def _reset(self) -> None:
         """Resets newly created functions, to prepare for next generation"""
@@ -106,6 +282,193 @@ class FunctionCallBlackboard(CustomBaseModel):
         """Receives the new version of user data, by setting the function-calls list, so is ready for next generation."""
         self._reset()
         self.internal_previously_generated_functions = user_data
+        self._function_call_ids = None
+        self._invalidate_function_name_positions()
+
+    def _add_function_call_id(self, function_call_id: str) -> None:
+        assert self._function_call_ids is not None
+        self._function_call_positions.setdefault(function_call_id, []).append(
+            len(self._function_call_ids)
+        )
+        self._function_call_ids.append(function_call_id)
+
+    def _build_function_call_positions(self) -> None:
+        assert self._function_call_ids is not None
+        self._function_call_positions = {}
+        for position, function_call_id in enumerate(self._function_call_ids):
+            self._function_call_positions.setdefault(function_call_id, []).append(
+                position
+            )
+
+    def _ensure_function_call_ids(self) -> None:
+        self._invalidate_indexes_if_changed()
+        if self._function_call_ids is not None and len(self._function_call_ids) == len(
+            self.internal_previously_generated_functions
+        ):
+            return
+        # The list was set directly (for example, from a request), so hash each function call once
+        self._function_call_ids = [
+            get_function_call_id(f)
+            for f in self.internal_previously_generated_functions
+        ]
+        self._build_function_call_positions()
+
+    def _move_function_name_position(
+        self, position: int, old_function_name: str, new_function_name: str
+    ) -> None:
+        is_indexed = position < self._function_name_indexed_count
+        if old_function_name == new_function_name or not is_indexed:
+            return
+        old_positions = self._function_name_positions[old_function_name]
+        del old_positions[bisect.bisect_left(old_positions, position)]
+        bisect.insort(
+            self._function_name_positions.setdefault(new_function_name, []), position
+        )
+
+    def _drop_positions(self, removed_positions: list[int]) -> None:
+        """Drop the removed function calls from the list, and shift the later positions of the indexes down (instead of rebuilding the indexes)."""
+        removed = set(removed_positions)
+
+        def _shift(positions: list[int]) -> list[int]:
+            return [
+                p - bisect.bisect_left(removed_positions, p)
+                for p in positions
+                if p not in removed
+            ]
+
+        assert self._function_call_ids is not None
+        self.internal_previously_generated_functions[:] = [
+            f
+            for i, f in enumerate(self.internal_previously_generated_functions)
+            if i not in removed
+        ]
+        self._function_call_ids = [
+            function_call_id
+            for i, function_call_id in enumerate(self._function_call_ids)
+            if i not in removed
+        ]
+        for function_call_id, positions in self._function_call_positions.items():
+            self._function_call_positions[function_call_id] = _shift(positions)
+        for function_name, positions in self._function_name_positions.items():
+            self._function_name_positions[function_name] = _shift(positions)
+        self._function_name_indexed_count -= bisect.bisect_left(
+            removed_positions, self._function_name_indexed_count
+        )
+
+    def _pop_position_of(self, function_call_id: str | None) -> int:
+        # The first position, since the ids refer to the data before the changes
+        return self._function_call_positions[function_call_id or ""].pop(0)
+
+    def check_user_data_delta(self, deltas: list[FunctionCallDelta]) -> None:
+        """Check that the changes can be applied (see apply_user_data_delta()), without changing the data. Raises RuntimeError if not."""
+        self._ensure_function_call_ids()
+        self._check_user_data_delta(deltas)
+
+    def create_checkpoint(
+        self, is_user_data_delta_pending: bool = False
+    ) -> FunctionCallBlackboardCheckpoint:
+        """
+        Record the state of the blackboard, so that the changes of a request can be undone by restore_checkpoint() if it fails. Much cheaper than a deep copy:
+        - messages and function calls are only appended by a generation, so only their counts are recorded.
+        - set_user_data() replaces the list of function calls, so the old list is kept as it is.
+        - only if apply_user_data_delta() will change the list in place, then it is copied (a shallow copy: the function calls are replaced, never changed).
+        """
+        function_calls = self.internal_previously_generated_functions
+        return FunctionCallBlackboardCheckpoint(
+            function_calls=function_calls,
+            function_call_count=len(function_calls),
+            function_calls_copy=list(function_calls)
+            if is_user_data_delta_pending
+            else None,
+            previous_message_count=len(self.internal_previous_messages),
+            history_summary=self.internal_history_summary,
+            newly_generated_messages=list(self.internal_newly_generated_messages),
+            newly_generated_functions=list(self.internal_newly_generated_functions),
+        )
+
+    def restore_checkpoint(self, checkpoint: FunctionCallBlackboardCheckpoint) -> None:
+        """Undo the changes since create_checkpoint(). The indexes are rebuilt on next use."""
+        if checkpoint.function_calls_copy is not None:
+            self.internal_previously_generated_functions = (
+                checkpoint.function_calls_copy
+            )
+        else:
+            self.internal_previously_generated_functions = checkpoint.function_calls
+            del self.internal_previously_generated_functions[
+                checkpoint.function_call_count :
+            ]
+        del self.internal_previous_messages[checkpoint.previous_message_count :]
+        self.internal_history_summary = checkpoint.history_summary
+        self.internal_newly_generated_messages = checkpoint.newly_generated_messages
+        self.internal_newly_generated_functions = checkpoint.newly_generated_functions
+
+    def _check_user_data_delta(self, deltas: list[FunctionCallDelta]) -> None:
+        """Check all the changes before applying any, so that an invalid change does not leave the data half-changed."""
+        used_counts: dict[str, int] = {}
+        for delta in deltas:
+            is_function_call_needed = (
+                delta.operation != FunctionCallDeltaOperation.remove
+            )
+            if is_function_call_needed and not delta.function_call:
+                raise RuntimeError(
+                    f"An '{delta.operation}' change needs a function_call"
+                )
+            if delta.operation == FunctionCallDeltaOperation.add:
+                continue
+            function_call_id = delta.function_call_id or ""
+            used_counts[function_call_id] = used_counts.get(function_call_id, 0) + 1
+            if used_counts[function_call_id] > len(
+                self._function_call_positions.get(function_call_id, [])
+            ):
+                raise RuntimeError(
+                    f"Cannot change the client data: no function call has id '{delta.function_call_id}'"
+                )
+
+    def apply_user_data_delta(self, deltas: list[FunctionCallDelta]) -> None:
+        """
+        Receives the changes to the user data, to prepare for the next generation - instead of the whole new version (see set_user_data()).
+        - each change is found via an index of the function call ids, so the existing function calls are not re-validated or re-hashed.
+        - removed function calls are dropped in one pass at the end, so the order of the other function calls is kept. The indexes are shifted, not rebuilt.
+        - the ids refer to the data before the changes.
+        """
+        self._reset()
+        self._ensure_function_call_ids()
+        self._check_user_data_delta(deltas)
+        assert self._function_call_ids is not None
+        function_calls = self.internal_previously_generated_functions
+        removed_positions: set[int] = set()
+        for delta in deltas:
+            match delta.operation:
+                case FunctionCallDeltaOperation.add:
+                    assert delta.function_call
+                    function_calls.append(delta.function_call)
+                    self._add_function_call_id(
+                        get_function_call_id(delta.function_call)
+                    )
+                case FunctionCallDeltaOperation.remove:
+                    removed_positions.add(self._pop_position_of(delta.function_call_id))
+                case FunctionCallDeltaOperation.replace_:
+                    assert delta.function_call
+                    position = self._pop_position_of(delta.function_call_id)
+                    function_call_id = get_function_call_id(delta.function_call)
+                    self._move_function_name_position(
+                        position=position,
+                        old_function_name=function_calls[position].function_name,
+                        new_function_name=delta.function_call.function_name,
+                    )
+                    function_calls[position] = delta.function_call
+                    self._function_call_ids[position] = function_call_id
+                    self._function_call_positions.setdefault(
+                        function_call_id, []
+                    ).append(position)
+                case _:
+                    raise RuntimeError(
+                        f"Not a recognised change operation: '{delta.operation}'"
+                    )
+
+        if removed_positions:
+            self._drop_positions(sorted(removed_positions))
+        self._mark_indexes_up_to_date()
 
 
 class GraphQLBlackboard(CustomBaseModel):
@@ -122,12 +485,17 @@ class GraphQLBlackboard(CustomBaseModel):
     # All previous messages in this chat (series of generations)
     internal_previous_messages: list[Message] = Field(default_factory=list)
 
+    # A summary of the older messages, sent to the Router instead of them (see chat_history.py). Replaced as a whole, when refreshed.
+    internal_history_summary: HistorySummary | None = Field(default=None)
+
     # Messages that were newly-generated during this generation (required for client to know what new messages to display)
     internal_newly_generated_messages: list[Message] = Field(default_factory=list)
 
     # The user data at the start of this generation.
     internal_user_data: str = Field(default="")
 
+    _user_data_index: GraphQLDataIndex | None = PrivateAttr(default=None)
+
     def add_generated_mutations(self, generated_mutation_calls: list[str]) -> None:
         self.internal_previously_generated_mutation_calls += generated_mutation_calls
 
@@ -153,6 +521,15 @@ class GraphQLBlackboard(CustomBaseModel):
     def get_user_data(self) -> str:
         return self.internal_user_data
 
+    def get_user_data_index(self) -> GraphQLDataIndex:
+        """Get the user data, parsed once per version of the data, so that each agent can get only the data that it accepts."""
+        if (
+            self._user_data_index is None
+            or self._user_data_index.user_data != self.internal_user_data
+        ):
+            self._user_data_index = GraphQLDataIndex(self.internal_user_data)
+        return self._user_data_index
+
     def set_user_data(self, user_data: str) -> None:
         self._reset()
         self.internal_user_data = user_data
@@ -163,6 +540,7 @@ class GraphQLBlackboard(CustomBaseModel):
         """
         self.internal_previously_generated_mutation_calls.clear()
         self.internal_previous_messages.clear()
+        self.internal_history_summary = None
         self.internal_newly_generated_messages.clear()
         self.internal_user_data = ""
 
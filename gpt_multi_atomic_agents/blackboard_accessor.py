@@ -1,7 +1,12 @@
 from dataclasses import dataclass, field
 
 from gpt_multi_atomic_agents.functions_dto import FunctionCallSchema
-from .blackboard import FunctionCallBlackboard, GraphQLBlackboard, Message
+from .blackboard import (
+    FunctionCallBlackboard,
+    FunctionCallDelta,
+    GraphQLBlackboard,
+    Message,
+)
 
 
 @dataclass
@@ -26,6 +31,10 @@ class FunctionCallBlackboardAccessor:
         """Update the blackboard with the updated client data, to prepare for a new generation."""
         self._blackboard.set_user_data(user_data=new_client_functions_representing_data)
 
+    def update_with_client_data_delta(self, deltas: list[FunctionCallDelta]) -> None:
+        """Update the blackboard with only the changes to the client data (see get_function_call_id()), to prepare for a new generation. Faster than update_with_new_client_data() when only a few function calls changed."""
+        self._blackboard.apply_user_data_delta(deltas=deltas)
+
 
 @dataclass
 class MutationsAndQueries:
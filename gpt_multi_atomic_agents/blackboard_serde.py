@@ -10,6 +10,7 @@ from .blackboard import Blackboard
 from .util_pydantic import CustomBaseModel
 
 from .config import Config
+from . import tracing
 
 console = Console()
 logger = logging.getLogger(__file__)
@@ -20,6 +21,22 @@ class SerializedBlackboard(CustomBaseModel):
     file_schema_version: str = "0.2"
 
 
+def load_blackboard_from_path(filepath: str) -> Blackboard:
+    """Load a blackboard that was saved via save_blackboard_to_path(). Raises if the file is not a valid blackboard."""
+    json_data = util_json.read_from_json_file(filepath)
+    with tracing.span("blackboard.deserialize"):
+        serialized = TypeAdapter(SerializedBlackboard).validate_python(json_data)
+    return serialized.blackboard
+
+
+def save_blackboard_to_path(blackboard: Blackboard, filepath: str) -> None:
+    with tracing.span("blackboard.serialize"):
+        serialized = SerializedBlackboard(blackboard=blackboard)
+        json_data = serialized.model_dump_json()
+
+    util_file.write_text_to_file(json_data, filepath)
+
+
 def load_blackboard_from_file(
     config: Config, existing_blackboard: Blackboard
 ) -> Blackboard | None:
@@ -37,9 +54,7 @@ def load_blackboard_from_file(
 
     console.print(f"Loading blackboard from {filepath}")
     try:
-        json_data = util_json.read_from_json_file(filepath)
-        serialized = TypeAdapter(SerializedBlackboard).validate_python(json_data)
-        return serialized.blackboard
+        return load_blackboard_from_path(filepath)
     except Exception as e:
         logger.exception(e)
 
@@ -60,10 +75,7 @@ def save_blackboard_to_file(
 
     console.print(f"Saving blackboard to {filepath}")
 
-    serialized = SerializedBlackboard(blackboard=blackboard)
-    json_data = serialized.model_dump_json()
-
-    util_file.write_text_to_file(json_data, filepath)
+    save_blackboard_to_path(blackboard=blackboard, filepath=filepath)
 
 
 def list_blackboard_files(blackboard: Blackboard, config: Config) -> None:
@@ -0,0 +1,335 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+import hashlib
+import logging
+import threading
+import typing
+
+from . import metrics, prompts_history_summary, util_ai
+from .blackboard import Blackboard, HistorySummary, Message, MessageRole
+from .config import Config
+
+logger = logging.getLogger(__file__)
+
+SUMMARY_MESSAGE_PREFIX = "Summary of the earlier chat: "
+
+MAX_CACHED_SUMMARIES = 1024
+
+# One worker, so that the summaries of one chat are refreshed in order
+_summary_executor = ThreadPoolExecutor(max_workers=1)
+
+# Digest of the summarized messages -> their summary.
+# The refreshes return the summary instead of writing into the caller's blackboard: the blackboard picks it up at its next generation (see apply_cached_summary()), so this also works for a blackboard that round-trips through a client, like in the stateless REST API.
+_summary_cache: OrderedDict[str, HistorySummary] = OrderedDict()
+_summary_cache_lock = threading.Lock()
+
+# The async refreshes in flight, by digest: also keeps a reference to each task, so it is not garbage collected while running
+_refresh_tasks: dict[str, asyncio.Future[HistorySummary | None]] = {}
+
+
+def _find_window_start(messages: list[Message], max_turns: int) -> int:
+    """Find the start of the last max_turns turns: a turn is a user message, plus the assistant messages that follow it."""
+    turn_count = 0
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].role == MessageRole.user:
+            turn_count += 1
+            if turn_count == max_turns:
+                return i
+    return 0
+
+
+def _get_usable_summary(blackboard: Blackboard) -> HistorySummary | None:
+    summary = blackboard.internal_history_summary
+    if summary is None or summary.message_count > len(
+        blackboard.internal_previous_messages
+    ):
+        # The messages were reset since the summary was made
+        return None
+    return summary
+
+
+def build_router_messages(blackboard: Blackboard, _config: Config) -> list[Message]:
+    """
+    Build the chat history for the Router, so that its input stays bounded in a long chat:
+    - a summary of the older messages (see refresh_summary()), then the messages of the last max_router_history_turns turns.
+    - messages that are older than the window but not yet summarized are also included, so nothing is lost while a summary is being refreshed (or if no summary was made yet).
+    """
+    messages = blackboard.internal_previous_messages
+    if _config.max_router_history_turns <= 0:
+        return messages
+    summary = _get_usable_summary(blackboard)
+    if summary is None:
+        return messages
+    window_start = _find_window_start(
+        messages=messages, max_turns=_config.max_router_history_turns
+    )
+
+    summarized_count = min(summary.message_count, window_start)
+    return [
+        Message(
+            role=MessageRole.assistant,
+            message=SUMMARY_MESSAGE_PREFIX + summary.summary,
+        )
+    ] + messages[summarized_count:]
+
+
+@dataclass
+class _SummaryRequest:
+    previous_summary: str
+    messages: list[Message]
+    # the count and digest of the messages that the new summary will cover
+    message_count: int
+    digest: str
+
+
+def _update_digest(hasher: typing.Any, message: Message) -> None:
+    hasher.update(f"{message.role.value}\0{message.message}\0".encode())
+
+
+def _digest_messages(messages: list[Message]) -> str:
+    hasher = hashlib.sha256()
+    for message in messages:
+        _update_digest(hasher, message)
+    return hasher.hexdigest()
+
+
+def _digest_message_prefixes(
+    messages: list[Message], message_counts: set[int]
+) -> dict[int, str]:
+    """Digest the first N messages, for each N of message_counts, in one pass."""
+    digests: dict[int, str] = {}
+    hasher = hashlib.sha256()
+    for i, message in enumerate(messages[: max(message_counts)]):
+        _update_digest(hasher, message)
+        if i + 1 in message_counts:
+            digests[i + 1] = hasher.hexdigest()
+    return digests
+
+
+def _get_cached_summary(digest: str) -> HistorySummary | None:
+    with _summary_cache_lock:
+        summary = _summary_cache.get(digest)
+        if summary is not None:
+            _summary_cache.move_to_end(digest)
+        return summary
+
+
+def _cache_summary(digest: str, summary: HistorySummary) -> None:
+    with _summary_cache_lock:
+        _summary_cache[digest] = summary
+        _summary_cache.move_to_end(digest)
+        while len(_summary_cache) > MAX_CACHED_SUMMARIES:
+            _summary_cache.popitem(last=False)
+
+
+def clear_summary_cache() -> None:
+    with _summary_cache_lock:
+        _summary_cache.clear()
+
+
+def _get_messages_to_summarize(
+    blackboard: Blackboard, _config: Config
+) -> tuple[str, list[Message], int]:
+    """Get the previous summary, the messages to add to it, and the count of messages that the new summary will cover."""
+    messages = blackboard.internal_previous_messages
+    window_start = _find_window_start(
+        messages=messages, max_turns=_config.max_router_history_turns
+    )
+    summary = _get_usable_summary(blackboard)
+    if summary is None:
+        return "", messages[:window_start], window_start
+    return (
+        summary.summary,
+        messages[summary.message_count : window_start],
+        window_start,
+    )
+
+
+def is_summary_refresh_needed(blackboard: Blackboard, _config: Config) -> bool:
+    if _config.max_router_history_turns <= 0:
+        return False
+    _previous_summary, messages, _message_count = _get_messages_to_summarize(
+        blackboard=blackboard, _config=_config
+    )
+    return len(messages) > 0
+
+
+def set_summary_if_newer(blackboard: Blackboard, summary: HistorySummary) -> None:
+    current = _get_usable_summary(blackboard)
+    if current and current.message_count >= summary.message_count:
+        return  # a newer summary was already set
+    if summary.message_count > len(blackboard.internal_previous_messages):
+        return  # the messages were reset since the summary was made
+    # One assignment, so that a reader sees either the old or the new summary
+    blackboard.internal_history_summary = summary
+
+
+def apply_cached_summary(blackboard: Blackboard, _config: Config) -> None:
+    """Set the newest summary that a refresh made for the messages of this blackboard (see refresh_summary()). Called by the owner of the blackboard, at the start of a generation."""
+    if _config.max_router_history_turns <= 0:
+        return
+    messages = blackboard.internal_previous_messages
+    current = _get_usable_summary(blackboard)
+    current_count = current.message_count if current else 0
+    with _summary_cache_lock:
+        message_counts = {
+            s.message_count
+            for s in _summary_cache.values()
+            if current_count < s.message_count <= len(messages)
+        }
+    if not message_counts:
+        return
+    digests = _digest_message_prefixes(messages=messages, message_counts=message_counts)
+    for message_count in sorted(message_counts, reverse=True):
+        summary = _get_cached_summary(digests[message_count])
+        if summary is not None:
+            set_summary_if_newer(blackboard=blackboard, summary=summary)
+            return
+
+
+def _build_summary_request(
+    blackboard: Blackboard, _config: Config
+) -> _SummaryRequest | None:
+    """Take what a refresh needs from the blackboard, so that the refresh does not read the blackboard later (when its owner may be changing it)."""
+    if _config.max_router_history_turns <= 0:
+        return None
+    previous_summary, messages, message_count = _get_messages_to_summarize(
+        blackboard=blackboard, _config=_config
+    )
+    if not messages:
+        return None
+    return _SummaryRequest(
+        previous_summary=previous_summary,
+        messages=messages,
+        message_count=message_count,
+        digest=_digest_messages(blackboard.internal_previous_messages[:message_count]),
+    )
+
+
+def _summarize(request: _SummaryRequest, _config: Config) -> HistorySummary:
+    cached_summary = _get_cached_summary(request.digest)
+    if cached_summary is not None:
+        return cached_summary
+    agent = prompts_history_summary.create_history_summary_agent(config=_config)
+    with metrics.llm_caller("history_summary"):
+        response = typing.cast(
+            prompts_history_summary.HistorySummaryAgentOutputSchema,
+            agent.run(
+                prompts_history_summary.build_input(
+                    previous_summary=request.previous_summary,
+                    messages=request.messages,
+                )
+            ),
+        )
+    summary = HistorySummary(
+        summary=response.summary, message_count=request.message_count
+    )
+    _cache_summary(request.digest, summary)
+    return summary
+
+
+async def _asummarize(request: _SummaryRequest, _config: Config) -> HistorySummary:
+    cached_summary = _get_cached_summary(request.digest)
+    if cached_summary is not None:
+        return cached_summary
+    agent = prompts_history_summary.create_history_summary_agent(
+        config=_config, is_async=True
+    )
+    with metrics.llm_caller("history_summary"):
+        response = typing.cast(
+            prompts_history_summary.HistorySummaryAgentOutputSchema,
+            await util_ai.run_agent_async(
+                agent,
+                prompts_history_summary.build_input(
+                    previous_summary=request.previous_summary,
+                    messages=request.messages,
+                ),
+            ),
+        )
+    summary = HistorySummary(
+        summary=response.summary, message_count=request.message_count
+    )
+    _cache_summary(request.digest, summary)
+    return summary
+
+
+def refresh_summary(blackboard: Blackboard, _config: Config) -> HistorySummary | None:
+    """
+    Add the messages that have left the Router's window to the summary of the chat (an LLM call).
+    - returns the new summary, or None if there were no messages to add.
+    - the blackboard is not changed: the caller sets the summary (see set_summary_if_newer()), or the blackboard picks it up at its next generation (see apply_cached_summary()).
+    """
+    request = _build_summary_request(blackboard=blackboard, _config=_config)
+    if request is None:
+        return None
+    return _summarize(request=request, _config=_config)
+
+
+async def arefresh_summary(
+    blackboard: Blackboard, _config: Config
+) -> HistorySummary | None:
+    """Async version of refresh_summary()."""
+    request = _build_summary_request(blackboard=blackboard, _config=_config)
+    if request is None:
+        return None
+    return await _asummarize(request=request, _config=_config)
+
+
+def _summarize_logging_errors(
+    request: _SummaryRequest, _config: Config
+) -> HistorySummary | None:
+    try:
+        return _summarize(request=request, _config=_config)
+    except Exception as e:
+        logger.exception(e)
+        return None
+
+
+async def _asummarize_logging_errors(
+    request: _SummaryRequest, _config: Config
+) -> HistorySummary | None:
+    try:
+        return await _asummarize(request=request, _config=_config)
+    except Exception as e:
+        logger.exception(e)
+        return None
+
+
+def refresh_summary_in_background(
+    blackboard: Blackboard, _config: Config
+) -> Future[HistorySummary | None] | None:
+    """Refresh the summary in a background thread, so that it is off the critical path: the caller can return the blackboard straight away."""
+    request = _build_summary_request(blackboard=blackboard, _config=_config)
+    if request is None:
+        return None
+    return _summary_executor.submit(
+        _summarize_logging_errors, request=request, _config=_config
+    )
+
+
+def arefresh_summary_in_background(
+    blackboard: Blackboard, _config: Config
+) -> asyncio.Future[HistorySummary | None] | None:
+    """
+    Async version of refresh_summary_in_background(): a task on the running event loop.
+    - a refresh of the same messages that is already in flight is shared, rather than repeated.
+    """
+    request = _build_summary_request(blackboard=blackboard, _config=_config)
+    if request is None:
+        return None
+    task = _refresh_tasks.get(request.digest)
+    if task is not None and task.get_loop() is asyncio.get_running_loop():
+        return task
+    new_task = asyncio.ensure_future(
+        _asummarize_logging_errors(request=request, _config=_config)
+    )
+    _refresh_tasks[request.digest] = new_task
+
+    def _on_done(_task: asyncio.Future[HistorySummary | None]) -> None:
+        if _refresh_tasks.get(request.digest) is new_task:
+            del _refresh_tasks[request.digest]
+
+    new_task.add_done_callback(_on_done)
+    return new_task
@@ -11,6 +11,35 @@ class AI_PLATFORM_Enum(StrEnum):
     openai = auto()
     groq = auto()
     bedrock_anthropic = auto()
+    mock = (
+        auto()
+    )  # Replays (or records) LLM responses from a cassette file - see mock_llm.py
+
+
+class PLAN_CACHE_BACKEND_Enum(StrEnum):
+    none = auto()
+    memory = auto()
+    sqlite = auto()
+
+
+class MOCK_MODE_Enum(StrEnum):
+    replay = auto()
+    record = auto()
+
+
+class MOCK_LATENCY_Enum(StrEnum):
+    none = auto()
+    recorded = auto()  # The latency of each response when it was recorded
+    constant = auto()
+    uniform = auto()
+    normal = auto()
+    lognormal = auto()
+
+
+class TRACE_EXPORT_FORMAT_Enum(StrEnum):
+    none = auto()
+    chrome = auto()  # Chrome Trace Event format: open in https://ui.perfetto.dev
+    otlp = auto()  # OTLP JSON lines, as written by the OpenTelemetry Collector
 
 
 GROQ_MODEL = "llama-3.1-70b-versatile"  # 'llama-3.1-70b-versatile' #"llama-3.1-8b-instant"  #  llama3-8b-8192
@@ -27,8 +56,74 @@ class Config:
     model: str = ANTHROPIC_MODEL
     max_tokens: int = ANTHROPIC_MAX_TOKENS
     is_debug: bool = False
-    delay_between_calls_in_seconds: float = 0.0
+    delay_between_calls_in_seconds: float = 0.0  # Deprecated and ignored: the LLM calls are rate limited instead (see the rate_limit_* settings).
+    max_parallel_agents: int = 4  # Agents in the same stage of the execution plan are run in parallel. Set to 1 to run agents one at a time.
+    is_dependency_scheduling_enabled: bool = True  # Schedule the stages from what each agent accepts and generates, instead of trusting the router's parallel groups.
+    is_streaming_enabled: bool = False  # Async generation only: stream the LLM responses, so each agent starts as soon as the router has recommended it, and function calls are reported as soon as they are complete.
     temp_data_dir_path: str = "data-generated"
+    # The LLM requests are rate limited per AI platform and model, shared by all the calls of this process: a call only waits when the quota requires it. Set a limit to 0 for no limit. See rate_limiter.py.
+    rate_limit_requests_per_minute: int = 0
+    rate_limit_tokens_per_minute: int = 0  # The input and output tokens
+    rate_limit_max_concurrency: int = 16  # The concurrent requests: halved when the AI platform throttles a request (HTTP 429), and grown back one at a time after successful requests.
+    rate_limit_min_concurrency: int = 1
+    # The LLM requests are retried on transient errors (throttling, server errors, timeouts), with jittered exponential backoff. See resilience.py.
+    llm_max_retries: int = 2  # Set to 0 to not retry
+    llm_retry_base_delay_seconds: float = 0.5
+    llm_retry_max_delay_seconds: float = 8.0
+    # Hedging: if an LLM request is slower than the recent p95 latency (of the same agent or router), send a duplicate request and use the first response. This cuts the tail latency, for a few percent more requests.
+    is_llm_hedging_enabled: bool = False
+    llm_hedge_percentile: float = 95.0
+    llm_hedge_min_samples: int = (
+        20  # Only hedge once the latencies of this many requests are known
+    )
+    llm_hedge_min_delay_seconds: float = 1.0
+    # The LLM clients are pooled and re-used, with these HTTP connection settings:
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry_seconds: float = 60.0
+    is_http2_enabled: bool = (
+        False  # Requires the 'h2' package (pip install httpx[http2])
+    )
+    is_client_warm_up_enabled: bool = (
+        False  # The REST API opens a connection to the AI platform at startup
+    )
+    # Re-use execution plans for repeated prompts (same prompt, agents, previous plan and messages):
+    plan_cache_backend: PLAN_CACHE_BACKEND_Enum = PLAN_CACHE_BACKEND_Enum.none
+    plan_cache_max_entries: int = 1000
+    plan_cache_ttl_seconds: float = 3600.0
+    plan_cache_sqlite_path: str = "data-generated/plan_cache.sqlite"
+    # Also re-use plans for paraphrased prompts (in memory). Unless the prompts have the same words, only the choice of agents is re-used: the agents get the current prompt, not the other prompt's rewritten prompts and parameters.
+    is_semantic_plan_cache_enabled: bool = False
+    semantic_plan_cache_similarity_threshold: float = 0.9
+    semantic_plan_cache_max_entries: int = 1000
+    max_router_candidate_agents: int = 0  # Only send the most relevant agents to the router (for example 20), to keep its prompt small. Set to 0 to send all agents.
+    hierarchical_routing_min_agents: int = 0  # With at least this many agents, route in two stages: first to groups of agents, then within the selected groups. Set to 0 to disable.
+    is_pre_router_enabled: bool = False  # Skip the LLM router, when the prompt is a single request that starts with an action verb (like "Add"), and matches the topics of exactly one agent.
+    max_router_history_turns: int = 0  # Only send the Router the messages of the last N turns (a user message and its replies), plus a summary of the older messages that is refreshed in the background. Set to 0 to send all messages.
+    max_previous_function_tokens_per_agent: int = 0  # Only send each function-calling agent the most relevant previously generated functions that fit in this many tokens (estimated). Set to 0 to send all of them.
+    # GraphQL agents only get the client data of the types in their accepted schemas (if the data is JSON). Optionally also only the entities that match the router's agent parameters.
+    is_graphql_data_pruning_enabled: bool = False
+    is_graphql_data_narrowed_by_agent_parameters: bool = False
+    # The sessions of the REST API: the server keeps each session's blackboard, so clients only send the new prompt and data changes.
+    session_max_in_memory: int = 1000
+    session_ttl_seconds: float = 86400.0
+    session_sqlite_path: str = "data-generated/sessions.sqlite"  # The least recently used sessions are spilled to this file. Set to '' to drop them instead.
+    # Trace the hot path (router, agents, blackboard serialization) as spans, exported to a local file. See tracing.py.
+    trace_export_format: TRACE_EXPORT_FORMAT_Enum = TRACE_EXPORT_FORMAT_Enum.none
+    trace_file_path: str = "data-generated/trace.json"
+    # The mock AI platform (ai_platform='mock'): to test, benchmark and load-test without a live AI platform. See mock_llm.py.
+    mock_mode: MOCK_MODE_Enum = MOCK_MODE_Enum.replay
+    mock_recorded_ai_platform: AI_PLATFORM_Enum = (
+        AI_PLATFORM_Enum.bedrock_anthropic
+    )  # In record mode, the real AI platform to call (with the model).
+    mock_cassette_path: str = "data-generated/cassette.jsonl"
+    mock_is_strict: bool = True  # In replay mode, fail if a request was not recorded. Else replay a recorded response of the same output schema (for load tests with new prompts).
+    mock_latency: MOCK_LATENCY_Enum = MOCK_LATENCY_Enum.none
+    mock_latency_seconds: float = 1.0  # The constant or mean latency
+    mock_latency_spread_seconds: float = (
+        0.5  # The standard deviation (normal, lognormal) or half-width (uniform)
+    )
+    mock_random_seed: int = 0
 
 
 def _get_path_to_ini(path_to_ini: str) -> str:
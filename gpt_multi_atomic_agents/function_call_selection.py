@@ -0,0 +1,129 @@
+import functools
+import re
+
+import numpy as np
+
+from . import util_embedding, util_tokens
+from .functions_dto import FunctionCallSchema, ParamNameToValues
+
+# The weights of the relevance signals of a previous function call
+PARAMETER_OVERLAP_WEIGHT = 2.0
+SIMILARITY_WEIGHT = 1.0
+RECENCY_WEIGHT = 0.5
+
+# A value of an agent parameter is a better signal than a word of the prompt
+_PROMPT_WORD_OVERLAP_SCORE = 0.5
+
+
+def _normalize_value(value: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", value.lower()))
+
+
+def _to_text(function_call: FunctionCallSchema) -> str:
+    return f"{function_call.function_name} " + " ".join(
+        function_call.parameters.values()
+    )
+
+
+@functools.lru_cache(maxsize=8192)
+def _embed_function_call_text(text: str) -> np.ndarray:
+    return util_embedding.embed_text(text)
+
+
+@functools.lru_cache(maxsize=8192)
+def _estimate_function_call_tokens(function_call_json: str) -> int:
+    return util_tokens.estimate_tokens(function_call_json)
+
+
+def estimate_function_call_tokens(function_call: FunctionCallSchema) -> int:
+    return _estimate_function_call_tokens(function_call.model_dump_json())
+
+
+def _score_parameter_overlap(
+    function_call: FunctionCallSchema,
+    agent_parameter_values: set[str],
+    prompt_text: str,
+) -> float:
+    """1 if a parameter value of the call is one of the agent parameters (like 'creature_name': ['wolf']), 0.5 if it is in the prompt, else 0."""
+    score = 0.0
+    for value in function_call.parameters.values():
+        normalized = _normalize_value(value)
+        if not normalized:
+            continue
+        if normalized in agent_parameter_values:
+            return 1.0
+        if f" {normalized} " in prompt_text:
+            score = _PROMPT_WORD_OVERLAP_SCORE
+    return score
+
+
+def rank_function_calls(
+    function_calls: list[FunctionCallSchema],
+    user_prompt: str,
+    agent_parameters: ParamNameToValues,
+) -> list[int]:
+    """
+    Rank the function calls by their relevance to the prompt and the agent parameters: the indices of the calls, most relevant first.
+    - relevance combines: parameter-value overlap, vector similarity (see util_embedding) and recency.
+    """
+    if not function_calls:
+        return []
+    agent_parameter_values = {
+        _normalize_value(v) for values in agent_parameters.values() for v in values
+    } - {""}
+    prompt_text = f" {_normalize_value(user_prompt)} "
+    query_embedding = util_embedding.embed_text(
+        user_prompt + " " + " ".join(agent_parameter_values)
+    )
+
+    embeddings = np.stack(
+        [_embed_function_call_text(_to_text(f)) for f in function_calls]
+    )
+    similarities = embeddings @ query_embedding
+    overlaps = np.array(
+        [
+            _score_parameter_overlap(
+                f,
+                agent_parameter_values=agent_parameter_values,
+                prompt_text=prompt_text,
+            )
+            for f in function_calls
+        ]
+    )
+    recencies = np.arange(1, len(function_calls) + 1) / len(function_calls)
+
+    scores: np.ndarray = (
+        PARAMETER_OVERLAP_WEIGHT * overlaps
+        + SIMILARITY_WEIGHT * similarities
+        + RECENCY_WEIGHT * recencies
+    )
+    # For equal scores, the most recent call first
+    return sorted(range(len(function_calls)), key=lambda i: (-scores[i], -i))
+
+
+def select_function_calls_within_budget(
+    function_calls: list[FunctionCallSchema],
+    user_prompt: str,
+    agent_parameters: ParamNameToValues,
+    max_tokens: int,
+) -> list[FunctionCallSchema]:
+    """
+    Select the most relevant function calls that fit within the token budget (see rank_function_calls()).
+    - the selected calls keep their original order, since later calls can depend on earlier ones.
+    - if all the calls fit, then they are all returned without ranking.
+    """
+    tokens = [estimate_function_call_tokens(f) for f in function_calls]
+    if sum(tokens) <= max_tokens:
+        return function_calls
+
+    selected_indices: list[int] = []
+    remaining_tokens = max_tokens
+    for i in rank_function_calls(
+        function_calls=function_calls,
+        user_prompt=user_prompt,
+        agent_parameters=agent_parameters,
+    ):
+        if tokens[i] <= remaining_tokens:
+            selected_indices.append(i)
+            remaining_tokens -= tokens[i]
+    return [function_calls[i] for i in sorted(selected_indices)]
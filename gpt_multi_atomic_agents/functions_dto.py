@@ -1,4 +1,6 @@
 from enum import StrEnum
+import hashlib
+import json
 from atomic_agents.agents.base_agent import (
     BaseIOSchema,
 )
@@ -47,6 +49,19 @@ class FunctionCallSchema(BaseIOSchema):
     )
 
 
+def get_function_call_id(function_call: FunctionCallSchema) -> str:
+    """
+    Get the stable identity of a function call, from its function name and parameters (not the agent that generated it).
+    - this is the first 16 hex characters of the SHA-256 of: function_name + '\\0' + parameters as compact JSON with sorted keys.
+    """
+    content = (
+        function_call.function_name
+        + "\0"
+        + json.dumps(function_call.parameters, sort_keys=True, separators=(",", ":"))
+    )
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
 class FunctionAgentInputSchema(BaseIOSchema):
     """
     This schema represents the input to the agent.
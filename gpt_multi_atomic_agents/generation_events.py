@@ -0,0 +1,53 @@
+from dataclasses import dataclass
+from enum import StrEnum, auto
+
+from pydantic import BaseModel, Field
+
+from .blackboard import Blackboard
+from .functions_dto import FunctionAgentOutputSchema, FunctionCallSchema
+from .graphql_dto import GraphQLAgentOutputSchema
+from .prompts_router import AgentExecutionPlanSchema, RecommendedAgent
+from .util_pydantic import CustomBaseModel
+
+
+class GenerationEventType(StrEnum):
+    plan = auto()
+    recommended_agent = auto()
+    function_call = auto()
+    agent_output = auto()
+    blackboard = auto()
+
+
+class AgentOutputEventData(CustomBaseModel):
+    agent_name: str = Field(
+        description="The name of the agent that generated the output"
+    )
+    output: FunctionAgentOutputSchema | GraphQLAgentOutputSchema = Field(
+        description="The output of the agent: its chat message and its newly generated calls"
+    )
+
+
+@dataclass
+class GenerationEvent:
+    """
+    One step of a generation, so that a client can show progress before all the agents have finished:
+    - plan: the execution plan (including the router's chat message).
+    - recommended_agent: [streaming only] one agent of the plan, as soon as the router has recommended it.
+    - function_call: [streaming only] one function call, as soon as an agent has generated it. The agent_output event has the final version.
+    - agent_output: the output of one agent, once it has been merged into the blackboard.
+    - blackboard: the final blackboard - always the last event.
+    """
+
+    event_type: GenerationEventType
+    data: (
+        AgentExecutionPlanSchema
+        | RecommendedAgent
+        | FunctionCallSchema
+        | AgentOutputEventData
+        | Blackboard
+    )
+
+    def to_sse(self) -> str:
+        """Format the event as a Server-Sent Event."""
+        data: BaseModel = self.data
+        return f"event: {self.event_type}\ndata: {data.model_dump_json()}\n\n"
@@ -0,0 +1,166 @@
+from dataclasses import dataclass, field
+import json
+import logging
+import threading
+
+from . import util_graphql, util_tokens
+from .graphql_dto import ParamNameToValues
+
+logger = logging.getLogger(__file__)
+
+
+@dataclass
+class GraphQLDataPruningStats:
+    agent_calls: int = 0
+    tokens_before: int = 0
+    tokens_saved: int = 0
+
+
+@dataclass
+class _RootField:
+    name: str
+    # For a list of entities: each entity and its JSON. Else the JSON of the whole value.
+    entities: list[tuple[dict, str]] | None
+    value_json: str = ""
+    typename_by_entity: list[str] = field(default_factory=list)
+
+
+def _guess_type_name(root_field_name: str) -> str:
+    """Guess the type of a root field that is not in the Query type, for example 'creatures' -> 'Creature'."""
+    name = root_field_name
+    if name.endswith("ies"):
+        name = name[:-3] + "y"
+    elif name.endswith("s"):
+        name = name[:-1]
+    return name[:1].upper() + name[1:]
+
+
+def _is_matching_agent_parameters(
+    entity: dict, agent_parameters: ParamNameToValues
+) -> bool:
+    """Does the entity match the values that the router extracted for the agent? A parameter that the entity does not have is ignored."""
+    for name, values in agent_parameters.items():
+        if not values or name not in entity:
+            continue
+        entity_value = str(entity[name]).lower()
+        if not any(str(v).lower() == entity_value for v in values):
+            return False
+    return True
+
+
+class GraphQLDataIndex:
+    """
+    The client's GraphQL data, parsed once so that each agent can get only the entities of the types that it accepts.
+    - the data is expected to be JSON, like the result of a GraphQL query: {"data": {"creatures": [...], ...}} or {"creatures": [...], ...}
+    - the type of an entity is its '__typename', or else the type of its root field in the Query type, or else guessed from the root field name.
+    - if the data is not a JSON object, then it cannot be pruned, and each agent gets all of it.
+    """
+
+    def __init__(self, user_data: str) -> None:
+        self.user_data = user_data
+        self._is_wrapped_in_data = False
+        self._root_fields: list[_RootField] | None = None
+        try:
+            parsed = json.loads(user_data) if user_data.strip() else None
+        except json.JSONDecodeError:
+            parsed = None
+        if not isinstance(parsed, dict):
+            return
+        if set(parsed.keys()) == {"data"} and isinstance(parsed["data"], dict):
+            self._is_wrapped_in_data = True
+            parsed = parsed["data"]
+
+        self._root_fields = []
+        for name, value in parsed.items():
+            if isinstance(value, list) and all(isinstance(e, dict) for e in value):
+                self._root_fields.append(
+                    _RootField(
+                        name=name,
+                        entities=[(e, json.dumps(e)) for e in value],
+                        typename_by_entity=[
+                            str(e.get("__typename", "")) for e in value
+                        ],
+                    )
+                )
+            else:
+                self._root_fields.append(
+                    _RootField(name=name, entities=None, value_json=json.dumps(value))
+                )
+
+    @property
+    def is_prunable(self) -> bool:
+        return self._root_fields is not None
+
+    def get_data_for_agent(
+        self,
+        accepted_graphql_schemas: list[str],
+        agent_parameters: ParamNameToValues | None = None,
+    ) -> str:
+        """
+        Get the data that the agent can use: only the entities whose types appear in its schemas.
+        - if agent_parameters is set, then only the entities that match those values (see _is_matching_agent_parameters()).
+        """
+        if self._root_fields is None:
+            return self.user_data
+
+        schemas = tuple(accepted_graphql_schemas)
+        accepted_type_names = util_graphql.parse_out_data_type_names_from_schemas(
+            schemas
+        )
+        query_field_types = util_graphql.parse_out_query_field_types_from_schemas(
+            schemas
+        )
+
+        parts: list[str] = []
+        for root_field in self._root_fields:
+            if root_field.entities is None:
+                parts.append(f"{json.dumps(root_field.name)}: {root_field.value_json}")
+                continue
+            root_type_name = query_field_types.get(
+                root_field.name, _guess_type_name(root_field.name)
+            )
+            entities_json = [
+                entity_json
+                for (entity, entity_json), typename in zip(
+                    root_field.entities, root_field.typename_by_entity
+                )
+                if (typename or root_type_name) in accepted_type_names
+                and (
+                    not agent_parameters
+                    or _is_matching_agent_parameters(entity, agent_parameters)
+                )
+            ]
+            if entities_json:
+                parts.append(
+                    f"{json.dumps(root_field.name)}: [{', '.join(entities_json)}]"
+                )
+
+        data_json = "{" + ", ".join(parts) + "}"
+        if self._is_wrapped_in_data:
+            return '{"data": ' + data_json + "}"
+        return data_json
+
+
+_stats = GraphQLDataPruningStats()
+_stats_lock = threading.Lock()
+
+
+def record_pruning(agent_name: str, user_data: str, pruned_data: str) -> None:
+    tokens_before = util_tokens.estimate_tokens(user_data)
+    tokens_saved = max(0, tokens_before - util_tokens.estimate_tokens(pruned_data))
+    with _stats_lock:
+        _stats.agent_calls += 1
+        _stats.tokens_before += tokens_before
+        _stats.tokens_saved += tokens_saved
+    logger.info(
+        f"[{agent_name}] graphql_data pruned: {tokens_saved} of {tokens_before} tokens saved (estimated)"
+    )
+
+
+def get_graphql_data_pruning_stats() -> GraphQLDataPruningStats:
+    with _stats_lock:
+        return GraphQLDataPruningStats(
+            agent_calls=_stats.agent_calls,
+            tokens_before=_stats.tokens_before,
+            tokens_saved=_stats.tokens_saved,
+        )
@@ -1,3 +1,8 @@
+import asyncio
+from contextlib import contextmanager
+import contextvars
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor
 import logging
 import typing
 
@@ -6,19 +11,35 @@ from atomic_agents.agents.base_agent import (
     BaseAgentConfig,
     BaseIOSchema,
 )
-from cornsnake import util_time, util_wait
+from cornsnake import util_time
 from rich.console import Console
 
 from gpt_multi_atomic_agents.graphql_dto import GraphQLAgentOutputSchema
 
-from .functions_dto import FunctionAgentOutputSchema
+from .functions_dto import FunctionAgentOutputSchema, FunctionCallSchema
+from .generation_events import (
+    AgentOutputEventData,
+    GenerationEvent,
+    GenerationEventType,
+)
 from .util_output import print_warning
 
 from .blackboard_serde import load_blackboard_from_file
 
-from .prompts_router import AgentExecutionPlanSchema
+from .prompts_router import (
+    CHAT_AGENT_NAME,
+    AgentExecutionPlanSchema,
+    RecommendedAgent,
+)
 
-from . import main_router
+from . import (
+    agent_cache,
+    agent_scheduler,
+    chat_history,
+    main_router,
+    metrics,
+    tracing,
+)
 
 from . import util_ai
 from .agent_definition import (
@@ -46,21 +67,37 @@ console = Console()
 logger = logging.getLogger(__file__)
 
 
-def _create_agent(agent_definition: AgentDefinitionBase, _config: Config) -> BaseAgent:
-    client, model, max_tokens = util_ai.create_client(_config=_config)
-    system_prompt_builder = agent_definition.get_system_prompt_builder(_config=_config)
+def _create_agent(
+    agent_definition: AgentDefinitionBase, _config: Config, is_async: bool = False
+) -> BaseAgent:
+    client, model, max_tokens = util_ai.create_client(
+        _config=_config, is_async=is_async
+    )
 
-    agent = BaseAgent(
-        config=BaseAgentConfig(
-            client=client,
-            model=model,
-            system_prompt_generator=system_prompt_builder.build_system_prompt(),
-            input_schema=agent_definition.input_schema,
-            output_schema=agent_definition.output_schema,
-            max_tokens=max_tokens,
+    def _build_agent() -> BaseAgent:
+        system_prompt_builder = agent_definition.get_system_prompt_builder(
+            _config=_config
         )
+        return BaseAgent(
+            config=BaseAgentConfig(
+                client=client,
+                model=model,
+                system_prompt_generator=system_prompt_builder.build_system_prompt(),
+                input_schema=agent_definition.input_schema,
+                output_schema=agent_definition.output_schema,
+                max_tokens=max_tokens,
+            )
+        )
+
+    # The key covers everything the built agent depends on, so a changed definition or Config gets a new agent
+    key = agent_cache.build_cache_key(
+        agent_definition.model_dump_json(exclude={"input_schema", "output_schema"}),
+        agent_definition.input_schema.__qualname__,
+        agent_definition.output_schema.__qualname__,
+        _config,
+        id(client),
     )
-    return agent
+    return agent_cache.get_or_create_agent(key=key, create_agent=_build_agent)
 
 
 def _check_blackboard(
@@ -165,6 +202,521 @@ def _has_new_user_prompt(user_prompt: str) -> bool:
     return not is_user_prompt_proceed(user_prompt=user_prompt)
 
 
+def _get_agent_stages(
+    execution_plan: AgentExecutionPlanSchema,
+    agent_definitions: list[AgentDefinitionBase],
+    _config: Config,
+) -> list[list[RecommendedAgent]]:
+    """
+    Get the stages of agents to execute, skipping the chat agent.
+    - within each stage, the agents are sorted by their index in the plan: so their results are merged into the blackboard in the plan's order, however the stage was built.
+    """
+    if _config.max_parallel_agents > 1 and _config.is_dependency_scheduling_enabled:
+        stages = agent_scheduler.build_execution_stages(
+            recommended_agents=execution_plan.recommended_agents,
+            agent_definitions=agent_definitions,
+        )
+    elif _config.max_parallel_agents > 1:
+        stages = execution_plan.get_agent_stages()
+    else:
+        stages = [[a] for a in execution_plan.recommended_agents]
+
+    plan_index_of_agent = {
+        id(a): i for i, a in enumerate(execution_plan.recommended_agents)
+    }
+    # TODO: add option to redirect to some Chat agent
+    stages = [
+        sorted(
+            [a for a in stage if a.agent_name != CHAT_AGENT_NAME],
+            key=lambda a: plan_index_of_agent.get(id(a), len(plan_index_of_agent)),
+        )
+        for stage in stages
+    ]
+    return [stage for stage in stages if stage]
+
+
+def _find_agent_definition(
+    recommended_agent: RecommendedAgent, agent_definitions: list[AgentDefinitionBase]
+) -> AgentDefinitionBase:
+    matching_agent_definitions = list(
+        filter(
+            lambda a: a.agent_name == recommended_agent.agent_name,
+            agent_definitions,
+        )
+    )
+    if not matching_agent_definitions:
+        raise RuntimeError(
+            f"Could not match recommended agent {recommended_agent.agent_name}"
+        )
+    if len(matching_agent_definitions) > 1:
+        print_warning(f"Matched more than one agent to {recommended_agent.agent_name}")
+    return matching_agent_definitions[0]
+
+
+@contextmanager
+def _time_agent_stage(stage: str, agent_name: str) -> typing.Iterator[None]:
+    """Time and trace a stage of executing an agent: build_input, run (the LLM call) or update_blackboard."""
+    with (
+        tracing.span(f"agent.{stage}", agent_name=agent_name),
+        metrics.time_agent_stage(stage, agent_name),
+    ):
+        yield
+
+
+def _run_agent(
+    agent_definition: AgentDefinitionBase, agent_input: BaseIOSchema, _config: Config
+) -> BaseIOSchema:
+    agent = _create_agent(agent_definition, _config=_config)
+    with _time_agent_stage("run", agent_definition.agent_name):
+        return agent.run(agent_input)
+
+
+async def _run_agent_async(
+    agent_definition: AgentDefinitionBase,
+    agent_input: BaseIOSchema,
+    _config: Config,
+    semaphore: asyncio.Semaphore,
+) -> BaseIOSchema:
+    async with semaphore:
+        agent = _create_agent(agent_definition, _config=_config, is_async=True)
+        with _time_agent_stage("run", agent_definition.agent_name):
+            return await util_ai.run_agent_async(agent, agent_input)
+
+
+def _build_stage_inputs(
+    stage: list[RecommendedAgent],
+    agent_definitions: list[AgentDefinitionBase],
+    blackboard: Blackboard,
+    _config: Config,
+) -> list[tuple[AgentDefinitionBase, BaseIOSchema]]:
+    """Build the inputs for the agents of one stage, from the blackboard as it is at the start of the stage."""
+    agents_and_inputs: list[tuple[AgentDefinitionBase, BaseIOSchema]] = []
+    for recommended_agent in stage:
+        try:
+            console.log(f":robot: Executing agent {recommended_agent.agent_name}...")
+            util_print_agent.print_agent(
+                recommended_agent, _config=_config, prefix="EXECUTING: "
+            )
+            agent_definition = _find_agent_definition(
+                recommended_agent=recommended_agent,
+                agent_definitions=agent_definitions,
+            )
+            with _time_agent_stage("build_input", agent_definition.agent_name):
+                agent_input = agent_definition.build_input(
+                    recommended_agent.rewritten_user_prompt,
+                    blackboard=blackboard,
+                    config=_config,
+                    agent_parameters=recommended_agent.agent_parameters,
+                )
+            agents_and_inputs.append((agent_definition, agent_input))
+        except Exception as e:
+            logger.exception(e)
+    return agents_and_inputs
+
+
+def _merge_agent_output(
+    agent_definition: AgentDefinitionBase,
+    response: BaseIOSchema,
+    blackboard: Blackboard,
+) -> None:
+    _fix_agent_name(response, agent_definition)
+    with tracing.span("print_assistant_output"):
+        util_print_agent.print_assistant_output(response, agent_definition)
+
+    with _time_agent_stage("update_blackboard", agent_definition.agent_name):
+        agent_definition.update_blackboard(response=response, blackboard=blackboard)
+
+
+def _execute_stage(
+    stage: list[RecommendedAgent],
+    agent_definitions: list[AgentDefinitionBase],
+    blackboard: Blackboard,
+    _config: Config,
+    executor: ThreadPoolExecutor,
+) -> None:
+    """
+    Execute one stage of the plan: the agents run in parallel, and then their results are merged into the blackboard in the plan's order (so the output is deterministic).
+    - the agents of one stage all see the blackboard as it was at the start of the stage.
+    """
+    agents_and_inputs = _build_stage_inputs(
+        stage=stage,
+        agent_definitions=agent_definitions,
+        blackboard=blackboard,
+        _config=_config,
+    )
+    running: list[tuple[AgentDefinitionBase, Future[BaseIOSchema]]] = [
+        (
+            agent_definition,
+            # (in a copy of the context, so the agent's span is a child of this generation's span)
+            executor.submit(
+                contextvars.copy_context().run,
+                _run_agent,
+                agent_definition=agent_definition,
+                agent_input=agent_input,
+                _config=_config,
+            ),
+        )
+        for agent_definition, agent_input in agents_and_inputs
+    ]
+
+    for agent_definition, future in running:
+        try:
+            _merge_agent_output(
+                agent_definition=agent_definition,
+                response=future.result(),
+                blackboard=blackboard,
+            )
+        except Exception as e:
+            logger.exception(e)
+
+
+async def _aexecute_stage(
+    stage: list[RecommendedAgent],
+    agent_definitions: list[AgentDefinitionBase],
+    blackboard: Blackboard,
+    _config: Config,
+    semaphore: asyncio.Semaphore,
+) -> typing.AsyncIterator[GenerationEvent]:
+    """
+    Async version of _execute_stage(): the agents of the stage are awaited concurrently.
+    - yields the output of each agent as soon as it is merged into the blackboard (in the plan's order).
+    """
+    agents_and_inputs = _build_stage_inputs(
+        stage=stage,
+        agent_definitions=agent_definitions,
+        blackboard=blackboard,
+        _config=_config,
+    )
+    tasks = [
+        asyncio.ensure_future(
+            _run_agent_async(
+                agent_definition=agent_definition,
+                agent_input=agent_input,
+                _config=_config,
+                semaphore=semaphore,
+            )
+        )
+        for agent_definition, agent_input in agents_and_inputs
+    ]
+
+    try:
+        for (agent_definition, _agent_input), task in zip(agents_and_inputs, tasks):
+            try:
+                response = await task
+                _merge_agent_output(
+                    agent_definition=agent_definition,
+                    response=response,
+                    blackboard=blackboard,
+                )
+            except Exception as e:
+                logger.exception(e)
+                continue
+            yield GenerationEvent(
+                event_type=GenerationEventType.agent_output,
+                data=AgentOutputEventData(
+                    agent_name=agent_definition.agent_name,
+                    output=typing.cast(
+                        FunctionAgentOutputSchema | GraphQLAgentOutputSchema, response
+                    ),
+                ),
+            )
+    finally:
+        # In case the caller stopped early (for example, a streaming client disconnected)
+        for task in tasks:
+            task.cancel()
+
+
+@dataclass
+class _PipelinedAgentRun:
+    recommended_agent: RecommendedAgent
+    agent_definition: AgentDefinitionBase
+    is_merged: asyncio.Event = field(default_factory=asyncio.Event)
+    task: asyncio.Future[None] | None = None
+
+
+def _get_dependency_runs(
+    agent_definition: AgentDefinitionBase,
+    runs: list[_PipelinedAgentRun],
+    _config: Config,
+) -> list[_PipelinedAgentRun]:
+    """Get the earlier agents that this agent must wait for. The rest of the plan is not yet known, so this can only use dependency scheduling."""
+    if _config.max_parallel_agents > 1 and _config.is_dependency_scheduling_enabled:
+        return [
+            r
+            for r in runs
+            if agent_scheduler.is_dependent(
+                consumer=agent_definition, producer=r.agent_definition
+            )
+        ]
+    return runs[-1:]
+
+
+async def _arun_agent_streaming(
+    agent_definition: AgentDefinitionBase,
+    agent_input: BaseIOSchema,
+    _config: Config,
+    events: asyncio.Queue[GenerationEvent | None],
+) -> BaseIOSchema:
+    """Run the agent, streaming its response: each function call is reported as soon as it is complete."""
+    agent = _create_agent(agent_definition, _config=_config, is_async=True)
+    emitted_count = 0
+
+    def _emit_function_calls(function_calls: list[typing.Any]) -> None:
+        nonlocal emitted_count
+        for function_call in function_calls:
+            events.put_nowait(
+                GenerationEvent(
+                    event_type=GenerationEventType.function_call,
+                    data=FunctionCallSchema.model_validate(
+                        function_call.model_dump()
+                        | {"agent_name": agent_definition.agent_name}
+                    ),
+                )
+            )
+            emitted_count += 1
+
+    def _on_partial_response(partial_response: typing.Any) -> None:
+        _emit_function_calls(
+            util_ai.get_newly_completed_items(
+                getattr(partial_response, "generated_function_calls", None),
+                emitted_count=emitted_count,
+            )
+        )
+
+    with _time_agent_stage("run", agent_definition.agent_name):
+        response = await util_ai.run_agent_streaming_async(
+            agent, agent_input, on_partial_response=_on_partial_response
+        )
+    if isinstance(response, FunctionAgentOutputSchema):
+        _emit_function_calls(response.generated_function_calls[emitted_count:])
+    return response
+
+
+async def _arun_pipelined_agent(
+    run: _PipelinedAgentRun,
+    dependency_runs: list[_PipelinedAgentRun],
+    previous_is_merged: asyncio.Event,
+    blackboard: Blackboard,
+    _config: Config,
+    semaphore: asyncio.Semaphore,
+    events: asyncio.Queue[GenerationEvent | None],
+) -> None:
+    """
+    Run one agent of a streamed plan: wait for the agents it depends on, run it, and then merge its output after the previous agent (so the blackboard is in the plan's order).
+    """
+    response: BaseIOSchema | None = None
+    try:
+        for dependency_run in dependency_runs:
+            await dependency_run.is_merged.wait()
+        async with semaphore:
+            console.log(
+                f":robot: Executing agent {run.recommended_agent.agent_name}..."
+            )
+            util_print_agent.print_agent(
+                run.recommended_agent, _config=_config, prefix="EXECUTING: "
+            )
+            with _time_agent_stage("build_input", run.agent_definition.agent_name):
+                agent_input = run.agent_definition.build_input(
+                    run.recommended_agent.rewritten_user_prompt,
+                    blackboard=blackboard,
+                    config=_config,
+                    agent_parameters=run.recommended_agent.agent_parameters,
+                )
+            response = await _arun_agent_streaming(
+                agent_definition=run.agent_definition,
+                agent_input=agent_input,
+                _config=_config,
+                events=events,
+            )
+    except Exception as e:
+        logger.exception(e)
+
+    await previous_is_merged.wait()
+    try:
+        if response:
+            _merge_agent_output(
+                agent_definition=run.agent_definition,
+                response=response,
+                blackboard=blackboard,
+            )
+            events.put_nowait(
+                GenerationEvent(
+                    event_type=GenerationEventType.agent_output,
+                    data=AgentOutputEventData(
+                        agent_name=run.agent_definition.agent_name,
+                        output=typing.cast(
+                            FunctionAgentOutputSchema | GraphQLAgentOutputSchema,
+                            response,
+                        ),
+                    ),
+                )
+            )
+    except Exception as e:
+        logger.exception(e)
+    finally:
+        run.is_merged.set()
+
+
+async def _astream_plan_and_agents(
+    agent_definitions: list[AgentDefinitionBase],
+    chat_agent_description: str,
+    _config: Config,
+    user_prompt: str,
+    blackboard: Blackboard,
+    execution_plan: AgentExecutionPlanSchema | None,
+) -> typing.AsyncIterator[GenerationEvent]:
+    """
+    Generate with streaming, so the latency of the router and the agents overlap:
+    - each agent is started as soon as the router has recommended it, instead of after the whole plan.
+    - if execution_plan is set, then that plan is used instead of the router.
+    """
+    events: asyncio.Queue[GenerationEvent | None] = asyncio.Queue()
+    runs: list[_PipelinedAgentRun] = []
+    is_plan_merged = asyncio.Event()
+    semaphore = asyncio.Semaphore(max(1, _config.max_parallel_agents))
+
+    def _on_recommended_agent(recommended_agent: RecommendedAgent) -> None:
+        if recommended_agent.agent_name == CHAT_AGENT_NAME:
+            return
+        events.put_nowait(
+            GenerationEvent(
+                event_type=GenerationEventType.recommended_agent,
+                data=recommended_agent,
+            )
+        )
+        try:
+            agent_definition = _find_agent_definition(
+                recommended_agent=recommended_agent,
+                agent_definitions=agent_definitions,
+            )
+        except Exception as e:
+            logger.exception(e)
+            return
+        run = _PipelinedAgentRun(
+            recommended_agent=recommended_agent, agent_definition=agent_definition
+        )
+        run.task = asyncio.ensure_future(
+            _arun_pipelined_agent(
+                run=run,
+                dependency_runs=_get_dependency_runs(
+                    agent_definition=agent_definition, runs=runs, _config=_config
+                ),
+                previous_is_merged=runs[-1].is_merged if runs else is_plan_merged,
+                blackboard=blackboard,
+                _config=_config,
+                semaphore=semaphore,
+                events=events,
+            )
+        )
+        runs.append(run)
+
+    async def _produce_events() -> None:
+        try:
+            if execution_plan:
+                plan = execution_plan
+                for recommended_agent in plan.recommended_agents:
+                    _on_recommended_agent(recommended_agent)
+            else:
+                plan = await main_router.agenerate_plan(
+                    agent_definitions=agent_definitions,
+                    chat_agent_description=chat_agent_description,
+                    _config=_config,
+                    user_prompt=user_prompt,
+                    previous_plan=None,
+                    messages=chat_history.build_router_messages(
+                        blackboard=blackboard, _config=_config
+                    ),
+                    on_recommended_agent=_on_recommended_agent,
+                )
+                _add_plan_to_blackboard(execution_plan=plan, blackboard=blackboard)
+            events.put_nowait(
+                GenerationEvent(event_type=GenerationEventType.plan, data=plan)
+            )
+            is_plan_merged.set()
+            await asyncio.gather(*[r.task for r in runs if r.task])
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            events.put_nowait(None)
+
+    producer = asyncio.ensure_future(_produce_events())
+    try:
+        while (event := await events.get()) is not None:
+            yield event
+    finally:
+        # In case the caller stopped early, or the router failed
+        producer.cancel()
+        for run in runs:
+            if run.task:
+                run.task.cancel()
+
+
+def _prepare_blackboard(
+    agent_definitions: list[AgentDefinitionBase],
+    user_prompt: str,
+    blackboard: Blackboard | None,
+    _config: Config,
+) -> Blackboard:
+    if blackboard:
+        _check_blackboard(blackboard=blackboard, agent_definitions=agent_definitions)
+        # The summary that was refreshed after an earlier generation (see chat_history.refresh_summary())
+        chat_history.apply_cached_summary(blackboard=blackboard, _config=_config)
+    else:
+        blackboard = _create_blackboard(agent_definitions)
+
+    blackboard.add_previous_message(Message(role=MessageRole.user, message=user_prompt))
+    return blackboard
+
+
+def _is_new_plan_needed(
+    execution_plan: AgentExecutionPlanSchema | None, user_prompt: str
+) -> bool:
+    if (
+        execution_plan and not _has_new_user_prompt(user_prompt=user_prompt)
+    ):  # A new user prompt means we likely need a new plan, for example if different agents are needed.
+        return False
+
+    if execution_plan:
+        print_warning(
+            "Generating a new plan: Generate received a user prompt, so discarding the current generation plan (to optimize, you can send a plan with an empty user prompt)"
+        )
+    else:
+        print("Generating a new plan")
+    return True
+
+
+def _add_plan_to_blackboard(
+    execution_plan: AgentExecutionPlanSchema, blackboard: Blackboard
+) -> None:
+    blackboard.add_message(
+        Message(role=MessageRole.assistant, message=execution_plan.chat_message)
+    )
+    util_print_agent.print_assistant_message(execution_plan.chat_message)
+
+
+def _record_blackboard_metrics(blackboard: Blackboard) -> None:
+    metrics.BLACKBOARD_SIZE.observe(
+        len(blackboard.internal_previous_messages), kind="messages"
+    )
+    if isinstance(blackboard, FunctionCallBlackboard):
+        metrics.BLACKBOARD_SIZE.observe(
+            len(blackboard.internal_previously_generated_functions),
+            kind="function_calls",
+        )
+    else:
+        metrics.BLACKBOARD_SIZE.observe(
+            len(blackboard.internal_previously_generated_mutation_calls),
+            kind="mutation_calls",
+        )
+
+
+def _log_generation_end(start: float, blackboard: Blackboard) -> None:
+    console.log(":robot: (done)")
+    time_taken = util_time.end_timer(start=start)
+    console.log(f"  time taken: {util_time.describe_elapsed_seconds(time_taken)}")
+    _record_blackboard_metrics(blackboard)
+
+
 def generate_with_blackboard(
     agent_definitions: list[AgentDefinitionBase],
     chat_agent_description: str,
@@ -182,98 +734,205 @@ def generate_with_blackboard(
     - if a user prompt is provided, then a new execution plan is generated (since the user may need different agents).
     """
 
-    start = util_time.start_timer()
-
-    if blackboard:
-        _check_blackboard(blackboard=blackboard, agent_definitions=agent_definitions)
-    else:
-        blackboard = _create_blackboard(agent_definitions)
+    tracing.configure_tracing(_config)
+    with tracing.span("generate_with_blackboard"):
+        start = util_time.start_timer()
 
-    blackboard.add_previous_message(Message(role=MessageRole.user, message=user_prompt))
+        blackboard = _prepare_blackboard(
+            agent_definitions=agent_definitions,
+            user_prompt=user_prompt,
+            blackboard=blackboard,
+            _config=_config,
+        )
 
-    with console.status("[bold green]Processing...") as _status:
-        try:
-            if (
-                not execution_plan or _has_new_user_prompt(user_prompt=user_prompt)
-            ):  # A new user prompt means we likely need a new plan, for example if different agents are needed.
-                if execution_plan:
-                    print_warning(
-                        "Generating a new plan: Generate received a user prompt, so discarding the current generation plan (to optimize, you can send a plan with an empty user prompt)"
-                    )
-                else:
-                    print("Generating a new plan")
-                execution_plan = main_router.generate_plan(
-                    agent_definitions=agent_definitions,
-                    chat_agent_description=chat_agent_description,
-                    _config=_config,
-                    user_prompt=user_prompt,
-                    previous_plan=None,
-                    messages=blackboard.internal_previous_messages,
-                )
-                blackboard.add_message(
-                    Message(
-                        role=MessageRole.assistant, message=execution_plan.chat_message
-                    )
-                )
-                util_print_agent.print_assistant_message(execution_plan.chat_message)
-                util_wait.wait_seconds(_config.delay_between_calls_in_seconds)
-
-            # Loop thru all the recommended agents, sending each one a rewritten version of the user prompt
-            for i, recommended_agent in enumerate(execution_plan.recommended_agents):
-                try:
-                    if recommended_agent.agent_name == "chat":
-                        # TODO: add option to redirect to some Chat agent
-                        continue
-
-                    console.log(
-                        f":robot: Executing agent {recommended_agent.agent_name}..."
+        with console.status("[bold green]Processing...") as _status:
+            try:
+                if (
+                    _is_new_plan_needed(
+                        execution_plan=execution_plan, user_prompt=user_prompt
                     )
-                    util_print_agent.print_agent(
-                        recommended_agent, _config=_config, prefix="EXECUTING: "
+                    or not execution_plan
+                ):
+                    execution_plan = main_router.generate_plan(
+                        agent_definitions=agent_definitions,
+                        chat_agent_description=chat_agent_description,
+                        _config=_config,
+                        user_prompt=user_prompt,
+                        previous_plan=None,
+                        messages=chat_history.build_router_messages(
+                            blackboard=blackboard, _config=_config
+                        ),
                     )
-                    matching_agent_definitions = list(
-                        filter(
-                            lambda a: a.agent_name == recommended_agent.agent_name,
-                            agent_definitions,
-                        )
+                    _add_plan_to_blackboard(
+                        execution_plan=execution_plan, blackboard=blackboard
                     )
-                    if not matching_agent_definitions:
-                        raise RuntimeError(
-                            f"Could not match recommended agent {recommended_agent.agent_name}"
-                        )
-                    if len(matching_agent_definitions) > 1:
-                        print_warning(
-                            f"Matched more than one agent to {recommended_agent.agent_name}"
-                        )
-                    agent_definition = matching_agent_definitions[0]
-                    agent = _create_agent(agent_definition, _config=_config)
 
-                    response = agent.run(
-                        agent_definition.build_input(
-                            recommended_agent.rewritten_user_prompt,
+                # Execute the recommended agents in stages, sending each one a rewritten version of the user prompt
+                stages = _get_agent_stages(
+                    execution_plan=execution_plan,
+                    agent_definitions=agent_definitions,
+                    _config=_config,
+                )
+                with ThreadPoolExecutor(
+                    max_workers=max(1, _config.max_parallel_agents)
+                ) as executor:
+                    # (the LLM calls are rate limited by the AI client, so there is no delay between the stages)
+                    for stage in stages:
+                        _execute_stage(
+                            stage=stage,
+                            agent_definitions=agent_definitions,
                             blackboard=blackboard,
-                            config=_config,
-                            agent_parameters=recommended_agent.agent_parameters,
+                            _config=_config,
+                            executor=executor,
                         )
-                    )
-                    _fix_agent_name(response, agent_definition)
-                    util_print_agent.print_assistant_output(response, agent_definition)
+            except Exception as e:
+                logger.exception(e)
 
-                    agent_definition.update_blackboard(
-                        response=response, blackboard=blackboard
-                    )
-                    is_last = i == len(execution_plan.recommended_agents) - 1
-                    if not is_last:
-                        util_wait.wait_seconds(_config.delay_between_calls_in_seconds)
-                except Exception as e:
-                    logger.exception(e)
-        except Exception as e:
-            logger.exception(e)
+            _log_generation_end(start=start, blackboard=blackboard)
+        # Off the critical path: the summary is ready for the Router of a later generation
+        chat_history.refresh_summary_in_background(
+            blackboard=blackboard, _config=_config
+        )
+        return blackboard
 
-        console.log(":robot: (done)")
-        time_taken = util_time.end_timer(start=start)
-        console.log(f"  time taken: {util_time.describe_elapsed_seconds(time_taken)}")
-    return blackboard
+
+async def agenerate_events_with_blackboard(
+    agent_definitions: list[AgentDefinitionBase],
+    chat_agent_description: str,
+    _config: Config,
+    user_prompt: str,
+    blackboard: Blackboard | None = None,
+    execution_plan: AgentExecutionPlanSchema | None = None,
+) -> typing.AsyncIterator[GenerationEvent]:
+    """
+    Streaming version of agenerate_with_blackboard(): yields each step of the generation as soon as it is ready (see GenerationEvent).
+    - first the plan, then the output of each agent, and finally the blackboard.
+    """
+
+    start = util_time.start_timer()
+
+    blackboard = _prepare_blackboard(
+        agent_definitions=agent_definitions,
+        user_prompt=user_prompt,
+        blackboard=blackboard,
+        _config=_config,
+    )
+
+    try:
+        is_new_plan_needed = (
+            _is_new_plan_needed(execution_plan=execution_plan, user_prompt=user_prompt)
+            or not execution_plan
+        )
+        if _config.is_streaming_enabled:
+            async for event in _astream_plan_and_agents(
+                agent_definitions=agent_definitions,
+                chat_agent_description=chat_agent_description,
+                _config=_config,
+                user_prompt=user_prompt,
+                blackboard=blackboard,
+                execution_plan=None if is_new_plan_needed else execution_plan,
+            ):
+                yield event
+            _log_generation_end(start=start, blackboard=blackboard)
+            chat_history.arefresh_summary_in_background(
+                blackboard=blackboard, _config=_config
+            )
+            yield GenerationEvent(
+                event_type=GenerationEventType.blackboard, data=blackboard
+            )
+            return
+
+        if is_new_plan_needed or not execution_plan:
+            execution_plan = await main_router.agenerate_plan(
+                agent_definitions=agent_definitions,
+                chat_agent_description=chat_agent_description,
+                _config=_config,
+                user_prompt=user_prompt,
+                previous_plan=None,
+                messages=chat_history.build_router_messages(
+                    blackboard=blackboard, _config=_config
+                ),
+            )
+            _add_plan_to_blackboard(
+                execution_plan=execution_plan, blackboard=blackboard
+            )
+            yield GenerationEvent(
+                event_type=GenerationEventType.plan, data=execution_plan
+            )
+        else:
+            yield GenerationEvent(
+                event_type=GenerationEventType.plan, data=execution_plan
+            )
+
+        stages = _get_agent_stages(
+            execution_plan=execution_plan,
+            agent_definitions=agent_definitions,
+            _config=_config,
+        )
+        semaphore = asyncio.Semaphore(max(1, _config.max_parallel_agents))
+        for stage in stages:
+            async for event in _aexecute_stage(
+                stage=stage,
+                agent_definitions=agent_definitions,
+                blackboard=blackboard,
+                _config=_config,
+                semaphore=semaphore,
+            ):
+                yield event
+    except Exception as e:
+        logger.exception(e)
+
+    _log_generation_end(start=start, blackboard=blackboard)
+    # Off the critical path: the summary is ready for the Router of a later generation
+    chat_history.arefresh_summary_in_background(blackboard=blackboard, _config=_config)
+    yield GenerationEvent(event_type=GenerationEventType.blackboard, data=blackboard)
+
+
+async def agenerate_with_blackboard(
+    agent_definitions: list[AgentDefinitionBase],
+    chat_agent_description: str,
+    _config: Config,
+    user_prompt: str,
+    blackboard: Blackboard | None = None,
+    execution_plan: AgentExecutionPlanSchema | None = None,
+) -> Blackboard:
+    """
+    Async version of generate_with_blackboard(): uses async LLM clients, so many generations can be in flight on one event loop (for example in the REST API).
+    """
+    tracing.configure_tracing(_config)
+    with tracing.span("agenerate_with_blackboard"):
+        async for event in agenerate_events_with_blackboard(
+            agent_definitions=agent_definitions,
+            chat_agent_description=chat_agent_description,
+            _config=_config,
+            user_prompt=user_prompt,
+            blackboard=blackboard,
+            execution_plan=execution_plan,
+        ):
+            if event.event_type == GenerationEventType.blackboard:
+                return typing.cast(Blackboard, event.data)
+        raise RuntimeError("Generation ended without a blackboard")
+
+
+async def agenerate(
+    agent_definitions: list[AgentDefinitionBase],
+    chat_agent_description: str,
+    _config: Config,
+    user_prompt: str,
+    blackboard: BlackboardAccessor | None = None,
+    execution_plan: AgentExecutionPlanSchema | None = None,
+) -> BlackboardAccessor:
+    """Async version of generate()."""
+    previous_blackboard = blackboard._blackboard if blackboard else None
+    new_blackboard = await agenerate_with_blackboard(
+        agent_definitions=agent_definitions,
+        chat_agent_description=chat_agent_description,
+        _config=_config,
+        user_prompt=user_prompt,
+        blackboard=previous_blackboard,
+        execution_plan=execution_plan,
+    )
+    return _create_blackboard_accessor_from_blackboard(blackboard=new_blackboard)
 
 
 def run_chat_loop(
@@ -1,13 +1,19 @@
+import asyncio
+from contextlib import asynccontextmanager
 import logging
 import time
-from typing import Any, Callable
-from fastapi import FastAPI, Request
+from typing import Any, AsyncIterator, Callable
+import weakref
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import Field
 
-from .blackboard import FunctionCallBlackboard, Message
+from .blackboard import FunctionCallBlackboard, FunctionCallDelta, Message
+from .functions_dto import FunctionCallSchema, get_function_call_id
 from .rest_api_examples import (
     FunctionAgentDefinitionMinimal,
     creature_agent_name,
+    example_create_creature_call__wolf,
     example_creeature_creator_agent,
 )
 
@@ -21,18 +27,32 @@ from .agent_definition import (
     build_function_agent_definition,
 )
 
+from . import chat_history
 from . import main_router
 from . import main_generator
+from . import metrics
+from . import session_store
+from . import tracing
+from . import util_ai
 
 logger = logging.getLogger(__file__)
 
-app = FastAPI()
-
 
 def _load_config_from_ini() -> Config:
     return load_config(path_to_ini="config.ini")
 
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    config = _load_config_from_ini()
+    if config.is_client_warm_up_enabled:
+        await util_ai.warm_up_client_async(_config=config)
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
 class AsyncIteratorWrapper:
     """The following is a utility class that transforms a
     regular iterable to an asynchronous one.
@@ -54,6 +74,19 @@ class AsyncIteratorWrapper:
         return value
 
 
+_HTTP_REQUEST_SECONDS = metrics.get_metrics_registry().histogram(
+    "http_request_seconds",
+    "The time to handle each REST request, by method, path (the route, such as /sessions/{session_id}) and status code",
+    label_names=("method", "path", "status_code"),
+)
+
+
+def _get_route_path(request: Request) -> str:
+    # The route's path, not the requested path, so that the metric does not have a label per session id
+    route = request.scope.get("route")
+    return str(getattr(route, "path", "(no route)"))
+
+
 @app.middleware("http")
 async def add_request_response_logging(request: Request, call_next: Callable) -> Any:
     start_time = time.perf_counter()
@@ -64,7 +97,11 @@ async def add_request_response_logging(request: Request, call_next: Callable) ->
         request_body = await request.body()
         print("REQUEST BODY", request_body)
 
-    response = await call_next(request)
+    tracing.configure_tracing(config)
+    with tracing.span(
+        "http_request", method=request.method, path=request.url.path
+    ) as request_span:
+        response = await call_next(request)
     process_time = time.perf_counter() - start_time
 
     if config.is_debug:
@@ -73,6 +110,14 @@ async def add_request_response_logging(request: Request, call_next: Callable) ->
         print("RESPONSE BODY", str(resp_body))
 
     response.headers["X-Process-Time"] = str(process_time)
+    if request_span:
+        response.headers["X-Trace-Id"] = request_span.trace_id
+    _HTTP_REQUEST_SECONDS.observe(
+        process_time,
+        method=request.method,
+        path=_get_route_path(request),
+        status_code=str(response.status_code),
+    )
     return response
 
 
@@ -167,7 +212,7 @@ class FunctionCallGenerateRequest(CustomBaseModel):
 async def generate_plan(
     request: GeneratePlanRequest,
 ) -> prompts_router.AgentExecutionPlanSchema:
-    return main_router.generate_plan_via_descriptions(
+    return await main_router.agenerate_plan_via_descriptions(
         agent_descriptions=request.agent_descriptions,
         chat_agent_description=request.chat_agent_description,
         _config=_load_config_from_ini(),
@@ -189,18 +234,22 @@ def _build_agent_definition_from_minimal(
     )
 
 
-@app.post("/generate_function_calls")
-def generate_function_calls(
+def _build_agent_definitions_from_request(
     request: FunctionCallGenerateRequest,
-) -> FunctionCallBlackboard:
-    agent_definitions: list[AgentDefinitionBase] = [
-        _build_agent_definition_from_minimal(a) for a in request.agent_definitions
-    ]
-
+) -> list[AgentDefinitionBase]:
     if request.blackboard:
         request.blackboard.reset_newly_generated()  # in case client did not clear out
 
-    blackboard = main_generator.generate_with_blackboard(
+    return [_build_agent_definition_from_minimal(a) for a in request.agent_definitions]
+
+
+@app.post("/generate_function_calls")
+async def generate_function_calls(
+    request: FunctionCallGenerateRequest,
+) -> FunctionCallBlackboard:
+    agent_definitions = _build_agent_definitions_from_request(request)
+
+    blackboard = await main_generator.agenerate_with_blackboard(
         agent_definitions=agent_definitions,
         chat_agent_description=request.chat_agent_description,
         _config=_load_config_from_ini(),
@@ -213,4 +262,276 @@ def generate_function_calls(
     return blackboard
 
 
+@app.post("/generate_function_calls/stream")
+async def generate_function_calls_stream(
+    request: FunctionCallGenerateRequest,
+) -> StreamingResponse:
+    """
+    Streaming version of /generate_function_calls, as Server-Sent Events, so the client can show progress before all the agents have finished:
+    - 'plan': the execution plan, including the chat message for the user.
+    - 'agent_output': the output of each agent (its chat message and new function calls), as soon as it is ready.
+    - 'blackboard': the final FunctionCallBlackboard - always the last event.
+    """
+    agent_definitions = _build_agent_definitions_from_request(request)
+
+    async def _stream_events() -> AsyncIterator[str]:
+        async for event in main_generator.agenerate_events_with_blackboard(
+            agent_definitions=agent_definitions,
+            chat_agent_description=request.chat_agent_description,
+            _config=_load_config_from_ini(),
+            user_prompt=request.user_prompt,
+            blackboard=request.blackboard,
+            execution_plan=request.execution_plan,
+        ):
+            yield event.to_sse()
+
+    return StreamingResponse(_stream_events(), media_type="text/event-stream")
+
+
+class CreateSessionRequest(CustomBaseModel):
+    agent_definitions: list[FunctionAgentDefinitionMinimal] = Field(
+        description="The defintions of the Agents to execute, in order. These are kept for the whole session.",
+        examples=[[example_creeature_creator_agent]],
+    )
+    chat_agent_description: str = Field(
+        description="Describe the purpose and domain of this chat system.",
+        examples=["Handles users questions about an ecosystem game like Sim Life"],
+    )
+    blackboard: FunctionCallBlackboard | None = Field(
+        description="Optionally include an initial Blackboard state, for example to continue a previous stateless conversation.",
+        default=None,
+    )
+
+
+class CreateSessionResponse(CustomBaseModel):
+    session_id: str = Field(
+        description="The id of the new session. Send this with each request of the session."
+    )
+
+
+class SessionFunctionCallGenerateRequest(CustomBaseModel):
+    user_prompt: str = Field(
+        description="The input from the user", examples=["Add a sheep that eats grass"]
+    )
+    user_data: list[FunctionCallSchema] | None = Field(
+        description="Optionally send the new version of the user data (if the client has changed it), as the function calls that would create it. Otherwise the data from the previous generation is used.",
+        default=None,
+    )
+    user_data_delta: list[FunctionCallDelta] | None = Field(
+        description="Optionally send only the changes to the user data (applied after user_data): add, remove or replace function calls. Existing function calls are identified by their id (see function_call_ids in the response).",
+        examples=[
+            [
+                {
+                    "operation": "add",
+                    "function_call": example_create_creature_call__wolf,
+                },
+                {"operation": "remove", "function_call_id": "0123456789abcdef"},
+            ]
+        ],
+        default=None,
+    )
+    execution_plan: prompts_router.AgentExecutionPlanSchema | None = Field(
+        description="Optionally also include a previously generated plan, to reduce latency. If no plan is included, OR there is a user prompt, then generate will also internally call generate_plan.",
+        default=None,
+    )
+
+
+class SessionFunctionCallGenerateResponse(CustomBaseModel):
+    session_id: str = Field(description="The id of the session")
+    internal_newly_generated_messages: list[Message] = Field(
+        description="The messages that were generated for the user in this generation"
+    )
+    internal_newly_generated_functions: list[FunctionCallSchema] = Field(
+        description="The function calls that were generated in this generation: the client should execute them to update its data"
+    )
+    function_call_ids: list[str] = Field(
+        description="The id of each newly generated function call, for use in a later user_data_delta"
+    )
+
+
+class FunctionCallSession(CustomBaseModel):
+    agent_definitions: list[FunctionAgentDefinitionMinimal]
+    chat_agent_description: str
+    blackboard: FunctionCallBlackboard
+
+
+# One lock per session, so that concurrent requests to a session do not both update its blackboard
+_session_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = (
+    weakref.WeakValueDictionary()
+)
+
+
+def _get_session_lock(session_id: str) -> asyncio.Lock:
+    lock = _session_locks.get(session_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _session_locks[session_id] = lock
+    return lock
+
+
+def _get_function_call_session_store(
+    _config: Config,
+) -> session_store.SessionStore[FunctionCallSession]:
+    return session_store.get_session_store(
+        session_type=FunctionCallSession, _config=_config
+    )
+
+
+def _get_session_or_404(
+    store: session_store.SessionStore[FunctionCallSession], session_id: str
+) -> FunctionCallSession:
+    session = store.get(session_id)
+    if session is None:
+        raise HTTPException(
+            status_code=404, detail=f"Session not found (or expired): '{session_id}'"
+        )
+    return session
+
+
+@app.post("/sessions")
+async def create_session(request: CreateSessionRequest) -> CreateSessionResponse:
+    """
+    Create a session, so that the server keeps the Blackboard between requests: then each request only needs to send the new prompt and any data changes.
+    """
+    store = _get_function_call_session_store(_load_config_from_ini())
+    session_id = store.create_session_id()
+    store.set(
+        session_id,
+        FunctionCallSession(
+            agent_definitions=request.agent_definitions,
+            chat_agent_description=request.chat_agent_description,
+            blackboard=request.blackboard or FunctionCallBlackboard(),
+        ),
+    )
+    return CreateSessionResponse(session_id=session_id)
+
+
+async def _refresh_session_history_summary(session_id: str, config: Config) -> None:
+    """After the response: summarize the session's older messages for the Router, without holding the session lock during the LLM call. The summary is then set under the lock, and stored with the session."""
+    store = _get_function_call_session_store(config)
+    session = store.get(session_id)
+    if session is None:
+        return
+    # (shares the refresh that the generation started, see chat_history.arefresh_summary_in_background())
+    refresh = chat_history.arefresh_summary_in_background(
+        blackboard=session.blackboard, _config=config
+    )
+    if refresh is None:
+        return
+    summary = await refresh
+    if summary is None:
+        return
+    async with _get_session_lock(session_id):
+        session = store.get(session_id)
+        if session is not None:
+            chat_history.set_summary_if_newer(
+                blackboard=session.blackboard, summary=summary
+            )
+            store.set(session_id, session)
+
+
+def _check_user_data_delta(
+    session: FunctionCallSession, request: SessionFunctionCallGenerateRequest
+) -> None:
+    """Check the changes to the user data before the session is changed. The ids of the changes refer to the new user_data, if it was sent."""
+    if not request.user_data_delta:
+        return
+    blackboard = session.blackboard
+    if request.user_data is not None:
+        blackboard = FunctionCallBlackboard(
+            internal_previously_generated_functions=request.user_data
+        )
+    try:
+        blackboard.check_user_data_delta(request.user_data_delta)
+    except RuntimeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.post("/sessions/{session_id}/generate_function_calls")
+async def generate_function_calls_in_session(
+    session_id: str,
+    request: SessionFunctionCallGenerateRequest,
+    background_tasks: BackgroundTasks,
+) -> SessionFunctionCallGenerateResponse:
+    """
+    Session version of /generate_function_calls: the Blackboard is kept on the server, so only the newly generated messages and function calls are returned.
+    - the request is checked before the Blackboard is changed, and the changes are undone if the generation fails (see FunctionCallBlackboard.create_checkpoint()).
+    """
+    config = _load_config_from_ini()
+    store = _get_function_call_session_store(config)
+    async with _get_session_lock(session_id):
+        session = _get_session_or_404(store=store, session_id=session_id)
+        _check_user_data_delta(session=session, request=request)
+
+        checkpoint = session.blackboard.create_checkpoint(
+            # (with new user_data, the delta changes the new list, not the session's)
+            is_user_data_delta_pending=bool(request.user_data_delta)
+            and request.user_data is None
+        )
+        try:
+            if request.user_data is not None:
+                session.blackboard.set_user_data(request.user_data)
+            else:
+                session.blackboard.reset_newly_generated()
+            if request.user_data_delta:
+                session.blackboard.apply_user_data_delta(request.user_data_delta)
+
+            blackboard = await main_generator.agenerate_with_blackboard(
+                agent_definitions=[
+                    _build_agent_definition_from_minimal(a)
+                    for a in session.agent_definitions
+                ],
+                chat_agent_description=session.chat_agent_description,
+                _config=config,
+                user_prompt=request.user_prompt,
+                blackboard=session.blackboard,
+                execution_plan=request.execution_plan,
+            )
+            if not isinstance(blackboard, FunctionCallBlackboard):
+                raise RuntimeError("blackboard is not FunctionCallBlackboard")
+        except BaseException:
+            # (including cancellation, if the client disconnected)
+            session.blackboard.restore_checkpoint(checkpoint)
+            raise
+        session.blackboard = blackboard
+        store.set(session_id, session)
+    background_tasks.add_task(
+        _refresh_session_history_summary, session_id=session_id, config=config
+    )
+
+    return SessionFunctionCallGenerateResponse(
+        session_id=session_id,
+        internal_newly_generated_messages=blackboard.internal_newly_generated_messages,
+        internal_newly_generated_functions=blackboard.internal_newly_generated_functions,
+        function_call_ids=[
+            get_function_call_id(f)
+            for f in blackboard.internal_newly_generated_functions
+        ],
+    )
+
+
+@app.get("/sessions/{session_id}")
+async def get_session_blackboard(session_id: str) -> FunctionCallBlackboard:
+    """Get the full Blackboard of the session, for example if the client has lost its state."""
+    store = _get_function_call_session_store(_load_config_from_ini())
+    return _get_session_or_404(store=store, session_id=session_id).blackboard
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str) -> None:
+    store = _get_function_call_session_store(_load_config_from_ini())
+    if not store.delete(session_id):
+        raise HTTPException(
+            status_code=404, detail=f"Session not found (or expired): '{session_id}'"
+        )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> str:
+    """
+    The metrics of the server, in the Prometheus text format: latencies of the router and agent stages, LLM tokens and validation retries, blackboard sizes and cache hit rates.
+    """
+    return metrics.render_prometheus()
+
+
 # TODO (someone): Later add generate_graphql()
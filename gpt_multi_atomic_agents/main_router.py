@@ -1,6 +1,10 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import logging
 import typing
 
+from pydantic import ValidationError
 from rich.console import Console
 
 from cornsnake import util_time
@@ -11,12 +15,25 @@ from .agent_definition import (
     AgentDefinitionBase,
 )
 from .config import Config
-from . import util_print_agent
+from . import (
+    agent_groups,
+    agent_retrieval,
+    metrics,
+    plan_cache,
+    pre_router,
+    prompts_group_router,
+    semantic_plan_cache,
+    tracing,
+    util_ai,
+    util_print_agent,
+)
 
 console = Console()
 
 logger = logging.getLogger(__file__)
 
+OnRecommendedAgent = typing.Callable[[prompts_router.RecommendedAgent], None]
+
 
 def _convert_agent_to_description(
     agent: AgentDefinitionBase,
@@ -26,6 +43,7 @@ def _convert_agent_to_description(
         description=agent.description,
         topics=agent.get_topics(),
         agent_parameter_names=list(agent.get_agent_parameters().keys()),
+        agent_group=agent.agent_group,
     )
 
 
@@ -52,24 +70,36 @@ def generate_plan(
         user_prompt=user_prompt,
         previous_plan=previous_plan,
         messages=messages,
+        agent_definitions=agent_definitions,
     )
 
 
-def generate_plan_via_descriptions(
-    agent_descriptions: list[prompts_router.AgentDescription],
+async def agenerate_plan(
+    agent_definitions: list[AgentDefinitionBase],
     chat_agent_description: str,
     _config: Config,
     user_prompt: str,
     previous_plan: prompts_router.AgentExecutionPlanSchema | None = None,
     messages: list[Message] | None = None,
+    on_recommended_agent: OnRecommendedAgent | None = None,
 ) -> prompts_router.AgentExecutionPlanSchema:
-    """
-    Generate an agent execution plan to fulfill the user prompt, using the provided agents.
-    - can be called again, with new user prompt, providing human-in-the-loop feedback.
+    """Async version of generate_plan(): does not block the event loop while waiting for the LLM."""
+    agent_descriptions = _convert_agents_to_descriptions(agents=agent_definitions)
+    return await agenerate_plan_via_descriptions(
+        agent_descriptions=agent_descriptions,
+        chat_agent_description=chat_agent_description,
+        _config=_config,
+        user_prompt=user_prompt,
+        previous_plan=previous_plan,
+        messages=messages,
+        on_recommended_agent=on_recommended_agent,
+        agent_definitions=agent_definitions,
+    )
 
-    note: calling this router seperately from generation (agent execution) helps to reduce the *perceived* time taken to generate, since the user gets an (intermediate) response earlier.
-    """
 
+def _log_routing_start(
+    user_prompt: str, previous_plan: prompts_router.AgentExecutionPlanSchema | None
+) -> None:
     previous_plan_summary = (
         f"[PREVIOUS PLAN: {previous_plan.chat_message}]"
         if previous_plan
@@ -77,27 +107,501 @@ def generate_plan_via_descriptions(
     )
     console.log(f"Routing user prompt '{user_prompt}' {previous_plan_summary}")
 
-    start = util_time.start_timer()
+
+def _log_routing_end(
+    response: prompts_router.RouterAgentOutputSchema, _config: Config, start: float
+) -> None:
+    util_print_agent.print_router_assistant(response, _config=_config)
+    time_taken = util_time.end_timer(start=start)
+    console.log(f"  time taken: {util_time.describe_elapsed_seconds(time_taken)}")
+    metrics.ROUTER_SECONDS.observe(time_taken, route="llm")
+
+
+def _get_cached_plan_or_none(
+    scope_key: str, user_prompt: str, _config: Config, start: float
+) -> prompts_router.AgentExecutionPlanSchema | None:
+    plan = None
+    cache = plan_cache.get_plan_cache(_config=_config)
+    if cache:
+        plan = cache.get(plan_cache.build_plan_cache_key(scope_key, user_prompt))
+    if not plan:
+        semantic_cache = semantic_plan_cache.get_semantic_plan_cache(_config=_config)
+        if semantic_cache:
+            plan = semantic_cache.get(scope_key=scope_key, user_prompt=user_prompt)
+    if plan:
+        time_taken = util_time.end_timer(start=start)
+        console.log(
+            f"  (plan cache hit) time taken: {util_time.describe_elapsed_seconds(time_taken)}"
+        )
+        metrics.ROUTER_SECONDS.observe(time_taken, route="plan_cache")
+    return plan
+
+
+def _pre_route_or_none(
+    agent_descriptions: list[prompts_router.AgentDescription],
+    user_prompt: str,
+    previous_plan: prompts_router.AgentExecutionPlanSchema | None,
+    _config: Config,
+    start: float,
+) -> prompts_router.AgentExecutionPlanSchema | None:
+    # If there is a previous plan, then the user is giving feedback, which needs the LLM router
+    if not _config.is_pre_router_enabled or previous_plan:
+        return None
+    plan = pre_router.try_route(
+        agent_descriptions=agent_descriptions, user_prompt=user_prompt
+    )
+    if plan:
+        time_taken = util_time.end_timer(start=start)
+        console.log(
+            f"  (pre-router) time taken: {util_time.describe_elapsed_seconds(time_taken)}"
+        )
+        metrics.ROUTER_SECONDS.observe(time_taken, route="pre_router")
+    return plan
+
+
+def _add_plan_to_caches(
+    scope_key: str,
+    user_prompt: str,
+    plan: prompts_router.AgentExecutionPlanSchema,
+    _config: Config,
+) -> None:
+    cache = plan_cache.get_plan_cache(_config=_config)
+    if cache:
+        cache.set(plan_cache.build_plan_cache_key(scope_key, user_prompt), plan)
+    semantic_cache = semantic_plan_cache.get_semantic_plan_cache(_config=_config)
+    if semantic_cache:
+        semantic_cache.set(scope_key=scope_key, user_prompt=user_prompt, plan=plan)
+
+
+def _run_router(
+    agent_descriptions: list[prompts_router.AgentDescription],
+    chat_agent_description: str,
+    _config: Config,
+    user_prompt: str,
+    previous_plan: prompts_router.AgentExecutionPlanSchema | None,
+    messages: list[Message] | None,
+) -> prompts_router.RouterAgentOutputSchema:
+    candidate_agent_descriptions = agent_retrieval.select_candidate_agents(
+        agent_descriptions=agent_descriptions,
+        user_prompt=user_prompt,
+        messages=messages,
+        previous_plan=previous_plan,
+        max_candidates=_config.max_router_candidate_agents,
+    )
 
     # TODO: optimizate router:
     # - possibly run it on smaller (and faster) LLM
     # - could allow for Classifier based router, but then cannot rewrite prompts
     router_agent = prompts_router.create_router_agent(config=_config)
-    response = typing.cast(
-        prompts_router.RouterAgentOutputSchema,
-        router_agent.run(
-            prompts_router.build_input(
+    with metrics.llm_caller("router"):
+        return typing.cast(
+            prompts_router.RouterAgentOutputSchema,
+            router_agent.run(
+                prompts_router.build_input(
+                    user_prompt=user_prompt,
+                    agent_descriptions=candidate_agent_descriptions,
+                    chat_agent_description=chat_agent_description,
+                    previous_plan=previous_plan,
+                    messages=messages,
+                )
+            ),
+        )
+
+
+async def _arun_router(
+    agent_descriptions: list[prompts_router.AgentDescription],
+    chat_agent_description: str,
+    _config: Config,
+    user_prompt: str,
+    previous_plan: prompts_router.AgentExecutionPlanSchema | None,
+    messages: list[Message] | None,
+) -> prompts_router.RouterAgentOutputSchema:
+    candidate_agent_descriptions = agent_retrieval.select_candidate_agents(
+        agent_descriptions=agent_descriptions,
+        user_prompt=user_prompt,
+        messages=messages,
+        previous_plan=previous_plan,
+        max_candidates=_config.max_router_candidate_agents,
+    )
+
+    router_agent = prompts_router.create_router_agent(config=_config, is_async=True)
+    with metrics.llm_caller("router"):
+        return typing.cast(
+            prompts_router.RouterAgentOutputSchema,
+            await util_ai.run_agent_async(
+                router_agent,
+                prompts_router.build_input(
+                    user_prompt=user_prompt,
+                    agent_descriptions=candidate_agent_descriptions,
+                    chat_agent_description=chat_agent_description,
+                    previous_plan=previous_plan,
+                    messages=messages,
+                ),
+            ),
+        )
+
+
+def _notify_recommended_agents(
+    plan: prompts_router.AgentExecutionPlanSchema,
+    on_recommended_agent: OnRecommendedAgent | None,
+) -> None:
+    if on_recommended_agent:
+        for recommended_agent in plan.recommended_agents:
+            on_recommended_agent(recommended_agent)
+
+
+async def _astream_router(
+    agent_descriptions: list[prompts_router.AgentDescription],
+    chat_agent_description: str,
+    _config: Config,
+    user_prompt: str,
+    previous_plan: prompts_router.AgentExecutionPlanSchema | None,
+    messages: list[Message] | None,
+    on_recommended_agent: OnRecommendedAgent,
+) -> prompts_router.RouterAgentOutputSchema:
+    """Streaming version of _arun_router(): calls on_recommended_agent() as soon as each recommended agent is complete."""
+    candidate_agent_descriptions = agent_retrieval.select_candidate_agents(
+        agent_descriptions=agent_descriptions,
+        user_prompt=user_prompt,
+        messages=messages,
+        previous_plan=previous_plan,
+        max_candidates=_config.max_router_candidate_agents,
+    )
+
+    emitted_count = 0
+    is_streaming_agents = True
+
+    def _on_partial_response(partial_response: typing.Any) -> None:
+        nonlocal emitted_count, is_streaming_agents
+        partial_plan = partial_response.execution_plan
+        if not is_streaming_agents or not partial_plan:
+            return
+        partial_agents: list[typing.Any] = util_ai.get_newly_completed_items(
+            partial_plan.recommended_agents, emitted_count=emitted_count
+        )
+        for partial_agent in partial_agents:
+            try:
+                recommended_agent = prompts_router.RecommendedAgent.model_validate(
+                    partial_agent.model_dump()
+                )
+            except ValidationError:
+                # Keep the order: the remaining agents are notified when the plan is complete
+                is_streaming_agents = False
+                return
+            on_recommended_agent(recommended_agent)
+            emitted_count += 1
+
+    router_agent = prompts_router.create_router_agent(config=_config, is_async=True)
+    with metrics.llm_caller("router"):
+        response = typing.cast(
+            prompts_router.RouterAgentOutputSchema,
+            await util_ai.run_agent_streaming_async(
+                router_agent,
+                prompts_router.build_input(
+                    user_prompt=user_prompt,
+                    agent_descriptions=candidate_agent_descriptions,
+                    chat_agent_description=chat_agent_description,
+                    previous_plan=previous_plan,
+                    messages=messages,
+                ),
+                on_partial_response=_on_partial_response,
+            ),
+        )
+    for recommended_agent in response.execution_plan.recommended_agents[emitted_count:]:
+        on_recommended_agent(recommended_agent)
+    return response
+
+
+def _log_selected_groups(selected_groups: list[agent_groups.AgentGroup]) -> None:
+    console.log(
+        f"  selected agent groups: {[g.summary.group_name for g in selected_groups]}"
+    )
+
+
+def _run_hierarchical_router(
+    agent_groups_: list[agent_groups.AgentGroup],
+    chat_agent_description: str,
+    _config: Config,
+    user_prompt: str,
+    previous_plan: prompts_router.AgentExecutionPlanSchema | None,
+    messages: list[Message] | None,
+    agent_definitions: list[AgentDefinitionBase] | None,
+) -> prompts_router.RouterAgentOutputSchema:
+    """
+    Route in two stages, for many agents: first select the relevant groups of agents, then route within each selected group (in parallel).
+    - the plans of the groups are merged into one plan (see agent_groups.merge_plans()).
+    """
+    group_router_agent = prompts_group_router.create_group_router_agent(config=_config)
+    with metrics.llm_caller("group_router"):
+        group_response = typing.cast(
+            prompts_group_router.GroupRouterAgentOutputSchema,
+            group_router_agent.run(
+                prompts_group_router.build_input(
+                    user_prompt=user_prompt,
+                    agent_groups=[g.summary for g in agent_groups_],
+                    previous_plan=previous_plan,
+                    messages=messages,
+                )
+            ),
+        )
+    selected_groups = agent_groups.select_agent_groups(
+        agent_groups=agent_groups_,
+        group_names=group_response.group_names,
+        previous_plan=previous_plan,
+    )
+    _log_selected_groups(selected_groups)
+    if not selected_groups:
+        # So the router can still recommend the chat agent
+        selected_groups = agent_groups_
+
+    def _route_group(
+        group: agent_groups.AgentGroup,
+    ) -> prompts_router.RouterAgentOutputSchema:
+        return _run_router(
+            agent_descriptions=group.agent_descriptions,
+            chat_agent_description=chat_agent_description,
+            _config=_config,
+            user_prompt=user_prompt,
+            previous_plan=previous_plan,
+            messages=messages,
+        )
+
+    with ThreadPoolExecutor(max_workers=len(selected_groups)) as executor:
+        # (each in a copy of the context, so the spans of the groups are children of the routing span)
+        futures = [
+            executor.submit(contextvars.copy_context().run, _route_group, group)
+            for group in selected_groups
+        ]
+        responses = [future.result() for future in futures]
+
+    return prompts_router.RouterAgentOutputSchema(
+        execution_plan=agent_groups.merge_plans(
+            [r.execution_plan for r in responses], agent_definitions=agent_definitions
+        )
+    )
+
+
+async def _arun_hierarchical_router(
+    agent_groups_: list[agent_groups.AgentGroup],
+    chat_agent_description: str,
+    _config: Config,
+    user_prompt: str,
+    previous_plan: prompts_router.AgentExecutionPlanSchema | None,
+    messages: list[Message] | None,
+    agent_definitions: list[AgentDefinitionBase] | None,
+) -> prompts_router.RouterAgentOutputSchema:
+    """Async version of _run_hierarchical_router()."""
+    group_router_agent = prompts_group_router.create_group_router_agent(
+        config=_config, is_async=True
+    )
+    with metrics.llm_caller("group_router"):
+        group_response = typing.cast(
+            prompts_group_router.GroupRouterAgentOutputSchema,
+            await util_ai.run_agent_async(
+                group_router_agent,
+                prompts_group_router.build_input(
+                    user_prompt=user_prompt,
+                    agent_groups=[g.summary for g in agent_groups_],
+                    previous_plan=previous_plan,
+                    messages=messages,
+                ),
+            ),
+        )
+    selected_groups = agent_groups.select_agent_groups(
+        agent_groups=agent_groups_,
+        group_names=group_response.group_names,
+        previous_plan=previous_plan,
+    )
+    _log_selected_groups(selected_groups)
+    if not selected_groups:
+        # So the router can still recommend the chat agent
+        selected_groups = agent_groups_
+
+    responses = await asyncio.gather(
+        *[
+            _arun_router(
+                agent_descriptions=group.agent_descriptions,
+                chat_agent_description=chat_agent_description,
+                _config=_config,
                 user_prompt=user_prompt,
+                previous_plan=previous_plan,
+                messages=messages,
+            )
+            for group in selected_groups
+        ]
+    )
+
+    return prompts_router.RouterAgentOutputSchema(
+        execution_plan=agent_groups.merge_plans(
+            [r.execution_plan for r in responses], agent_definitions=agent_definitions
+        )
+    )
+
+
+def generate_plan_via_descriptions(
+    agent_descriptions: list[prompts_router.AgentDescription],
+    chat_agent_description: str,
+    _config: Config,
+    user_prompt: str,
+    previous_plan: prompts_router.AgentExecutionPlanSchema | None = None,
+    messages: list[Message] | None = None,
+    agent_definitions: list[AgentDefinitionBase] | None = None,
+) -> prompts_router.AgentExecutionPlanSchema:
+    """
+    Generate an agent execution plan to fulfill the user prompt, using the provided agents.
+    - can be called again, with new user prompt, providing human-in-the-loop feedback.
+    - agent_definitions (optional): with routing in two stages, lets the agents of different groups run in parallel when they do not depend on each other.
+
+    note: calling this router seperately from generation (agent execution) helps to reduce the *perceived* time taken to generate, since the user gets an (intermediate) response earlier.
+    """
+    tracing.configure_tracing(_config)
+    with tracing.span("generate_plan_via_descriptions"):
+        _log_routing_start(user_prompt=user_prompt, previous_plan=previous_plan)
+
+        start = util_time.start_timer()
+
+        scope_key = plan_cache.build_plan_scope_key(
+            agent_descriptions=agent_descriptions,
+            chat_agent_description=chat_agent_description,
+            previous_plan=previous_plan,
+            messages=messages,
+            user_prompt=user_prompt,
+            _config=_config,
+        )
+        cached_plan = _get_cached_plan_or_none(
+            scope_key=scope_key, user_prompt=user_prompt, _config=_config, start=start
+        )
+        if cached_plan:
+            return cached_plan
+
+        pre_routed_plan = _pre_route_or_none(
+            agent_descriptions=agent_descriptions,
+            user_prompt=user_prompt,
+            previous_plan=previous_plan,
+            _config=_config,
+            start=start,
+        )
+        if pre_routed_plan:
+            return pre_routed_plan
+
+        agent_groups_ = agent_groups.get_agent_groups(agent_descriptions)
+        if agent_groups.is_hierarchical_routing_needed(agent_groups_, _config=_config):
+            response = _run_hierarchical_router(
+                agent_groups_=agent_groups_,
+                chat_agent_description=chat_agent_description,
+                _config=_config,
+                user_prompt=user_prompt,
+                previous_plan=previous_plan,
+                messages=messages,
+                agent_definitions=agent_definitions,
+            )
+        else:
+            response = _run_router(
                 agent_descriptions=agent_descriptions,
                 chat_agent_description=chat_agent_description,
+                _config=_config,
+                user_prompt=user_prompt,
                 previous_plan=previous_plan,
                 messages=messages,
             )
-        ),
-    )
 
-    util_print_agent.print_router_assistant(response, _config=_config)
-    time_taken = util_time.end_timer(start=start)
-    console.log(f"  time taken: {util_time.describe_elapsed_seconds(time_taken)}")
+        _log_routing_end(response=response, _config=_config, start=start)
+
+        _add_plan_to_caches(
+            scope_key=scope_key,
+            user_prompt=user_prompt,
+            plan=response.execution_plan,
+            _config=_config,
+        )
+
+        return response.execution_plan
+
+
+async def agenerate_plan_via_descriptions(
+    agent_descriptions: list[prompts_router.AgentDescription],
+    chat_agent_description: str,
+    _config: Config,
+    user_prompt: str,
+    previous_plan: prompts_router.AgentExecutionPlanSchema | None = None,
+    messages: list[Message] | None = None,
+    on_recommended_agent: OnRecommendedAgent | None = None,
+    agent_definitions: list[AgentDefinitionBase] | None = None,
+) -> prompts_router.AgentExecutionPlanSchema:
+    """
+    Async version of generate_plan_via_descriptions(): uses an async LLM client, so does not block the event loop.
+    - if on_recommended_agent is set, then the router's response is streamed, and on_recommended_agent() is called with each recommended agent as soon as it is complete. This allows the caller to start executing agents before the whole plan is ready.
+    """
+    tracing.configure_tracing(_config)
+    with tracing.span("agenerate_plan_via_descriptions"):
+        _log_routing_start(user_prompt=user_prompt, previous_plan=previous_plan)
+
+        start = util_time.start_timer()
+
+        scope_key = plan_cache.build_plan_scope_key(
+            agent_descriptions=agent_descriptions,
+            chat_agent_description=chat_agent_description,
+            previous_plan=previous_plan,
+            messages=messages,
+            user_prompt=user_prompt,
+            _config=_config,
+        )
+        cached_plan = _get_cached_plan_or_none(
+            scope_key=scope_key, user_prompt=user_prompt, _config=_config, start=start
+        )
+        if cached_plan:
+            _notify_recommended_agents(cached_plan, on_recommended_agent)
+            return cached_plan
+
+        pre_routed_plan = _pre_route_or_none(
+            agent_descriptions=agent_descriptions,
+            user_prompt=user_prompt,
+            previous_plan=previous_plan,
+            _config=_config,
+            start=start,
+        )
+        if pre_routed_plan:
+            _notify_recommended_agents(pre_routed_plan, on_recommended_agent)
+            return pre_routed_plan
+
+        agent_groups_ = agent_groups.get_agent_groups(agent_descriptions)
+        if agent_groups.is_hierarchical_routing_needed(agent_groups_, _config=_config):
+            response = await _arun_hierarchical_router(
+                agent_groups_=agent_groups_,
+                chat_agent_description=chat_agent_description,
+                _config=_config,
+                user_prompt=user_prompt,
+                previous_plan=previous_plan,
+                messages=messages,
+                agent_definitions=agent_definitions,
+            )
+            _notify_recommended_agents(response.execution_plan, on_recommended_agent)
+        elif on_recommended_agent:
+            response = await _astream_router(
+                agent_descriptions=agent_descriptions,
+                chat_agent_description=chat_agent_description,
+                _config=_config,
+                user_prompt=user_prompt,
+                previous_plan=previous_plan,
+                messages=messages,
+                on_recommended_agent=on_recommended_agent,
+            )
+        else:
+            response = await _arun_router(
+                agent_descriptions=agent_descriptions,
+                chat_agent_description=chat_agent_description,
+                _config=_config,
+                user_prompt=user_prompt,
+                previous_plan=previous_plan,
+                messages=messages,
+            )
+
+        _log_routing_end(response=response, _config=_config, start=start)
+
+        _add_plan_to_caches(
+            scope_key=scope_key,
+            user_prompt=user_prompt,
+            plan=response.execution_plan,
+            _config=_config,
+        )
 
-    return response.execution_plan
+        return response.execution_plan
@@ -0,0 +1,442 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import contextvars
+from dataclasses import dataclass, field
+import logging
+import math
+import threading
+import time
+import typing
+
+logger = logging.getLogger(__file__)
+
+METRIC_NAME_PREFIX = "gpt_multi_atomic_agents_"
+
+LATENCY_BUCKETS_SECONDS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+SIZE_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+LabelValues = tuple[str, ...]
+
+
+@dataclass
+class _HistogramValue:
+    bucket_counts: list[int]
+    count: int = 0
+    sum: float = 0.0
+
+
+@dataclass
+class MetricBase:
+    name: str
+    description: str
+    label_names: tuple[str, ...] = ()
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def metric_type(self) -> str:
+        raise NotImplementedError()
+
+    def _to_label_values(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise RuntimeError(
+                f"Metric '{self.name}' expects the labels {self.label_names}, but got {tuple(labels)}"
+            )
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def render_samples(self) -> list[str]:
+        raise NotImplementedError()
+
+
+@dataclass
+class Counter(MetricBase):
+    """A count that only goes up, like the number of LLM calls."""
+
+    _values: dict[LabelValues, float] = field(default_factory=dict, repr=False)
+
+    @property
+    def metric_type(self) -> str:
+        return "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._to_label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._to_label_values(labels), 0.0)
+
+    def render_samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_render_labels(self.label_names, key)} {_render_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+@dataclass
+class Gauge(MetricBase):
+    """A value that can go up or down, like the number of cached agents."""
+
+    _values: dict[LabelValues, float] = field(default_factory=dict, repr=False)
+
+    @property
+    def metric_type(self) -> str:
+        return "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._to_label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._to_label_values(labels), 0.0)
+
+    def render_samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_render_labels(self.label_names, key)} {_render_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+@dataclass
+class Histogram(MetricBase):
+    """A distribution of values, like latencies: counts per bucket (upper bound), plus the count and sum of all values."""
+
+    buckets: tuple[float, ...] = LATENCY_BUCKETS_SECONDS
+    _values: dict[LabelValues, _HistogramValue] = field(
+        default_factory=dict, repr=False
+    )
+
+    @property
+    def metric_type(self) -> str:
+        return "histogram"
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._to_label_values(labels)
+        bucket_index = bisect_left(self.buckets, value)
+        with self._lock:
+            histogram_value = self._values.get(key)
+            if histogram_value is None:
+                histogram_value = _HistogramValue(bucket_counts=[0] * len(self.buckets))
+                self._values[key] = histogram_value
+            if bucket_index < len(self.buckets):
+                histogram_value.bucket_counts[bucket_index] += 1
+            histogram_value.count += 1
+            histogram_value.sum += value
+
+    def get_count(self, **labels: str) -> int:
+        with self._lock:
+            histogram_value = self._values.get(self._to_label_values(labels))
+            return histogram_value.count if histogram_value else 0
+
+    def get_sum(self, **labels: str) -> float:
+        with self._lock:
+            histogram_value = self._values.get(self._to_label_values(labels))
+            return histogram_value.sum if histogram_value else 0.0
+
+    def render_samples(self) -> list[str]:
+        with self._lock:
+            values = {
+                key: (list(v.bucket_counts), v.count, v.sum)
+                for key, v in self._values.items()
+            }
+        lines: list[str] = []
+        for key, (bucket_counts, count, sum_) in sorted(values.items()):
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative_count += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{_render_labels(self.label_names + ('le',), key + (_render_value(upper_bound),))} {cumulative_count}"
+                )
+            lines.append(
+                f"{self.name}_bucket{_render_labels(self.label_names + ('le',), key + ('+Inf',))} {count}"
+            )
+            lines.append(
+                f"{self.name}_count{_render_labels(self.label_names, key)} {count}"
+            )
+            lines.append(
+                f"{self.name}_sum{_render_labels(self.label_names, key)} {_render_value(sum_)}"
+            )
+        return lines
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _render_labels(label_names: tuple[str, ...], label_values: LabelValues) -> str:
+    if not label_names:
+        return ""
+    pairs = ",".join(
+        f'{n}="{_escape_label_value(v)}"' for n, v in zip(label_names, label_values)
+    )
+    return "{" + pairs + "}"
+
+
+def _render_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+TMetric = typing.TypeVar("TMetric", bound=MetricBase)
+
+Collector = typing.Callable[[], None]
+
+
+class MetricsRegistry:
+    """
+    The metrics of this process, in the Prometheus text format (see render_prometheus()).
+    - metrics are created on first use, and are then shared: get the same metric again by calling counter(), gauge() or histogram() with the same name.
+    - a collector is called before the metrics are read, to copy in values that are kept elsewhere (like the statistics of a cache).
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, MetricBase] = {}
+        self._collectors: list[Collector] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(
+        self, metric_class: type[TMetric], name: str, **kwargs: typing.Any
+    ) -> TMetric:
+        full_name = METRIC_NAME_PREFIX + name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = metric_class(name=full_name, **kwargs)
+                self._metrics[full_name] = metric
+        if not isinstance(metric, metric_class):
+            raise RuntimeError(
+                f"Metric '{full_name}' is already registered as a {metric.metric_type}"
+            )
+        return metric
+
+    def counter(
+        self, name: str, description: str, label_names: tuple[str, ...] = ()
+    ) -> Counter:
+        return self._get_or_create(
+            Counter, name, description=description, label_names=label_names
+        )
+
+    def gauge(
+        self, name: str, description: str, label_names: tuple[str, ...] = ()
+    ) -> Gauge:
+        return self._get_or_create(
+            Gauge, name, description=description, label_names=label_names
+        )
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS_SECONDS,
+    ) -> Histogram:
+        return self._get_or_create(
+            Histogram,
+            name,
+            description=description,
+            label_names=label_names,
+            buckets=buckets,
+        )
+
+    def add_collector(self, collector: Collector) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self) -> None:
+        """Call the collectors, so that the metrics that copy values from elsewhere are up to date."""
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.exception(e)
+
+    def get_metrics(self) -> list[MetricBase]:
+        """Get the metrics, after calling the collectors. Use the get*() methods of each metric to read its values."""
+        self.collect()
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def render_prometheus(self) -> str:
+        """Render all the metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines: list[str] = []
+        for metric in self.get_metrics():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines += metric.render_samples()
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Get the process-wide metrics registry: for example to read the metrics in code, or to add your own metrics."""
+    return _registry
+
+
+def render_prometheus() -> str:
+    return _registry.render_prometheus()
+
+
+# The metrics of the library
+ROUTER_SECONDS = _registry.histogram(
+    "router_seconds",
+    "The time to get an execution plan, by route: llm, plan_cache or pre_router",
+    label_names=("route",),
+)
+AGENT_STAGE_SECONDS = _registry.histogram(
+    "agent_stage_seconds",
+    "The time of each stage of executing an agent: build_input, run (the LLM call) or update_blackboard",
+    label_names=("stage", "agent_name"),
+)
+LLM_CALLS = _registry.counter(
+    "llm_calls_total",
+    "The number of LLM responses, by caller (an agent name, or 'router' etc.) and model",
+    label_names=("agent_name", "model"),
+)
+LLM_INPUT_TOKENS = _registry.counter(
+    "llm_input_tokens_total",
+    "The input (prompt) tokens reported by the AI platform",
+    label_names=("agent_name", "model"),
+)
+LLM_OUTPUT_TOKENS = _registry.counter(
+    "llm_output_tokens_total",
+    "The output (completion) tokens reported by the AI platform",
+    label_names=("agent_name", "model"),
+)
+LLM_VALIDATION_RETRIES = _registry.counter(
+    "llm_validation_retries_total",
+    "The number of LLM responses that did not match the output schema, so that instructor asked the LLM again",
+    label_names=("agent_name", "model"),
+)
+BLACKBOARD_SIZE = _registry.histogram(
+    "blackboard_size",
+    "The number of items on the blackboard at the end of a generation, by kind: messages, function_calls or mutation_calls",
+    label_names=("kind",),
+    buckets=SIZE_BUCKETS,
+)
+RATE_LIMIT_WAIT_SECONDS = _registry.histogram(
+    "rate_limit_wait_seconds",
+    "The time that an LLM request waited for the rate limiter (only the requests that had to wait)",
+    label_names=("ai_platform", "model"),
+)
+RATE_LIMIT_THROTTLED = _registry.counter(
+    "rate_limit_throttled_total",
+    "The number of LLM requests that the AI platform throttled (HTTP 429)",
+    label_names=("ai_platform", "model"),
+)
+RATE_LIMIT_CONCURRENCY = _registry.gauge(
+    "rate_limit_concurrency",
+    "The current limit of concurrent LLM requests, as adjusted by the rate limiter",
+    label_names=("ai_platform", "model"),
+)
+LLM_RETRIES = _registry.counter(
+    "llm_retries_total",
+    "The LLM requests that were retried after a transient error, by reason: the HTTP status code or the error type",
+    label_names=("agent_name", "model", "reason"),
+)
+LLM_ATTEMPTS = _registry.histogram(
+    "llm_attempts",
+    "The number of attempts of each LLM call (1 if it was not retried)",
+    label_names=("agent_name", "model"),
+    buckets=(1, 2, 3, 4, 5, 10),
+)
+LLM_HEDGES = _registry.counter(
+    "llm_hedges_total",
+    "The slow LLM requests that were hedged (a duplicate request was sent), by the winner: original, hedge or none (both failed)",
+    label_names=("agent_name", "model", "winner"),
+)
+LLM_HEDGE_DELAY_SECONDS = _registry.gauge(
+    "llm_hedge_delay_seconds",
+    "How long a request waits before it is hedged: the recent p95 latency (or the configured percentile)",
+    label_names=("agent_name", "model"),
+)
+CACHE_HITS = _registry.gauge(
+    "cache_hits",
+    "The hits of each cache, since the process started",
+    label_names=("cache",),
+)
+CACHE_MISSES = _registry.gauge(
+    "cache_misses",
+    "The misses of each cache, since the process started",
+    label_names=("cache",),
+)
+CACHE_HIT_RATIO = _registry.gauge(
+    "cache_hit_ratio",
+    "The fraction of the lookups of each cache that were hits",
+    label_names=("cache",),
+)
+CACHE_SIZE = _registry.gauge(
+    "cache_size",
+    "The number of entries in each cache",
+    label_names=("cache",),
+)
+
+UNKNOWN_CALLER = "unknown"
+
+_llm_caller: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "llm_caller", default=UNKNOWN_CALLER
+)
+
+
+@contextmanager
+def llm_caller(caller_name: str) -> typing.Iterator[None]:
+    """Attribute the LLM calls made in this block (in this thread or task) to the caller, for the token and retry metrics."""
+    token = _llm_caller.set(caller_name)
+    try:
+        yield
+    finally:
+        _llm_caller.reset(token)
+
+
+def get_llm_caller() -> str:
+    return _llm_caller.get()
+
+
+@contextmanager
+def time_agent_stage(stage: str, agent_name: str) -> typing.Iterator[None]:
+    """Time a stage of executing an agent. The LLM calls made in the block are attributed to the agent."""
+    start = time.perf_counter()
+    try:
+        with llm_caller(agent_name):
+            yield
+    finally:
+        AGENT_STAGE_SECONDS.observe(
+            time.perf_counter() - start, stage=stage, agent_name=agent_name
+        )
+
+
+def record_cache_stats(
+    cache: str, hits: int, misses: int, size: int | None = None
+) -> None:
+    """For a collector: copy the statistics of a cache into the cache metrics."""
+    CACHE_HITS.set(hits, cache=cache)
+    CACHE_MISSES.set(misses, cache=cache)
+    CACHE_HIT_RATIO.set(hits / (hits + misses) if hits + misses else 0.0, cache=cache)
+    if size is not None:
+        CACHE_SIZE.set(size, cache=cache)
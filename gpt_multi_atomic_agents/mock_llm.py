@@ -0,0 +1,456 @@
+import asyncio
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import typing
+
+import instructor
+from instructor.hooks import Hooks
+from pydantic import BaseModel
+
+from . import util_tokens
+from .config import Config, MOCK_LATENCY_Enum, MOCK_MODE_Enum
+from .util_pydantic import CustomBaseModel
+
+logger = logging.getLogger(__file__)
+
+# A replayed stream is split into chunks of this many characters (about 4 tokens)
+STREAM_CHUNK_CHARACTERS = 16
+# The share of a replayed stream's latency that is before the first chunk (the time to first token)
+STREAM_FIRST_CHUNK_LATENCY_SHARE = 0.3
+
+
+class CassetteEntry(CustomBaseModel):
+    """One recorded LLM request and its response."""
+
+    request_key: str
+    response_model_name: str
+    response_json: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency_seconds: float = 0.0
+
+
+def build_request_key(response_model_name: str, messages: list[typing.Any]) -> str:
+    """A hash of the request. The model is not included, so a cassette recorded with one model can be replayed for any model."""
+    return hashlib.sha256(
+        json.dumps(
+            {"response_model": response_model_name, "messages": messages},
+            sort_keys=True,
+            default=str,
+        ).encode()
+    ).hexdigest()
+
+
+class Cassette:
+    """
+    The recorded LLM responses, in a JSON lines file (one CassetteEntry per line).
+    - if a request was recorded more than once, then its responses are replayed in turn.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._entries_by_key: dict[str, list[CassetteEntry]] = {}
+        self._entries_by_response_model: dict[str, list[CassetteEntry]] = {}
+        self._replay_counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _index(self, entry: CassetteEntry) -> None:
+        self._entries_by_key.setdefault(entry.request_key, []).append(entry)
+        self._entries_by_response_model.setdefault(
+            entry.response_model_name, []
+        ).append(entry)
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    self._index(CassetteEntry.model_validate_json(line))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(e) for e in self._entries_by_key.values())
+
+    def add(self, entry: CassetteEntry) -> None:
+        with self._lock:
+            self._index(entry)
+            dir_path = os.path.dirname(self.path)
+            if dir_path:
+                os.makedirs(dir_path, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(entry.model_dump_json() + "\n")
+
+    def find(
+        self, request_key: str, response_model_name: str, is_strict: bool
+    ) -> CassetteEntry:
+        """Find the recorded response. If not is_strict, then a request that was not recorded gets a recorded response of the same output schema."""
+        with self._lock:
+            replay_key = request_key
+            entries = self._entries_by_key.get(request_key)
+            if not entries and not is_strict:
+                replay_key = response_model_name
+                entries = self._entries_by_response_model.get(response_model_name)
+            if not entries:
+                raise RuntimeError(
+                    f"The request was not recorded in the cassette '{self.path}' (output schema: {response_model_name}). To record it, set mock_mode='record'. To replay another response of the same output schema, set mock_is_strict=false."
+                )
+            replay_count = self._replay_counts.get(replay_key, 0)
+            self._replay_counts[replay_key] = replay_count + 1
+            return entries[replay_count % len(entries)]
+
+
+class LatencyModel:
+    """Samples the injected latency of each replayed response, from the configured distribution. Seeded, so a run can be repeated."""
+
+    def __init__(self, _config: Config) -> None:
+        self.latency = _config.mock_latency
+        self.mean_seconds = _config.mock_latency_seconds
+        self.spread_seconds = _config.mock_latency_spread_seconds
+        self._random = random.Random(_config.mock_random_seed)
+        self._lock = threading.Lock()
+
+    def _sample_lognormal(self) -> float:
+        if self.mean_seconds <= 0:
+            return 0.0
+        # The mu and sigma that give the configured mean and standard deviation
+        sigma_squared = math.log(1 + (self.spread_seconds / self.mean_seconds) ** 2)
+        mu = math.log(self.mean_seconds) - sigma_squared / 2
+        return self._random.lognormvariate(mu, math.sqrt(sigma_squared))
+
+    def sample(self, entry: CassetteEntry) -> float:
+        with self._lock:
+            match self.latency:
+                case MOCK_LATENCY_Enum.none:
+                    seconds = 0.0
+                case MOCK_LATENCY_Enum.recorded:
+                    seconds = entry.latency_seconds
+                case MOCK_LATENCY_Enum.constant:
+                    seconds = self.mean_seconds
+                case MOCK_LATENCY_Enum.uniform:
+                    seconds = self._random.uniform(
+                        self.mean_seconds - self.spread_seconds,
+                        self.mean_seconds + self.spread_seconds,
+                    )
+                case MOCK_LATENCY_Enum.normal:
+                    seconds = self._random.gauss(self.mean_seconds, self.spread_seconds)
+                case MOCK_LATENCY_Enum.lognormal:
+                    seconds = self._sample_lognormal()
+                case _:
+                    raise RuntimeError(
+                        f"Not a recognised mock latency: '{self.latency}' - please check Config."
+                    )
+        return max(0.0, seconds)
+
+
+def _get_response_model_name(response_model: typing.Any, is_stream: bool) -> str:
+    # A streamed response model is instructor.Partial[X], which is a subclass of X
+    base_model = response_model.__bases__[0] if is_stream else response_model
+    return str(base_model.__name__)
+
+
+def _split_into_chunks(text: str) -> list[str]:
+    return [
+        text[i : i + STREAM_CHUNK_CHARACTERS]
+        for i in range(0, len(text), STREAM_CHUNK_CHARACTERS)
+    ]
+
+
+def _get_chunk_delays(latency_seconds: float, chunk_count: int) -> list[float]:
+    if chunk_count <= 1:
+        return [latency_seconds] * chunk_count
+    first_delay = latency_seconds * STREAM_FIRST_CHUNK_LATENCY_SHARE
+    other_delay = (latency_seconds - first_delay) / (chunk_count - 1)
+    return [first_delay] + [other_delay] * (chunk_count - 1)
+
+
+@dataclass
+class _MockUsage:
+    prompt_tokens: int
+    completion_tokens: int
+
+
+@dataclass
+class _MockResponse:
+    """Passed to the instructor hooks, like a raw response of an AI platform (see util_tokens.get_llm_token_usage())."""
+
+    usage: _MockUsage
+
+
+class _ReplayingLlm:
+    """Replays the responses from the cassette, as an instructor create() function."""
+
+    def __init__(self, cassette: Cassette, _config: Config) -> None:
+        self.cassette = cassette
+        self.latency_model = LatencyModel(_config)
+        self.is_strict = _config.mock_is_strict
+
+    def _find_entry(
+        self, response_model: typing.Any, messages: list[typing.Any], is_stream: bool
+    ) -> CassetteEntry:
+        response_model_name = _get_response_model_name(response_model, is_stream)
+        return self.cassette.find(
+            request_key=build_request_key(response_model_name, messages),
+            response_model_name=response_model_name,
+            is_strict=self.is_strict,
+        )
+
+    def _emit_request(
+        self, hooks: Hooks | None, messages: list[typing.Any], **kwargs: typing.Any
+    ) -> None:
+        if hooks:
+            hooks.emit_completion_arguments(
+                messages=messages, model=kwargs.get("model")
+            )
+
+    def _emit_response(self, hooks: Hooks | None, entry: CassetteEntry) -> None:
+        if hooks:
+            hooks.emit_completion_response(
+                _MockResponse(
+                    usage=_MockUsage(
+                        prompt_tokens=entry.input_tokens,
+                        completion_tokens=entry.output_tokens,
+                    )
+                )
+            )
+
+    def create(
+        self,
+        response_model: typing.Any,
+        messages: list[typing.Any],
+        hooks: Hooks | None = None,
+        **kwargs: typing.Any,
+    ) -> typing.Any:
+        is_stream = bool(kwargs.get("stream"))
+        entry = self._find_entry(response_model, messages, is_stream=is_stream)
+        latency_seconds = self.latency_model.sample(entry)
+        self._emit_request(hooks, messages, **kwargs)
+        if is_stream:
+            return self._create_stream(response_model, entry, latency_seconds, hooks)
+        time.sleep(latency_seconds)
+        self._emit_response(hooks, entry)
+        return response_model.model_validate_json(entry.response_json)
+
+    def _create_stream(
+        self,
+        response_model: typing.Any,
+        entry: CassetteEntry,
+        latency_seconds: float,
+        hooks: Hooks | None,
+    ) -> typing.Iterator[typing.Any]:
+        chunks = _split_into_chunks(entry.response_json)
+        delays = _get_chunk_delays(latency_seconds, len(chunks))
+
+        def _generate_chunks() -> typing.Iterator[str]:
+            for chunk, delay in zip(chunks, delays):
+                time.sleep(delay)
+                yield chunk
+
+        yield from response_model.model_from_chunks(_generate_chunks())
+        self._emit_response(hooks, entry)
+
+    async def acreate(
+        self,
+        response_model: typing.Any,
+        messages: list[typing.Any],
+        hooks: Hooks | None = None,
+        **kwargs: typing.Any,
+    ) -> typing.Any:
+        """Async version of create(). For a stream, returns an async generator (as instructor.AsyncInstructor expects)."""
+        is_stream = bool(kwargs.get("stream"))
+        entry = self._find_entry(response_model, messages, is_stream=is_stream)
+        latency_seconds = self.latency_model.sample(entry)
+        self._emit_request(hooks, messages, **kwargs)
+        if is_stream:
+            return self._acreate_stream(response_model, entry, latency_seconds, hooks)
+        await asyncio.sleep(latency_seconds)
+        self._emit_response(hooks, entry)
+        return response_model.model_validate_json(entry.response_json)
+
+    async def _acreate_stream(
+        self,
+        response_model: typing.Any,
+        entry: CassetteEntry,
+        latency_seconds: float,
+        hooks: Hooks | None,
+    ) -> typing.AsyncIterator[typing.Any]:
+        chunks = _split_into_chunks(entry.response_json)
+        delays = _get_chunk_delays(latency_seconds, len(chunks))
+
+        async def _generate_chunks() -> typing.AsyncIterator[str]:
+            for chunk, delay in zip(chunks, delays):
+                await asyncio.sleep(delay)
+                yield chunk
+
+        async for partial_response in response_model.model_from_chunks_async(
+            _generate_chunks()
+        ):
+            yield partial_response
+        self._emit_response(hooks, entry)
+
+
+class _RecordingLlm:
+    """Calls the real AI platform, and records each request and response in the cassette, as an instructor create() function."""
+
+    def __init__(
+        self, cassette: Cassette, recorded_client: instructor.Instructor
+    ) -> None:
+        self.cassette = cassette
+        self.recorded_client = recorded_client
+
+    def _record(
+        self,
+        response_model_name: str,
+        messages: list[typing.Any],
+        response: BaseModel,
+        start: float,
+    ) -> None:
+        response_json = response.model_dump_json()
+        token_usage = util_tokens.get_llm_token_usage(
+            getattr(response, "_raw_response", None)
+        )
+        if token_usage is None:
+            # For example a streamed response
+            token_usage = (
+                util_tokens.estimate_tokens(json.dumps(messages, default=str)),
+                util_tokens.estimate_tokens(response_json),
+            )
+        input_tokens, output_tokens = token_usage
+        self.cassette.add(
+            CassetteEntry(
+                request_key=build_request_key(response_model_name, messages),
+                response_model_name=response_model_name,
+                response_json=response_json,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                latency_seconds=time.perf_counter() - start,
+            )
+        )
+
+    def create(
+        self,
+        response_model: typing.Any,
+        messages: list[typing.Any],
+        hooks: Hooks | None = None,
+        **kwargs: typing.Any,
+    ) -> typing.Any:
+        # (the hooks are not passed on: the recorded client has its own hooks)
+        if kwargs.pop("stream", False):
+            return self._create_stream(response_model, messages, **kwargs)
+        start = time.perf_counter()
+        response = self.recorded_client.chat.completions.create(
+            response_model=response_model, messages=messages, **kwargs
+        )
+        self._record(response_model.__name__, messages, response, start)
+        return response
+
+    def _create_stream(
+        self,
+        response_model: typing.Any,
+        messages: list[typing.Any],
+        **kwargs: typing.Any,
+    ) -> typing.Iterator[typing.Any]:
+        base_model = response_model.__bases__[0]
+        start = time.perf_counter()
+        last_partial_response: typing.Any = None
+        for partial_response in self.recorded_client.chat.completions.create_partial(
+            response_model=base_model, messages=messages, **kwargs
+        ):
+            last_partial_response = partial_response
+            yield partial_response
+        if last_partial_response is not None:
+            response = base_model.model_validate(last_partial_response.model_dump())
+            self._record(base_model.__name__, messages, response, start)
+
+    async def acreate(
+        self,
+        response_model: typing.Any,
+        messages: list[typing.Any],
+        hooks: Hooks | None = None,
+        **kwargs: typing.Any,
+    ) -> typing.Any:
+        """Async version of create()."""
+        if kwargs.pop("stream", False):
+            return self._acreate_stream(response_model, messages, **kwargs)
+        start = time.perf_counter()
+        response = await self.recorded_client.chat.completions.create(
+            response_model=response_model, messages=messages, **kwargs
+        )
+        self._record(response_model.__name__, messages, response, start)
+        return response
+
+    async def _acreate_stream(
+        self,
+        response_model: typing.Any,
+        messages: list[typing.Any],
+        **kwargs: typing.Any,
+    ) -> typing.AsyncIterator[typing.Any]:
+        base_model = response_model.__bases__[0]
+        # (typed as Any, since the recorded client is an instructor.AsyncInstructor)
+        recorded_client: typing.Any = self.recorded_client
+        start = time.perf_counter()
+        last_partial_response: typing.Any = None
+        async for partial_response in recorded_client.chat.completions.create_partial(
+            response_model=base_model, messages=messages, **kwargs
+        ):
+            last_partial_response = partial_response
+            yield partial_response
+        if last_partial_response is not None:
+            response = base_model.model_validate(last_partial_response.model_dump())
+            self._record(base_model.__name__, messages, response, start)
+
+
+_cassettes: dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: str) -> Cassette:
+    """Get the cassette at the path. One cassette is shared per path, so recordings are seen by the replaying clients."""
+    with _cassettes_lock:
+        cassette = _cassettes.get(path)
+        if cassette is None:
+            cassette = Cassette(path)
+            _cassettes[path] = cassette
+        return cassette
+
+
+def clear_cassettes() -> None:
+    """Forget the loaded cassettes, for example after changing a cassette file."""
+    with _cassettes_lock:
+        _cassettes.clear()
+
+
+def create_mock_client(
+    _config: Config,
+    is_async: bool,
+    recorded_client: instructor.Instructor | None = None,
+) -> instructor.Instructor:
+    """
+    Create an instructor client for the mock AI platform (see util_ai.create_client()).
+    - in replay mode, the responses are replayed from the cassette, with the configured latency.
+    - in record mode, the requests are sent to the recorded_client (a client of the real AI platform), and are recorded in the cassette.
+    """
+    cassette = get_cassette(_config.mock_cassette_path)
+    llm: _ReplayingLlm | _RecordingLlm
+    if _config.mock_mode == MOCK_MODE_Enum.record:
+        if recorded_client is None:
+            raise RuntimeError("The mock AI platform needs a client to record")
+        llm = _RecordingLlm(cassette=cassette, recorded_client=recorded_client)
+    else:
+        llm = _ReplayingLlm(cassette=cassette, _config=_config)
+
+    if is_async:
+        return instructor.AsyncInstructor(
+            client=None, create=llm.acreate, mode=instructor.Mode.TOOLS
+        )
+    return instructor.Instructor(
+        client=None, create=llm.create, mode=instructor.Mode.TOOLS
+    )
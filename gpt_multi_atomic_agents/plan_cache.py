@@ -0,0 +1,277 @@
+from abc import abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import typing
+
+from .blackboard import Message, MessageRole
+from . import metrics
+from .config import Config, PLAN_CACHE_BACKEND_Enum
+from .prompts_router import AgentDescription, AgentExecutionPlanSchema
+
+logger = logging.getLogger(__file__)
+
+
+@dataclass
+class PlanCacheStats:
+    hits: int = 0
+    misses: int = 0
+    size: int = 0
+
+
+class PlanCacheBase:
+    """
+    Caches execution plans, keyed by a hash of everything the router sees (see build_plan_cache_key()).
+    - entries expire after ttl_seconds, and the least recently used entry is evicted when there are more than max_entries.
+    - plans are stored as JSON, so each hit returns a new plan that the caller can modify.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._stats = PlanCacheStats()
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> AgentExecutionPlanSchema | None:
+        plan_json = self._get(key=key, now=time.time())
+        with self._stats_lock:
+            if plan_json is None:
+                self._stats.misses += 1
+                return None
+            self._stats.hits += 1
+        return typing.cast(
+            AgentExecutionPlanSchema,
+            AgentExecutionPlanSchema.model_validate_json(plan_json),
+        )
+
+    def set(self, key: str, plan: AgentExecutionPlanSchema) -> None:
+        self._set(key=key, plan_json=plan.model_dump_json(), now=time.time())
+
+    def get_stats(self) -> PlanCacheStats:
+        with self._stats_lock:
+            return PlanCacheStats(
+                hits=self._stats.hits, misses=self._stats.misses, size=self.get_size()
+            )
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return now - created_at > self.ttl_seconds
+
+    @abstractmethod
+    def _get(self, key: str, now: float) -> str | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _set(self, key: str, plan_json: str, now: float) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_size(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryPlanCache(PlanCacheBase):
+    """An in-process plan cache. Fastest, but not shared between worker processes."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        super().__init__(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        # key -> (created_at, plan_json)
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str, now: float) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, plan_json = entry
+            if self._is_expired(created_at=created_at, now=now):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return plan_json
+
+    def _set(self, key: str, plan_json: str, now: float) -> None:
+        with self._lock:
+            self._entries[key] = (now, plan_json)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SqlitePlanCache(PlanCacheBase):
+    """A plan cache in a local SQLite file. Survives restarts, and can be shared by the worker processes on one machine."""
+
+    def __init__(self, path_to_db: str, max_entries: int, ttl_seconds: float) -> None:
+        super().__init__(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        dir_path = os.path.dirname(path_to_db)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path_to_db, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS plan_cache (key TEXT PRIMARY KEY, plan_json TEXT NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS plan_cache_last_used_at ON plan_cache (last_used_at)"
+            )
+
+    def _get(self, key: str, now: float) -> str | None:
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT plan_json, created_at FROM plan_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            plan_json, created_at = row
+            if self._is_expired(created_at=created_at, now=now):
+                self._connection.execute("DELETE FROM plan_cache WHERE key = ?", (key,))
+                return None
+            self._connection.execute(
+                "UPDATE plan_cache SET last_used_at = ? WHERE key = ?", (now, key)
+            )
+            return str(plan_json)
+
+    def _set(self, key: str, plan_json: str, now: float) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO plan_cache (key, plan_json, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                (key, plan_json, now, now),
+            )
+            self._connection.execute(
+                "DELETE FROM plan_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self._connection.execute(
+                "DELETE FROM plan_cache WHERE key NOT IN (SELECT key FROM plan_cache ORDER BY last_used_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def get_size(self) -> int:
+        with self._lock:
+            row = self._connection.execute("SELECT COUNT(*) FROM plan_cache").fetchone()
+            return int(row[0])
+
+    def clear(self) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM plan_cache")
+
+
+def normalize_prompt(user_prompt: str) -> str:
+    return re.sub(r"\s+", " ", user_prompt.strip().lower())
+
+
+def build_plan_scope_key(
+    agent_descriptions: list[AgentDescription],
+    chat_agent_description: str,
+    previous_plan: AgentExecutionPlanSchema | None,
+    messages: list[Message] | None,
+    user_prompt: str,
+    _config: Config,
+) -> str:
+    """
+    Build a hash of everything the router sees, except for the user prompt: a cached plan can only be re-used within the same scope.
+    - the generate functions add the user prompt to the messages before routing: that last message is left out, so paraphrases of the prompt share a scope.
+    """
+    messages = list(messages or [])
+    if (
+        messages
+        and messages[-1].role == MessageRole.user
+        and messages[-1].message == user_prompt
+    ):
+        messages = messages[:-1]
+    messages_digest = hashlib.sha256(
+        "\n".join(f"{m.role}:{m.message}" for m in messages).encode()
+    ).hexdigest()
+    parts = [
+        _config.ai_platform,
+        _config.model,
+        repr(agent_descriptions),
+        chat_agent_description,
+        previous_plan.model_dump_json() if previous_plan else "",
+        messages_digest,
+    ]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def build_plan_cache_key(scope_key: str, user_prompt: str) -> str:
+    """
+    Build the cache key from the scope (see build_plan_scope_key()) and the user prompt, so that a cached plan is only re-used for the same request.
+    - the user prompt is normalized (case and whitespace), so trivially different prompts share a plan.
+    """
+    return hashlib.sha256(
+        f"{scope_key}\0{normalize_prompt(user_prompt)}".encode()
+    ).hexdigest()
+
+
+_plan_caches: dict[tuple, PlanCacheBase] = {}
+_plan_caches_lock = threading.Lock()
+
+
+def get_plan_cache(_config: Config) -> PlanCacheBase | None:
+    """Get the plan cache for the Config, or None if the plan cache is disabled. One cache is shared per backend setting."""
+    match _config.plan_cache_backend:
+        case PLAN_CACHE_BACKEND_Enum.none:
+            return None
+        case PLAN_CACHE_BACKEND_Enum.memory | PLAN_CACHE_BACKEND_Enum.sqlite:
+            pass
+        case _:
+            raise RuntimeError(
+                f"Not a recognised plan cache backend: '{_config.plan_cache_backend}' - please check Config."
+            )
+
+    key = (
+        _config.plan_cache_backend,
+        _config.plan_cache_sqlite_path,
+        _config.plan_cache_max_entries,
+        _config.plan_cache_ttl_seconds,
+    )
+    with _plan_caches_lock:
+        plan_cache = _plan_caches.get(key)
+        if plan_cache is None:
+            if _config.plan_cache_backend == PLAN_CACHE_BACKEND_Enum.sqlite:
+                plan_cache = SqlitePlanCache(
+                    path_to_db=_config.plan_cache_sqlite_path,
+                    max_entries=_config.plan_cache_max_entries,
+                    ttl_seconds=_config.plan_cache_ttl_seconds,
+                )
+            else:
+                plan_cache = MemoryPlanCache(
+                    max_entries=_config.plan_cache_max_entries,
+                    ttl_seconds=_config.plan_cache_ttl_seconds,
+                )
+            _plan_caches[key] = plan_cache
+            logger.info(f"Created plan cache: {_config.plan_cache_backend}")
+        return plan_cache
+
+
+def _collect_metrics() -> None:
+    with _plan_caches_lock:
+        plan_caches = list(_plan_caches.values())
+    all_stats = [c.get_stats() for c in plan_caches]
+    metrics.record_cache_stats(
+        "plan",
+        hits=sum(s.hits for s in all_stats),
+        misses=sum(s.misses for s in all_stats),
+        size=sum(s.size for s in all_stats),
+    )
+
+
+metrics.get_metrics_registry().add_collector(_collect_metrics)
@@ -0,0 +1,223 @@
+from dataclasses import dataclass
+import hashlib
+import logging
+import re
+import threading
+
+from . import metrics
+from .prompts_router import (
+    AgentDescription,
+    AgentExecutionPlanSchema,
+    ParamNameToValues,
+    RecommendedAgent,
+)
+
+logger = logging.getLogger(__file__)
+
+# Parameter names like 'creature_name' are indexed by their meaningful words only ('creature')
+_GENERIC_PARAMETER_WORDS = {"name", "names", "id", "ids", "type", "types", "value"}
+
+# A prompt with more than one request, or a question, is left to the LLM router (which can split it, or send it to the chat agent)
+_AMBIGUOUS_PROMPT_REGEX = re.compile(
+    r"\?|[,;]|\b(and|then|also|or|what|why|how|who|which|when|where)\b"
+)
+
+# A topic word alone is not a clear request ('tell me a joke about creatures'): the prompt must start with one of these verbs, after any polite words
+_ACTION_VERBS = {
+    "add",
+    "build",
+    "change",
+    "create",
+    "delete",
+    "drop",
+    "edit",
+    "generate",
+    "insert",
+    "make",
+    "modify",
+    "move",
+    "remove",
+    "rename",
+    "replace",
+    "set",
+    "update",
+}
+_POLITE_WORDS = {"please", "kindly"}
+
+# A negated request ('do not add any creatures') is left to the LLM router
+_NEGATION_REGEX = re.compile(r"\b(no|not|never|none|nothing|without|nor|dont)\b|n't\b")
+
+# A parameter value is only extracted when it is named explicitly, like 'a creature called Wolf'
+_PARAMETER_VALUE_REGEX = re.compile(
+    r"\b(?:called|named)\s+[\"']?([\w-]+)", re.IGNORECASE
+)
+
+# The same for every agent, since the prompt does not mention an agent
+PLAN_CHAT_MESSAGE = "OK, I will handle your request."
+
+
+@dataclass
+class PreRouterStats:
+    fast_path_count: int = 0
+    fall_through_count: int = 0
+
+
+def _stem(word: str) -> str:
+    """A naive stemmer, so that 'creatures' matches the topic 'creature'."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _tokenize(text: str) -> list[str]:
+    return [_stem(w) for w in re.findall(r"[a-z0-9]+", text.lower())]
+
+
+def _starts_with_action_verb(user_prompt: str) -> bool:
+    for word in re.findall(r"[a-z]+", user_prompt.lower()):
+        if word not in _POLITE_WORDS:
+            return word in _ACTION_VERBS
+    return False
+
+
+def is_clear_request(user_prompt: str) -> bool:
+    """Is the prompt a single request to do something: it starts with an action verb, and is not negated, a question, or more than one request?"""
+    lower_prompt = user_prompt.lower()
+    return (
+        _starts_with_action_verb(user_prompt)
+        and not _NEGATION_REGEX.search(lower_prompt)
+        and not _AMBIGUOUS_PROMPT_REGEX.search(lower_prompt)
+    )
+
+
+class PreRouter:
+    """
+    A deterministic router, that recommends an agent without calling the LLM when the prompt is unambiguous.
+    - built once per agent set: an inverted index from the words of each agent's topics and parameter names, to the agent.
+    - a prompt is unambiguous when it is a clear request (see is_clear_request()), and the topics of exactly one agent match it.
+    """
+
+    def __init__(self, agent_descriptions: list[AgentDescription]) -> None:
+        # first word of a term -> (agent name, all words of the term)
+        self._index: dict[str, list[tuple[str, list[str]]]] = {}
+        self._agent_parameter_names: dict[str, list[str]] = {}
+        for agent in agent_descriptions:
+            self._agent_parameter_names[agent.agent_name] = agent.agent_parameter_names
+            terms = [_tokenize(topic) for topic in agent.topics] + [
+                [
+                    w
+                    for w in _tokenize(name.replace("_", " "))
+                    if w not in _GENERIC_PARAMETER_WORDS
+                ]
+                for name in agent.agent_parameter_names
+            ]
+            for term in terms:
+                if term:
+                    self._index.setdefault(term[0], []).append((agent.agent_name, term))
+
+    def find_matching_agent_names(self, user_prompt: str) -> set[str]:
+        word_set = set(_tokenize(user_prompt))
+        matching_agent_names: set[str] = set()
+        for word in word_set:
+            for agent_name, term in self._index.get(word, []):
+                if all(w in word_set for w in term):
+                    matching_agent_names.add(agent_name)
+        return matching_agent_names
+
+    def extract_agent_parameters(
+        self, agent_name: str, user_prompt: str
+    ) -> ParamNameToValues:
+        """
+        Extract the agent parameters from the prompt, without the LLM.
+        - only when the agent has one parameter, else the values could go to the wrong parameter.
+        - otherwise the parameters are left empty, so the data is not narrowed by them (the same as when the LLM router extracts no values).
+        """
+        parameter_names = self._agent_parameter_names.get(agent_name, [])
+        if len(parameter_names) != 1:
+            return {}
+        values = _PARAMETER_VALUE_REGEX.findall(user_prompt)
+        if not values:
+            return {}
+        return {parameter_names[0]: values}
+
+    def route_or_none(self, user_prompt: str) -> AgentExecutionPlanSchema | None:
+        """Get a plan for the prompt, or None if the LLM router is needed."""
+        if not is_clear_request(user_prompt):
+            return None
+        matching_agent_names = self.find_matching_agent_names(user_prompt)
+        if len(matching_agent_names) != 1:
+            return None
+        agent_name = next(iter(matching_agent_names))
+        return AgentExecutionPlanSchema(
+            chat_message=PLAN_CHAT_MESSAGE,
+            recommended_agents=[
+                RecommendedAgent(
+                    agent_name=agent_name,
+                    rewritten_user_prompt=user_prompt,
+                    agent_parameters=self.extract_agent_parameters(
+                        agent_name=agent_name, user_prompt=user_prompt
+                    ),
+                )
+            ],
+        )
+
+
+MAX_CACHED_PRE_ROUTERS = 64
+
+_pre_routers: dict[str, PreRouter] = {}
+_stats = PreRouterStats()
+_lock = threading.Lock()
+
+
+def try_route(
+    agent_descriptions: list[AgentDescription], user_prompt: str
+) -> AgentExecutionPlanSchema | None:
+    """
+    Try to route the prompt without the LLM. Returns None if the prompt is ambiguous.
+    - the index is only built once per agent set.
+    """
+    key = hashlib.sha256(repr(agent_descriptions).encode()).hexdigest()
+    with _lock:
+        pre_router = _pre_routers.get(key)
+    if pre_router is None:
+        pre_router = PreRouter(agent_descriptions=agent_descriptions)
+        with _lock:
+            if len(_pre_routers) >= MAX_CACHED_PRE_ROUTERS:
+                _pre_routers.clear()
+            _pre_routers[key] = pre_router
+
+    plan = pre_router.route_or_none(user_prompt)
+    with _lock:
+        if plan:
+            _stats.fast_path_count += 1
+        else:
+            _stats.fall_through_count += 1
+    if plan:
+        logger.info(f"Pre-router fast path: '{plan.recommended_agents[0].agent_name}'")
+    return plan
+
+
+def get_pre_router_stats() -> PreRouterStats:
+    with _lock:
+        return PreRouterStats(
+            fast_path_count=_stats.fast_path_count,
+            fall_through_count=_stats.fall_through_count,
+        )
+
+
+def _collect_metrics() -> None:
+    stats = get_pre_router_stats()
+    with _lock:
+        size = len(_pre_routers)
+    # A hit is a prompt that did not need the LLM router
+    metrics.record_cache_stats(
+        "pre_router",
+        hits=stats.fast_path_count,
+        misses=stats.fall_through_count,
+        size=size,
+    )
+
+
+metrics.get_metrics_registry().add_collector(_collect_metrics)
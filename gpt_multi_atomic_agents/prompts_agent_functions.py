@@ -1,5 +1,7 @@
 # A generic Agent prompt.
 # - more specialized prompts can be set when creating the relevant AgentSpec.
+import functools
+
 from . import util_output
 from .config import Config
 
@@ -44,16 +46,26 @@ Notes:
 """
 
 
-def build_agent_prompt(
-    allowed_functions_to_generate_names: list[str], topics: list[str], _config: Config
+@functools.lru_cache(maxsize=256)
+def _render_agent_prompt(
+    allowed_functions_to_generate_names: tuple[str, ...], topics: tuple[str, ...]
 ) -> str:
-    def _join(strings: list[str]) -> str:
+    def _join(strings: tuple[str, ...]) -> str:
         return ", ".join(strings)
 
-    prompt = GENERIC_AGENT_PROMPT_TEMPLATE.replace("{TOPICS}", _join(topics)).replace(
+    return GENERIC_AGENT_PROMPT_TEMPLATE.replace("{TOPICS}", _join(topics)).replace(
         "{AVAILABLE_FUNCTIONS}", _join(allowed_functions_to_generate_names)
     )
 
+
+def build_agent_prompt(
+    allowed_functions_to_generate_names: list[str], topics: list[str], _config: Config
+) -> str:
+    # The rendered prompt only depends on the names and topics, so it is cached
+    prompt = _render_agent_prompt(
+        tuple(allowed_functions_to_generate_names), tuple(topics)
+    )
+
     util_output.print_debug(f"prompt: {prompt}", config=_config)
 
     return prompt
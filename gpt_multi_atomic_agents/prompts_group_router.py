@@ -0,0 +1,109 @@
+from atomic_agents.agents.base_agent import (
+    BaseIOSchema,
+    BaseAgent,
+    BaseAgentConfig,
+)
+from atomic_agents.lib.components.system_prompt_generator import SystemPromptGenerator
+from pydantic import Field
+
+from . import agent_cache, util_ai
+from .blackboard import Message
+from .config import Config
+from .prompts_router import AgentExecutionPlanSchema
+
+
+class AgentGroupSummary(BaseIOSchema):
+    """
+    This schema represents one group of agents, summarized by the topics that its agents handle.
+    """
+
+    group_name: str = Field(description="The name of the group of agents")
+    topics: list[str] = Field(
+        description="The topics handled by the agents in this group"
+    )
+
+
+class GroupRouterAgentInputSchema(BaseIOSchema):
+    """
+    This schema represents the input to the Group Router agent.
+    The schema contains the user's prompt and the list of available groups of agents. You need to select the groups whose agents are needed to handle the user's prompt, allowing for previous messages and any previous plan.
+    """
+
+    user_prompt: str = Field(
+        description="The current chat message from the user - this takes priority.",
+        default="",
+    )
+    agent_groups: list[AgentGroupSummary] = Field(
+        description="The list of available groups of agents, with their topics"
+    )
+    previous_plan: AgentExecutionPlanSchema | None = Field(
+        description="The previously executed plan which the user wants you to modify - always prioritize the user prompt.",
+        default=None,
+    )
+    messages: list[Message] | None = Field(
+        description="The chat message history, in case user is referring to previous messages. You must take account of the previous messages, but prioritize the user_prompt.",
+        default=None,
+    )
+
+
+class GroupRouterAgentOutputSchema(BaseIOSchema):
+    """
+    This schema represents the output of the Group Router agent.
+    """
+
+    group_names: list[str] = Field(
+        description="The names of the groups of agents that are needed to handle the user's prompt. Can be empty if no group is relevant."
+    )
+
+
+def _build_system_prompt_generator_custom() -> SystemPromptGenerator:
+    return SystemPromptGenerator(
+        background=[
+            "You are a router bot that selects the groups of AI agents that are needed to handle the user's prompt, allowing for previous messages.",
+        ],
+        steps=[
+            "Check if there is a previous plan - if so, also select the groups needed to modify that plan",
+            "For each group, consider whether its topics are relevant to the user's prompt",
+            "Only select groups that are really relevant to the user's prompt",
+        ],
+        output_instructions=[
+            "Take the user prompt and previous messages and match them to one or more of the available groups of agents. If no group is relevant, then output no groups."
+        ],
+    )
+
+
+def create_group_router_agent(config: Config, is_async: bool = False) -> BaseAgent:
+    """
+    Create a Group Router agent, which selects the groups of agents that are relevant to the user's prompt. Then the Router only needs to consider the agents of those groups.
+    - if is_async, then run the agent via util_ai.run_agent_async()
+    """
+    client, model, max_tokens = util_ai.create_client(_config=config, is_async=is_async)
+
+    def _build_agent() -> BaseAgent:
+        return BaseAgent(
+            config=BaseAgentConfig(
+                client=client,
+                model=model,
+                system_prompt_generator=_build_system_prompt_generator_custom(),
+                input_schema=GroupRouterAgentInputSchema,
+                output_schema=GroupRouterAgentOutputSchema,
+                max_tokens=max_tokens,
+            )
+        )
+
+    key = agent_cache.build_cache_key("group_router", config, id(client))
+    return agent_cache.get_or_create_agent(key=key, create_agent=_build_agent)
+
+
+def build_input(
+    user_prompt: str,
+    agent_groups: list[AgentGroupSummary],
+    previous_plan: AgentExecutionPlanSchema | None = None,
+    messages: list[Message] | None = None,
+) -> GroupRouterAgentInputSchema:
+    return GroupRouterAgentInputSchema(
+        user_prompt=user_prompt,
+        agent_groups=agent_groups,
+        previous_plan=previous_plan,
+        messages=messages,
+    )
@@ -0,0 +1,83 @@
+from atomic_agents.agents.base_agent import (
+    BaseIOSchema,
+    BaseAgent,
+    BaseAgentConfig,
+)
+from atomic_agents.lib.components.system_prompt_generator import SystemPromptGenerator
+from pydantic import Field
+
+from . import agent_cache, util_ai
+from .blackboard import Message
+from .config import Config
+
+
+class HistorySummaryAgentInputSchema(BaseIOSchema):
+    """
+    This schema represents the input to the History Summary agent.
+    The schema contains the summary of the earlier chat (if any), and the next chat messages to add to the summary.
+    """
+
+    previous_summary: str = Field(
+        description="The summary of the earlier chat messages. Can be empty.",
+        default="",
+    )
+    messages: list[Message] = Field(
+        description="The next chat messages, to add to the summary"
+    )
+
+
+class HistorySummaryAgentOutputSchema(BaseIOSchema):
+    """
+    This schema represents the output of the History Summary agent.
+    """
+
+    summary: str = Field(
+        description="The updated summary of the whole chat: what the user asked for, and what was done."
+    )
+
+
+def _build_system_prompt_generator_custom() -> SystemPromptGenerator:
+    return SystemPromptGenerator(
+        background=[
+            "You are a bot that keeps a short summary of a chat between a user and a team of AI agents, so that the agents can understand later messages that refer to earlier ones.",
+        ],
+        steps=[
+            "Read the previous summary, if any",
+            "Add what the user asked for in the next messages, and what the AI agents did",
+            "Keep the names of things that the user created or mentioned, since later messages may refer to them",
+        ],
+        output_instructions=[
+            "Output the updated summary of the whole chat. Be concise: drop greetings and details that later messages are unlikely to refer to."
+        ],
+    )
+
+
+def create_history_summary_agent(config: Config, is_async: bool = False) -> BaseAgent:
+    """
+    Create a History Summary agent, which maintains a summary of the older chat messages, so that the Router's input stays small in a long chat.
+    - if is_async, then run the agent via util_ai.run_agent_async()
+    """
+    client, model, max_tokens = util_ai.create_client(_config=config, is_async=is_async)
+
+    def _build_agent() -> BaseAgent:
+        return BaseAgent(
+            config=BaseAgentConfig(
+                client=client,
+                model=model,
+                system_prompt_generator=_build_system_prompt_generator_custom(),
+                input_schema=HistorySummaryAgentInputSchema,
+                output_schema=HistorySummaryAgentOutputSchema,
+                max_tokens=max_tokens,
+            )
+        )
+
+    key = agent_cache.build_cache_key("history_summary", config, id(client))
+    return agent_cache.get_or_create_agent(key=key, create_agent=_build_agent)
+
+
+def build_input(
+    previous_summary: str, messages: list[Message]
+) -> HistorySummaryAgentInputSchema:
+    return HistorySummaryAgentInputSchema(
+        previous_summary=previous_summary, messages=messages
+    )
@@ -8,7 +8,7 @@ from atomic_agents.lib.components.system_prompt_generator import SystemPromptGen
 from pydantic import Field
 
 
-from . import util_ai
+from . import agent_cache, util_ai
 from .blackboard import Message
 from .config import Config
 
@@ -27,11 +27,15 @@ class AgentDescription:
     agent_parameter_names: list[str] = Field(
         description="A list of agent parameters that you can extract from the user's prompt."
     )  # Agent Parameters can be used by client to know what context to include in generation requests.
+    agent_group: str = ""  # Optional: used to route across many agents (see agent_groups.py). By default, agents are grouped by their first topic.
+
+
+CHAT_AGENT_NAME = "chat"
 
 
 def _build_chat_agent_description(description: str) -> AgentDescription:
     return AgentDescription(
-        agent_name="chat",
+        agent_name=CHAT_AGENT_NAME,
         description=description,
         topics=[],
         agent_parameter_names=["subjects"],
@@ -56,6 +60,16 @@ class RecommendedAgent(BaseIOSchema):
     )
 
 
+class ParallelAgentsGroup(BaseIOSchema):
+    """
+    This schema represents one stage of the plan: a group of recommended agents that do NOT depend on each other's output, so they can be executed at the same time.
+    """
+
+    agent_names: list[str] = Field(
+        description="The names of the recommended agents in this group. Only group agents that do not need the output of each other."
+    )
+
+
 class AgentExecutionPlanSchema(BaseIOSchema):
     """
     This schema represents a generated plan to execute agents to fulfill the user's request. The chat message should be non-technical - do NOT mention agents.
@@ -67,7 +81,27 @@ class AgentExecutionPlanSchema(BaseIOSchema):
     recommended_agents: list[RecommendedAgent] = Field(
         description="The ordered list of agents that you recommend should be used to handle the user's prompt. Only the most relevant agents should be recommended."
     )
-    # TODO: could group the agents via list of ParallelAgentsGroup - this could also allow client to execute the agents in stages, allowing for HITL
+    parallel_agent_groups: list[ParallelAgentsGroup] = Field(
+        description="Optionally, the recommended agents grouped into ordered stages. Each stage is executed after the previous stage. Agents in the same stage are executed at the same time, so must not depend on each other's output.",
+        default_factory=list,
+    )  # The stages also allow a client to execute the agents in stages, allowing for HITL
+
+    def get_agent_stages(self) -> list[list[RecommendedAgent]]:
+        """
+        Get the recommended agents as ordered stages, where the agents within one stage can be executed in parallel.
+        - if there are no parallel groups, then each agent is its own stage (sequential execution).
+        - agents that are not in any group are executed afterwards, one at a time.
+        """
+        remaining = list(self.recommended_agents)
+        stages: list[list[RecommendedAgent]] = []
+        for group in self.parallel_agent_groups:
+            stage = [a for a in remaining if a.agent_name in group.agent_names]
+            if not stage:
+                continue
+            stages.append(stage)
+            remaining = [a for a in remaining if not any(a is s for s in stage)]
+        stages += [[a] for a in remaining]
+        return stages
 
 
 class RouterAgentInputSchema(BaseIOSchema):
@@ -116,6 +150,7 @@ def _build_system_prompt_generator_custom() -> SystemPromptGenerator:
             # done: make router reject irrelevant user prompts (if no matching agents + it does not fit the chat_agent_description)
             "If you find no suitable agent, then generate a polite message to explain to the user that you cannot handle this request",
             "For each selected agent, rewrite the user's prompt to suit that agent",
+            "Group the selected agents into ordered stages: agents that do not need the output of each other can be in the same stage",
         ],
         output_instructions=[
             "Take the user prompt and previous messages and match them to a sequence of one or more of the available agents. If no suitable agent is available, then generate a polite message to explain to the user that you cannot handle this request."
@@ -123,24 +158,28 @@ def _build_system_prompt_generator_custom() -> SystemPromptGenerator:
     )
 
 
-def create_router_agent(config: Config) -> BaseAgent:
+def create_router_agent(config: Config, is_async: bool = False) -> BaseAgent:
     """
     Create a Router agent which can recommend one or more agents to handle the user's prompt. For quality it rewrites the user prompt for each agent.
     - this approach prevents agents answering prompts that are not really for them
+    - if is_async, then run the agent via util_ai.run_agent_async()
     """
-    client, model, max_tokens = util_ai.create_client(_config=config)
-
-    agent = BaseAgent(
-        config=BaseAgentConfig(
-            client=client,
-            model=model,
-            system_prompt_generator=_build_system_prompt_generator_custom(),
-            input_schema=RouterAgentInputSchema,
-            output_schema=RouterAgentOutputSchema,
-            max_tokens=max_tokens,
+    client, model, max_tokens = util_ai.create_client(_config=config, is_async=is_async)
+
+    def _build_agent() -> BaseAgent:
+        return BaseAgent(
+            config=BaseAgentConfig(
+                client=client,
+                model=model,
+                system_prompt_generator=_build_system_prompt_generator_custom(),
+                input_schema=RouterAgentInputSchema,
+                output_schema=RouterAgentOutputSchema,
+                max_tokens=max_tokens,
+            )
         )
-    )
-    return agent
+
+    key = agent_cache.build_cache_key("router", config, id(client))
+    return agent_cache.get_or_create_agent(key=key, create_agent=_build_agent)
 
 
 def build_input(
@@ -150,11 +189,14 @@ def build_input(
     previous_plan: AgentExecutionPlanSchema | None = None,
     messages: list[Message] | None = None,
 ) -> RouterAgentInputSchema:
-    agent_descriptions.append(_build_chat_agent_description(chat_agent_description))
+    # Do not modify the caller's list, since it can be re-used across requests
+    all_agent_descriptions = agent_descriptions + [
+        _build_chat_agent_description(chat_agent_description)
+    ]
 
     return RouterAgentInputSchema(
         user_prompt=user_prompt,
-        agent_descriptions=agent_descriptions,
+        agent_descriptions=all_agent_descriptions,
         previous_plan=previous_plan,
         messages=messages,
     )
@@ -0,0 +1,394 @@
+import asyncio
+from contextlib import contextmanager
+import contextvars
+from dataclasses import dataclass
+import email.utils
+import functools
+import json
+import logging
+import threading
+import time
+import typing
+
+from . import metrics, util_tokens
+from .config import Config
+
+logger = logging.getLogger(__file__)
+
+THROTTLED_STATUS_CODE = 429
+# If a throttled response has no retry-after header, then pause the calls for this long
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+# While all the concurrency slots are in use, check again after this long
+CONCURRENCY_POLL_SECONDS = 0.05
+# The calls that were already in flight can all be throttled together: only halve the concurrency once per burst
+CONCURRENCY_DECREASE_COOLDOWN_SECONDS = 1.0
+
+
+class _TokenBucket:
+    """
+    Refills continuously at the rate per minute, up to one minute's quota.
+    - the level can go below zero (a debt), when a call used more tokens than were estimated: the next calls then wait for the refill.
+    """
+
+    def __init__(self, limit_per_minute: int, now: float) -> None:
+        self.capacity = float(limit_per_minute)
+        self.rate_per_second = limit_per_minute / 60.0
+        self.level = self.capacity
+        self.updated_at = now
+
+    def refill(self, now: float) -> None:
+        self.level = min(
+            self.capacity, self.level + (now - self.updated_at) * self.rate_per_second
+        )
+        self.updated_at = now
+
+    def get_wait_seconds(self, amount: float) -> float:
+        # A call that needs more than the whole quota waits for a full bucket (else it would never run)
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate_per_second
+
+
+@dataclass
+class RequestTiming:
+    """When a request was sent, after its wait for the limiter: so its latency does not include that wait (see track_request_timing())."""
+
+    sent_at: float | None = None  # time.perf_counter()
+
+
+# (a mutable object, so a request in a copy of the context, like a hedged request, also sets it)
+_request_timing: contextvars.ContextVar[RequestTiming | None] = contextvars.ContextVar(
+    "request_timing", default=None
+)
+
+
+@contextmanager
+def track_request_timing(timing: RequestTiming) -> typing.Iterator[RequestTiming]:
+    """Set timing.sent_at when the first request made within this block is sent."""
+    token = _request_timing.set(timing)
+    try:
+        yield timing
+    finally:
+        _request_timing.reset(token)
+
+
+def _mark_request_sent() -> None:
+    timing = _request_timing.get()
+    if timing is not None and timing.sent_at is None:
+        timing.sent_at = time.perf_counter()
+
+
+@dataclass
+class RateLimiterStats:
+    requests: int = 0
+    waits: int = 0
+    wait_seconds: float = 0.0
+    throttled: int = 0
+    concurrency_limit: int = 0  # 0 means no limit
+    in_flight: int = 0
+
+
+class RateLimiter:
+    """
+    Limits the LLM requests to one AI platform and model. Shared by all the calls of this process (sync and async), so a call only waits when the quota requires it.
+    - token buckets for the requests per minute and the tokens per minute. The input tokens are estimated before the request, and corrected by the usage in the response.
+    - the concurrency is adjusted by AIMD: halved when the AI platform throttles a request (HTTP 429), and increased by one after a full window of successful requests.
+    - the retry-after header of a throttled response pauses all the requests.
+    """
+
+    def __init__(
+        self,
+        ai_platform: str,
+        model: str,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_concurrency: int,
+        min_concurrency: int,
+    ) -> None:
+        now = time.monotonic()
+        self.ai_platform = ai_platform
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = max(1, min(min_concurrency, max_concurrency))
+        self._requests = (
+            _TokenBucket(requests_per_minute, now) if requests_per_minute > 0 else None
+        )
+        self._tokens = (
+            _TokenBucket(tokens_per_minute, now) if tokens_per_minute > 0 else None
+        )
+        self._concurrency_limit = max_concurrency
+        self._success_count = 0
+        self._last_decrease_at = float("-inf")
+        self._paused_until = 0.0
+        self._stats = RateLimiterStats(concurrency_limit=max_concurrency)
+        self._lock = threading.Lock()
+        self._record_concurrency_limit()
+
+    def _record_concurrency_limit(self) -> None:
+        metrics.RATE_LIMIT_CONCURRENCY.set(
+            self._concurrency_limit, ai_platform=self.ai_platform, model=self.model
+        )
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take a request slot and the tokens: returns 0, or else the seconds to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            wait_seconds = max(0.0, self._paused_until - now)
+            if self.max_concurrency > 0 and (
+                self._stats.in_flight >= self._concurrency_limit
+            ):
+                wait_seconds = max(wait_seconds, CONCURRENCY_POLL_SECONDS)
+            for bucket, amount in [(self._requests, 1), (self._tokens, tokens)]:
+                if bucket:
+                    bucket.refill(now)
+                    wait_seconds = max(wait_seconds, bucket.get_wait_seconds(amount))
+            if wait_seconds > 0:
+                return wait_seconds
+
+            if self._requests:
+                self._requests.level -= 1
+            if self._tokens:
+                self._tokens.level -= tokens
+            self._stats.in_flight += 1
+            self._stats.requests += 1
+            return 0.0
+
+    def _record_wait(self, wait_seconds: float) -> None:
+        if wait_seconds <= 0:
+            return
+        with self._lock:
+            self._stats.waits += 1
+            self._stats.wait_seconds += wait_seconds
+        metrics.RATE_LIMIT_WAIT_SECONDS.observe(
+            wait_seconds, ai_platform=self.ai_platform, model=self.model
+        )
+
+    def acquire(self, tokens: int) -> None:
+        """Wait until the quota allows a request of (an estimated) this many tokens."""
+        waited = 0.0
+        while (wait_seconds := self._try_acquire(tokens)) > 0:
+            time.sleep(wait_seconds)
+            waited += wait_seconds
+        self._record_wait(waited)
+
+    async def aacquire(self, tokens: int) -> None:
+        """Async version of acquire(): waits without blocking the event loop."""
+        waited = 0.0
+        while (wait_seconds := self._try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait_seconds)
+            waited += wait_seconds
+        self._record_wait(waited)
+
+    def has_free_capacity(self) -> bool:
+        """Could a request be sent now, without waiting: not paused after being throttled, with a free concurrency slot, and quota left."""
+        with self._lock:
+            now = time.monotonic()
+            if self._paused_until > now:
+                return False
+            if (
+                self.max_concurrency > 0
+                and self._stats.in_flight >= self._concurrency_limit
+            ):
+                return False
+            for bucket, amount in [(self._requests, 1.0), (self._tokens, 1.0)]:
+                if bucket:
+                    bucket.refill(now)
+                    if bucket.level < amount:
+                        return False
+            return True
+
+    def on_success(self, estimated_tokens: int, used_tokens: int | None) -> None:
+        with self._lock:
+            self._stats.in_flight -= 1
+            if self._tokens and used_tokens is not None:
+                self._tokens.level -= used_tokens - estimated_tokens
+            if self.max_concurrency <= 0:
+                return
+            # Additive increase: one more slot per window of successful requests
+            self._success_count += 1
+            if self._success_count >= self._concurrency_limit:
+                self._success_count = 0
+                if self._concurrency_limit < self.max_concurrency:
+                    self._concurrency_limit += 1
+                    self._record_concurrency_limit()
+
+    def on_throttled(self, retry_after_seconds: float | None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._stats.in_flight -= 1
+            self._stats.throttled += 1
+            self._paused_until = max(
+                self._paused_until,
+                now
+                + (
+                    retry_after_seconds
+                    if retry_after_seconds is not None
+                    else DEFAULT_RETRY_AFTER_SECONDS
+                ),
+            )
+            # Multiplicative decrease
+            if (
+                self.max_concurrency > 0
+                and now - self._last_decrease_at
+                >= CONCURRENCY_DECREASE_COOLDOWN_SECONDS
+            ):
+                self._last_decrease_at = now
+                self._success_count = 0
+                self._concurrency_limit = max(
+                    self.min_concurrency, self._concurrency_limit // 2
+                )
+                self._record_concurrency_limit()
+        metrics.RATE_LIMIT_THROTTLED.inc(ai_platform=self.ai_platform, model=self.model)
+        logger.warning(
+            f"Throttled by {self.ai_platform} ({self.model}): concurrency is now {self._concurrency_limit}, retry after {retry_after_seconds}s"
+        )
+
+    def on_error(self, error: BaseException) -> None:
+        if is_throttled(error):
+            self.on_throttled(get_retry_after_seconds(error))
+            return
+        with self._lock:
+            self._stats.in_flight -= 1
+
+    def get_stats(self) -> RateLimiterStats:
+        with self._lock:
+            return RateLimiterStats(
+                requests=self._stats.requests,
+                waits=self._stats.waits,
+                wait_seconds=self._stats.wait_seconds,
+                throttled=self._stats.throttled,
+                concurrency_limit=self._concurrency_limit,
+                in_flight=self._stats.in_flight,
+            )
+
+
+def is_throttled(error: BaseException) -> bool:
+    # (the SDK errors of OpenAI, Groq and Anthropic all have the HTTP status code)
+    return getattr(error, "status_code", None) == THROTTLED_STATUS_CODE
+
+
+def get_retry_after_seconds(error: BaseException) -> float | None:
+    """Get the wait requested by the AI platform, from the 'retry-after-ms' or 'retry-after' header (seconds, or an HTTP date)."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            return max(0.0, float(retry_after_ms) / 1000)
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(str(retry_after))
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _estimate_request_tokens(kwargs: dict[str, typing.Any]) -> int:
+    # The input: the system prompt, the messages and the tools (the output schema)
+    return util_tokens.estimate_tokens(
+        json.dumps(
+            [kwargs.get("system"), kwargs.get("messages"), kwargs.get("tools")],
+            default=str,
+        )
+    )
+
+
+def _get_used_tokens(response: typing.Any) -> int | None:
+    token_usage = util_tokens.get_llm_token_usage(response)
+    return sum(token_usage) if token_usage else None
+
+
+TCallable = typing.TypeVar("TCallable", bound=typing.Callable[..., typing.Any])
+
+
+def limit_calls(create: TCallable, limiter: RateLimiter) -> TCallable:
+    """
+    Wrap an AI platform SDK's create() function, so each request waits for the limiter.
+    - a streamed response frees its slot when the response starts, and its output tokens are not counted.
+    """
+
+    @functools.wraps(create)
+    def _create(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+        estimated_tokens = _estimate_request_tokens(kwargs)
+        limiter.acquire(estimated_tokens)
+        _mark_request_sent()
+        try:
+            response = create(*args, **kwargs)
+        except Exception as e:
+            limiter.on_error(e)
+            raise
+        limiter.on_success(estimated_tokens, _get_used_tokens(response))
+        return response
+
+    return typing.cast(TCallable, _create)
+
+
+def alimit_calls(create: TCallable, limiter: RateLimiter) -> TCallable:
+    """Async version of limit_calls()."""
+
+    @functools.wraps(create)
+    async def _acreate(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+        estimated_tokens = _estimate_request_tokens(kwargs)
+        await limiter.aacquire(estimated_tokens)
+        _mark_request_sent()
+        try:
+            response = await create(*args, **kwargs)
+        except BaseException as e:
+            # (including a cancelled request, for example the slower of a hedged pair)
+            limiter.on_error(e)
+            raise
+        limiter.on_success(estimated_tokens, _get_used_tokens(response))
+        return response
+
+    return typing.cast(TCallable, _acreate)
+
+
+_limiters: dict[tuple, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter_settings(_config: Config) -> tuple:
+    """The settings of the Config that the limiter depends on."""
+    return (
+        _config.rate_limit_requests_per_minute,
+        _config.rate_limit_tokens_per_minute,
+        _config.rate_limit_max_concurrency,
+        _config.rate_limit_min_concurrency,
+    )
+
+
+def get_rate_limiter(
+    ai_platform: str, model: str, _config: Config
+) -> RateLimiter | None:
+    """Get the limiter of the AI platform and model (shared by the sync and async clients), or None if the Config sets no limits."""
+    if (
+        _config.rate_limit_requests_per_minute <= 0
+        and _config.rate_limit_tokens_per_minute <= 0
+        and _config.rate_limit_max_concurrency <= 0
+    ):
+        return None
+    key = (ai_platform, model, get_rate_limiter_settings(_config))
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(
+                ai_platform=ai_platform,
+                model=model,
+                requests_per_minute=_config.rate_limit_requests_per_minute,
+                tokens_per_minute=_config.rate_limit_tokens_per_minute,
+                max_concurrency=_config.rate_limit_max_concurrency,
+                min_concurrency=_config.rate_limit_min_concurrency,
+            )
+            _limiters[key] = limiter
+        return limiter
+
+
+def clear_rate_limiters() -> None:
+    with _limiters_lock:
+        _limiters.clear()
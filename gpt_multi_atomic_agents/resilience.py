@@ -0,0 +1,482 @@
+import asyncio
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import contextvars
+from dataclasses import dataclass
+import functools
+import logging
+import random
+import threading
+import time
+import typing
+
+import anthropic
+import groq
+import httpx
+import openai
+
+from . import metrics, rate_limiter, tracing
+from .config import Config
+
+logger = logging.getLogger(__file__)
+
+# Throttled, overloaded, or a server error: the same request can succeed if sent again
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+TRANSIENT_ERROR_TYPES: tuple[type[BaseException], ...] = (
+    openai.APIConnectionError,  # (includes the timeouts)
+    groq.APIConnectionError,
+    anthropic.APIConnectionError,
+    httpx.TransportError,
+)
+# The recent latencies of each caller, to estimate the hedge delay
+LATENCY_WINDOW_SIZE = 100
+HEDGE_MAX_WORKERS = 32
+# While a request waits for the rate limiter, check again after this long whether it was sent
+HEDGE_POLL_SECONDS = 0.05
+ORIGINAL_WINNER = "original"
+HEDGE_WINNER = "hedge"
+NO_WINNER = "none"
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether the LLM request can succeed if sent again: a connection error or timeout, throttling, or a server error."""
+    # The AI platform can say whether to retry (as the SDKs do)
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    should_retry = str(headers.get("x-should-retry")) if headers else None
+    if should_retry in ("true", "false"):
+        return should_retry == "true"
+    if isinstance(error, TRANSIENT_ERROR_TYPES):
+        return True
+    return getattr(error, "status_code", None) in TRANSIENT_STATUS_CODES
+
+
+def _get_error_reason(error: BaseException) -> str:
+    status_code = getattr(error, "status_code", None)
+    return str(status_code) if status_code else type(error).__name__
+
+
+def _get_percentile(samples: typing.Iterable[float], percentile: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+    return ordered[index]
+
+
+@dataclass
+class ResilienceStats:
+    calls: int = 0
+    retries: int = 0
+    failures: int = 0  # The calls that failed after all the retries (or with an error that is not transient)
+    hedges: int = 0
+    hedge_wins: int = 0  # The hedges that finished before the original request
+
+
+class ResiliencePolicy:
+    """
+    Retries and hedges the LLM requests to one AI platform and model.
+    - a transient error is retried, after a jittered exponential backoff ('full jitter': a random delay up to base * 2^retry, capped). A retry-after header is a minimum delay.
+    - hedging: if a request is slower than the recent p95 latency of its caller (an agent, or the router etc.), then a duplicate request is sent, and the first response wins. The other request is cancelled (async), or its response is discarded (sync).
+    - the latencies and the hedge delay count from when a request was sent, not including its wait for the rate limiter. There is no hedge while the rate limiter has no free capacity, since the hedge would compete for the scarce quota.
+    - streamed requests are retried, but not hedged.
+    """
+
+    def __init__(
+        self,
+        ai_platform: str,
+        model: str,
+        max_retries: int,
+        retry_base_delay_seconds: float,
+        retry_max_delay_seconds: float,
+        is_hedging_enabled: bool,
+        hedge_percentile: float,
+        hedge_min_samples: int,
+        hedge_min_delay_seconds: float,
+    ) -> None:
+        self.ai_platform = ai_platform
+        self.model = model
+        self.max_retries = max(0, max_retries)
+        self.retry_base_delay_seconds = retry_base_delay_seconds
+        self.retry_max_delay_seconds = retry_max_delay_seconds
+        self.is_hedging_enabled = is_hedging_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = max(1, hedge_min_samples)
+        self.hedge_min_delay_seconds = hedge_min_delay_seconds
+        self._latencies: dict[str, deque[float]] = {}
+        self._stats = ResilienceStats()
+        self._lock = threading.Lock()
+
+    def get_retry_delay_seconds(self, retry: int, error: BaseException) -> float:
+        """The backoff before the given retry (0 is the first retry)."""
+        delay = random.uniform(
+            0.0,
+            min(
+                self.retry_max_delay_seconds,
+                self.retry_base_delay_seconds * 2**retry,
+            ),
+        )
+        retry_after = rate_limiter.get_retry_after_seconds(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def get_hedge_delay_seconds(self, caller: str) -> float | None:
+        """How long to wait for a request of the caller before hedging it, or None to not hedge (yet)."""
+        if not self.is_hedging_enabled:
+            return None
+        with self._lock:
+            latencies = self._latencies.get(caller)
+            if latencies is None or len(latencies) < self.hedge_min_samples:
+                return None
+            delay = max(
+                self.hedge_min_delay_seconds,
+                _get_percentile(latencies, self.hedge_percentile),
+            )
+        metrics.LLM_HEDGE_DELAY_SECONDS.set(delay, agent_name=caller, model=self.model)
+        return delay
+
+    def record_latency(self, caller: str, seconds: float) -> None:
+        with self._lock:
+            latencies = self._latencies.get(caller)
+            if latencies is None:
+                latencies = self._latencies[caller] = deque(maxlen=LATENCY_WINDOW_SIZE)
+            latencies.append(seconds)
+
+    def on_call(self) -> None:
+        with self._lock:
+            self._stats.calls += 1
+
+    def on_retry(self, caller: str, error: BaseException, delay_seconds: float) -> None:
+        reason = _get_error_reason(error)
+        with self._lock:
+            self._stats.retries += 1
+        metrics.LLM_RETRIES.inc(agent_name=caller, model=self.model, reason=reason)
+        tracing.add_event("llm_retry", reason=reason, delay_seconds=delay_seconds)
+        logger.warning(
+            f"Retrying the LLM request of {caller} ({self.model}) in {delay_seconds:.2f}s, after: {reason}"
+        )
+
+    def on_call_end(self, caller: str, attempts: int, is_failed: bool) -> None:
+        if is_failed:
+            with self._lock:
+                self._stats.failures += 1
+        metrics.LLM_ATTEMPTS.observe(attempts, agent_name=caller, model=self.model)
+
+    def on_hedge(self) -> None:
+        with self._lock:
+            self._stats.hedges += 1
+        tracing.add_event("llm_hedge")
+
+    def on_hedge_end(self, caller: str, winner: str) -> None:
+        """The winner is 'original' or 'hedge', or 'none' if both requests failed."""
+        if winner == HEDGE_WINNER:
+            with self._lock:
+                self._stats.hedge_wins += 1
+        metrics.LLM_HEDGES.inc(agent_name=caller, model=self.model, winner=winner)
+
+    def get_stats(self) -> ResilienceStats:
+        with self._lock:
+            return ResilienceStats(
+                calls=self._stats.calls,
+                retries=self._stats.retries,
+                failures=self._stats.failures,
+                hedges=self._stats.hedges,
+                hedge_wins=self._stats.hedge_wins,
+            )
+
+
+_hedge_executor: ThreadPoolExecutor | None = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="llm_hedge"
+            )
+        return _hedge_executor
+
+
+def _get_seconds_until_hedge(
+    timing: rate_limiter.RequestTiming, hedge_delay_seconds: float
+) -> float:
+    """The hedge delay counts from when the request was sent: while it waits for the rate limiter, check again later."""
+    if timing.sent_at is None:
+        return HEDGE_POLL_SECONDS
+    return max(0.0, timing.sent_at + hedge_delay_seconds - time.perf_counter())
+
+
+def _is_hedge_due(
+    timing: rate_limiter.RequestTiming, hedge_delay_seconds: float
+) -> bool:
+    return timing.sent_at is not None and (
+        _get_seconds_until_hedge(timing, hedge_delay_seconds) <= 0
+    )
+
+
+def _is_hedge_allowed(limiter: rate_limiter.RateLimiter | None) -> bool:
+    return limiter is None or limiter.has_free_capacity()
+
+
+def _call_hedged(
+    create: typing.Callable[..., typing.Any],
+    args: tuple,
+    kwargs: dict[str, typing.Any],
+    policy: ResiliencePolicy,
+    caller: str,
+    hedge_delay_seconds: float,
+    timing: rate_limiter.RequestTiming,
+    limiter: rate_limiter.RateLimiter | None,
+) -> typing.Any:
+    """Send the request, and after the hedge delay, a duplicate request: the first response wins. A request in a thread cannot be cancelled, so the other response is discarded."""
+    executor = _get_hedge_executor()
+
+    def _submit() -> Future[typing.Any]:
+        # (in a copy of the context, so the request is traced and attributed to the caller)
+        return executor.submit(contextvars.copy_context().run, create, *args, **kwargs)
+
+    original = _submit()
+    while not _is_hedge_due(timing, hedge_delay_seconds):
+        done, _pending = wait(
+            [original], timeout=_get_seconds_until_hedge(timing, hedge_delay_seconds)
+        )
+        if done:
+            return original.result()
+    if not _is_hedge_allowed(limiter):
+        return original.result()
+
+    policy.on_hedge()
+    running = [original, _submit()]
+    first_error: BaseException | None = None
+    while running:
+        done, _pending = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            running.remove(future)
+            error = future.exception()
+            if error is None:
+                policy.on_hedge_end(
+                    caller,
+                    winner=ORIGINAL_WINNER if future is original else HEDGE_WINNER,
+                )
+                return future.result()
+            first_error = first_error or error
+    policy.on_hedge_end(caller, winner=NO_WINNER)
+    raise typing.cast(BaseException, first_error)
+
+
+async def _acall_hedged(
+    create: typing.Callable[..., typing.Any],
+    args: tuple,
+    kwargs: dict[str, typing.Any],
+    policy: ResiliencePolicy,
+    caller: str,
+    hedge_delay_seconds: float,
+    timing: rate_limiter.RequestTiming,
+    limiter: rate_limiter.RateLimiter | None,
+) -> typing.Any:
+    """Async version of _call_hedged(): the slower request is cancelled."""
+    original = asyncio.ensure_future(create(*args, **kwargs))
+    try:
+        while not _is_hedge_due(timing, hedge_delay_seconds):
+            done, _pending = await asyncio.wait(
+                [original],
+                timeout=_get_seconds_until_hedge(timing, hedge_delay_seconds),
+            )
+            if done:
+                return original.result()
+        if not _is_hedge_allowed(limiter):
+            return await original
+    except BaseException:
+        original.cancel()
+        raise
+
+    policy.on_hedge()
+    running = {original, asyncio.ensure_future(create(*args, **kwargs))}
+    first_error: BaseException | None = None
+    try:
+        while running:
+            done, running = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    policy.on_hedge_end(
+                        caller,
+                        winner=ORIGINAL_WINNER if task is original else HEDGE_WINNER,
+                    )
+                    return task.result()
+                first_error = first_error or error
+    finally:
+        for task in running:
+            task.cancel()
+    policy.on_hedge_end(caller, winner=NO_WINNER)
+    raise typing.cast(BaseException, first_error)
+
+
+TCallable = typing.TypeVar("TCallable", bound=typing.Callable[..., typing.Any])
+
+
+def _start_request_timing(
+    limiter: rate_limiter.RateLimiter | None,
+) -> rate_limiter.RequestTiming:
+    # Without a limiter, the request is sent straight away
+    return rate_limiter.RequestTiming(
+        sent_at=time.perf_counter() if limiter is None else None
+    )
+
+
+def _get_latency_seconds(timing: rate_limiter.RequestTiming, start: float) -> float:
+    return time.perf_counter() - (
+        timing.sent_at if timing.sent_at is not None else start
+    )
+
+
+def resilient_calls(
+    create: TCallable,
+    policy: ResiliencePolicy,
+    limiter: rate_limiter.RateLimiter | None = None,
+) -> TCallable:
+    """
+    Wrap an AI platform SDK's create() function, so each request is retried on transient errors, and hedged if slow.
+    - limiter: the rate limiter that create() waits for, if any (see rate_limiter.limit_calls()).
+    """
+
+    @functools.wraps(create)
+    def _create(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+        caller = metrics.get_llm_caller()
+        is_stream = bool(kwargs.get("stream"))
+        policy.on_call()
+        retry = 0
+        while True:
+            hedge_delay = None if is_stream else policy.get_hedge_delay_seconds(caller)
+            start = time.perf_counter()
+            timing = _start_request_timing(limiter)
+            try:
+                with rate_limiter.track_request_timing(timing):
+                    response = (
+                        _call_hedged(
+                            create,
+                            args,
+                            kwargs,
+                            policy,
+                            caller,
+                            hedge_delay,
+                            timing=timing,
+                            limiter=limiter,
+                        )
+                        if hedge_delay is not None
+                        else create(*args, **kwargs)
+                    )
+            except Exception as e:
+                if retry >= policy.max_retries or not is_transient_error(e):
+                    policy.on_call_end(caller, attempts=retry + 1, is_failed=True)
+                    raise
+                delay = policy.get_retry_delay_seconds(retry, e)
+                policy.on_retry(caller, e, delay)
+                time.sleep(delay)
+                retry += 1
+                continue
+            if not is_stream:
+                # (without the wait for the rate limiter)
+                policy.record_latency(caller, _get_latency_seconds(timing, start))
+            policy.on_call_end(caller, attempts=retry + 1, is_failed=False)
+            return response
+
+    return typing.cast(TCallable, _create)
+
+
+def aresilient_calls(
+    create: TCallable,
+    policy: ResiliencePolicy,
+    limiter: rate_limiter.RateLimiter | None = None,
+) -> TCallable:
+    """Async version of resilient_calls()."""
+
+    @functools.wraps(create)
+    async def _acreate(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+        caller = metrics.get_llm_caller()
+        is_stream = bool(kwargs.get("stream"))
+        policy.on_call()
+        retry = 0
+        while True:
+            hedge_delay = None if is_stream else policy.get_hedge_delay_seconds(caller)
+            start = time.perf_counter()
+            timing = _start_request_timing(limiter)
+            try:
+                with rate_limiter.track_request_timing(timing):
+                    response = await (
+                        _acall_hedged(
+                            create,
+                            args,
+                            kwargs,
+                            policy,
+                            caller,
+                            hedge_delay,
+                            timing=timing,
+                            limiter=limiter,
+                        )
+                        if hedge_delay is not None
+                        else create(*args, **kwargs)
+                    )
+            except Exception as e:
+                if retry >= policy.max_retries or not is_transient_error(e):
+                    policy.on_call_end(caller, attempts=retry + 1, is_failed=True)
+                    raise
+                delay = policy.get_retry_delay_seconds(retry, e)
+                policy.on_retry(caller, e, delay)
+                await asyncio.sleep(delay)
+                retry += 1
+                continue
+            if not is_stream:
+                # (without the wait for the rate limiter)
+                policy.record_latency(caller, _get_latency_seconds(timing, start))
+            policy.on_call_end(caller, attempts=retry + 1, is_failed=False)
+            return response
+
+    return typing.cast(TCallable, _acreate)
+
+
+_policies: dict[tuple, ResiliencePolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_resilience_policy_settings(_config: Config) -> tuple:
+    """The settings of the Config that the policy depends on."""
+    return (
+        _config.llm_max_retries,
+        _config.llm_retry_base_delay_seconds,
+        _config.llm_retry_max_delay_seconds,
+        _config.is_llm_hedging_enabled,
+        _config.llm_hedge_percentile,
+        _config.llm_hedge_min_samples,
+        _config.llm_hedge_min_delay_seconds,
+    )
+
+
+def get_resilience_policy(
+    ai_platform: str, model: str, _config: Config
+) -> ResiliencePolicy | None:
+    """Get the policy of the AI platform and model (shared by the sync and async clients), or None if the Config sets no retries and no hedging."""
+    if _config.llm_max_retries <= 0 and not _config.is_llm_hedging_enabled:
+        return None
+    key = (ai_platform, model, get_resilience_policy_settings(_config))
+    with _policies_lock:
+        policy = _policies.get(key)
+        if policy is None:
+            policy = ResiliencePolicy(
+                ai_platform=ai_platform,
+                model=model,
+                max_retries=_config.llm_max_retries,
+                retry_base_delay_seconds=_config.llm_retry_base_delay_seconds,
+                retry_max_delay_seconds=_config.llm_retry_max_delay_seconds,
+                is_hedging_enabled=_config.is_llm_hedging_enabled,
+                hedge_percentile=_config.llm_hedge_percentile,
+                hedge_min_samples=_config.llm_hedge_min_samples,
+                hedge_min_delay_seconds=_config.llm_hedge_min_delay_seconds,
+            )
+            _policies[key] = policy
+        return policy
+
+
+def clear_resilience_policies() -> None:
+    with _policies_lock:
+        _policies.clear()
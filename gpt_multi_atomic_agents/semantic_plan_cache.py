@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+import typing
+
+import numpy as np
+
+from . import metrics, util_embedding
+from .config import Config
+from .plan_cache import PlanCacheStats
+from .pre_router import PLAN_CHAT_MESSAGE
+from .prompts_router import AgentExecutionPlanSchema, RecommendedAgent
+
+logger = logging.getLogger(__file__)
+
+
+class SemanticPlanCache:
+    """
+    Caches execution plans by the meaning of the user prompt, so that paraphrases like 'add a wolf' and 'please add a wolf' share a plan.
+    - the prompt embeddings are stored as rows of one matrix, so a lookup is a single matrix-vector product.
+    - a plan is only re-used within the same scope (see plan_cache.build_plan_scope_key()), and when the similarity is at least the threshold.
+    - a similar prompt can still differ in one important word ('northern forest' and 'southern forest'): so unless the words match, only the choice of agents is re-used (see _adapt_plan_to_prompt()).
+    - when full, the least recently used entry is replaced.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        similarity_threshold: float,
+        dimensions: int = util_embedding.EMBEDDING_DIMENSIONS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.dimensions = dimensions
+        self._embeddings = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self._scope_keys: list[str | None] = [None] * max_entries
+        self._plans_json: list[str] = [""] * max_entries
+        self._normalized_prompts: list[str] = [""] * max_entries
+        self._created_at = np.zeros(max_entries, dtype=np.float64)
+        # A use counter instead of a time, so that the order is exact
+        self._last_used_tick = np.zeros(max_entries, dtype=np.int64)
+        self._tick = 0
+        self._size = 0
+        self._stats = PlanCacheStats()
+        self._lock = threading.Lock()
+
+    def _find_best_row(
+        self, scope_key: str, embedding: np.ndarray, now: float
+    ) -> tuple[int, float]:
+        similarities = self._embeddings[: self._size] @ embedding
+        is_usable = np.fromiter(
+            (k == scope_key for k in self._scope_keys[: self._size]),
+            dtype=bool,
+            count=self._size,
+        ) & (now - self._created_at[: self._size] <= self.ttl_seconds)
+        similarities = np.where(is_usable, similarities, -1.0)
+        best_row = int(np.argmax(similarities))
+        return best_row, float(similarities[best_row])
+
+    def get(self, scope_key: str, user_prompt: str) -> AgentExecutionPlanSchema | None:
+        embedding = util_embedding.embed_text(user_prompt, dimensions=self.dimensions)
+        now = time.time()
+        with self._lock:
+            if not self._size:
+                self._stats.misses += 1
+                return None
+            best_row, similarity = self._find_best_row(
+                scope_key=scope_key, embedding=embedding, now=now
+            )
+            if similarity < self.similarity_threshold:
+                self._stats.misses += 1
+                return None
+            self._stats.hits += 1
+            self._tick += 1
+            self._last_used_tick[best_row] = self._tick
+            plan_json = self._plans_json[best_row]
+            normalized_prompt = self._normalized_prompts[best_row]
+        logger.info(f"Semantic plan cache hit (similarity {similarity:.2f})")
+        plan = typing.cast(
+            AgentExecutionPlanSchema,
+            AgentExecutionPlanSchema.model_validate_json(plan_json),
+        )
+        if util_embedding.normalize_text(user_prompt) == normalized_prompt:
+            return plan
+        return _adapt_plan_to_prompt(plan=plan, user_prompt=user_prompt)
+
+    def set(
+        self, scope_key: str, user_prompt: str, plan: AgentExecutionPlanSchema
+    ) -> None:
+        embedding = util_embedding.embed_text(user_prompt, dimensions=self.dimensions)
+        now = time.time()
+        with self._lock:
+            if self._size < self.max_entries:
+                row = self._size
+                self._size += 1
+            else:
+                row = int(np.argmin(self._last_used_tick))
+            self._embeddings[row] = embedding
+            self._scope_keys[row] = scope_key
+            self._plans_json[row] = plan.model_dump_json()
+            self._normalized_prompts[row] = util_embedding.normalize_text(user_prompt)
+            self._created_at[row] = now
+            self._tick += 1
+            self._last_used_tick[row] = self._tick
+
+    def get_stats(self) -> PlanCacheStats:
+        with self._lock:
+            return PlanCacheStats(
+                hits=self._stats.hits, misses=self._stats.misses, size=self._size
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._size = 0
+            self._scope_keys = [None] * self.max_entries
+
+
+def _adapt_plan_to_prompt(
+    plan: AgentExecutionPlanSchema, user_prompt: str
+) -> AgentExecutionPlanSchema:
+    """
+    Re-use only the choice of agents from the plan of a similar prompt.
+    - each agent gets the current prompt, since the cached rewritten prompts and parameters were taken from the other prompt.
+    - the parameters are left empty, so the data is not narrowed by them (the same as when the LLM router extracts no values).
+    """
+    agent_names = list(dict.fromkeys(a.agent_name for a in plan.recommended_agents))
+    return AgentExecutionPlanSchema(
+        chat_message=PLAN_CHAT_MESSAGE,
+        recommended_agents=[
+            RecommendedAgent(
+                agent_name=agent_name,
+                rewritten_user_prompt=user_prompt,
+                agent_parameters={},
+            )
+            for agent_name in agent_names
+        ],
+    )
+
+
+_semantic_plan_caches: dict[tuple, SemanticPlanCache] = {}
+_semantic_plan_caches_lock = threading.Lock()
+
+
+def get_semantic_plan_cache(_config: Config) -> SemanticPlanCache | None:
+    """Get the semantic plan cache for the Config, or None if it is disabled. One cache is shared per setting."""
+    if not _config.is_semantic_plan_cache_enabled:
+        return None
+
+    key = (
+        _config.semantic_plan_cache_max_entries,
+        _config.plan_cache_ttl_seconds,
+        _config.semantic_plan_cache_similarity_threshold,
+    )
+    with _semantic_plan_caches_lock:
+        semantic_plan_cache = _semantic_plan_caches.get(key)
+        if semantic_plan_cache is None:
+            semantic_plan_cache = SemanticPlanCache(
+                max_entries=_config.semantic_plan_cache_max_entries,
+                ttl_seconds=_config.plan_cache_ttl_seconds,
+                similarity_threshold=_config.semantic_plan_cache_similarity_threshold,
+            )
+            _semantic_plan_caches[key] = semantic_plan_cache
+        return semantic_plan_cache
+
+
+def _collect_metrics() -> None:
+    with _semantic_plan_caches_lock:
+        semantic_plan_caches = list(_semantic_plan_caches.values())
+    all_stats = [c.get_stats() for c in semantic_plan_caches]
+    metrics.record_cache_stats(
+        "semantic_plan",
+        hits=sum(s.hits for s in all_stats),
+        misses=sum(s.misses for s in all_stats),
+        size=sum(s.size for s in all_stats),
+    )
+
+
+metrics.get_metrics_registry().add_collector(_collect_metrics)
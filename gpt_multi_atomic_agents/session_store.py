@@ -0,0 +1,227 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+import os
+import sqlite3
+import threading
+import time
+import typing
+import uuid
+
+from pydantic import BaseModel
+
+from . import metrics, tracing
+from .config import Config
+
+logger = logging.getLogger(__file__)
+
+TSession = typing.TypeVar("TSession", bound=BaseModel)
+
+
+@dataclass
+class SessionStoreStats:
+    memory_hits: int = 0
+    spill_hits: int = 0
+    misses: int = 0
+    in_memory_count: int = 0
+    spilled_count: int = 0
+
+
+class SessionStore(typing.Generic[TSession]):
+    """
+    Keeps the state of each session on the server, so that a client only needs to send its session id.
+    - the most recently used sessions are kept in memory as objects, so they are not re-validated on each request.
+    - when there are more than max_in_memory sessions, the least recently used are spilled to a local SQLite file as JSON (or dropped, if there is no path_to_db).
+    - a session expires ttl_seconds after it was last used.
+    """
+
+    def __init__(
+        self,
+        session_type: type[TSession],
+        max_in_memory: int,
+        ttl_seconds: float,
+        path_to_db: str | None,
+    ) -> None:
+        self.session_type = session_type
+        self.max_in_memory = max_in_memory
+        self.ttl_seconds = ttl_seconds
+        # session id -> (last_used_at, session)
+        self._sessions: OrderedDict[str, tuple[float, TSession]] = OrderedDict()
+        self._stats = SessionStoreStats()
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        if path_to_db:
+            dir_path = os.path.dirname(path_to_db)
+            if dir_path:
+                os.makedirs(dir_path, exist_ok=True)
+            self._connection = sqlite3.connect(path_to_db, check_same_thread=False)
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS session (session_id TEXT PRIMARY KEY, session_json TEXT NOT NULL, last_used_at REAL NOT NULL)"
+                )
+
+    def _is_expired(self, last_used_at: float, now: float) -> bool:
+        return now - last_used_at > self.ttl_seconds
+
+    def create_session_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def _serialize(
+        self, evicted: list[tuple[str, float, TSession]]
+    ) -> list[tuple[str, str, float]]:
+        if not evicted:
+            return []
+        with tracing.span("session_store.serialize", session_count=len(evicted)):
+            return [
+                (session_id, session.model_dump_json(), last_used_at)
+                for session_id, last_used_at, session in evicted
+            ]
+
+    def _spill(self, evicted: list[tuple[str, float, TSession]], now: float) -> None:
+        if self._connection is None:
+            return
+        rows = self._serialize(evicted)
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO session (session_id, session_json, last_used_at) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._connection.execute(
+                "DELETE FROM session WHERE last_used_at < ?", (now - self.ttl_seconds,)
+            )
+
+    def _set_in_memory(self, session_id: str, session: TSession, now: float) -> None:
+        evicted: list[tuple[str, float, TSession]] = []
+        self._sessions[session_id] = (now, session)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_in_memory:
+            evicted_id, (last_used_at, evicted_session) = self._sessions.popitem(
+                last=False
+            )
+            if not self._is_expired(last_used_at=last_used_at, now=now):
+                evicted.append((evicted_id, last_used_at, evicted_session))
+        self._spill(evicted=evicted, now=now)
+
+    def _pop_spilled(self, session_id: str, now: float) -> TSession | None:
+        if self._connection is None:
+            return None
+        with self._connection:
+            row = self._connection.execute(
+                "SELECT session_json, last_used_at FROM session WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "DELETE FROM session WHERE session_id = ?", (session_id,)
+            )
+        session_json, last_used_at = row
+        if self._is_expired(last_used_at=last_used_at, now=now):
+            return None
+        with tracing.span("session_store.deserialize"):
+            return self.session_type.model_validate_json(session_json)
+
+    def get(self, session_id: str) -> TSession | None:
+        """Get the session, or None if it does not exist or has expired. A spilled session is moved back into memory."""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                last_used_at, session = entry
+                if not self._is_expired(last_used_at=last_used_at, now=now):
+                    self._stats.memory_hits += 1
+                    self._sessions[session_id] = (now, session)
+                    self._sessions.move_to_end(session_id)
+                    return session
+                del self._sessions[session_id]
+
+            spilled_session = self._pop_spilled(session_id=session_id, now=now)
+            if spilled_session is None:
+                self._stats.misses += 1
+                return None
+            self._stats.spill_hits += 1
+            self._set_in_memory(session_id=session_id, session=spilled_session, now=now)
+            return spilled_session
+
+    def set(self, session_id: str, session: TSession) -> None:
+        now = time.time()
+        with self._lock:
+            self._set_in_memory(session_id=session_id, session=session, now=now)
+
+    def delete(self, session_id: str) -> bool:
+        """Delete the session. Returns False if it did not exist."""
+        with self._lock:
+            is_deleted = self._sessions.pop(session_id, None) is not None
+            if self._connection is not None:
+                with self._connection:
+                    cursor = self._connection.execute(
+                        "DELETE FROM session WHERE session_id = ?", (session_id,)
+                    )
+                    is_deleted = is_deleted or cursor.rowcount > 0
+            return is_deleted
+
+    def get_stats(self) -> SessionStoreStats:
+        with self._lock:
+            spilled_count = 0
+            if self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT COUNT(*) FROM session"
+                ).fetchone()
+                spilled_count = int(row[0])
+            return SessionStoreStats(
+                memory_hits=self._stats.memory_hits,
+                spill_hits=self._stats.spill_hits,
+                misses=self._stats.misses,
+                in_memory_count=len(self._sessions),
+                spilled_count=spilled_count,
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("DELETE FROM session")
+
+
+_session_stores: dict[tuple, SessionStore] = {}
+_session_stores_lock = threading.Lock()
+
+
+def get_session_store(
+    session_type: type[TSession], _config: Config
+) -> SessionStore[TSession]:
+    """Get the session store for the type of session and the Config. One store is shared per setting."""
+    key = (
+        session_type,
+        _config.session_max_in_memory,
+        _config.session_ttl_seconds,
+        _config.session_sqlite_path,
+    )
+    with _session_stores_lock:
+        session_store = _session_stores.get(key)
+        if session_store is None:
+            session_store = SessionStore(
+                session_type=session_type,
+                max_in_memory=_config.session_max_in_memory,
+                ttl_seconds=_config.session_ttl_seconds,
+                path_to_db=_config.session_sqlite_path or None,
+            )
+            _session_stores[key] = session_store
+            logger.info(f"Created session store for {session_type.__name__}")
+        return session_store
+
+
+def _collect_metrics() -> None:
+    with _session_stores_lock:
+        session_stores = list(_session_stores.values())
+    all_stats = [s.get_stats() for s in session_stores]
+    metrics.record_cache_stats(
+        "session",
+        hits=sum(s.memory_hits + s.spill_hits for s in all_stats),
+        misses=sum(s.misses for s in all_stats),
+        size=sum(s.in_memory_count + s.spilled_count for s in all_stats),
+    )
+
+
+metrics.get_metrics_registry().add_collector(_collect_metrics)
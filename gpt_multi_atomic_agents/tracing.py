@@ -0,0 +1,413 @@
+from abc import ABC, abstractmethod
+import atexit
+from contextlib import contextmanager
+import contextvars
+from dataclasses import dataclass, field
+import functools
+import inspect
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import typing
+
+from .config import Config, TRACE_EXPORT_FORMAT_Enum
+
+logger = logging.getLogger(__file__)
+
+SERVICE_NAME = "gpt-multi-atomic-agents"
+TRACER_NAME = "gpt_multi_atomic_agents"
+
+# Export the spans after this many, even if the trace has not ended (for example, a long chat loop)
+MAX_PENDING_SPANS = 1000
+
+AttributeValue = str | int | float | bool
+
+
+@dataclass
+class SpanEvent:
+    name: str
+    time_ns: int
+    attributes: dict[str, AttributeValue] = field(default_factory=dict)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str  # 32 hex characters, as in OpenTelemetry
+    span_id: str  # 16 hex characters
+    parent_span_id: str | None
+    start_time_ns: int  # Unix time
+    thread_id: int
+    end_time_ns: int = 0
+    attributes: dict[str, AttributeValue] = field(default_factory=dict)
+    events: list[SpanEvent] = field(default_factory=list)
+    error: str | None = None
+    _start_perf_ns: int = 0
+
+    @property
+    def duration_ns(self) -> int:
+        return self.end_time_ns - self.start_time_ns
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: AttributeValue) -> None:
+        self.events.append(
+            SpanEvent(name=name, time_ns=time.time_ns(), attributes=attributes)
+        )
+
+
+class TraceExporterBase(ABC):
+    """Exports the ended spans, for example to a file. To plug in your own exporter, see set_exporter()."""
+
+    @abstractmethod
+    def export(self, spans: list[Span]) -> None:
+        raise NotImplementedError()
+
+
+def _ensure_dir_of_file(path: str) -> None:
+    dir_path = os.path.dirname(path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+
+
+class ChromeTraceFileExporter(TraceExporterBase):
+    """
+    Writes the spans to a file in the Chrome Trace Event format: open it in https://ui.perfetto.dev or chrome://tracing.
+    - the file is started over by each process. The closing ']' is optional in this format, so spans can be appended as they end.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._is_started = False
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _to_chrome_events(self, span: Span) -> list[dict[str, typing.Any]]:
+        ids: dict[str, AttributeValue] = {
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+        }
+        if span.parent_span_id:
+            ids["parent_span_id"] = span.parent_span_id
+        if span.error:
+            ids["error"] = span.error
+        events: list[dict[str, typing.Any]] = [
+            {
+                "name": span.name,
+                "cat": TRACER_NAME,
+                "ph": "X",
+                "ts": span.start_time_ns / 1000,
+                "dur": span.duration_ns / 1000,
+                "pid": self._pid,
+                "tid": span.thread_id,
+                "args": span.attributes | ids,
+            }
+        ]
+        for event in span.events:
+            events.append(
+                {
+                    "name": event.name,
+                    "cat": TRACER_NAME,
+                    "ph": "i",
+                    "s": "t",
+                    "ts": event.time_ns / 1000,
+                    "pid": self._pid,
+                    "tid": span.thread_id,
+                    "args": event.attributes,
+                }
+            )
+        return events
+
+    def export(self, spans: list[Span]) -> None:
+        lines = [
+            json.dumps(e, default=str)
+            for span in spans
+            for e in self._to_chrome_events(span)
+        ]
+        if not lines:
+            return
+        with self._lock:
+            if not self._is_started:
+                _ensure_dir_of_file(self.path)
+                with open(self.path, "w", encoding="utf-8") as file:
+                    file.write("[\n" + ",\n".join(lines))
+                self._is_started = True
+                return
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(",\n" + ",\n".join(lines))
+
+
+def _to_otlp_value(value: AttributeValue) -> dict[str, typing.Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp_attributes(
+    attributes: dict[str, AttributeValue],
+) -> list[dict[str, typing.Any]]:
+    return [{"key": k, "value": _to_otlp_value(v)} for k, v in attributes.items()]
+
+
+_OTLP_SPAN_KIND_INTERNAL = 1
+_OTLP_STATUS_CODE_ERROR = 2
+
+
+class OtlpJsonFileExporter(TraceExporterBase):
+    """
+    Writes the spans to a file in the OTLP JSON format (as written by the OpenTelemetry Collector's file exporter): one ExportTraceServiceRequest per line.
+    - the file is appended to, so it can be sent on to any OTLP backend later.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _to_otlp_span(self, span: Span) -> dict[str, typing.Any]:
+        otlp_span: dict[str, typing.Any] = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": _OTLP_SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(span.start_time_ns),
+            "endTimeUnixNano": str(span.end_time_ns),
+            "attributes": _to_otlp_attributes(
+                span.attributes | {"thread.id": span.thread_id}
+            ),
+            "events": [
+                {
+                    "timeUnixNano": str(e.time_ns),
+                    "name": e.name,
+                    "attributes": _to_otlp_attributes(e.attributes),
+                }
+                for e in span.events
+            ],
+            "status": (
+                {"code": _OTLP_STATUS_CODE_ERROR, "message": span.error}
+                if span.error
+                else {}
+            ),
+        }
+        if span.parent_span_id:
+            otlp_span["parentSpanId"] = span.parent_span_id
+        return otlp_span
+
+    def export(self, spans: list[Span]) -> None:
+        if not spans:
+            return
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _to_otlp_attributes(
+                            {"service.name": SERVICE_NAME}
+                        )
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": TRACER_NAME},
+                            "spans": [self._to_otlp_span(s) for s in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        line = json.dumps(request, default=str)
+        with self._lock:
+            _ensure_dir_of_file(self.path)
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line + "\n")
+
+
+class Tracer:
+    """Collects the ended spans, and exports them when their trace ends (when the root span ends)."""
+
+    def __init__(self, exporter: TraceExporterBase) -> None:
+        self.exporter = exporter
+        self._pending_spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def on_span_end(self, span: Span) -> None:
+        with self._lock:
+            self._pending_spans.append(span)
+            is_flush_needed = (
+                span.parent_span_id is None
+                or len(self._pending_spans) >= MAX_PENDING_SPANS
+            )
+        if is_flush_needed:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            spans = self._pending_spans
+            self._pending_spans = []
+        if not spans:
+            return
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            # Tracing must not break a generation
+            logger.exception(e)
+
+
+_tracer: Tracer | None = None
+_tracer_config_key: tuple | None = None
+_tracer_lock = threading.Lock()
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def _create_exporter(_config: Config) -> TraceExporterBase | None:
+    match _config.trace_export_format:
+        case TRACE_EXPORT_FORMAT_Enum.none:
+            return None
+        case TRACE_EXPORT_FORMAT_Enum.chrome:
+            return ChromeTraceFileExporter(_config.trace_file_path)
+        case TRACE_EXPORT_FORMAT_Enum.otlp:
+            return OtlpJsonFileExporter(_config.trace_file_path)
+        case _:
+            raise RuntimeError(
+                f"Not a recognised trace export format: '{_config.trace_export_format}' - please check Config."
+            )
+
+
+def configure_tracing(_config: Config) -> None:
+    """
+    Start tracing to a file, if the Config has a trace_export_format. Called at the start of each generation, so is cheap when nothing has changed.
+    - does not replace an exporter that was set via set_exporter(), unless the Config enables tracing.
+    """
+    global _tracer, _tracer_config_key
+    if _config.trace_export_format == TRACE_EXPORT_FORMAT_Enum.none:
+        return
+    key = (_config.trace_export_format, _config.trace_file_path)
+    if key == _tracer_config_key:
+        return
+    with _tracer_lock:
+        if key == _tracer_config_key:
+            return
+        exporter = _create_exporter(_config)
+        if _tracer:
+            _tracer.flush()
+        _tracer = Tracer(exporter) if exporter else None
+        _tracer_config_key = key
+
+
+def set_exporter(exporter: TraceExporterBase | None) -> None:
+    """Plug in an exporter, for example to send the spans to your own tracing system. Set to None to stop tracing."""
+    global _tracer, _tracer_config_key
+    with _tracer_lock:
+        if _tracer:
+            _tracer.flush()
+        _tracer = Tracer(exporter) if exporter else None
+        _tracer_config_key = None
+
+
+def is_tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def flush() -> None:
+    """Export the spans that have ended, without waiting for their traces to end."""
+    tracer = _tracer
+    if tracer:
+        tracer.flush()
+
+
+atexit.register(flush)
+
+
+def _new_id(byte_count: int) -> str:
+    return secrets.token_hex(byte_count)
+
+
+@contextmanager
+def span(name: str, **attributes: AttributeValue) -> typing.Iterator[Span | None]:
+    """
+    Trace the block as a span: a child of the current span (in this thread or task), or else the root span of a new trace.
+    - if tracing is not enabled, then this does nothing, and the span is None.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    new_span = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else _new_id(16),
+        span_id=_new_id(8),
+        parent_span_id=parent.span_id if parent else None,
+        start_time_ns=time.time_ns(),
+        thread_id=threading.get_ident(),
+        attributes=dict(attributes),
+        _start_perf_ns=time.perf_counter_ns(),
+    )
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        # The duration is from the monotonic clock, so it is accurate even if the system clock changes
+        new_span.end_time_ns = new_span.start_time_ns + (
+            time.perf_counter_ns() - new_span._start_perf_ns
+        )
+        tracer.on_span_end(new_span)
+
+
+TCallable = typing.TypeVar("TCallable", bound=typing.Callable[..., typing.Any])
+
+
+def traced(name: str | None = None) -> typing.Callable[[TCallable], TCallable]:
+    """Decorator: trace each call of the function (sync or async) as a span. The span name defaults to the function name."""
+
+    def _decorate(function: TCallable) -> TCallable:
+        span_name = name or function.__name__
+
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def _async_wrapper(
+                *args: typing.Any, **kwargs: typing.Any
+            ) -> typing.Any:
+                with span(span_name):
+                    return await function(*args, **kwargs)
+
+            return typing.cast(TCallable, _async_wrapper)
+
+        @functools.wraps(function)
+        def _wrapper(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+            with span(span_name):
+                return function(*args, **kwargs)
+
+        return typing.cast(TCallable, _wrapper)
+
+    return _decorate
+
+
+def get_current_span() -> Span | None:
+    return _current_span.get()
+
+
+def get_current_trace_id() -> str | None:
+    current_span = _current_span.get()
+    return current_span.trace_id if current_span else None
+
+
+def add_event(name: str, **attributes: AttributeValue) -> None:
+    """Add an event to the current span (if any), for example when the LLM response did not match the output schema."""
+    current_span = _current_span.get()
+    if current_span:
+        current_span.add_event(name, **attributes)
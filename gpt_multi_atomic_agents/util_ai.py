@@ -1,37 +1,543 @@
+import asyncio
+from dataclasses import dataclass, replace
+import functools
+import importlib.util
+import logging
+import threading
+import typing
+import weakref
+import httpx
 import instructor
+from instructor.validators import AsyncValidationError
+from json import JSONDecodeError
+from pydantic import ValidationError
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+)
+from atomic_agents.agents.base_agent import BaseAgent, BaseIOSchema
 from rich.console import Console
 from rich.text import Text
-from anthropic import AnthropicBedrock
-from groq import Groq
-from openai import OpenAI
+from anthropic import AnthropicBedrock, AsyncAnthropicBedrock
+from groq import AsyncGroq, Groq
+from openai import AsyncOpenAI, OpenAI
 
-from . import config
+from . import (
+    config,
+    metrics,
+    mock_llm,
+    rate_limiter,
+    resilience,
+    tracing,
+    util_tokens,
+)
 
 console = Console()
+logger = logging.getLogger(__file__)
 
 ClientModel = tuple[instructor.Instructor, str, int | None]  # client, model, max_tokens
 
+HttpClient = httpx.Client | httpx.AsyncClient
 
-def create_client(_config: config.Config) -> ClientModel:
-    client: instructor.Instructor | None = None
-    model: str | None = None
-    max_tokens: int | None = None
+# The errors after which instructor asks the LLM again (with the error)
+REASK_ERROR_TYPES = (ValidationError, JSONDecodeError, AsyncValidationError)
+
+
+@dataclass
+class ClientPoolStats:
+    """Statistics of the process-wide LLM client pool."""
+
+    clients_created: int = 0
+    client_reuses: int = 0
+    http_requests: int = 0
+    connections_opened: int = 0
+
+    @property
+    def connection_reuse_ratio(self) -> float:
+        """The fraction of HTTP requests that re-used an already open connection."""
+        if not self.http_requests:
+            return 0.0
+        return max(0.0, 1.0 - self.connections_opened / self.http_requests)
+
+
+@dataclass
+class _PooledClient:
+    client: instructor.Instructor
+    http_client: HttpClient | None  # None for the mock AI platform, when replaying
+    base_url: str
+
+
+# Keyed by (ai_platform, model, is_async, mock settings, rate limiter + resilience settings): the client's create() is wrapped with the limiter and the resilience policy of those settings.
+_PoolKey = tuple[config.AI_PLATFORM_Enum, str, bool, tuple, tuple]
+
+_client_pool: dict[_PoolKey, _PooledClient] = {}
+# The async clients of each event loop, since an async HTTP client should only be used by the event loop that created it.
+# - dropped when the loop is garbage collected, or when it is found to be closed (the clients can keep their loop alive, via its open connections).
+_async_client_pools: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[_PoolKey, _PooledClient]
+] = weakref.WeakKeyDictionary()
+_client_pool_lock = threading.Lock()
+_stats = ClientPoolStats()
+_stats_lock = threading.Lock()
+
+
+def _on_trace(event_name: str, _info: dict[str, typing.Any]) -> None:
+    if event_name.endswith("connect_tcp.complete"):
+        with _stats_lock:
+            _stats.connections_opened += 1
+
+
+async def _on_trace_async(event_name: str, info: dict[str, typing.Any]) -> None:
+    _on_trace(event_name, info)
+
+
+def _on_request(request: httpx.Request) -> None:
+    with _stats_lock:
+        _stats.http_requests += 1
+    request.extensions["trace"] = _on_trace
+
+
+async def _on_request_async(request: httpx.Request) -> None:
+    with _stats_lock:
+        _stats.http_requests += 1
+    request.extensions["trace"] = _on_trace_async
+
+
+def _add_instrumentation_hooks(client: instructor.Instructor, model: str) -> None:
+    """
+    Record the LLM calls, tokens and validation retries of the client (see metrics.py), and add them as events to the current span (see tracing.py).
+    - the calls are attributed to the caller set via metrics.llm_caller().
+    """
+
+    def _on_completion_kwargs(*_args: typing.Any, **_kwargs: typing.Any) -> None:
+        tracing.add_event("llm_request")
+
+    def _on_completion_response(response: typing.Any) -> None:
+        caller = metrics.get_llm_caller()
+        metrics.LLM_CALLS.inc(agent_name=caller, model=model)
+        token_usage = util_tokens.get_llm_token_usage(response)
+        if token_usage:
+            input_tokens, output_tokens = token_usage
+            metrics.LLM_INPUT_TOKENS.inc(input_tokens, agent_name=caller, model=model)
+            metrics.LLM_OUTPUT_TOKENS.inc(output_tokens, agent_name=caller, model=model)
+            tracing.add_event(
+                "llm_response", input_tokens=input_tokens, output_tokens=output_tokens
+            )
+        else:
+            tracing.add_event("llm_response")
+
+    def _on_parse_error(error: Exception) -> None:
+        metrics.LLM_VALIDATION_RETRIES.inc(
+            agent_name=metrics.get_llm_caller(), model=model
+        )
+        tracing.add_event("validation_error", error=type(error).__name__)
+
+    client.on("completion:kwargs", _on_completion_kwargs)
+    client.on("completion:response", _on_completion_response)
+    client.on("parse:error", _on_parse_error)
+
+
+def _is_http2_available(_config: config.Config) -> bool:
+    if not _config.is_http2_enabled:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning(
+            "HTTP/2 is enabled in Config, but the 'h2' package is not installed - using HTTP/1.1 (to fix: pip install httpx[http2])"
+        )
+        return False
+    return True
+
+
+def _create_http_client(_config: config.Config, is_async: bool) -> HttpClient:
+    limits = httpx.Limits(
+        max_connections=_config.http_max_connections,
+        max_keepalive_connections=_config.http_max_keepalive_connections,
+        keepalive_expiry=_config.http_keepalive_expiry_seconds,
+    )
+    http2 = _is_http2_available(_config)
+    # The timeout is set per request, by the AI platform's SDK.
+    if is_async:
+        return httpx.AsyncClient(
+            limits=limits,
+            http2=http2,
+            event_hooks={"request": [_on_request_async]},
+        )
+    return httpx.Client(
+        limits=limits,
+        http2=http2,
+        event_hooks={"request": [_on_request]},
+    )
+
+
+def _get_mock_settings(_config: config.Config) -> tuple:
+    if _config.ai_platform != config.AI_PLATFORM_Enum.mock:
+        return ()
+    return (
+        _config.mock_mode,
+        _config.mock_recorded_ai_platform,
+        _config.mock_cassette_path,
+        _config.mock_is_strict,
+        _config.mock_latency,
+        _config.mock_latency_seconds,
+        _config.mock_latency_spread_seconds,
+        _config.mock_random_seed,
+    )
+
+
+def _create_mock_pooled_client(_config: config.Config, is_async: bool) -> _PooledClient:
+    """The mock AI platform: replays the LLM responses from a cassette file, or records the responses of the real AI platform (mock_recorded_ai_platform) into it."""
+    recorded: _PooledClient | None = None
+    if _config.mock_mode == config.MOCK_MODE_Enum.record:
+        if _config.mock_recorded_ai_platform == config.AI_PLATFORM_Enum.mock:
+            raise RuntimeError(
+                "The mock AI platform cannot record itself - please check Config.mock_recorded_ai_platform."
+            )
+        recorded = _create_pooled_client(
+            _config=replace(_config, ai_platform=_config.mock_recorded_ai_platform),
+            is_async=is_async,
+        )
+    client = mock_llm.create_mock_client(
+        _config=_config,
+        is_async=is_async,
+        recorded_client=recorded.client if recorded else None,
+    )
+    if recorded is None:
+        # (when recording, the recorded client has the instrumentation hooks)
+        _add_instrumentation_hooks(client=client, model=_config.model)
+
+    console.print(
+        Text(
+            f"  AI platform: {_config.ai_platform} ({_config.mock_mode}: {_config.mock_cassette_path})",
+            style="magenta",
+        )
+    )
+
+    return _PooledClient(
+        client=client,
+        http_client=recorded.http_client if recorded else None,
+        base_url=recorded.base_url if recorded else "",
+    )
+
+
+def _wrap_sdk_create(
+    sdk_resource: typing.Any, _config: config.Config, is_async: bool
+) -> None:
+    """
+    Wrap the SDK's create() function, before instructor wraps it: so each request is handled, including the retries when a response does not match the output schema.
+    - the rate limiter is inside the retries and hedging: so each retried or hedged request also waits for the quota.
+    - the resilience policy is given the limiter: so its latencies do not include the wait for the quota, and it does not hedge while the limiter has no free capacity.
+    """
+    ai_platform, model = _config.ai_platform, _config.model
+    limiter = rate_limiter.get_rate_limiter(
+        ai_platform=ai_platform, model=model, _config=_config
+    )
+    if limiter is not None:
+        sdk_resource.create = (
+            rate_limiter.alimit_calls(sdk_resource.create, limiter)
+            if is_async
+            else rate_limiter.limit_calls(sdk_resource.create, limiter)
+        )
+    policy = resilience.get_resilience_policy(
+        ai_platform=ai_platform, model=model, _config=_config
+    )
+    if policy is not None:
+        sdk_resource.create = (
+            resilience.aresilient_calls(sdk_resource.create, policy, limiter=limiter)
+            if is_async
+            else resilience.resilient_calls(
+                sdk_resource.create, policy, limiter=limiter
+            )
+        )
+
+
+def _reask_only_on_validation_errors(
+    client: instructor.Instructor, is_async: bool
+) -> None:
+    """
+    instructor sends a request again after any error: only do that (a re-ask) when the response did not match the output schema.
+    - other errors are retried by _wrap_sdk_create(), so the retries of a call are bounded.
+    """
+    create_fn = client.create_fn
+    retrying_class = AsyncRetrying if is_async else Retrying
+
+    @functools.wraps(create_fn)
+    def _create_fn(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+        max_retries = kwargs.get("max_retries")
+        if isinstance(max_retries, int):
+            kwargs["max_retries"] = retrying_class(
+                stop=stop_after_attempt(max_retries),
+                retry=retry_if_exception_type(REASK_ERROR_TYPES),
+            )
+        return create_fn(*args, **kwargs)
+
+    client.create_fn = _create_fn
+
+
+def _create_pooled_client(_config: config.Config, is_async: bool) -> _PooledClient:
+    if _config.ai_platform == config.AI_PLATFORM_Enum.mock:
+        return _create_mock_pooled_client(_config=_config, is_async=is_async)
+    # (the SDK clients do not retry: see _wrap_sdk_create())
+    # (typed as Any, since the SDK client is either sync or async - matching the HTTP client)
+    http_client: typing.Any = _create_http_client(_config=_config, is_async=is_async)
+    sdk_client: typing.Any = None
     match _config.ai_platform:
         case config.AI_PLATFORM_Enum.groq:
-            client = instructor.from_groq(Groq())
-            model = _config.model
+            sdk_client = (
+                AsyncGroq(http_client=http_client, max_retries=0)
+                if is_async
+                else Groq(http_client=http_client, max_retries=0)
+            )
+            _wrap_sdk_create(sdk_client.chat.completions, _config, is_async)
+            client = instructor.from_groq(sdk_client)
         case config.AI_PLATFORM_Enum.openai:
-            client = instructor.from_openai(OpenAI())
-            model = _config.model
+            sdk_client = (
+                AsyncOpenAI(http_client=http_client, max_retries=0)
+                if is_async
+                else OpenAI(http_client=http_client, max_retries=0)
+            )
+            _wrap_sdk_create(sdk_client.chat.completions, _config, is_async)
+            client = instructor.from_openai(sdk_client)
         case config.AI_PLATFORM_Enum.bedrock_anthropic:
-            client = instructor.from_anthropic(AnthropicBedrock())
-            model = _config.model
-            max_tokens = _config.max_tokens
+            sdk_client = (
+                AsyncAnthropicBedrock(http_client=http_client, max_retries=0)
+                if is_async
+                else AnthropicBedrock(http_client=http_client, max_retries=0)
+            )
+            _wrap_sdk_create(sdk_client.messages, _config, is_async)
+            client = instructor.from_anthropic(sdk_client)
         case _:
             raise RuntimeError(
                 f"Not a recognised AI_PLATFORM: '{_config.ai_platform}' - please check Config."
             )
 
+    _reask_only_on_validation_errors(client=client, is_async=is_async)
+    _add_instrumentation_hooks(client=client, model=_config.model)
+
     console.print(Text(f"  AI platform: {_config.ai_platform}", style="magenta"))
 
-    return client, model, max_tokens
+    return _PooledClient(
+        client=client, http_client=http_client, base_url=str(sdk_client.base_url)
+    )
+
+
+def _get_running_loop_or_none() -> asyncio.AbstractEventLoop | None:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _evict_closed_event_loops() -> None:
+    for loop in [loop for loop in _async_client_pools if loop.is_closed()]:
+        del _async_client_pools[loop]
+
+
+def _get_pool(is_async: bool) -> dict[_PoolKey, _PooledClient]:
+    """Get the pool for the current event loop (if is_async). The caller must hold _client_pool_lock."""
+    loop = _get_running_loop_or_none() if is_async else None
+    if loop is None:
+        return _client_pool
+    _evict_closed_event_loops()
+    pool = _async_client_pools.get(loop)
+    if pool is None:
+        pool = {}
+        _async_client_pools[loop] = pool
+    return pool
+
+
+def _get_pooled_client(_config: config.Config, is_async: bool) -> _PooledClient:
+    key: _PoolKey = (
+        _config.ai_platform,
+        _config.model,
+        is_async,
+        _get_mock_settings(_config),
+        (
+            rate_limiter.get_rate_limiter_settings(_config),
+            resilience.get_resilience_policy_settings(_config),
+        ),
+    )
+    with _client_pool_lock:
+        pool = _get_pool(is_async)
+        pooled = pool.get(key)
+        is_created = pooled is None
+        if pooled is None:
+            pooled = _create_pooled_client(_config=_config, is_async=is_async)
+            pool[key] = pooled
+    with _stats_lock:
+        if is_created:
+            _stats.clients_created += 1
+        else:
+            _stats.client_reuses += 1
+    return pooled
+
+
+def create_client(_config: config.Config, is_async: bool = False) -> ClientModel:
+    """
+    Get an instructor client for the configured AI platform.
+    - the clients are long-lived: one client per (ai_platform, model) is kept in a process-wide pool, so HTTP connections are re-used across calls.
+    - the async clients are pooled per event loop, and are dropped once their loop is closed.
+    - if is_async, then the client is an instructor.AsyncInstructor: use it via run_agent_async().
+    """
+    pooled = _get_pooled_client(_config=_config, is_async=is_async)
+
+    max_tokens: int | None = None
+    ai_platform = (
+        _config.mock_recorded_ai_platform
+        if _config.ai_platform == config.AI_PLATFORM_Enum.mock
+        else _config.ai_platform
+    )
+    if ai_platform == config.AI_PLATFORM_Enum.bedrock_anthropic:
+        max_tokens = _config.max_tokens
+
+    return pooled.client, _config.model, max_tokens
+
+
+def warm_up_client(_config: config.Config) -> None:
+    """Create the pooled client and open a connection to the AI platform, so the first real call does not pay for the connection setup."""
+    pooled = _get_pooled_client(_config=_config, is_async=False)
+    if pooled.http_client is None:
+        return
+    try:
+        typing.cast(httpx.Client, pooled.http_client).head(pooled.base_url)
+    except httpx.HTTPError as e:
+        logger.warning(f"Could not warm up the client for {_config.ai_platform}: {e}")
+
+
+async def warm_up_client_async(_config: config.Config) -> None:
+    """Async version of warm_up_client(): warms up the async client for the current event loop."""
+    pooled = _get_pooled_client(_config=_config, is_async=True)
+    if pooled.http_client is None:
+        return
+    try:
+        await typing.cast(httpx.AsyncClient, pooled.http_client).head(pooled.base_url)
+    except httpx.HTTPError as e:
+        logger.warning(f"Could not warm up the client for {_config.ai_platform}: {e}")
+
+
+def get_client_pool_stats() -> ClientPoolStats:
+    """Get a snapshot of the client pool statistics, for example to check how often HTTP connections are re-used."""
+    with _stats_lock:
+        return ClientPoolStats(
+            clients_created=_stats.clients_created,
+            client_reuses=_stats.client_reuses,
+            http_requests=_stats.http_requests,
+            connections_opened=_stats.connections_opened,
+        )
+
+
+def clear_client_pool() -> None:
+    """Remove all the pooled clients, for example after changing credentials. Open connections are closed when the clients are garbage collected."""
+    with _client_pool_lock:
+        _client_pool.clear()
+        _async_client_pools.clear()
+
+
+def get_client_pool_size() -> int:
+    """Get the number of pooled clients, including the async clients of each open event loop."""
+    with _client_pool_lock:
+        _evict_closed_event_loops()
+        return len(_client_pool) + sum(len(p) for p in _async_client_pools.values())
+
+
+def _build_messages(agent: BaseAgent, user_input: BaseIOSchema) -> list[dict]:
+    agent.memory.initialize_turn()
+    agent.current_user_input = user_input
+    agent.memory.add_message("user", user_input)
+
+    messages: list[dict] = [
+        {
+            "role": "system",
+            "content": agent.system_prompt_generator.generate_prompt(),
+        }
+    ]
+    history: list[dict] = agent.memory.get_history()
+    return messages + history
+
+
+async def run_agent_async(agent: BaseAgent, user_input: BaseIOSchema) -> BaseIOSchema:
+    """
+    Run the agent with the given input, awaiting the full structured response.
+    - the agent must have been created with an async client (see create_client()).
+    - this mirrors BaseAgent.run(), which cannot await an async client.
+    """
+    messages = _build_messages(agent=agent, user_input=user_input)
+
+    response = await agent.client.chat.completions.create(
+        messages=messages,
+        model=agent.model,
+        response_model=agent.output_schema,
+        temperature=agent.temperature,
+        max_tokens=agent.max_tokens,
+    )
+    agent.memory.add_message("assistant", response)
+
+    return typing.cast(BaseIOSchema, response)
+
+
+async def run_agent_streaming_async(
+    agent: BaseAgent,
+    user_input: BaseIOSchema,
+    on_partial_response: typing.Callable[[typing.Any], None],
+) -> BaseIOSchema:
+    """
+    Streaming version of run_agent_async(): calls on_partial_response() with each partial response, as the LLM writes it.
+    - a partial response has the fields of the output schema, but they can be missing or incomplete (see get_newly_completed_items()).
+    - returns the full structured response.
+    """
+    messages = _build_messages(agent=agent, user_input=user_input)
+
+    last_partial_response: typing.Any = None
+    async for partial_response in agent.client.chat.completions.create_partial(
+        messages=messages,
+        model=agent.model,
+        response_model=agent.output_schema,
+        temperature=agent.temperature,
+        max_tokens=agent.max_tokens,
+    ):
+        if last_partial_response is None:
+            tracing.add_event("first_partial_response")
+        last_partial_response = partial_response
+        on_partial_response(partial_response)
+
+    if last_partial_response is None:
+        raise RuntimeError("The LLM did not stream a response")
+    response = agent.output_schema.model_validate(last_partial_response.model_dump())
+    agent.memory.add_message("assistant", response)
+
+    return typing.cast(BaseIOSchema, response)
+
+
+T = typing.TypeVar("T")
+
+
+def get_newly_completed_items(
+    items: list[T] | None, emitted_count: int, is_final: bool = False
+) -> list[T]:
+    """
+    Get the items of a streamed list that are complete, but have not yet been emitted.
+    - while streaming, the last item may still be incomplete: an item is only complete once the next item has started (or the stream has ended).
+    """
+    items = items or []
+    completed_count = len(items) if is_final else max(0, len(items) - 1)
+    return items[emitted_count:completed_count]
+
+
+def _collect_metrics() -> None:
+    stats = get_client_pool_stats()
+    metrics.record_cache_stats(
+        "client_pool",
+        hits=stats.client_reuses,
+        misses=stats.clients_created,
+        size=get_client_pool_size(),
+    )
+    # A hit is an HTTP request that re-used an open connection
+    metrics.record_cache_stats(
+        "http_connection",
+        hits=max(0, stats.http_requests - stats.connections_opened),
+        misses=stats.connections_opened,
+    )
+
+
+metrics.get_metrics_registry().add_collector(_collect_metrics)
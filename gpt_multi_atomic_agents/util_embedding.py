@@ -0,0 +1,39 @@
+import re
+import zlib
+
+import numpy as np
+
+EMBEDDING_DIMENSIONS = 1024
+
+# Words that do not change the meaning of a request to an agent
+_FILLER_WORDS = {"please", "kindly", "thanks", "thank", "you", "can", "could", "would"}
+
+
+def normalize_text(text: str) -> str:
+    """The words of the text that matter to its meaning: lower case, without punctuation or filler words."""
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return " ".join(w for w in words if w not in _FILLER_WORDS)
+
+
+def _get_features(text: str) -> list[str]:
+    """The words, plus the character trigrams (including word boundaries) that make the embedding tolerant of small spelling differences."""
+    normalized = normalize_text(text)
+    padded = f" {normalized} "
+    trigrams = [padded[i : i + 3] for i in range(len(padded) - 2)]
+    return normalized.split() + trigrams
+
+
+def embed_text(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> np.ndarray:
+    """
+    Embed the text as a normalized vector of hashed word and character n-gram counts.
+    - local and deterministic, so needs no model: similar wording gives similar vectors, but this does not capture synonyms.
+    - the dot product of two embeddings is their cosine similarity.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature in _get_features(text):
+        # crc32 is stable across processes, unlike hash()
+        vector[zlib.crc32(feature.encode()) % dimensions] += 1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
@@ -1,5 +1,8 @@
+import functools
 import logging
-from cornsnake import util_list, util_string
+import re
+
+from cornsnake import util_string
 
 logger = logging.getLogger(__file__)
 
@@ -9,38 +12,138 @@ def _clean_mutation_name(name: str) -> str:
     return result
 
 
+_OBJECT_TYPE_REGEX = re.compile(r"\btype\s+([_a-zA-Z][_a-zA-Z0-9]*)[^{}]*\{")
+# Descriptions and comments can contain anything, so they are removed before parsing the fields
+_DESCRIPTION_OR_COMMENT_REGEX = re.compile(r'"""(?:.|\n)*?"""|"[^"\n]*"|#[^\n]*')
+# A field name and its type - a list type like '[Creature!]!' is parsed as 'Creature'
+_FIELD_REGEX = re.compile(
+    r"([_a-zA-Z][_a-zA-Z0-9]*)\s*:\s*\[*\s*([_a-zA-Z][_a-zA-Z0-9]*)?"
+)
+
+_ROOT_OPERATION_TYPE_NAMES = {"Query", "Mutation", "Subscription"}
+
+
+def _find_block_end(text: str, start: int) -> int:
+    """Find the end of the block that starts at 'start' (just after its opening brace), allowing for nested braces."""
+    depth = 1
+    for i in range(start, len(text)):
+        if text[i] == "{":
+            depth += 1
+        elif text[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(text)
+
+
+def _remove_arguments(text: str) -> str:
+    """Remove the arguments of the fields - including nested parentheses - so that only the field names are followed by ':'."""
+    result: list[str] = []
+    depth = 0
+    for c in text:
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth = max(0, depth - 1)
+        elif depth == 0:
+            result.append(c)
+    return "".join(result)
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_object_types(schema: str) -> tuple[tuple[str, str, str], ...]:
+    """Parse the fields of every 'type X { ... }' block of the schema, as (type name, field name, field type)."""
+    schema = _DESCRIPTION_OR_COMMENT_REGEX.sub("", schema)
+    fields: list[tuple[str, str, str]] = []
+    for match in _OBJECT_TYPE_REGEX.finditer(schema):
+        block = schema[match.end() : _find_block_end(schema, match.end())]
+        type_name = match.group(1)
+        fields.append((type_name, "", ""))  # so that a type without fields is found
+        for field_name, field_type in _FIELD_REGEX.findall(_remove_arguments(block)):
+            fields.append((type_name, field_name, field_type))
+    return tuple(fields)
+
+
+def _parse_mutation_names_from_schema(schema: str) -> list[str]:
+    return [
+        _clean_mutation_name(field_name)
+        for type_name, field_name, _field_type in _parse_object_types(schema)
+        if type_name == "Mutation" and field_name
+    ]
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_mutation_names_from_schemas(
+    accepted_graphql_schemas: tuple[str, ...],
+) -> tuple[str, ...]:
+    mutation_names: list[str] = []
+    for schema in accepted_graphql_schemas:
+        for name in _parse_mutation_names_from_schema(schema):
+            if name and name not in mutation_names:
+                mutation_names.append(name)
+    return tuple(mutation_names)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_out_data_type_names_from_schemas(
+    accepted_graphql_schemas: tuple[str, ...],
+) -> frozenset[str]:
+    """
+    Parse the names of the data types from the schemas: the object types (not Query, Mutation or Subscription), and the types returned by the mutations.
+    - memoized per set of schemas.
+    """
+    type_names: set[str] = set()
+    for schema in accepted_graphql_schemas:
+        for type_name, field_name, field_type in _parse_object_types(schema):
+            if type_name not in _ROOT_OPERATION_TYPE_NAMES:
+                type_names.add(type_name)
+            elif type_name == "Mutation" and field_type:
+                type_names.add(field_type)
+    return frozenset(type_names)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_out_query_field_types_from_schemas(
+    accepted_graphql_schemas: tuple[str, ...],
+) -> dict[str, str]:
+    """
+    Parse the type of each field of the Query type, for example 'creatures' -> 'Creature'.
+    - memoized per set of schemas: the caller must not modify the result.
+    """
+    field_types: dict[str, str] = {}
+    for schema in accepted_graphql_schemas:
+        for type_name, field_name, field_type in _parse_object_types(schema):
+            if type_name == "Query" and field_name and field_type:
+                field_types[field_name] = field_type
+    return field_types
+
+
 def parse_out_mutation_names_from_schemas(
     accepted_graphql_schemas: list[str],
 ) -> list[str]:
-    accepted_mutation_names = []
+    """
+    Parse the names of all the mutations from the schemas: every field of each 'type Mutation { ... }' block.
+    - the result is memoized per set of schemas, since the schemas of an agent do not change.
+    """
+    return list(_parse_mutation_names_from_schemas(tuple(accepted_graphql_schemas)))
 
-    for accepted in accepted_graphql_schemas:
-        token = "type Mutation {"
-        if token not in accepted:
-            continue
-        parts = accepted.split(token)
-        if len(parts) != 2:
-            logger.warning("Expected 2 parts in accepted mutations schema")
-            continue
-        mutation_def = parts[1].split("}")[0]
-        mutation = mutation_def.split("(")[0].strip()
-        if mutation:
-            accepted_mutation_names.append(_clean_mutation_name(mutation))
 
-    return accepted_mutation_names
+@functools.lru_cache(maxsize=1024)
+def _compile_mutation_call_regex(
+    accepted_mutation_names: tuple[str, ...],
+) -> re.Pattern[str]:
+    names = "|".join(re.escape(n) for n in accepted_mutation_names)
+    return re.compile(rf"(?<![_a-zA-Z0-9])(?:{names})\s*\(")
 
 
 def filter_to_matching_mutation_calls(
     previously_generated_mutation_calls: list[str], accepted_mutation_names: list[str]
 ) -> list[str]:
-    accepted_mutation_names__adjusted = util_list.flatten(
-        [[f"{n}(", f"{n} ("] for n in accepted_mutation_names]
-    )
-
-    matching: list[str] = []
-    for previous in previously_generated_mutation_calls:
-        filtered = filter(lambda a: a in previous, accepted_mutation_names__adjusted)
-        if any(list(filtered)):
-            matching.append(previous)
-
-    return matching
+    """
+    Get the mutation calls that call one of the accepted mutations.
+    - all the names are matched in one pass, via a compiled regex (memoized per set of names).
+    """
+    if not accepted_mutation_names:
+        return []
+    regex = _compile_mutation_call_regex(tuple(accepted_mutation_names))
+    return [c for c in previously_generated_mutation_calls if regex.search(c)]
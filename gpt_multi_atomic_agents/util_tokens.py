@@ -0,0 +1,25 @@
+import math
+import typing
+
+# A rough average for English text with the common LLM tokenizers
+CHARACTERS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of LLM tokens in the text, without needing the AI platform's tokenizer."""
+    return math.ceil(len(text) / CHARACTERS_PER_TOKEN)
+
+
+def get_llm_token_usage(response: typing.Any) -> tuple[int, int] | None:
+    """Get the input and output tokens reported in a raw LLM response, or None if not reported (for example, a streamed response)."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    # OpenAI and Groq: prompt_tokens, completion_tokens. Anthropic: input_tokens, output_tokens.
+    input_tokens = getattr(usage, "prompt_tokens", None) or getattr(
+        usage, "input_tokens", 0
+    )
+    output_tokens = getattr(usage, "completion_tokens", None) or getattr(
+        usage, "output_tokens", 0
+    )
+    return int(input_tokens or 0), int(output_tokens or 0)
@@ -0,0 +1,174 @@
+"""
+Helpers for the tests that run a whole generation offline, against the mock AI platform (see mock_llm.py).
+- a non-strict cassette: the router always replays the same plan, and the function-calling agents replay the agent outputs in turn (in the order the agents call the LLM).
+"""
+
+import os
+import tempfile
+import typing
+
+from gpt_multi_atomic_agents import mock_llm, prompts_history_summary, prompts_router
+from gpt_multi_atomic_agents.agent_definition import (
+    FunctionAgentDefinition,
+    build_function_agent_definition,
+)
+from gpt_multi_atomic_agents.config import (
+    AI_PLATFORM_Enum,
+    Config,
+    MOCK_LATENCY_Enum,
+)
+from gpt_multi_atomic_agents.functions_dto import (
+    FunctionAgentOutputSchema,
+    FunctionCallSchema,
+    FunctionSpecSchema,
+    ParameterSpec,
+    ParameterType,
+)
+from gpt_multi_atomic_agents.rest_api_examples import FunctionAgentDefinitionMinimal
+
+CHAT_AGENT_DESCRIPTION = "Handles questions about an ecosystem game"
+PLAN_CHAT_MESSAGE = "Sure, I will add that."
+SUBJECTS = ["creature", "vegetation"]
+
+
+def get_agent_name(subject: str) -> str:
+    return f"{subject.title()} Creator"
+
+
+def create_call(subject: str, name: str) -> FunctionCallSchema:
+    return FunctionCallSchema(
+        agent_name=get_agent_name(subject),
+        function_name=f"Add{subject.title()}",
+        parameters={f"{subject}_name": name},
+    )
+
+
+def build_minimal_agents() -> list[FunctionAgentDefinitionMinimal]:
+    """Agents that do not depend on each other, so they run in the same stage. In the form that the REST API receives."""
+    agent_definitions = []
+    for subject in SUBJECTS:
+        function_spec = FunctionSpecSchema(
+            function_name=f"Add{subject.title()}",
+            description=f"Adds a new {subject} to the world",
+            parameters=[
+                ParameterSpec(name=f"{subject}_name", type=ParameterType.string)
+            ],
+        )
+        agent_definitions.append(
+            FunctionAgentDefinitionMinimal(
+                agent_name=get_agent_name(subject),
+                description=f"Creates new {subject} objects given the user prompt.",
+                accepted_functions=[function_spec],
+                functions_allowed_to_generate=[function_spec],
+                topics=[subject],
+            )
+        )
+    return agent_definitions
+
+
+def build_relationship_agent() -> FunctionAgentDefinition:
+    """An agent that reads the output of the other agents, so it runs in a later stage."""
+    function_spec = FunctionSpecSchema(
+        function_name="AddRelationship",
+        description="Adds a relationship between a creature and vegetation",
+        parameters=[ParameterSpec(name="relationship_name", type=ParameterType.string)],
+    )
+    accepted_functions = [
+        f for a in build_minimal_agents() for f in a.functions_allowed_to_generate
+    ]
+    return build_function_agent_definition(
+        agent_name=get_agent_name("relationship"),
+        description="Creates new relationships given the user prompt.",
+        accepted_functions=accepted_functions + [function_spec],
+        functions_allowed_to_generate=[function_spec],
+        topics=["relationship"],
+    )
+
+
+def build_agents() -> list[FunctionAgentDefinition]:
+    return [
+        build_function_agent_definition(
+            agent_name=a.agent_name,
+            description=a.description,
+            accepted_functions=a.accepted_functions,
+            functions_allowed_to_generate=a.functions_allowed_to_generate,
+            topics=a.topics,
+        )
+        for a in build_minimal_agents()
+    ]
+
+
+def _add_entry(
+    cassette: mock_llm.Cassette, response: typing.Any, latency_seconds: float = 0.0
+) -> None:
+    response_model_name = type(response).__name__
+    cassette.add(
+        mock_llm.CassetteEntry(
+            request_key=mock_llm.build_request_key(response_model_name, []),
+            response_model_name=response_model_name,
+            response_json=response.model_dump_json(),
+            latency_seconds=latency_seconds,
+        )
+    )
+
+
+def create_cassette(
+    plan_subjects: list[str],
+    agent_outputs: list[tuple[FunctionCallSchema, float]],
+    history_summary: str | None = None,
+) -> str:
+    """
+    Create a cassette in a new temporary directory, and return its path.
+    - the plan recommends the agents of plan_subjects, in that order.
+    - agent_outputs: the function call and the latency of each agent response, in turn.
+    - history_summary: the response of the History Summary agent, if any.
+    """
+    path = os.path.join(tempfile.mkdtemp(), "cassette.jsonl")
+    cassette = mock_llm.get_cassette(path)
+    _add_entry(
+        cassette,
+        prompts_router.RouterAgentOutputSchema(
+            execution_plan=prompts_router.AgentExecutionPlanSchema(
+                chat_message=PLAN_CHAT_MESSAGE,
+                recommended_agents=[
+                    prompts_router.RecommendedAgent(
+                        agent_name=get_agent_name(subject),
+                        rewritten_user_prompt=f"Add a {subject}",
+                        agent_parameters={},
+                    )
+                    for subject in plan_subjects
+                ],
+            )
+        ),
+    )
+    for function_call, latency_seconds in agent_outputs:
+        _add_entry(
+            cassette,
+            FunctionAgentOutputSchema(
+                chat_message=f"Added {list(function_call.parameters.values())[0]}.",
+                generated_function_calls=[function_call],
+            ),
+            latency_seconds=latency_seconds,
+        )
+    if history_summary is not None:
+        _add_entry(
+            cassette,
+            prompts_history_summary.HistorySummaryAgentOutputSchema(
+                summary=history_summary
+            ),
+        )
+    return path
+
+
+def create_config(cassette_path: str, **kwargs: typing.Any) -> Config:
+    return Config(
+        ai_platform=AI_PLATFORM_Enum.mock,
+        mock_cassette_path=cassette_path,
+        mock_is_strict=False,
+        mock_latency=MOCK_LATENCY_Enum.recorded,
+        **kwargs,
+    )
+
+
+def get_call_names(function_calls: list[FunctionCallSchema]) -> list[str]:
+    return [list(f.parameters.values())[0] for f in function_calls]
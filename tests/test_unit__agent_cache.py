@@ -0,0 +1,63 @@
+from atomic_agents.agents.base_agent import BaseAgent, BaseAgentConfig
+from atomic_agents.lib.components.system_prompt_generator import SystemPromptGenerator
+import instructor
+from gpt_multi_atomic_agents import agent_cache
+from gpt_multi_atomic_agents.functions_dto import (
+    FunctionAgentInputSchema,
+    FunctionAgentOutputSchema,
+)
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+def _create_agent() -> BaseAgent:
+    return BaseAgent(
+        config=BaseAgentConfig(
+            client=instructor.Instructor(
+                client=None, create=lambda **_kwargs: None, mode=instructor.Mode.TOOLS
+            ),
+            model="test-model",
+            system_prompt_generator=SystemPromptGenerator(background=["Test agent."]),
+            input_schema=FunctionAgentInputSchema,
+            output_schema=FunctionAgentOutputSchema,
+        )
+    )
+
+
+class TestAgentCache(unittest.TestCase):
+    def setUp(self) -> None:
+        agent_cache.clear_agent_cache()
+
+    def test_get_or_create_agent(self) -> None:
+        # Arrange
+        key = agent_cache.build_cache_key("test-agent")
+        stats_before = agent_cache.get_agent_cache_stats()
+
+        # Act
+        agent1 = agent_cache.get_or_create_agent(key=key, create_agent=_create_agent)
+        agent2 = agent_cache.get_or_create_agent(key=key, create_agent=_create_agent)
+
+        # Assert
+        stats = agent_cache.get_agent_cache_stats()
+        self.assertEqual(1, stats.misses - stats_before.misses)
+        self.assertEqual(1, stats.hits - stats_before.hits)
+        self.assertIsNot(agent1.memory, agent2.memory)
+        self.assertEqual(
+            agent1.system_prompt_generator.generate_prompt(),
+            agent2.system_prompt_generator.generate_prompt(),
+        )
+        self.assertEqual(
+            1,
+            agent1.system_prompt_generator.generate_prompt().count(
+                "Always respond using the proper JSON schema."
+            ),
+        )
+
+    def test_build_cache_key__changed_part_gives_new_key(self) -> None:
+        self.assertNotEqual(
+            agent_cache.build_cache_key("agent", "config-1"),
+            agent_cache.build_cache_key("agent", "config-2"),
+        )
@@ -0,0 +1,164 @@
+from gpt_multi_atomic_agents import agent_groups
+from gpt_multi_atomic_agents.agent_definition import AgentDefinitionBase
+from gpt_multi_atomic_agents.prompts_router import (
+    AgentDescription,
+    AgentExecutionPlanSchema,
+    ParallelAgentsGroup,
+    RecommendedAgent,
+)
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+from tests import mock_generation
+
+console = Console()
+
+
+def _agent(name: str, topics: list[str], agent_group: str = "") -> AgentDescription:
+    return AgentDescription(
+        agent_name=name,
+        description=name,
+        topics=topics,
+        agent_parameter_names=[],
+        agent_group=agent_group,
+    )
+
+
+def _plan(
+    agent_names: list[str], groups: list[list[str]], chat_message: str = "OK"
+) -> AgentExecutionPlanSchema:
+    return AgentExecutionPlanSchema(
+        chat_message=chat_message,
+        recommended_agents=[
+            RecommendedAgent(agent_name=n, rewritten_user_prompt=n, agent_parameters={})
+            for n in agent_names
+        ],
+        parallel_agent_groups=[ParallelAgentsGroup(agent_names=g) for g in groups],
+    )
+
+
+class TestAgentGroups(unittest.TestCase):
+    def test_build_agent_groups(self) -> None:
+        # Arrange
+        agent_descriptions = [
+            _agent("creature", ["creature", "summary"]),
+            _agent("weather", ["weather"], agent_group="world"),
+            _agent("terrain", ["terrain"], agent_group="world"),
+            _agent("creature-remover", ["creature"]),
+        ]
+
+        # Act
+        groups = agent_groups.build_agent_groups(agent_descriptions)
+
+        # Assert
+        self.assertEqual(
+            [
+                ("creature", ["creature", "summary"], ["creature", "creature-remover"]),
+                ("world", ["weather", "terrain"], ["weather", "terrain"]),
+            ],
+            [
+                (
+                    g.summary.group_name,
+                    g.summary.topics,
+                    [a.agent_name for a in g.agent_descriptions],
+                )
+                for g in groups
+            ],
+        )
+
+    @parameterized.expand(
+        [
+            (
+                "test: Without the agent definitions, the groups run one after another.",
+                [
+                    _plan(["creature", "relationship"], [], "Adding creatures."),
+                    _plan(["weather"], [], "Adding weather."),
+                ],
+                [["creature"], ["weather"], ["relationship"]],
+                "Adding creatures. Adding weather.",
+            ),
+            (
+                "test: Chat agent is dropped when other agents are recommended.",
+                [
+                    _plan(["chat"], [], "I cannot help."),
+                    _plan(["weather"], [], "Adding weather."),
+                ],
+                [["weather"]],
+                "Adding weather.",
+            ),
+            (
+                "test: Chat agent is kept once when no other agents.",
+                [
+                    _plan(["chat"], [], "I cannot help."),
+                    _plan(["chat"], [], "I cannot help."),
+                ],
+                [["chat"]],
+                "I cannot help.",
+            ),
+        ]
+    )
+    def test_merge_plans(
+        self,
+        _test_name_implicitly_used: str,
+        plans: list[AgentExecutionPlanSchema],
+        expected_stages: list[list[str]],
+        expected_chat_message: str,
+    ) -> None:
+        # Act
+        plan = agent_groups.merge_plans(plans)
+
+        # Assert
+        self.assertEqual(
+            expected_stages,
+            [[a.agent_name for a in stage] for stage in plan.get_agent_stages()],
+        )
+        self.assertEqual(expected_chat_message, plan.chat_message)
+
+    @parameterized.expand(
+        [
+            (
+                "test: Independent groups run together.",
+                [["creature"], ["vegetation"]],
+                [["creature", "vegetation"]],
+            ),
+            (
+                "test: Consumer waits for the producer of another group.",
+                [["creature"], ["relationship"]],
+                [["creature"], ["relationship"]],
+            ),
+            (
+                "test: Stages of each group are kept.",
+                [["creature", "relationship"], ["vegetation"]],
+                [["creature", "vegetation"], ["relationship"]],
+            ),
+        ]
+    )
+    def test_merge_plans__with_agent_definitions(
+        self,
+        _test_name_implicitly_used: str,
+        plans_subjects: list[list[str]],
+        expected_stages_subjects: list[list[str]],
+    ) -> None:
+        # Arrange
+        agent_definitions: list[AgentDefinitionBase] = [
+            *mock_generation.build_agents(),
+            mock_generation.build_relationship_agent(),
+        ]
+        plans = [
+            _plan([mock_generation.get_agent_name(s) for s in subjects], [])
+            for subjects in plans_subjects
+        ]
+
+        # Act
+        plan = agent_groups.merge_plans(plans, agent_definitions=agent_definitions)
+
+        # Assert
+        self.assertEqual(
+            [
+                [mock_generation.get_agent_name(s) for s in subjects]
+                for subjects in expected_stages_subjects
+            ],
+            [[a.agent_name for a in stage] for stage in plan.get_agent_stages()],
+        )
@@ -0,0 +1,108 @@
+from gpt_multi_atomic_agents import agent_retrieval
+from gpt_multi_atomic_agents.blackboard import Message, MessageRole
+from gpt_multi_atomic_agents.prompts_router import (
+    AgentDescription,
+    AgentExecutionPlanSchema,
+    RecommendedAgent,
+)
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+def _agent(name: str, topic: str) -> AgentDescription:
+    return AgentDescription(
+        agent_name=name,
+        description=f"Creates {topic} objects, given the user prompt.",
+        topics=[topic],
+        agent_parameter_names=[],
+    )
+
+
+agent_descriptions = [
+    _agent("creature", "creature"),
+    _agent("vegetation", "vegetation"),
+    _agent("weather", "weather"),
+    _agent("terrain", "terrain"),
+]
+
+
+def _plan(agent_name: str) -> AgentExecutionPlanSchema:
+    return AgentExecutionPlanSchema(
+        chat_message="OK",
+        recommended_agents=[
+            RecommendedAgent(
+                agent_name=agent_name, rewritten_user_prompt="x", agent_parameters={}
+            )
+        ],
+    )
+
+
+class TestAgentRetrieval(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (
+                "test: Best matches, in original order.",
+                "Add some vegetation and a creature",
+                None,
+                None,
+                2,
+                ["creature", "vegetation"],
+            ),
+            (
+                "test: Recent messages are included.",
+                "Add another one",
+                [Message(role=MessageRole.user, message="Add a terrain of hills")],
+                None,
+                1,
+                ["terrain"],
+            ),
+            (
+                "test: Agents of the previous plan are kept.",
+                "Add a creature",
+                None,
+                _plan("weather"),
+                1,
+                ["creature", "weather"],
+            ),
+            (
+                "test: No words in common means all agents.",
+                "Add a wolf",
+                None,
+                None,
+                1,
+                ["creature", "vegetation", "weather", "terrain"],
+            ),
+            (
+                "test: Zero means all agents.",
+                "Add a creature",
+                None,
+                None,
+                0,
+                ["creature", "vegetation", "weather", "terrain"],
+            ),
+        ]
+    )
+    def test_select_candidate_agents(
+        self,
+        _test_name_implicitly_used: str,
+        user_prompt: str,
+        messages: list[Message] | None,
+        previous_plan: AgentExecutionPlanSchema | None,
+        max_candidates: int,
+        expected_agent_names: list[str],
+    ) -> None:
+        # Act
+        candidates = agent_retrieval.select_candidate_agents(
+            agent_descriptions=agent_descriptions,
+            user_prompt=user_prompt,
+            messages=messages,
+            previous_plan=previous_plan,
+            max_candidates=max_candidates,
+        )
+
+        # Assert
+        self.assertEqual(expected_agent_names, [a.agent_name for a in candidates])
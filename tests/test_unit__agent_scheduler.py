@@ -0,0 +1,147 @@
+from gpt_multi_atomic_agents import agent_scheduler
+from gpt_multi_atomic_agents.agent_definition import (
+    AgentDefinitionBase,
+    build_function_agent_definition,
+    build_graphql_agent_definition,
+)
+from gpt_multi_atomic_agents.functions_dto import FunctionSpecSchema
+from gpt_multi_atomic_agents.prompts_router import RecommendedAgent
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+def _function(name: str) -> FunctionSpecSchema:
+    return FunctionSpecSchema(function_name=name, description=name, parameters=[])
+
+
+add_creature = _function("AddCreature")
+add_vegetation = _function("AddVegetation")
+add_relationship = _function("AddCreatureRelationship")
+
+function_agent_definitions: list[AgentDefinitionBase] = [
+    build_function_agent_definition(
+        agent_name="creature",
+        description="Creates creatures",
+        accepted_functions=[add_creature, add_relationship],
+        functions_allowed_to_generate=[add_creature],
+        topics=["creature"],
+    ),
+    build_function_agent_definition(
+        agent_name="vegetation",
+        description="Creates vegetation",
+        accepted_functions=[add_vegetation, add_relationship],
+        functions_allowed_to_generate=[add_vegetation],
+        topics=["vegetation"],
+    ),
+    build_function_agent_definition(
+        agent_name="relationship",
+        description="Creates relationships",
+        accepted_functions=[add_creature, add_vegetation, add_relationship],
+        functions_allowed_to_generate=[add_relationship],
+        topics=["relationship"],
+    ),
+]
+
+creature_mutations = (
+    "type Mutation {\n  addCreature(input: CreatureInput!): Creature!\n}"
+)
+vegetation_mutations = (
+    "type Mutation {\n  addVegetation(input: VegetationInput!): Vegetation!\n}"
+)
+relationship_mutations = "type Mutation {\n  addCreatureRelationship(input: RelationshipInput!): Relationship!\n}"
+
+graphql_agent_definitions: list[AgentDefinitionBase] = [
+    build_graphql_agent_definition(
+        agent_name="creature",
+        description="Creates creatures",
+        accepted_graphql_schemas=[creature_mutations],
+        mutations_allowed_to_generate=[creature_mutations],
+        topics=["creature"],
+    ),
+    build_graphql_agent_definition(
+        agent_name="vegetation",
+        description="Creates vegetation",
+        accepted_graphql_schemas=[vegetation_mutations],
+        mutations_allowed_to_generate=[vegetation_mutations],
+        topics=["vegetation"],
+    ),
+    build_graphql_agent_definition(
+        agent_name="relationship",
+        description="Creates relationships",
+        accepted_graphql_schemas=[
+            creature_mutations,
+            vegetation_mutations,
+            relationship_mutations,
+        ],
+        mutations_allowed_to_generate=[relationship_mutations],
+        topics=["relationship"],
+    ),
+]
+
+
+def _recommend(agent_names: list[str]) -> list[RecommendedAgent]:
+    return [
+        RecommendedAgent(agent_name=n, rewritten_user_prompt=n, agent_parameters={})
+        for n in agent_names
+    ]
+
+
+class TestAgentScheduler(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (
+                "test: Creature and vegetation together, then relationship.",
+                function_agent_definitions,
+                ["creature", "vegetation", "relationship"],
+                [["creature", "vegetation"], ["relationship"]],
+            ),
+            (
+                "test: Relationship first - creature reads its output so must wait.",
+                function_agent_definitions,
+                ["relationship", "creature", "vegetation"],
+                [["relationship"], ["creature", "vegetation"]],
+            ),
+            (
+                "test: Same agent twice reads its own output.",
+                function_agent_definitions,
+                ["creature", "creature"],
+                [["creature"], ["creature"]],
+            ),
+            (
+                "test: Unknown agent has no dependencies.",
+                function_agent_definitions,
+                ["creature", "chat"],
+                [["creature", "chat"]],
+            ),
+            (
+                "test: GraphQL agents are scheduled via their mutations.",
+                graphql_agent_definitions,
+                ["creature", "vegetation", "relationship"],
+                [["creature", "vegetation"], ["relationship"]],
+            ),
+            ("test: Empty plan.", function_agent_definitions, [], []),
+        ]
+    )
+    def test_build_execution_stages(
+        self,
+        _test_name_implicitly_used: str,
+        agent_definitions: list[AgentDefinitionBase],
+        agent_names: list[str],
+        expected_stages: list[list[str]],
+    ) -> None:
+        # Arrange
+        recommended_agents = _recommend(agent_names)
+
+        # Act
+        stages = agent_scheduler.build_execution_stages(
+            recommended_agents=recommended_agents, agent_definitions=agent_definitions
+        )
+
+        # Assert
+        self.assertEqual(
+            expected_stages, [[a.agent_name for a in stage] for stage in stages]
+        )
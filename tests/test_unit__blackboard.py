@@ -0,0 +1,399 @@
+import typing
+from gpt_multi_atomic_agents.blackboard import (
+    FunctionCallBlackboard,
+    FunctionCallDelta,
+    FunctionCallDeltaOperation,
+    Message,
+    MessageRole,
+)
+from gpt_multi_atomic_agents.functions_dto import (
+    FunctionCallSchema,
+    get_function_call_id,
+)
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+def _create_call(creature_name: str) -> FunctionCallSchema:
+    return FunctionCallSchema(
+        agent_name="client",
+        function_name="AddCreature",
+        parameters={"creature_name": creature_name},
+    )
+
+
+def _get_creature_names_of(function_calls: list[FunctionCallSchema]) -> list[str]:
+    return [f.parameters["creature_name"] for f in function_calls]
+
+
+def _get_creature_names(blackboard: FunctionCallBlackboard) -> list[str]:
+    return _get_creature_names_of(blackboard.internal_previously_generated_functions)
+
+
+class TestFunctionCallBlackboard(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (
+                "test: Add.",
+                [
+                    FunctionCallDelta(
+                        operation=FunctionCallDeltaOperation.add,
+                        function_call=_create_call("fox"),
+                    )
+                ],
+                ["wolf", "sheep", "goat", "fox"],
+            ),
+            (
+                "test: Remove keeps the order.",
+                [
+                    FunctionCallDelta(
+                        operation=FunctionCallDeltaOperation.remove,
+                        function_call_id=get_function_call_id(_create_call("sheep")),
+                    )
+                ],
+                ["wolf", "goat"],
+            ),
+            (
+                "test: Replace in place.",
+                [
+                    FunctionCallDelta(
+                        operation=FunctionCallDeltaOperation.replace_,
+                        function_call_id=get_function_call_id(_create_call("wolf")),
+                        function_call=_create_call("fox"),
+                    )
+                ],
+                ["fox", "sheep", "goat"],
+            ),
+        ]
+    )
+    def test_apply_user_data_delta(
+        self,
+        _test_name_implicitly_used: str,
+        deltas: list[FunctionCallDelta],
+        expected_creature_names: list[str],
+    ) -> None:
+        # Arrange
+        blackboard = FunctionCallBlackboard()
+        blackboard.set_user_data(
+            [_create_call("wolf"), _create_call("sheep"), _create_call("goat")]
+        )
+
+        # Act
+        blackboard.apply_user_data_delta(deltas)
+
+        # Assert
+        self.assertEqual(expected_creature_names, _get_creature_names(blackboard))
+
+    def test_function_call_delta__replace__parsed_from_wire_value(self) -> None:
+        # Arrange
+        delta_json = (
+            '{"operation": "replace", "function_call_id": "0123456789abcdef", '
+            + f'"function_call": {_create_call("fox").model_dump_json()}}}'
+        )
+
+        # Act
+        delta = FunctionCallDelta.model_validate_json(delta_json)
+
+        # Assert
+        self.assertEqual(FunctionCallDeltaOperation.replace_, delta.operation)
+        self.assertIn('"operation":"replace"', delta.model_dump_json())
+
+    @parameterized.expand(
+        [
+            ("test: Delta.", False),
+            ("test: New user data.", True),
+        ]
+    )
+    def test_restore_checkpoint__changes_undone(
+        self, _test_name_implicitly_used: str, is_user_data_set: bool
+    ) -> None:
+        # Arrange
+        blackboard = FunctionCallBlackboard()
+        blackboard.set_user_data(
+            [_create_call("wolf"), _create_call("sheep"), _create_call("goat")]
+        )
+        blackboard.add_message(Message(role=MessageRole.user, message="Add a wolf"))
+        blackboard.get_generated_functions_matching(["AddCreature"])  # builds the index
+        blackboard_before = blackboard.model_dump()
+        checkpoint = blackboard.create_checkpoint(
+            is_user_data_delta_pending=not is_user_data_set
+        )
+        if is_user_data_set:
+            blackboard.set_user_data([_create_call("fox")])
+        else:
+            blackboard.apply_user_data_delta(
+                [
+                    FunctionCallDelta(
+                        operation=FunctionCallDeltaOperation.remove,
+                        function_call_id=get_function_call_id(_create_call("sheep")),
+                    ),
+                    FunctionCallDelta(
+                        operation=FunctionCallDeltaOperation.replace_,
+                        function_call_id=get_function_call_id(_create_call("wolf")),
+                        function_call=_create_call("fox"),
+                    ),
+                ]
+            )
+        blackboard.add_generated_functions([_create_call("deer")])
+        blackboard.add_message(Message(role=MessageRole.user, message="Add a deer"))
+
+        # Act
+        blackboard.restore_checkpoint(checkpoint)
+
+        # Assert
+        self.assertEqual(blackboard_before, blackboard.model_dump())
+        self.assertEqual(
+            ["wolf", "sheep", "goat"],
+            _get_creature_names_of(
+                blackboard.get_generated_functions_matching(["AddCreature"])
+            ),
+        )
+
+    def test_apply_user_data_delta__unknown_id__changes_nothing(self) -> None:
+        # Arrange
+        blackboard = FunctionCallBlackboard()
+        blackboard.set_user_data([_create_call("wolf")])
+        deltas = [
+            FunctionCallDelta(
+                operation=FunctionCallDeltaOperation.add,
+                function_call=_create_call("fox"),
+            ),
+            FunctionCallDelta(
+                operation=FunctionCallDeltaOperation.remove, function_call_id="unknown"
+            ),
+        ]
+
+        # Act
+        with self.assertRaises(RuntimeError):
+            blackboard.apply_user_data_delta(deltas)
+
+        # Assert
+        self.assertEqual(["wolf"], _get_creature_names(blackboard))
+
+    def test_apply_user_data_delta__after_generation(self) -> None:
+        # Arrange
+        blackboard = FunctionCallBlackboard()
+        blackboard.apply_user_data_delta([])
+        blackboard.add_generated_functions([_create_call("wolf")])
+
+        # Act
+        blackboard.apply_user_data_delta(
+            [
+                FunctionCallDelta(
+                    operation=FunctionCallDeltaOperation.remove,
+                    function_call_id=get_function_call_id(_create_call("wolf")),
+                )
+            ]
+        )
+
+        # Assert
+        self.assertEqual([], _get_creature_names(blackboard))
+
+    @parameterized.expand(
+        [
+            ("test: One function.", ["AddCreature"], ["wolf", "goat"]),
+            (
+                "test: Two functions, in insertion order.",
+                ["AddVegetation", "AddCreature"],
+                ["wolf", "grass", "goat"],
+            ),
+            ("test: Unknown function.", ["RemoveCreature"], []),
+        ]
+    )
+    def test_get_generated_functions_matching(
+        self,
+        _test_name_implicitly_used: str,
+        function_names: list[str],
+        expected_names: list[str],
+    ) -> None:
+        # Arrange
+        blackboard = FunctionCallBlackboard()
+        blackboard.add_generated_functions([_create_call("wolf")])
+        blackboard.get_generated_functions_matching(["AddCreature"])  # builds the index
+        blackboard.add_generated_functions(
+            [
+                FunctionCallSchema(
+                    agent_name="client",
+                    function_name="AddVegetation",
+                    parameters={"vegetation_name": "grass"},
+                ),
+                _create_call("goat"),
+            ]
+        )
+
+        # Act
+        function_calls = blackboard.get_generated_functions_matching(function_names)
+
+        # Assert
+        self.assertEqual(
+            expected_names, [list(f.parameters.values())[0] for f in function_calls]
+        )
+
+    def test_get_generated_functions_matching__after_replace(self) -> None:
+        # Arrange
+        blackboard = FunctionCallBlackboard()
+        blackboard.set_user_data([_create_call("wolf"), _create_call("goat")])
+        blackboard.get_generated_functions_matching(["AddCreature"])  # builds the index
+
+        # Act
+        blackboard.apply_user_data_delta(
+            [
+                FunctionCallDelta(
+                    operation=FunctionCallDeltaOperation.replace_,
+                    function_call_id=get_function_call_id(_create_call("wolf")),
+                    function_call=FunctionCallSchema(
+                        agent_name="client",
+                        function_name="AddVegetation",
+                        parameters={"vegetation_name": "grass"},
+                    ),
+                )
+            ]
+        )
+
+        # Assert
+        self.assertEqual(
+            ["goat"],
+            _get_creature_names_of(
+                blackboard.get_generated_functions_matching(["AddCreature"])
+            ),
+        )
+        self.assertEqual(
+            1, len(blackboard.get_generated_functions_matching(["AddVegetation"]))
+        )
+
+    @parameterized.expand(
+        [
+            (
+                "test: Assigned directly.",
+                lambda b, calls: setattr(
+                    b, "internal_previously_generated_functions", calls
+                ),
+            ),
+            (
+                "test: Replaced in place.",
+                lambda b, calls: b.internal_previously_generated_functions.__setitem__(
+                    slice(None), calls
+                ),
+            ),
+            (
+                "test: Popped and appended.",
+                lambda b, calls: (
+                    b.internal_previously_generated_functions.pop(),
+                    b.internal_previously_generated_functions.pop(),
+                    b.internal_previously_generated_functions.extend(calls[:2]),
+                ),
+            ),
+        ]
+    )
+    def test_get_generated_functions_matching__list_changed_directly(
+        self,
+        _test_name_implicitly_used: str,
+        change: typing.Callable[
+            [FunctionCallBlackboard, list[FunctionCallSchema]], typing.Any
+        ],
+    ) -> None:
+        # Arrange
+        blackboard = FunctionCallBlackboard()
+        blackboard.set_user_data(
+            [
+                FunctionCallSchema(
+                    agent_name="client", function_name=name, parameters={}
+                )
+                for name in ["A", "B"]
+            ]
+        )
+        blackboard.get_generated_functions_matching(["A"])  # builds the index
+
+        # Act
+        change(
+            blackboard,
+            [
+                FunctionCallSchema(
+                    agent_name="client", function_name=name, parameters={}
+                )
+                for name in ["C", "A"]
+            ],
+        )
+
+        # Assert
+        self.assertEqual(
+            [1],
+            [
+                blackboard.internal_previously_generated_functions.index(f)
+                for f in blackboard.get_generated_functions_matching(["A"])
+            ],
+        )
+        self.assertEqual([], blackboard.get_generated_functions_matching(["B"]))
+
+    def test_get_generated_functions_matching__after_reset_all(self) -> None:
+        # Arrange
+        blackboard = FunctionCallBlackboard()
+        blackboard.add_generated_functions(
+            [
+                FunctionCallSchema(
+                    agent_name="client", function_name=name, parameters={}
+                )
+                for name in ["A", "B"]
+            ]
+        )
+        blackboard.get_generated_functions_matching(["A"])  # builds the index
+
+        # Act
+        blackboard.reset_all()
+        blackboard.add_generated_functions(
+            [
+                FunctionCallSchema(
+                    agent_name="client", function_name=name, parameters={}
+                )
+                for name in ["C", "D", "E"]
+            ]
+        )
+
+        # Assert
+        self.assertEqual([], blackboard.get_generated_functions_matching(["A"]))
+        self.assertEqual(
+            ["C"],
+            [
+                f.function_name
+                for f in blackboard.get_generated_functions_matching(["C"])
+            ],
+        )
+
+    def test_apply_user_data_delta__remove__indexes_shifted(self) -> None:
+        # Arrange
+        blackboard = FunctionCallBlackboard()
+        blackboard.set_user_data(
+            [_create_call("wolf"), _create_call("sheep"), _create_call("goat")]
+        )
+        blackboard.get_generated_functions_matching(["AddCreature"])  # builds the index
+
+        # Act
+        blackboard.apply_user_data_delta(
+            [
+                FunctionCallDelta(
+                    operation=FunctionCallDeltaOperation.remove,
+                    function_call_id=get_function_call_id(_create_call("wolf")),
+                )
+            ]
+        )
+        blackboard.apply_user_data_delta(
+            [
+                FunctionCallDelta(
+                    operation=FunctionCallDeltaOperation.remove,
+                    function_call_id=get_function_call_id(_create_call("goat")),
+                )
+            ]
+        )
+
+        # Assert
+        self.assertEqual(["sheep"], _get_creature_names(blackboard))
+        self.assertEqual(
+            ["sheep"],
+            _get_creature_names_of(
+                blackboard.get_generated_functions_matching(["AddCreature"])
+            ),
+        )
@@ -0,0 +1,133 @@
+from gpt_multi_atomic_agents import chat_history
+from gpt_multi_atomic_agents.blackboard import (
+    FunctionCallBlackboard,
+    HistorySummary,
+    Message,
+    MessageRole,
+)
+from gpt_multi_atomic_agents.config import Config
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+from tests import mock_generation
+
+console = Console()
+
+
+def _build_blackboard(turn_count: int) -> FunctionCallBlackboard:
+    blackboard = FunctionCallBlackboard()
+    for i in range(turn_count):
+        blackboard.add_previous_message(
+            Message(role=MessageRole.user, message=f"user {i}")
+        )
+        blackboard.add_previous_message(
+            Message(role=MessageRole.assistant, message=f"assistant {i}")
+        )
+    return blackboard
+
+
+class TestChatHistory(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("test: Disabled sends all.", 0, None, 8),
+            ("test: No summary yet sends all.", 2, None, 8),
+            ("test: Summary and window.", 2, 4, 1 + 4),
+            ("test: Summary, unsummarized messages and window.", 2, 2, 1 + 2 + 4),
+            ("test: Summary of reset messages is ignored.", 2, 100, 8),
+        ]
+    )
+    def test_build_router_messages(
+        self,
+        _test_name_implicitly_used: str,
+        max_router_history_turns: int,
+        summary_message_count: int | None,
+        expected_message_count: int,
+    ) -> None:
+        # Arrange
+        blackboard = _build_blackboard(turn_count=4)
+        if summary_message_count is not None:
+            blackboard.internal_history_summary = HistorySummary(
+                summary="The user chatted.", message_count=summary_message_count
+            )
+        config = Config(max_router_history_turns=max_router_history_turns)
+
+        # Act
+        messages = chat_history.build_router_messages(
+            blackboard=blackboard, _config=config
+        )
+
+        # Assert
+        self.assertEqual(expected_message_count, len(messages))
+        self.assertEqual("assistant 3", messages[-1].message)
+        if max_router_history_turns:
+            self.assertEqual("user 2", messages[-4].message)
+
+    def test_is_summary_refresh_needed(self) -> None:
+        # Arrange
+        blackboard = _build_blackboard(turn_count=4)
+        config = Config(max_router_history_turns=2)
+
+        # Act
+        is_needed_before = chat_history.is_summary_refresh_needed(
+            blackboard=blackboard, _config=config
+        )
+        chat_history.set_summary_if_newer(
+            blackboard=blackboard,
+            summary=HistorySummary(summary="The user chatted.", message_count=4),
+        )
+        is_needed_after = chat_history.is_summary_refresh_needed(
+            blackboard=blackboard, _config=config
+        )
+
+        # Assert
+        self.assertTrue(is_needed_before)
+        self.assertFalse(is_needed_after)
+
+    def test_build_router_messages__no_summary__nothing_dropped(self) -> None:
+        # Arrange
+        blackboard = _build_blackboard(turn_count=4)
+        config = Config(max_router_history_turns=2)
+
+        # Act
+        messages = chat_history.build_router_messages(
+            blackboard=blackboard, _config=config
+        )
+
+        # Assert
+        self.assertEqual(
+            [m.message for m in blackboard.internal_previous_messages],
+            [m.message for m in messages],
+        )
+
+    def test_refresh_summary_in_background__blackboard_unchanged__applied_to_copy(
+        self,
+    ) -> None:
+        # Arrange
+        chat_history.clear_summary_cache()
+        cassette_path = mock_generation.create_cassette(
+            plan_subjects=[], agent_outputs=[], history_summary="The user chatted."
+        )
+        config = mock_generation.create_config(
+            cassette_path, max_router_history_turns=2
+        )
+        blackboard = _build_blackboard(turn_count=4)
+
+        # Act
+        refresh = chat_history.refresh_summary_in_background(
+            blackboard=blackboard, _config=config
+        )
+        summary = refresh.result() if refresh else None
+        # (like the stateless REST API, where the client sends the blackboard back)
+        blackboard_copy = FunctionCallBlackboard.model_validate_json(
+            blackboard.model_dump_json()
+        )
+        chat_history.apply_cached_summary(blackboard=blackboard_copy, _config=config)
+
+        # Assert
+        self.assertEqual(
+            HistorySummary(summary="The user chatted.", message_count=4), summary
+        )
+        self.assertIsNone(blackboard.internal_history_summary)
+        self.assertEqual(summary, blackboard_copy.internal_history_summary)
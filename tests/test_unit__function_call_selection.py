@@ -0,0 +1,81 @@
+from gpt_multi_atomic_agents import function_call_selection
+from gpt_multi_atomic_agents.functions_dto import FunctionCallSchema
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+def _create_call(function_name: str, **parameters: str) -> FunctionCallSchema:
+    return FunctionCallSchema(
+        agent_name="client", function_name=function_name, parameters=parameters
+    )
+
+
+function_calls = [
+    _create_call("AddCreature", creature_name="Wolf", allowed_terrain="mountain"),
+    _create_call("AddCreature", creature_name="Sheep", allowed_terrain="prairie"),
+    _create_call("AddVegetation", vegetation_name="Grass", allowed_terrain="prairie"),
+    _create_call("AddCreature", creature_name="Eagle", allowed_terrain="mountain"),
+]
+
+
+class TestFunctionCallSelection(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (
+                "test: Agent parameter is most relevant.",
+                "Add a relationship for the sheep",
+                {"creature_name": ["Sheep"]},
+                1,
+            ),
+            (
+                "test: Prompt word is relevant.",
+                "Something eats the grass",
+                {},
+                2,
+            ),
+            (
+                "test: Else the most recent.",
+                "Add a fox",
+                {},
+                3,
+            ),
+        ]
+    )
+    def test_rank_function_calls(
+        self,
+        _test_name_implicitly_used: str,
+        user_prompt: str,
+        agent_parameters: dict[str, list[str]],
+        expected_first_index: int,
+    ) -> None:
+        # Act
+        ranked = function_call_selection.rank_function_calls(
+            function_calls=function_calls,
+            user_prompt=user_prompt,
+            agent_parameters=agent_parameters,
+        )
+
+        # Assert
+        self.assertEqual(expected_first_index, ranked[0])
+        self.assertEqual([0, 1, 2, 3], sorted(ranked))
+
+    def test_select_function_calls_within_budget(self) -> None:
+        # Arrange
+        tokens_per_call = function_call_selection.estimate_function_call_tokens(
+            function_calls[0]
+        )
+
+        # Act
+        selected = function_call_selection.select_function_calls_within_budget(
+            function_calls=function_calls,
+            user_prompt="The sheep eats grass",
+            agent_parameters={"creature_name": ["Sheep"]},
+            max_tokens=2 * tokens_per_call + 1,
+        )
+
+        # Assert: the most relevant calls, in their original order
+        self.assertEqual([function_calls[1], function_calls[2]], selected)
@@ -0,0 +1,96 @@
+import json
+from gpt_multi_atomic_agents import graphql_data
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+creature_schema = """
+type Query {
+  creatures: [Creature!]!
+}
+
+type Creature {
+  id: ID!
+  creature_name: String!
+}
+"""
+
+vegetation_mutations_schema = """
+type Mutation {
+  addVegetation(input: VegetationInput!): Vegetation!
+}
+"""
+
+user_data = json.dumps(
+    {
+        "data": {
+            "creatures": [
+                {"id": "1", "creature_name": "Wolf"},
+                {"id": "2", "creature_name": "Sheep"},
+            ],
+            "vegetations": [{"id": "3", "vegetation_name": "Grass"}],
+        }
+    }
+)
+
+
+class TestGraphQLDataIndex(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (
+                "test: Only the types in the schemas.",
+                [creature_schema],
+                None,
+                {"creatures": ["Wolf", "Sheep"]},
+            ),
+            (
+                "test: Type returned by a mutation.",
+                [vegetation_mutations_schema],
+                None,
+                {"vegetations": ["Grass"]},
+            ),
+            (
+                "test: Narrowed by agent parameters.",
+                [creature_schema, vegetation_mutations_schema],
+                {"creature_name": ["sheep"]},
+                {"creatures": ["Sheep"], "vegetations": ["Grass"]},
+            ),
+        ]
+    )
+    def test_get_data_for_agent(
+        self,
+        _test_name_implicitly_used: str,
+        accepted_graphql_schemas: list[str],
+        agent_parameters: dict[str, list[str]] | None,
+        expected_names_by_field: dict[str, list[str]],
+    ) -> None:
+        # Arrange
+        index = graphql_data.GraphQLDataIndex(user_data)
+
+        # Act
+        data = index.get_data_for_agent(
+            accepted_graphql_schemas=accepted_graphql_schemas,
+            agent_parameters=agent_parameters,
+        )
+
+        # Assert
+        actual = {
+            field: [e.get("creature_name", e.get("vegetation_name")) for e in entities]
+            for field, entities in json.loads(data)["data"].items()
+        }
+        self.assertEqual(expected_names_by_field, actual)
+
+    def test_get_data_for_agent__not_json__is_not_pruned(self) -> None:
+        # Arrange
+        not_json = '{ id: "H001", creature_name: "Human" }'
+        index = graphql_data.GraphQLDataIndex(not_json)
+
+        # Act
+        data = index.get_data_for_agent(accepted_graphql_schemas=[creature_schema])
+
+        # Assert
+        self.assertFalse(index.is_prunable)
+        self.assertEqual(not_json, data)
@@ -0,0 +1,342 @@
+import asyncio
+import time
+import typing
+from unittest import mock
+from gpt_multi_atomic_agents import chat_history, main_generator, main_router
+from gpt_multi_atomic_agents.agent_definition import AgentDefinitionBase
+from gpt_multi_atomic_agents.blackboard import FunctionCallBlackboard
+from gpt_multi_atomic_agents.config import Config
+from gpt_multi_atomic_agents.generation_events import (
+    AgentOutputEventData,
+    GenerationEvent,
+    GenerationEventType,
+)
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+from tests import mock_generation
+
+console = Console()
+
+SLOW_AGENT_SECONDS = 5.0
+
+
+async def _acollect_events(
+    _config: Config,
+    stop_after: GenerationEventType | None = None,
+    agent_definitions: list[AgentDefinitionBase] | None = None,
+) -> tuple[list[GenerationEvent], list[asyncio.Task]]:
+    """Collect the events of a generation, optionally stopping early like a disconnected client. Also returns the tasks that are still pending after."""
+    events: list[GenerationEvent] = []
+    event_stream = main_generator.agenerate_events_with_blackboard(
+        agent_definitions=agent_definitions or mock_generation.build_agents(),
+        chat_agent_description=mock_generation.CHAT_AGENT_DESCRIPTION,
+        _config=_config,
+        user_prompt="Add a wolf and some grass",
+    )
+    try:
+        async for event in event_stream:
+            events.append(event)
+            if event.event_type == stop_after:
+                break
+    finally:
+        await event_stream.aclose()
+    # Let the cancelled tasks finish
+    await asyncio.sleep(0.1)
+    pending_tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    return events, pending_tasks
+
+
+async def _agenerate_turns_statelessly(
+    _config: Config, turn_count: int
+) -> list[list[typing.Any]]:
+    """Generate several turns of a chat, sending the blackboard through JSON like a client of the stateless REST API. Returns the messages that the Router received in each turn."""
+    blackboard: FunctionCallBlackboard | None = None
+    router_messages: list[list[typing.Any]] = []
+    agenerate_plan = main_router.agenerate_plan
+
+    async def _agenerate_plan_recording_messages(**kwargs: typing.Any) -> typing.Any:
+        # (a copy, since the blackboard's list grows later)
+        router_messages.append(list(kwargs["messages"]))
+        return await agenerate_plan(**kwargs)
+
+    with mock.patch.object(
+        main_router, "agenerate_plan", _agenerate_plan_recording_messages
+    ):
+        for _i in range(turn_count):
+            generated = await main_generator.agenerate_with_blackboard(
+                agent_definitions=mock_generation.build_agents(),
+                chat_agent_description=mock_generation.CHAT_AGENT_DESCRIPTION,
+                _config=_config,
+                user_prompt="Add a wolf and some grass",
+                blackboard=blackboard,
+            )
+            blackboard = FunctionCallBlackboard.model_validate_json(
+                generated.model_dump_json()
+            )
+            # Let the summary refresh finish, before the client's next request
+            await asyncio.gather(
+                *[t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            )
+    return router_messages
+
+
+def _get_event_types(events: list[GenerationEvent]) -> list[str]:
+    return [str(e.event_type) for e in events]
+
+
+def _get_agent_output_names(events: list[GenerationEvent]) -> list[str]:
+    return [
+        typing.cast(AgentOutputEventData, e.data).agent_name
+        for e in events
+        if e.event_type == GenerationEventType.agent_output
+    ]
+
+
+def _get_blackboard_call_names(events: list[GenerationEvent]) -> list[str]:
+    blackboard = typing.cast(FunctionCallBlackboard, events[-1].data)
+    return mock_generation.get_call_names(
+        blackboard.internal_previously_generated_functions
+    )
+
+
+class TestMainGenerator(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("test: Not streaming.", False),
+            ("test: Streaming.", True),
+        ]
+    )
+    def test_agenerate_events_with_blackboard__later_agent_finishes_first__plan_order(
+        self, _test_name_implicitly_used: str, is_streaming_enabled: bool
+    ) -> None:
+        # Arrange
+        cassette_path = mock_generation.create_cassette(
+            plan_subjects=mock_generation.SUBJECTS,
+            agent_outputs=[
+                (mock_generation.create_call("creature", "wolf"), 0.4),
+                (mock_generation.create_call("vegetation", "grass"), 0.0),
+            ],
+        )
+        _config = mock_generation.create_config(
+            cassette_path, is_streaming_enabled=is_streaming_enabled
+        )
+
+        # Act
+        events, pending_tasks = asyncio.run(_acollect_events(_config))
+
+        # Assert
+        agent_names = [
+            mock_generation.get_agent_name(s) for s in mock_generation.SUBJECTS
+        ]
+        self.assertIn(GenerationEventType.plan, _get_event_types(events))
+        self.assertEqual(GenerationEventType.blackboard, events[-1].event_type)
+        self.assertEqual(agent_names, _get_agent_output_names(events))
+        self.assertEqual(["wolf", "grass"], _get_blackboard_call_names(events))
+        self.assertEqual([], pending_tasks)
+
+    def test_agenerate_events_with_blackboard__stages_differ_from_plan__merged_by_plan_index(
+        self,
+    ) -> None:
+        # Arrange
+        # The relationship agent reads the creatures, so it runs after the vegetation agent, although it is before it in the plan
+        cassette_path = mock_generation.create_cassette(
+            plan_subjects=["creature", "relationship", "vegetation"],
+            agent_outputs=[
+                (mock_generation.create_call("creature", "wolf"), 0.4),
+                (mock_generation.create_call("vegetation", "grass"), 0.0),
+                (mock_generation.create_call("relationship", "wolf eats grass"), 0.0),
+            ],
+        )
+        _config = mock_generation.create_config(cassette_path)
+        agent_definitions: list[AgentDefinitionBase] = [
+            *mock_generation.build_agents(),
+            mock_generation.build_relationship_agent(),
+        ]
+
+        # Act
+        events, _pending_tasks = asyncio.run(
+            _acollect_events(_config, agent_definitions=agent_definitions)
+        )
+
+        # Assert
+        self.assertEqual(
+            [
+                mock_generation.get_agent_name(s)
+                for s in ["creature", "vegetation", "relationship"]
+            ],
+            _get_agent_output_names(events),
+        )
+        self.assertEqual(
+            ["wolf", "grass", "wolf eats grass"], _get_blackboard_call_names(events)
+        )
+
+    def test_agenerate_events_with_blackboard__streaming__events_before_slow_agent(
+        self,
+    ) -> None:
+        # Arrange
+        cassette_path = mock_generation.create_cassette(
+            plan_subjects=mock_generation.SUBJECTS,
+            agent_outputs=[
+                (mock_generation.create_call("creature", "wolf"), 0.4),
+                (mock_generation.create_call("vegetation", "grass"), 0.0),
+            ],
+        )
+        _config = mock_generation.create_config(
+            cassette_path, is_streaming_enabled=True
+        )
+
+        # Act
+        events, _pending_tasks = asyncio.run(_acollect_events(_config))
+
+        # Assert
+        self.assertEqual(
+            [
+                "recommended_agent",
+                "recommended_agent",
+                "plan",
+                "function_call",
+                "function_call",
+                "agent_output",
+                "agent_output",
+                "blackboard",
+            ],
+            _get_event_types(events),
+        )
+        # The fast agent reports its function call before the slow agent has finished
+        function_call_names = [
+            list(typing.cast(typing.Any, e.data).parameters.values())[0]
+            for e in events
+            if e.event_type == GenerationEventType.function_call
+        ]
+        self.assertEqual(["grass", "wolf"], function_call_names)
+
+    @parameterized.expand(
+        [
+            (
+                "test: Not streaming, an agent is not defined.",
+                False,
+                ["creature", "mountain"],
+                [(mock_generation.create_call("creature", "wolf"), 0.0)],
+                ["wolf"],
+            ),
+            (
+                "test: Streaming, an agent is not defined.",
+                True,
+                ["creature", "mountain"],
+                [(mock_generation.create_call("creature", "wolf"), 0.0)],
+                ["wolf"],
+            ),
+            (
+                "test: Not streaming, the agents fail.",
+                False,
+                mock_generation.SUBJECTS,
+                [],
+                [],
+            ),
+            (
+                "test: Streaming, the agents fail.",
+                True,
+                mock_generation.SUBJECTS,
+                [],
+                [],
+            ),
+        ]
+    )
+    def test_agenerate_events_with_blackboard__error__other_agents_still_merged(
+        self,
+        _test_name_implicitly_used: str,
+        is_streaming_enabled: bool,
+        plan_subjects: list[str],
+        agent_outputs: list,
+        expected_call_names: list[str],
+    ) -> None:
+        # Arrange
+        cassette_path = mock_generation.create_cassette(
+            plan_subjects=plan_subjects, agent_outputs=agent_outputs
+        )
+        _config = mock_generation.create_config(
+            cassette_path, is_streaming_enabled=is_streaming_enabled
+        )
+
+        # Act
+        events, pending_tasks = asyncio.run(_acollect_events(_config))
+
+        # Assert
+        self.assertIn(GenerationEventType.plan, _get_event_types(events))
+        self.assertEqual(GenerationEventType.blackboard, events[-1].event_type)
+        self.assertEqual(expected_call_names, _get_blackboard_call_names(events))
+        self.assertEqual([], pending_tasks)
+
+    @parameterized.expand(
+        [
+            ("test: Not streaming.", False, GenerationEventType.agent_output),
+            ("test: Streaming.", True, GenerationEventType.function_call),
+        ]
+    )
+    def test_agenerate_events_with_blackboard__client_stops_early__agents_cancelled(
+        self,
+        _test_name_implicitly_used: str,
+        is_streaming_enabled: bool,
+        stop_after: GenerationEventType,
+    ) -> None:
+        # Arrange
+        cassette_path = mock_generation.create_cassette(
+            plan_subjects=["vegetation", "creature"],
+            agent_outputs=[
+                (mock_generation.create_call("vegetation", "grass"), 0.0),
+                (
+                    mock_generation.create_call("creature", "wolf"),
+                    SLOW_AGENT_SECONDS,
+                ),
+            ],
+        )
+        _config = mock_generation.create_config(
+            cassette_path, is_streaming_enabled=is_streaming_enabled
+        )
+
+        # Act
+        start = time.perf_counter()
+        events, pending_tasks = asyncio.run(
+            _acollect_events(_config, stop_after=stop_after)
+        )
+        elapsed = time.perf_counter() - start
+
+        # Assert
+        self.assertEqual(stop_after, events[-1].event_type)
+        self.assertEqual([], pending_tasks)
+        self.assertLess(elapsed, SLOW_AGENT_SECONDS / 2)
+
+    def test_agenerate_with_blackboard__blackboard_sent_through_client__router_input_bounded(
+        self,
+    ) -> None:
+        # Arrange
+        chat_history.clear_summary_cache()
+        cassette_path = mock_generation.create_cassette(
+            plan_subjects=mock_generation.SUBJECTS,
+            agent_outputs=[
+                (mock_generation.create_call("creature", "wolf"), 0.0),
+                (mock_generation.create_call("vegetation", "grass"), 0.0),
+            ],
+            history_summary="The user added wolves and grass.",
+        )
+        _config = mock_generation.create_config(
+            cassette_path, max_router_history_turns=1
+        )
+
+        # Act
+        router_messages = asyncio.run(
+            _agenerate_turns_statelessly(_config, turn_count=5)
+        )
+
+        # Assert
+        router_message_counts = [len(m) for m in router_messages]
+        self.assertLess(router_message_counts[1], router_message_counts[2])
+        # From the third turn, the older turns are replaced by the summary
+        self.assertEqual(router_message_counts[2], router_message_counts[4])
+        self.assertEqual(
+            chat_history.SUMMARY_MESSAGE_PREFIX + "The user added wolves and grass.",
+            router_messages[4][0].message,
+        )
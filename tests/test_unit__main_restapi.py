@@ -0,0 +1,352 @@
+import json
+import os
+import tempfile
+import typing
+from unittest import mock
+from fastapi.testclient import TestClient
+from gpt_multi_atomic_agents import main_restapi
+from gpt_multi_atomic_agents.blackboard import (
+    FunctionCallBlackboard,
+    Message,
+    MessageRole,
+)
+from gpt_multi_atomic_agents.config import Config
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+from tests import mock_generation
+
+console = Console()
+
+
+def _create_client_config(cassette_path: str) -> Config:
+    return mock_generation.create_config(cassette_path, session_sqlite_path="")
+
+
+def _create_session(client: TestClient) -> str:
+    blackboard = FunctionCallBlackboard()
+    blackboard.add_message(Message(role=MessageRole.user, message="Add a wolf"))
+    blackboard.add_generated_functions(
+        [mock_generation.create_call("creature", "wolf")]
+    )
+    response = client.post(
+        "/sessions",
+        json={
+            "agent_definitions": [
+                a.model_dump(mode="json")
+                for a in mock_generation.build_minimal_agents()
+            ],
+            "chat_agent_description": mock_generation.CHAT_AGENT_DESCRIPTION,
+            "blackboard": blackboard.model_dump(mode="json"),
+        },
+    )
+    response.raise_for_status()
+    return response.json()["session_id"]
+
+
+async def _afail_generation(
+    blackboard: FunctionCallBlackboard, **kwargs: typing.Any
+) -> None:
+    """A generation that fails after it has changed the blackboard."""
+    blackboard.add_previous_message(
+        Message(role=MessageRole.user, message="Add a sheep")
+    )
+    blackboard.add_generated_functions(
+        [mock_generation.create_call("creature", "sheep")]
+    )
+    raise RuntimeError("The generation failed")
+
+
+def _create_generate_request() -> dict:
+    return {
+        "agent_definitions": [
+            a.model_dump(mode="json") for a in mock_generation.build_minimal_agents()
+        ],
+        "chat_agent_description": mock_generation.CHAT_AGENT_DESCRIPTION,
+        "user_prompt": "Add a wolf and some grass",
+    }
+
+
+def _create_two_agent_cassette() -> str:
+    # The first agent of the plan is the slowest, so it finishes last
+    return mock_generation.create_cassette(
+        plan_subjects=mock_generation.SUBJECTS,
+        agent_outputs=[
+            (mock_generation.create_call("creature", "wolf"), 0.3),
+            (mock_generation.create_call("vegetation", "grass"), 0.0),
+        ],
+    )
+
+
+def _parse_sse_events(body: str) -> list[tuple[str, dict]]:
+    """Parse the Server-Sent Events: each event is 'event: <type>' and 'data: <json>', and ends with a blank line."""
+    events = []
+    for frame in body.split("\n\n"):
+        if not frame:
+            continue
+        lines = frame.split("\n")
+        assert len(lines) == 2, f"Not a valid event: {frame!r}"
+        assert lines[0].startswith("event: ") and lines[1].startswith("data: ")
+        events.append(
+            (lines[0][len("event: ") :], json.loads(lines[1][len("data: ") :]))
+        )
+    assert body.endswith("\n\n")
+    return events
+
+
+class TestMainRestApi(unittest.TestCase):
+    def test_generate_function_calls__later_agent_finishes_first__plan_order(
+        self,
+    ) -> None:
+        # Arrange
+        config = mock_generation.create_config(_create_two_agent_cassette())
+        with mock.patch.object(
+            main_restapi, "_load_config_from_ini", return_value=config
+        ):
+            client = TestClient(main_restapi.app)
+
+            # Act
+            response = client.post(
+                "/generate_function_calls", json=_create_generate_request()
+            )
+
+        # Assert
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            ["wolf", "grass"],
+            [
+                list(f["parameters"].values())[0]
+                for f in response.json()["internal_newly_generated_functions"]
+            ],
+        )
+
+    @parameterized.expand(
+        [
+            (
+                "test: Not streaming.",
+                False,
+                ["plan", "agent_output", "agent_output", "blackboard"],
+            ),
+            (
+                "test: Streaming.",
+                True,
+                [
+                    "recommended_agent",
+                    "recommended_agent",
+                    "plan",
+                    "function_call",
+                    "function_call",
+                    "agent_output",
+                    "agent_output",
+                    "blackboard",
+                ],
+            ),
+        ]
+    )
+    def test_generate_function_calls_stream__events(
+        self,
+        _test_name_implicitly_used: str,
+        is_streaming_enabled: bool,
+        expected_event_types: list[str],
+    ) -> None:
+        # Arrange
+        config = mock_generation.create_config(
+            _create_two_agent_cassette(), is_streaming_enabled=is_streaming_enabled
+        )
+        with mock.patch.object(
+            main_restapi, "_load_config_from_ini", return_value=config
+        ):
+            client = TestClient(main_restapi.app)
+
+            # Act
+            response = client.post(
+                "/generate_function_calls/stream", json=_create_generate_request()
+            )
+
+        # Assert
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(
+            response.headers["content-type"].startswith("text/event-stream")
+        )
+        events = _parse_sse_events(response.text)
+        self.assertEqual(expected_event_types, [t for t, _data in events])
+        self.assertEqual(
+            mock_generation.PLAN_CHAT_MESSAGE,
+            next(data for t, data in events if t == "plan")["chat_message"],
+        )
+        self.assertEqual(
+            [mock_generation.get_agent_name(s) for s in mock_generation.SUBJECTS],
+            [data["agent_name"] for t, data in events if t == "agent_output"],
+        )
+        self.assertEqual(
+            ["wolf", "grass"],
+            [
+                list(f["parameters"].values())[0]
+                for f in events[-1][1]["internal_newly_generated_functions"]
+            ],
+        )
+
+    def test_generate_function_calls_in_session__invalid_delta__session_unchanged(
+        self,
+    ) -> None:
+        # Arrange
+        cassette_path = mock_generation.create_cassette(
+            plan_subjects=["creature"], agent_outputs=[]
+        )
+        config = _create_client_config(cassette_path)
+        with mock.patch.object(
+            main_restapi, "_load_config_from_ini", return_value=config
+        ):
+            client = TestClient(main_restapi.app)
+            session_id = _create_session(client)
+            session_before = client.get(f"/sessions/{session_id}").json()
+
+            # Act
+            response = client.post(
+                f"/sessions/{session_id}/generate_function_calls",
+                json={
+                    "user_prompt": "Add a sheep",
+                    "user_data": [],
+                    "user_data_delta": [
+                        {"operation": "remove", "function_call_id": "not-an-id"}
+                    ],
+                },
+            )
+            session_after = client.get(f"/sessions/{session_id}").json()
+
+        # Assert
+        self.assertEqual(422, response.status_code)
+        self.assertIn("not-an-id", response.json()["detail"])
+        self.assertEqual(session_before, session_after)
+
+    @parameterized.expand(
+        [
+            ("test: Prompt only.", {}),
+            (
+                "test: With a delta.",
+                {
+                    "user_data_delta": [
+                        {
+                            "operation": "add",
+                            "function_call": mock_generation.create_call(
+                                "creature", "fox"
+                            ).model_dump(mode="json"),
+                        }
+                    ]
+                },
+            ),
+            (
+                "test: With new user data.",
+                {
+                    "user_data": [
+                        mock_generation.create_call("creature", "fox").model_dump(
+                            mode="json"
+                        )
+                    ]
+                },
+            ),
+        ]
+    )
+    def test_generate_function_calls_in_session__generation_fails__session_unchanged(
+        self, _test_name_implicitly_used: str, other_request_fields: dict
+    ) -> None:
+        # Arrange
+        cassette_path = mock_generation.create_cassette(
+            plan_subjects=["creature"], agent_outputs=[]
+        )
+        config = _create_client_config(cassette_path)
+        with (
+            mock.patch.object(
+                main_restapi, "_load_config_from_ini", return_value=config
+            ),
+            mock.patch.object(
+                main_restapi.main_generator,
+                "agenerate_with_blackboard",
+                side_effect=_afail_generation,
+            ),
+        ):
+            client = TestClient(main_restapi.app, raise_server_exceptions=False)
+            session_id = _create_session(client)
+            session_before = client.get(f"/sessions/{session_id}").json()
+
+            # Act
+            response = client.post(
+                f"/sessions/{session_id}/generate_function_calls",
+                json={"user_prompt": "Add a sheep"} | other_request_fields,
+            )
+            session_after = client.get(f"/sessions/{session_id}").json()
+
+        # Assert
+        self.assertEqual(500, response.status_code)
+        self.assertEqual(session_before, session_after)
+
+    def test_generate_function_calls_in_session__success__session_updated(
+        self,
+    ) -> None:
+        # Arrange
+        cassette_path = mock_generation.create_cassette(
+            plan_subjects=["creature"],
+            agent_outputs=[(mock_generation.create_call("creature", "sheep"), 0.0)],
+        )
+        config = _create_client_config(cassette_path)
+        with mock.patch.object(
+            main_restapi, "_load_config_from_ini", return_value=config
+        ):
+            client = TestClient(main_restapi.app)
+            session_id = _create_session(client)
+
+            # Act
+            response = client.post(
+                f"/sessions/{session_id}/generate_function_calls",
+                json={"user_prompt": "Add a sheep"},
+            )
+            session_after = client.get(f"/sessions/{session_id}").json()
+
+        # Assert
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            ["sheep"],
+            [
+                f["parameters"]["creature_name"]
+                for f in response.json()["internal_newly_generated_functions"]
+            ],
+        )
+        self.assertEqual(
+            ["wolf", "sheep"],
+            [
+                f["parameters"]["creature_name"]
+                for f in session_after["internal_previously_generated_functions"]
+            ],
+        )
+
+    @parameterized.expand(
+        [
+            ("test: Not streaming.", False),
+            ("test: Streaming.", True),
+        ]
+    )
+    def test_generate_function_calls_stream__router_fails__ends_with_blackboard(
+        self, _test_name_implicitly_used: str, is_streaming_enabled: bool
+    ) -> None:
+        # Arrange
+        empty_cassette_path = os.path.join(tempfile.mkdtemp(), "cassette.jsonl")
+        config = mock_generation.create_config(
+            empty_cassette_path, is_streaming_enabled=is_streaming_enabled
+        )
+        with mock.patch.object(
+            main_restapi, "_load_config_from_ini", return_value=config
+        ):
+            client = TestClient(main_restapi.app)
+
+            # Act
+            response = client.post(
+                "/generate_function_calls/stream", json=_create_generate_request()
+            )
+
+        # Assert
+        self.assertEqual(200, response.status_code)
+        events = _parse_sse_events(response.text)
+        self.assertEqual(["blackboard"], [t for t, _data in events])
+        self.assertEqual([], events[-1][1]["internal_newly_generated_functions"])
@@ -0,0 +1,77 @@
+from gpt_multi_atomic_agents import metrics
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+class TestMetrics(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (
+                "test: Below the first bucket.",
+                [0.001],
+                ['le="0.01"} 1', 'le="1"} 1', 'le="+Inf"} 1'],
+            ),
+            (
+                "test: Cumulative buckets.",
+                [0.001, 0.5, 30.0],
+                ['le="0.01"} 1', 'le="1"} 2', 'le="+Inf"} 3'],
+            ),
+            (
+                "test: Above the last bucket.",
+                [30.0],
+                ['le="0.01"} 0', 'le="1"} 0', 'le="+Inf"} 1'],
+            ),
+        ]
+    )
+    def test_render_prometheus__histogram(
+        self,
+        _test_name_implicitly_used: str,
+        values: list[float],
+        expected_bucket_lines: list[str],
+    ) -> None:
+        # Arrange
+        registry = metrics.MetricsRegistry()
+        histogram = registry.histogram(
+            "test_seconds", "A test", label_names=("stage",), buckets=(0.01, 1.0)
+        )
+        for value in values:
+            histogram.observe(value, stage="run")
+
+        # Act
+        text = registry.render_prometheus()
+
+        # Assert
+        for expected_bucket_line in expected_bucket_lines:
+            self.assertIn(
+                'gpt_multi_atomic_agents_test_seconds_bucket{stage="run",'
+                + expected_bucket_line,
+                text,
+            )
+        self.assertIn(
+            f'gpt_multi_atomic_agents_test_seconds_count{{stage="run"}} {len(values)}',
+            text,
+        )
+
+    def test_render_prometheus__counter_and_collector(self) -> None:
+        # Arrange
+        registry = metrics.MetricsRegistry()
+        counter = registry.counter("test_total", "A test", label_names=("agent_name",))
+        counter.inc(agent_name='The "Best" Agent')
+        counter.inc(2, agent_name='The "Best" Agent')
+        gauge = registry.gauge("test_size", "A test")
+        registry.add_collector(lambda: gauge.set(7))
+
+        # Act
+        text = registry.render_prometheus()
+
+        # Assert
+        self.assertIn("# TYPE gpt_multi_atomic_agents_test_total counter", text)
+        self.assertIn(
+            'gpt_multi_atomic_agents_test_total{agent_name="The \\"Best\\" Agent"} 3',
+            text,
+        )
+        self.assertIn("gpt_multi_atomic_agents_test_size 7", text)
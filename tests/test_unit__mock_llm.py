@@ -0,0 +1,152 @@
+import asyncio
+import os
+import tempfile
+import typing
+from gpt_multi_atomic_agents import config, mock_llm
+from gpt_multi_atomic_agents.prompts_history_summary import (
+    HistorySummaryAgentOutputSchema,
+)
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+MESSAGES = [{"role": "user", "content": "Add a wolf"}]
+
+
+def _create_cassette(path: str) -> None:
+    cassette = mock_llm.get_cassette(path)
+    for summary in ["first", "second"]:
+        cassette.add(
+            mock_llm.CassetteEntry(
+                request_key=mock_llm.build_request_key(
+                    HistorySummaryAgentOutputSchema.__name__, MESSAGES
+                ),
+                response_model_name=HistorySummaryAgentOutputSchema.__name__,
+                response_json=HistorySummaryAgentOutputSchema(
+                    summary=summary
+                ).model_dump_json(),
+                input_tokens=10,
+                output_tokens=5,
+                latency_seconds=0.5,
+            )
+        )
+
+
+class TestMockLlm(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cassette_path = os.path.join(tempfile.mkdtemp(), "cassette.jsonl")
+        _create_cassette(self.cassette_path)
+        mock_llm.clear_cassettes()
+
+    def tearDown(self) -> None:
+        mock_llm.clear_cassettes()
+
+    def _create_client(
+        self, is_async: bool = False, **kwargs: typing.Any
+    ) -> typing.Any:
+        _config = config.Config(
+            ai_platform=config.AI_PLATFORM_Enum.mock,
+            mock_cassette_path=self.cassette_path,
+            **kwargs,
+        )
+        return mock_llm.create_mock_client(_config=_config, is_async=is_async)
+
+    def test_replay__recorded_responses_in_turn(self) -> None:
+        # Arrange
+        client = self._create_client()
+
+        # Act
+        summaries = [
+            client.chat.completions.create(
+                response_model=HistorySummaryAgentOutputSchema, messages=MESSAGES
+            ).summary
+            for _i in range(3)
+        ]
+
+        # Assert
+        self.assertEqual(["first", "second", "first"], summaries)
+
+    def test_replay__not_recorded__strict__raises(self) -> None:
+        # Arrange
+        client = self._create_client(mock_is_strict=True)
+
+        # Act + Assert
+        with self.assertRaises(RuntimeError):
+            client.chat.completions.create(
+                response_model=HistorySummaryAgentOutputSchema,
+                messages=[{"role": "user", "content": "Add a bear"}],
+            )
+
+    def test_replay__not_recorded__not_strict__replays_same_output_schema(
+        self,
+    ) -> None:
+        # Arrange
+        client = self._create_client(mock_is_strict=False)
+
+        # Act
+        response = client.chat.completions.create(
+            response_model=HistorySummaryAgentOutputSchema,
+            messages=[{"role": "user", "content": "Add a bear"}],
+        )
+
+        # Assert
+        self.assertEqual("first", response.summary)
+
+    def test_replay_async__streams_partial_responses(self) -> None:
+        # Arrange
+        client = self._create_client(is_async=True)
+
+        async def _stream() -> list[str | None]:
+            return [
+                p.summary
+                async for p in client.chat.completions.create_partial(
+                    response_model=HistorySummaryAgentOutputSchema, messages=MESSAGES
+                )
+            ]
+
+        # Act
+        summaries = asyncio.run(_stream())
+
+        # Assert
+        self.assertGreater(len(summaries), 1)
+        self.assertEqual("first", summaries[-1])
+
+    @parameterized.expand(
+        [
+            ("test: none.", config.MOCK_LATENCY_Enum.none, 0.0, 0.0),
+            ("test: recorded.", config.MOCK_LATENCY_Enum.recorded, 0.5, 0.5),
+            ("test: constant.", config.MOCK_LATENCY_Enum.constant, 2.0, 2.0),
+            ("test: uniform.", config.MOCK_LATENCY_Enum.uniform, 1.0, 3.0),
+            ("test: lognormal.", config.MOCK_LATENCY_Enum.lognormal, 0.0, 100.0),
+        ]
+    )
+    def test_latency_model(
+        self,
+        _name: str,
+        latency: config.MOCK_LATENCY_Enum,
+        expected_min: float,
+        expected_max: float,
+    ) -> None:
+        # Arrange
+        latency_model = mock_llm.LatencyModel(
+            config.Config(
+                mock_latency=latency,
+                mock_latency_seconds=2.0,
+                mock_latency_spread_seconds=1.0,
+            )
+        )
+        entry = mock_llm.get_cassette(self.cassette_path).find(
+            request_key="",
+            response_model_name="HistorySummaryAgentOutputSchema",
+            is_strict=False,
+        )
+
+        # Act
+        samples = [latency_model.sample(entry) for _i in range(100)]
+
+        # Assert
+        self.assertGreaterEqual(min(samples), expected_min)
+        self.assertLessEqual(max(samples), expected_max)
@@ -0,0 +1,158 @@
+import os
+import tempfile
+from unittest import mock
+from gpt_multi_atomic_agents import main_generator, plan_cache, semantic_plan_cache
+from gpt_multi_atomic_agents.blackboard import Message, MessageRole
+from gpt_multi_atomic_agents.config import Config, PLAN_CACHE_BACKEND_Enum
+from gpt_multi_atomic_agents.prompts_router import (
+    AgentDescription,
+    AgentExecutionPlanSchema,
+    RecommendedAgent,
+)
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+from tests import mock_generation
+
+console = Console()
+
+agent_descriptions = [
+    AgentDescription(
+        agent_name="creature",
+        description="Creates creatures",
+        topics=["creature"],
+        agent_parameter_names=[],
+    )
+]
+
+plan = AgentExecutionPlanSchema(
+    chat_message="OK",
+    recommended_agents=[
+        RecommendedAgent(
+            agent_name="creature",
+            rewritten_user_prompt="Add a goat",
+            agent_parameters={},
+        )
+    ],
+)
+
+
+def _build_key(
+    user_prompt: str = "Add a goat", messages: list[Message] | None = None
+) -> str:
+    scope_key = plan_cache.build_plan_scope_key(
+        agent_descriptions=agent_descriptions,
+        chat_agent_description="Handles questions about an ecosystem game",
+        previous_plan=None,
+        messages=messages,
+        user_prompt=user_prompt,
+        _config=Config(),
+    )
+    return plan_cache.build_plan_cache_key(scope_key=scope_key, user_prompt=user_prompt)
+
+
+def _create_cache(backend: str, temp_dir: str) -> plan_cache.PlanCacheBase:
+    if backend == "sqlite":
+        return plan_cache.SqlitePlanCache(
+            path_to_db=os.path.join(temp_dir, "plan_cache.sqlite"),
+            max_entries=2,
+            ttl_seconds=60,
+        )
+    return plan_cache.MemoryPlanCache(max_entries=2, ttl_seconds=60)
+
+
+class TestPlanCache(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("test: Whitespace and case are normalized.", "  add a GOAT ", None, True),
+            ("test: Different prompt.", "Add a sheep", None, False),
+            (
+                "test: Different messages.",
+                "Add a goat",
+                [Message(role=MessageRole.user, message="Add grass")],
+                False,
+            ),
+            (
+                "test: The messages end with the user prompt.",
+                "add a goat",
+                [Message(role=MessageRole.user, message="add a goat")],
+                True,
+            ),
+        ]
+    )
+    def test_build_plan_cache_key(
+        self,
+        _test_name_implicitly_used: str,
+        user_prompt: str,
+        messages: list[Message] | None,
+        expected_is_same_key: bool,
+    ) -> None:
+        self.assertEqual(
+            expected_is_same_key,
+            _build_key() == _build_key(user_prompt=user_prompt, messages=messages),
+        )
+
+    @parameterized.expand([("memory",), ("sqlite",)])
+    def test_get_set_evict(self, backend: str) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Arrange
+            cache = _create_cache(backend=backend, temp_dir=temp_dir)
+
+            # Act
+            cache.set("key-1", plan)
+            cache.set("key-2", plan)
+            self.assertEqual(plan, cache.get("key-1"))
+            cache.set("key-3", plan)  # evicts key-2, the least recently used
+
+            # Assert
+            self.assertIsNone(cache.get("key-2"))
+            self.assertEqual(plan, cache.get("key-3"))
+            self.assertEqual(
+                plan_cache.PlanCacheStats(hits=2, misses=1, size=2), cache.get_stats()
+            )
+
+    @parameterized.expand([("memory",), ("sqlite",)])
+    def test_ttl_expiry(self, backend: str) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Arrange
+            cache = _create_cache(backend=backend, temp_dir=temp_dir)
+            cache.set("key-1", plan)
+
+            # Act
+            with mock.patch.object(plan_cache.time, "time", return_value=1e12):
+                result = cache.get("key-1")
+
+            # Assert
+            self.assertIsNone(result)
+
+    def test_generate_with_blackboard__paraphrased_prompts__plan_reused(self) -> None:
+        # Arrange
+        cassette_path = mock_generation.create_cassette(
+            plan_subjects=["creature"],
+            agent_outputs=[(mock_generation.create_call("creature", "wolf"), 0.0)],
+        )
+        _config = mock_generation.create_config(
+            cassette_path,
+            plan_cache_backend=PLAN_CACHE_BACKEND_Enum.memory,
+            is_semantic_plan_cache_enabled=True,
+        )
+        cache = plan_cache.get_plan_cache(_config)
+        semantic_cache = semantic_plan_cache.get_semantic_plan_cache(_config)
+        assert cache and semantic_cache
+        cache.clear()
+        semantic_cache.clear()
+
+        # Act
+        for user_prompt in ["Add a wolf", "add a  wolf", "Please add a wolf"]:
+            main_generator.generate_with_blackboard(
+                agent_definitions=mock_generation.build_agents(),
+                chat_agent_description=mock_generation.CHAT_AGENT_DESCRIPTION,
+                _config=_config,
+                user_prompt=user_prompt,
+            )
+
+        # Assert
+        self.assertEqual(1, cache.get_stats().hits)
+        self.assertEqual(1, semantic_cache.get_stats().hits)
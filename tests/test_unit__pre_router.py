@@ -0,0 +1,135 @@
+from gpt_multi_atomic_agents.pre_router import PLAN_CHAT_MESSAGE, PreRouter
+from gpt_multi_atomic_agents.prompts_router import AgentDescription
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+agent_descriptions = [
+    AgentDescription(
+        agent_name="creature",
+        description="Creates creatures",
+        topics=["creature", "summary"],
+        agent_parameter_names=["creature_name"],
+    ),
+    AgentDescription(
+        agent_name="vegetation",
+        description="Creates vegetation",
+        topics=["vegetation", "summary"],
+        agent_parameter_names=[],
+    ),
+    AgentDescription(
+        agent_name="relationship",
+        description="Creates relationships",
+        topics=["food chain"],
+        agent_parameter_names=[],
+    ),
+]
+
+
+class TestPreRouter(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("test: One topic matches.", "Add a creature called Wolf", "creature"),
+            ("test: Plural matches.", "Remove all creatures", "creature"),
+            ("test: Multi-word topic.", "Update the food chain", "relationship"),
+            ("test: Shared topic is ambiguous.", "Give me a summary", None),
+            (
+                "test: Two requests go to the LLM router.",
+                "Add a creature and some vegetation",
+                None,
+            ),
+            ("test: Question goes to the LLM router.", "What is a creature?", None),
+            ("test: No topic matches.", "Add a wolf", None),
+            (
+                "test: Topic without an action goes to the LLM router.",
+                "tell me a joke about creatures",
+                None,
+            ),
+            (
+                "test: Negation goes to the LLM router.",
+                "do not add any creatures",
+                None,
+            ),
+            (
+                "test: Negation after the action goes to the LLM router.",
+                "Please don't remove the creatures",
+                None,
+            ),
+            (
+                "test: Polite action verb.",
+                "Please add a creature called Wolf",
+                "creature",
+            ),
+        ]
+    )
+    def test_route_or_none(
+        self,
+        _test_name_implicitly_used: str,
+        user_prompt: str,
+        expected_agent_name: str | None,
+    ) -> None:
+        # Arrange
+        pre_router = PreRouter(agent_descriptions=agent_descriptions)
+
+        # Act
+        plan = pre_router.route_or_none(user_prompt)
+
+        # Assert
+        if expected_agent_name is None:
+            self.assertIsNone(plan)
+        else:
+            assert plan is not None
+            self.assertEqual(
+                [expected_agent_name], [a.agent_name for a in plan.recommended_agents]
+            )
+            self.assertEqual(
+                user_prompt, plan.recommended_agents[0].rewritten_user_prompt
+            )
+            self.assertEqual(PLAN_CHAT_MESSAGE, plan.chat_message)
+            self.assertNotIn(expected_agent_name, plan.chat_message)
+
+    @parameterized.expand(
+        [
+            (
+                "test: Value named in the prompt.",
+                "Add a creature called Wolf",
+                "creature",
+                {"creature_name": ["Wolf"]},
+            ),
+            (
+                "test: Quoted value.",
+                "Remove the creature named 'Sheep'",
+                "creature",
+                {"creature_name": ["Sheep"]},
+            ),
+            ("test: No value named.", "Remove all creatures", "creature", {}),
+            (
+                "test: Agent without parameters.",
+                "Add vegetation called Grass",
+                "vegetation",
+                {},
+            ),
+        ]
+    )
+    def test_route_or_none__agent_parameters(
+        self,
+        _test_name_implicitly_used: str,
+        user_prompt: str,
+        expected_agent_name: str,
+        expected_agent_parameters: dict[str, list[str]],
+    ) -> None:
+        # Arrange
+        pre_router = PreRouter(agent_descriptions=agent_descriptions)
+
+        # Act
+        plan = pre_router.route_or_none(user_prompt)
+
+        # Assert
+        assert plan is not None
+        self.assertEqual(expected_agent_name, plan.recommended_agents[0].agent_name)
+        self.assertEqual(
+            expected_agent_parameters, plan.recommended_agents[0].agent_parameters
+        )
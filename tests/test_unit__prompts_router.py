@@ -0,0 +1,74 @@
+from gpt_multi_atomic_agents.prompts_router import (
+    AgentExecutionPlanSchema,
+    ParallelAgentsGroup,
+    RecommendedAgent,
+)
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+def _build_plan(
+    agent_names: list[str], groups: list[list[str]]
+) -> AgentExecutionPlanSchema:
+    return AgentExecutionPlanSchema(
+        chat_message="OK",
+        recommended_agents=[
+            RecommendedAgent(
+                agent_name=name, rewritten_user_prompt=f"Do {name}", agent_parameters={}
+            )
+            for name in agent_names
+        ],
+        parallel_agent_groups=[ParallelAgentsGroup(agent_names=g) for g in groups],
+    )
+
+
+class TestPromptsRouter(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (
+                "test: No groups - sequential stages.",
+                ["creature", "vegetation", "relationship"],
+                [],
+                [["creature"], ["vegetation"], ["relationship"]],
+            ),
+            (
+                "test: Parallel group then dependent agent.",
+                ["creature", "vegetation", "relationship"],
+                [["creature", "vegetation"], ["relationship"]],
+                [["creature", "vegetation"], ["relationship"]],
+            ),
+            (
+                "test: Agents missing from groups run afterwards.",
+                ["creature", "vegetation", "relationship"],
+                [["vegetation"]],
+                [["vegetation"], ["creature"], ["relationship"]],
+            ),
+            (
+                "test: Unknown agent in group is ignored.",
+                ["creature"],
+                [["unknown"], ["creature"]],
+                [["creature"]],
+            ),
+        ]
+    )
+    def test_get_agent_stages(
+        self,
+        _test_name_implicitly_used: str,
+        agent_names: list[str],
+        groups: list[list[str]],
+        expected_stages: list[list[str]],
+    ) -> None:
+        # Arrange
+        plan = _build_plan(agent_names=agent_names, groups=groups)
+
+        # Act
+        stages = plan.get_agent_stages()
+
+        # Assert
+        self.assertEqual(
+            expected_stages, [[a.agent_name for a in stage] for stage in stages]
+        )
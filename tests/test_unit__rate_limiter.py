@@ -0,0 +1,106 @@
+import time
+import typing
+from gpt_multi_atomic_agents import rate_limiter
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+class _FakeResponse:
+    def __init__(self, headers: dict[str, str]) -> None:
+        self.headers = headers
+
+
+class _FakeThrottledError(Exception):
+    def __init__(self, headers: dict[str, str]) -> None:
+        super().__init__("Too many requests")
+        self.status_code = rate_limiter.THROTTLED_STATUS_CODE
+        self.response = _FakeResponse(headers)
+
+
+def _create_limiter(**kwargs: typing.Any) -> rate_limiter.RateLimiter:
+    settings: dict[str, typing.Any] = dict(
+        ai_platform="openai",
+        model="test",
+        requests_per_minute=0,
+        tokens_per_minute=0,
+        max_concurrency=8,
+        min_concurrency=1,
+    )
+    settings.update(kwargs)
+    return rate_limiter.RateLimiter(**settings)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_acquire__tokens_per_minute_used__waits_for_refill(self) -> None:
+        # Arrange
+        limiter = _create_limiter(tokens_per_minute=6000)  # 100 tokens per second
+        limiter.acquire(6000)
+        limiter.on_success(estimated_tokens=6000, used_tokens=6000)
+
+        # Act
+        start = time.monotonic()
+        limiter.acquire(20)
+        waited = time.monotonic() - start
+
+        # Assert
+        self.assertGreaterEqual(waited, 0.15)
+        self.assertEqual(1, limiter.get_stats().waits)
+
+    def test_on_throttled__halves_concurrency__then_success_grows_it(self) -> None:
+        # Arrange
+        limiter = _create_limiter(max_concurrency=8)
+        limiter.acquire(1)
+
+        # Act
+        limiter.on_throttled(retry_after_seconds=0.0)
+        after_throttled = limiter.get_stats().concurrency_limit
+        for _i in range(4):
+            limiter.acquire(1)
+            limiter.on_success(estimated_tokens=1, used_tokens=None)
+
+        # Assert
+        self.assertEqual(4, after_throttled)
+        self.assertEqual(5, limiter.get_stats().concurrency_limit)
+
+    def test_limit_calls__error__releases_slot(self) -> None:
+        # Arrange
+        limiter = _create_limiter(max_concurrency=1)
+
+        def _create(**kwargs: typing.Any) -> None:
+            raise _FakeThrottledError({"retry-after-ms": "10"})
+
+        create = rate_limiter.limit_calls(_create, limiter)
+
+        # Act
+        with self.assertRaises(_FakeThrottledError):
+            create(messages=[])
+
+        # Assert
+        stats = limiter.get_stats()
+        self.assertEqual(0, stats.in_flight)
+        self.assertEqual(1, stats.throttled)
+
+    @parameterized.expand(
+        [
+            ("test: milliseconds.", {"retry-after-ms": "1500"}, 1.5),
+            ("test: seconds.", {"retry-after": "2"}, 2.0),
+            ("test: no header.", {}, None),
+            ("test: invalid.", {"retry-after": "soon"}, None),
+        ]
+    )
+    def test_get_retry_after_seconds(
+        self, _name: str, headers: dict[str, str], expected: float | None
+    ) -> None:
+        # Arrange
+        error = _FakeThrottledError(headers)
+
+        # Act
+        retry_after = rate_limiter.get_retry_after_seconds(error)
+
+        # Assert
+        self.assertTrue(rate_limiter.is_throttled(error))
+        self.assertEqual(expected, retry_after)
@@ -0,0 +1,235 @@
+import asyncio
+import threading
+import time
+import typing
+from gpt_multi_atomic_agents import rate_limiter, resilience
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+class _FakeResponse:
+    def __init__(self, headers: dict[str, str]) -> None:
+        self.headers = headers
+
+
+class _FakeApiError(Exception):
+    def __init__(self, status_code: int, headers: dict[str, str] | None = None) -> None:
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = _FakeResponse(headers or {})
+
+
+def _create_policy(**kwargs: typing.Any) -> resilience.ResiliencePolicy:
+    settings: dict[str, typing.Any] = dict(
+        ai_platform="openai",
+        model="test",
+        max_retries=2,
+        retry_base_delay_seconds=0.0,
+        retry_max_delay_seconds=0.0,
+        is_hedging_enabled=False,
+        hedge_percentile=95.0,
+        hedge_min_samples=1,
+        hedge_min_delay_seconds=0.0,
+    )
+    settings.update(kwargs)
+    return resilience.ResiliencePolicy(**settings)
+
+
+def _create_limiter(max_concurrency: int) -> rate_limiter.RateLimiter:
+    return rate_limiter.RateLimiter(
+        ai_platform="openai",
+        model="test",
+        requests_per_minute=0,
+        tokens_per_minute=0,
+        max_concurrency=max_concurrency,
+        min_concurrency=1,
+    )
+
+
+class _FlakyCreate:
+    """A fake SDK create(): raises the errors in turn, and then returns 'ok'."""
+
+    def __init__(self, errors: list[Exception]) -> None:
+        self.errors = errors
+        self.calls = 0
+
+    def __call__(self, **kwargs: typing.Any) -> str:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+class TestResilience(unittest.TestCase):
+    def test_resilient_calls__transient_errors__retried(self) -> None:
+        # Arrange
+        policy = _create_policy(max_retries=2)
+        create = _FlakyCreate([_FakeApiError(503), _FakeApiError(429)])
+
+        # Act
+        response = resilience.resilient_calls(create, policy)(messages=[])
+
+        # Assert
+        self.assertEqual("ok", response)
+        self.assertEqual(3, create.calls)
+        self.assertEqual(2, policy.get_stats().retries)
+
+    @parameterized.expand(
+        [
+            ("test: not transient.", [_FakeApiError(400)], 1),
+            (
+                "test: too many transient errors.",
+                [_FakeApiError(503), _FakeApiError(503), _FakeApiError(503)],
+                3,
+            ),
+        ]
+    )
+    def test_resilient_calls__gives_up(
+        self, _name: str, errors: list[Exception], expected_calls: int
+    ) -> None:
+        # Arrange
+        policy = _create_policy(max_retries=2)
+        create = _FlakyCreate(list(errors))
+
+        # Act + Assert
+        with self.assertRaises(_FakeApiError):
+            resilience.resilient_calls(create, policy)(messages=[])
+        self.assertEqual(expected_calls, create.calls)
+        self.assertEqual(1, policy.get_stats().failures)
+
+    @parameterized.expand(
+        [
+            ("test: server error.", _FakeApiError(503), True),
+            ("test: bad request.", _FakeApiError(400), False),
+            (
+                "test: server says do not retry.",
+                _FakeApiError(503, {"x-should-retry": "false"}),
+                False,
+            ),
+            ("test: other error.", ValueError("bad"), False),
+        ]
+    )
+    def test_is_transient_error(
+        self, _name: str, error: Exception, expected: bool
+    ) -> None:
+        # Act + Assert
+        self.assertEqual(expected, resilience.is_transient_error(error))
+
+    def test_resilient_calls__slow_request__hedge_wins(self) -> None:
+        # Arrange
+        policy = _create_policy(is_hedging_enabled=True, hedge_min_delay_seconds=0.05)
+        policy.record_latency("unknown", 0.01)
+        calls: list[int] = []
+
+        def _create(**kwargs: typing.Any) -> str:
+            calls.append(len(calls))
+            if len(calls) == 1:
+                time.sleep(1.0)
+                return "original"
+            return "hedge"
+
+        # Act
+        start = time.perf_counter()
+        response = resilience.resilient_calls(_create, policy)(messages=[])
+        elapsed = time.perf_counter() - start
+
+        # Assert
+        self.assertEqual("hedge", response)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(1, policy.get_stats().hedge_wins)
+
+    def test_aresilient_calls__slow_request__original_cancelled(self) -> None:
+        # Arrange
+        policy = _create_policy(is_hedging_enabled=True, hedge_min_delay_seconds=0.05)
+        policy.record_latency("unknown", 0.01)
+        cancelled: list[bool] = []
+
+        async def _acreate(**kwargs: typing.Any) -> str:
+            if not cancelled:
+                cancelled.append(False)
+                try:
+                    await asyncio.sleep(1.0)
+                except asyncio.CancelledError:
+                    cancelled[0] = True
+                    raise
+                return "original"
+            return "hedge"
+
+        # Act
+        response = asyncio.run(
+            resilience.aresilient_calls(_acreate, policy)(messages=[])
+        )
+
+        # Assert
+        self.assertEqual("hedge", response)
+        self.assertEqual([True], cancelled)
+
+    def test_resilient_calls__waits_for_rate_limiter__wait_not_in_latency(
+        self,
+    ) -> None:
+        # Arrange
+        policy = _create_policy(is_hedging_enabled=True)
+        limiter = _create_limiter(max_concurrency=1)
+        limiter.acquire(0)  # another request has the only slot
+        threading.Timer(0.3, limiter.on_success, args=(0, None)).start()
+        create = rate_limiter.limit_calls(_FlakyCreate([]), limiter)
+
+        # Act
+        start = time.perf_counter()
+        response = resilience.resilient_calls(create, policy, limiter=limiter)(
+            messages=[]
+        )
+        elapsed = time.perf_counter() - start
+
+        # Assert
+        self.assertEqual("ok", response)
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertLess(
+            typing.cast(float, policy.get_hedge_delay_seconds("unknown")), 0.1
+        )
+
+    @parameterized.expand(
+        [
+            ("test: Sync.", False),
+            ("test: Async.", True),
+        ]
+    )
+    def test_resilient_calls__rate_limiter_has_no_free_slot__not_hedged(
+        self, _test_name_implicitly_used: str, is_async: bool
+    ) -> None:
+        # Arrange
+        policy = _create_policy(is_hedging_enabled=True, hedge_min_delay_seconds=0.05)
+        policy.record_latency("unknown", 0.01)
+        # The slow request has the only slot: a hedge would wait for it
+        limiter = _create_limiter(max_concurrency=1)
+
+        def _create(**kwargs: typing.Any) -> str:
+            time.sleep(0.3)
+            return "original"
+
+        async def _acreate(**kwargs: typing.Any) -> str:
+            await asyncio.sleep(0.3)
+            return "original"
+
+        # Act
+        if is_async:
+            response = asyncio.run(
+                resilience.aresilient_calls(
+                    rate_limiter.alimit_calls(_acreate, limiter),
+                    policy,
+                    limiter=limiter,
+                )(messages=[])
+            )
+        else:
+            response = resilience.resilient_calls(
+                rate_limiter.limit_calls(_create, limiter), policy, limiter=limiter
+            )(messages=[])
+
+        # Assert
+        self.assertEqual("original", response)
+        self.assertEqual(0, policy.get_stats().hedges)
+        self.assertEqual(0, limiter.get_stats().in_flight)
@@ -0,0 +1,127 @@
+from gpt_multi_atomic_agents.pre_router import PLAN_CHAT_MESSAGE
+from gpt_multi_atomic_agents.prompts_router import (
+    AgentExecutionPlanSchema,
+    RecommendedAgent,
+)
+from gpt_multi_atomic_agents.semantic_plan_cache import SemanticPlanCache
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+plan = AgentExecutionPlanSchema(
+    chat_message="OK",
+    recommended_agents=[
+        RecommendedAgent(
+            agent_name="creature",
+            rewritten_user_prompt="Add a wolf",
+            agent_parameters={},
+        )
+    ],
+)
+
+forest_plan = AgentExecutionPlanSchema(
+    chat_message="OK, I will add a wolf to the northern forest",
+    recommended_agents=[
+        RecommendedAgent(
+            agent_name="creature",
+            rewritten_user_prompt="Add a wolf to the northern forest",
+            agent_parameters={"habitat": ["northern forest"]},
+        ),
+        RecommendedAgent(
+            agent_name="creature",
+            rewritten_user_prompt="Add a wolf den to the northern forest",
+            agent_parameters={},
+        ),
+    ],
+)
+
+
+class TestSemanticPlanCache(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("test: Paraphrase is a hit.", "scope-1", "Please add a wolf!", True),
+            ("test: Different creature is a miss.", "scope-1", "Add a fox", False),
+            ("test: Different scope is a miss.", "scope-2", "Add a wolf", False),
+        ]
+    )
+    def test_get(
+        self,
+        _test_name_implicitly_used: str,
+        scope_key: str,
+        user_prompt: str,
+        expected_is_hit: bool,
+    ) -> None:
+        # Arrange
+        cache = SemanticPlanCache(
+            max_entries=10, ttl_seconds=60, similarity_threshold=0.9
+        )
+        cache.set(scope_key="scope-1", user_prompt="Add a wolf", plan=plan)
+
+        # Act
+        result = cache.get(scope_key=scope_key, user_prompt=user_prompt)
+
+        # Assert
+        self.assertEqual(expected_is_hit, result == plan)
+
+    def test_set__when_full_evicts_least_recently_used(self) -> None:
+        # Arrange
+        cache = SemanticPlanCache(
+            max_entries=2, ttl_seconds=60, similarity_threshold=0.9
+        )
+        cache.set(scope_key="scope", user_prompt="Add a wolf", plan=plan)
+        cache.set(scope_key="scope", user_prompt="Add a sheep", plan=plan)
+        cache.get(scope_key="scope", user_prompt="Add a wolf")
+
+        # Act
+        cache.set(scope_key="scope", user_prompt="Add some grass", plan=plan)
+
+        # Assert
+        self.assertIsNone(cache.get(scope_key="scope", user_prompt="Add a sheep"))
+        self.assertIsNotNone(cache.get(scope_key="scope", user_prompt="Add a wolf"))
+        self.assertEqual(2, cache.get_stats().size)
+
+    @parameterized.expand(
+        [
+            (
+                "test: One word differs.",
+                "Add a wolf to the southern forest",
+            ),
+            (
+                "test: Different wording.",
+                "Please add one wolf to the northern forest",
+            ),
+        ]
+    )
+    def test_get__words_differ__only_agents_reused(
+        self, _test_name_implicitly_used: str, user_prompt: str
+    ) -> None:
+        # Arrange
+        cache = SemanticPlanCache(
+            max_entries=10, ttl_seconds=60, similarity_threshold=0.8
+        )
+        cache.set(
+            scope_key="scope",
+            user_prompt="Add a wolf to the northern forest",
+            plan=forest_plan,
+        )
+
+        # Act
+        result = cache.get(scope_key="scope", user_prompt=user_prompt)
+
+        # Assert
+        self.assertEqual(
+            AgentExecutionPlanSchema(
+                chat_message=PLAN_CHAT_MESSAGE,
+                recommended_agents=[
+                    RecommendedAgent(
+                        agent_name="creature",
+                        rewritten_user_prompt=user_prompt,
+                        agent_parameters={},
+                    )
+                ],
+            ),
+            result,
+        )
@@ -0,0 +1,97 @@
+import os
+import tempfile
+from unittest import mock
+from gpt_multi_atomic_agents import session_store
+from gpt_multi_atomic_agents.blackboard import (
+    FunctionCallBlackboard,
+    Message,
+    MessageRole,
+)
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+def _create_blackboard(message: str) -> FunctionCallBlackboard:
+    blackboard = FunctionCallBlackboard()
+    blackboard.add_message(Message(role=MessageRole.user, message=message))
+    return blackboard
+
+
+def _create_store(
+    temp_dir: str, is_spill_enabled: bool
+) -> session_store.SessionStore[FunctionCallBlackboard]:
+    return session_store.SessionStore(
+        session_type=FunctionCallBlackboard,
+        max_in_memory=1,
+        ttl_seconds=60,
+        path_to_db=os.path.join(temp_dir, "sessions.sqlite")
+        if is_spill_enabled
+        else None,
+    )
+
+
+class TestSessionStore(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("test: Spilled session is loaded back.", True, True),
+            ("test: Without spill, evicted session is dropped.", False, False),
+        ]
+    )
+    def test_evict(
+        self,
+        _test_name_implicitly_used: str,
+        is_spill_enabled: bool,
+        expected_is_found: bool,
+    ) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Arrange
+            store = _create_store(temp_dir=temp_dir, is_spill_enabled=is_spill_enabled)
+            store.set("session-1", _create_blackboard("Add a wolf"))
+
+            # Act
+            store.set("session-2", _create_blackboard("Add a sheep"))
+            session = store.get("session-1")
+
+            # Assert
+            self.assertEqual(expected_is_found, session is not None)
+            if session:
+                self.assertEqual(
+                    "Add a wolf", session.internal_previous_messages[0].message
+                )
+                self.assertEqual(1, store.get_stats().spill_hits)
+
+    def test_ttl_expiry(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Arrange
+            store = _create_store(temp_dir=temp_dir, is_spill_enabled=True)
+            store.set("session-1", _create_blackboard("Add a wolf"))
+            store.set("session-2", _create_blackboard("Add a sheep"))
+
+            # Act
+            with mock.patch.object(session_store.time, "time", return_value=1e12):
+                in_memory_session = store.get("session-2")
+                spilled_session = store.get("session-1")
+
+            # Assert
+            self.assertIsNone(in_memory_session)
+            self.assertIsNone(spilled_session)
+            self.assertEqual(2, store.get_stats().misses)
+
+    def test_delete(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Arrange
+            store = _create_store(temp_dir=temp_dir, is_spill_enabled=True)
+            store.set("session-1", _create_blackboard("Add a wolf"))
+            store.set("session-2", _create_blackboard("Add a sheep"))
+
+            # Act
+            is_deleted = store.delete("session-1")
+
+            # Assert
+            self.assertTrue(is_deleted)
+            self.assertIsNone(store.get("session-1"))
+            self.assertFalse(store.delete("session-1"))
@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+from gpt_multi_atomic_agents import tracing
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+class _ListExporter(tracing.TraceExporterBase):
+    def __init__(self) -> None:
+        self.exports: list[list[tracing.Span]] = []
+
+    def export(self, spans: list[tracing.Span]) -> None:
+        self.exports.append(spans)
+
+
+class TestTracing(unittest.TestCase):
+    def tearDown(self) -> None:
+        tracing.set_exporter(None)
+
+    def test_span__children_are_exported_with_their_root(self) -> None:
+        # Arrange
+        exporter = _ListExporter()
+        tracing.set_exporter(exporter)
+
+        # Act
+        with tracing.span("root") as root:
+            with tracing.span("child", agent_name="Creature Creator"):
+                tracing.add_event("llm_request")
+
+        # Assert
+        self.assertEqual(1, len(exporter.exports))
+        child, exported_root = exporter.exports[0]
+        self.assertIs(root, exported_root)
+        self.assertEqual(exported_root.trace_id, child.trace_id)
+        self.assertEqual(exported_root.span_id, child.parent_span_id)
+        self.assertIsNone(exported_root.parent_span_id)
+        self.assertEqual(["llm_request"], [e.name for e in child.events])
+        self.assertLessEqual(child.duration_ns, exported_root.duration_ns)
+
+    def test_span__not_enabled__does_nothing(self) -> None:
+        # Act
+        with tracing.span("root") as root:
+            trace_id = tracing.get_current_trace_id()
+
+        # Assert
+        self.assertIsNone(root)
+        self.assertIsNone(trace_id)
+
+    @parameterized.expand(
+        [
+            ("test: Chrome trace.", "chrome"),
+            ("test: OTLP JSON lines.", "otlp"),
+        ]
+    )
+    def test_file_exporter(
+        self, _test_name_implicitly_used: str, export_format: str
+    ) -> None:
+        # Arrange
+        path = os.path.join(tempfile.mkdtemp(), "trace.json")
+        exporter = (
+            tracing.ChromeTraceFileExporter(path)
+            if export_format == "chrome"
+            else tracing.OtlpJsonFileExporter(path)
+        )
+        tracing.set_exporter(exporter)
+
+        # Act
+        for _ in range(2):
+            with tracing.span("root"):
+                with tracing.span("child"):
+                    pass
+
+        # Assert
+        with open(path, encoding="utf-8") as file:
+            text = file.read()
+        if export_format == "chrome":
+            # The closing ']' is optional in the Chrome trace format
+            names = [e["name"] for e in json.loads(text + "]")]
+        else:
+            names = [
+                s["name"]
+                for line in text.splitlines()
+                for s in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+            ]
+        self.assertEqual(["child", "root", "child", "root"], names)
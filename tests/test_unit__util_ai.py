@@ -0,0 +1,88 @@
+import asyncio
+import os
+import tempfile
+import typing
+from gpt_multi_atomic_agents import util_ai
+from gpt_multi_atomic_agents.config import AI_PLATFORM_Enum, Config
+from parameterized import parameterized
+import unittest
+
+from rich.console import Console
+
+console = Console()
+
+
+def _create_config(**kwargs: typing.Any) -> Config:
+    return Config(
+        ai_platform=AI_PLATFORM_Enum.mock,
+        mock_cassette_path=os.path.join(tempfile.mkdtemp(), "cassette.jsonl"),
+        **kwargs,
+    )
+
+
+async def _acreate_clients(_config: Config) -> list[object]:
+    return [util_ai.create_client(_config=_config, is_async=True)[0] for _i in range(2)]
+
+
+class TestUtilAi(unittest.TestCase):
+    def setUp(self) -> None:
+        util_ai.clear_client_pool()
+
+    def test_create_client__async__one_client_per_event_loop(self) -> None:
+        # Arrange
+        _config = _create_config()
+        clients_created_before = util_ai.get_client_pool_stats().clients_created
+
+        # Act
+        clients_of_first_loop = asyncio.run(_acreate_clients(_config))
+        clients_of_second_loop = asyncio.run(_acreate_clients(_config))
+
+        # Assert
+        self.assertIs(clients_of_first_loop[0], clients_of_first_loop[1])
+        self.assertIsNot(clients_of_first_loop[0], clients_of_second_loop[0])
+        self.assertEqual(
+            2,
+            util_ai.get_client_pool_stats().clients_created - clients_created_before,
+        )
+
+    def test_create_client__async__evicted_when_event_loop_closed(self) -> None:
+        # Arrange
+        _config = _create_config()
+        util_ai.create_client(_config=_config, is_async=False)
+
+        # Act
+        for _i in range(3):
+            asyncio.run(_acreate_clients(_config))
+
+        # Assert
+        self.assertEqual(1, util_ai.get_client_pool_size())
+
+    @parameterized.expand(
+        [
+            ("test: Same settings.", {}, True),
+            ("test: Other retry settings.", {"llm_max_retries": 5}, False),
+            ("test: Hedging enabled.", {"is_llm_hedging_enabled": True}, False),
+            (
+                "test: Other rate limit.",
+                {"rate_limit_requests_per_minute": 60},
+                False,
+            ),
+        ]
+    )
+    def test_create_client__settings__client_reused(
+        self,
+        _test_name_implicitly_used: str,
+        other_settings: dict,
+        expected_is_reused: bool,
+    ) -> None:
+        # Arrange
+        _config = _create_config()
+        client, _model, _max_tokens = util_ai.create_client(_config=_config)
+
+        # Act
+        other_client, _model, _max_tokens = util_ai.create_client(
+            _config=Config(**(vars(_config) | other_settings))
+        )
+
+        # Assert
+        self.assertEqual(expected_is_reused, client is other_client)
@@ -65,6 +65,22 @@ String!\n  allowed_terrain: TerrainType!\n  age: Int!\n  icon_name: IconType!\n}
                 ],
                 ["addCreature", "addVegetation", "addCreatureRelationship"],
             ),
+            (
+                "test: Parse all mutations of one block.",
+                [
+                    """
+# Creatures
+type Mutation {
+  "Adds a creature (if new)"
+  addCreature(
+    input: CreatureInput!
+  ): Creature!
+  removeCreature(creature_name: String = "none"): Boolean
+}
+""",
+                ],
+                ["addCreature", "removeCreature"],
+            ),
         ]
     )
     def test_parse_out_mutations(
@@ -116,6 +132,18 @@ String!\n  allowed_terrain: TerrainType!\n  age: Int!\n  icon_name: IconType!\n}
                     """mutation {\n    addVegetation(input: {\n      vegetation_name: "Bioluminescent Vines",\n      icon_name: VINE,\n allowed_terrain: JUNGLE\n    }) {\n      id\n    }\n  }""",
                 ],
             ),
+            (
+                "test: Only match whole mutation names.",
+                [
+                    """mutation {\n  addCreatureRelationship(input: {from_name: "Sheep"}) {\n    id\n  }\n}""",
+                    """mutation {\n  my_addCreature (input: {creature_name: "Sheep"}) {\n    id\n  }\n}""",
+                    """mutation {\n  addCreature (input: {creature_name: "Wolf"}) {\n    id\n  }\n}""",
+                ],
+                ["addCreature"],
+                [
+                    """mutation {\n  addCreature (input: {creature_name: "Wolf"}) {\n    id\n  }\n}""",
+                ],
+            ),
         ]
     )
     def test_filter_to_matching_mutations_calls(